@@ -6,14 +6,22 @@ This module provides intelligent fee calculation using machine learning and beha
 import sqlite3
 import json
 import math
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 import numpy as np
 
+PROFILE_COLUMNS = ['id', 'email', 'account_type', 'current_tier', 'monthly_transaction_count',
+                   'loyalty_score', 'risk_profile', 'ai_fee_multiplier', 'total_lifetime_transactions',
+                   'avg_monthly_transactions', 'created_at']
+RECENT_TRANSACTIONS = 50  # Transactions in a profile's behavior window
+DEFAULT_BASE_FEES = {'individual': 0.25, 'family': 0.10, 'business': 0.10}
+
 class AIFeeEngine:
     """AI-powered fee calculation engine with ML capabilities"""
     
-    def __init__(self, db_path: str = 'kamioi.db'):
+    def __init__(self, db_path: str = 'kamioi.db', market_cache_ttl: float = 60.0):
         self.db_path = db_path
         self.ml_models = {
             'loyalty_scorer': LoyaltyScorer(),
@@ -21,6 +29,12 @@ class AIFeeEngine:
             'market_analyzer': MarketAnalyzer(),
             'retention_predictor': RetentionPredictor()
         }
+        
+        # Market conditions change daily at most, so every fee in the TTL shares one read
+        self.market_cache_ttl = market_cache_ttl
+        self._market_cache = None
+        self._market_cache_at = 0.0
+        self._market_lock = threading.Lock()
     
     def calculate_optimal_fee(self, user_id: int, transaction_amount: float, round_up_amount: float) -> Dict:
         """
@@ -30,57 +44,173 @@ class AIFeeEngine:
             # Get user profile and current tier
             user_profile = self._get_user_profile(user_id)
             current_tier = self._get_user_tier(user_id)
-            market_conditions = self._get_latest_market_conditions()
+            market_conditions = self._get_market_conditions()
             
             # Calculate base fee from tier
             base_fee = self._get_base_fee_from_tier(user_profile['account_type'], current_tier)
             
-            # AI Analysis
-            ai_factors = self._analyze_ai_factors(user_profile, market_conditions, transaction_amount)
-            
-            # Calculate dynamic adjustments
-            adjustments = self._calculate_ai_adjustments(ai_factors, user_profile)
-            
-            # Apply adjustments to base fee
-            if user_profile['account_type'] == 'business':
-                # For business accounts, apply percentage to round-up amount
-                final_fee = (base_fee * round_up_amount) + adjustments['total_adjustment']
-            else:
-                # For individual/family accounts, apply fixed fee with adjustments
-                final_fee = base_fee + adjustments['total_adjustment']
-            
-            # Ensure minimum fee
-            final_fee = max(final_fee, 0.01)
+            result, history = self._price_fee(user_profile, current_tier, base_fee, market_conditions,
+                                              transaction_amount, round_up_amount)
             
             # Store AI calculation history
-            self._store_ai_calculation(user_id, base_fee, adjustments, final_fee, ai_factors)
+            self._store_ai_calculation(user_id, *history)
             
-            return {
-                'base_fee': base_fee,
-                'ai_adjustments': adjustments,
-                'final_fee': round(final_fee, 2),
-                'ai_factors': ai_factors,
-                'confidence_score': adjustments['confidence_score'],
-                'tier_level': current_tier,
-                'recommendation': self._generate_fee_recommendation(ai_factors, final_fee)
-            }
+            return result
             
         except Exception as e:
             print(f"Error in AI fee calculation: {e}")
             # Fallback to simple calculation
             return self._fallback_fee_calculation(user_id, round_up_amount)
     
+    def calculate_fees_batch(self, items: List[Dict]) -> List[Dict]:
+        """
+        Batch form of calculate_optimal_fee for items of
+        {'user_id', 'transaction_amount', 'round_up_amount'}. Profiles and tiers
+        for every user in the batch come from a handful of queries, market
+        conditions are read once and the history rows go in with one
+        executemany. Results are in item order and match per-call results.
+        """
+        if not items:
+            return []
+        
+        user_ids = list(dict.fromkeys(item['user_id'] for item in items))
+        try:
+            profiles, latest_transactions, tiers = self._load_batch_context(user_ids)
+            market_conditions = self._get_market_conditions()
+        except Exception as e:
+            print(f"Error loading AI fee batch context: {e}")
+            return [self._fallback_fee_calculation(item['user_id'], item['round_up_amount']) for item in items]
+        
+        results = []
+        history_rows = []
+        for item in items:
+            user_id = item['user_id']
+            try:
+                user_profile = profiles.get(user_id)
+                if not user_profile:
+                    raise ValueError(f"User {user_id} not found")
+                
+                account_tiers = tiers.get(user_profile['account_type'], [])
+                current_tier = self._tier_for_count(account_tiers, user_profile['monthly_transaction_count'],
+                                                    user_profile['current_tier'])
+                base_fee = next((fee for level, _, _, fee in account_tiers if level == current_tier),
+                                DEFAULT_BASE_FEES.get(user_profile['account_type'], 0.25))
+                
+                result, history = self._price_fee(user_profile, current_tier, base_fee, market_conditions,
+                                                  item['transaction_amount'], item['round_up_amount'])
+                results.append(result)
+                if user_id in latest_transactions:
+                    history_rows.append(self._history_row(user_id, latest_transactions[user_id], *history))
+            except Exception as e:
+                print(f"Error in AI fee calculation: {e}")
+                results.append(self._fallback_fee_calculation(user_id, item['round_up_amount']))
+        
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.executemany("""
+                    INSERT INTO ai_fee_history 
+                    (user_id, transaction_id, base_fee, ai_adjustments, final_fee, ai_factors, tier_at_time, loyalty_score_at_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, history_rows)
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            # Same outcome as a failed per-call store: the caller gets fallback fees
+            print(f"Error in AI fee calculation: {e}")
+            return [self._fallback_fee_calculation(item['user_id'], item['round_up_amount']) for item in items]
+        
+        return results
+    
+    def _load_batch_context(self, user_ids: List[int]) -> Tuple[Dict, Dict, Dict]:
+        """Profiles, latest transaction id per user and active tiers by account type"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS fee_batch_users (user_id INTEGER PRIMARY KEY)")
+            cursor.execute("DELETE FROM fee_batch_users")
+            cursor.executemany("INSERT INTO fee_batch_users (user_id) VALUES (?)", [(user_id,) for user_id in user_ids])
+            
+            cursor.execute(f"""
+                SELECT {', '.join('u.' + column for column in PROFILE_COLUMNS)}
+                FROM users u
+                JOIN fee_batch_users b ON b.user_id = u.id
+            """)
+            profiles = {}
+            for row in cursor.fetchall():
+                profile = dict(zip(PROFILE_COLUMNS, row))
+                profile['recent_transactions'] = []
+                profiles[profile['id']] = profile
+            
+            cursor.execute("""
+                SELECT user_id, id, amount, fee, created_at, status FROM (
+                    SELECT t.user_id, t.id, t.amount, t.fee, t.created_at, t.status,
+                           ROW_NUMBER() OVER (PARTITION BY t.user_id ORDER BY t.created_at DESC, t.id DESC) AS position
+                    FROM transactions t
+                    JOIN fee_batch_users b ON b.user_id = t.user_id
+                )
+                WHERE position <= ?
+                ORDER BY user_id, position
+            """, (RECENT_TRANSACTIONS,))
+            latest_transactions = {}
+            for user_id, transaction_id, amount, fee, created_at, status in cursor.fetchall():
+                latest_transactions.setdefault(user_id, transaction_id)
+                if user_id in profiles:
+                    profiles[user_id]['recent_transactions'].append((amount, fee, created_at, status))
+            cursor.execute("DROP TABLE fee_batch_users")
+            
+            cursor.execute("""
+                SELECT account_type, tier_level, min_transactions, max_transactions, base_fee
+                FROM fee_tiers 
+                WHERE is_active = 1
+                ORDER BY account_type, tier_level, id
+            """)
+            tiers = {}
+            for account_type, tier_level, min_trans, max_trans, base_fee in cursor.fetchall():
+                tiers.setdefault(account_type, []).append((tier_level, min_trans, max_trans, base_fee))
+        finally:
+            conn.close()
+        
+        return profiles, latest_transactions, tiers
+    
+    def _price_fee(self, user_profile: Dict, current_tier: int, base_fee: float, market_conditions: Dict,
+                   transaction_amount: float, round_up_amount: float) -> Tuple[Dict, Tuple]:
+        """Fee result plus the (base_fee, adjustments, final_fee, ai_factors) history values"""
+        # AI Analysis
+        ai_factors = self._analyze_ai_factors(user_profile, market_conditions, transaction_amount)
+        
+        # Calculate dynamic adjustments
+        adjustments = self._calculate_ai_adjustments(ai_factors, user_profile)
+        
+        # Apply adjustments to base fee
+        if user_profile['account_type'] == 'business':
+            # For business accounts, apply percentage to round-up amount
+            final_fee = (base_fee * round_up_amount) + adjustments['total_adjustment']
+        else:
+            # For individual/family accounts, apply fixed fee with adjustments
+            final_fee = base_fee + adjustments['total_adjustment']
+        
+        # Ensure minimum fee
+        final_fee = max(final_fee, 0.01)
+        
+        result = {
+            'base_fee': base_fee,
+            'ai_adjustments': adjustments,
+            'final_fee': round(final_fee, 2),
+            'ai_factors': ai_factors,
+            'confidence_score': adjustments['confidence_score'],
+            'tier_level': current_tier,
+            'recommendation': self._generate_fee_recommendation(ai_factors, final_fee)
+        }
+        return result, (base_fee, adjustments, final_fee, ai_factors)
+    
     def _get_user_profile(self, user_id: int) -> Dict:
         """Get comprehensive user profile for AI analysis"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT id, email, account_type, current_tier, monthly_transaction_count,
-                   loyalty_score, risk_profile, ai_fee_multiplier, total_lifetime_transactions,
-                   avg_monthly_transactions, created_at
-            FROM users WHERE id = ?
-        """, (user_id,))
+        cursor.execute(f"SELECT {', '.join(PROFILE_COLUMNS)} FROM users WHERE id = ?", (user_id,))
         
         user = cursor.fetchone()
         if not user:
@@ -91,28 +221,17 @@ class AIFeeEngine:
             SELECT amount, fee, created_at, status
             FROM transactions 
             WHERE user_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT 50
-        """, (user_id,))
+            ORDER BY created_at DESC, id DESC 
+            LIMIT ?
+        """, (user_id, RECENT_TRANSACTIONS))
         
         transactions = cursor.fetchall()
         
         conn.close()
         
-        return {
-            'id': user[0],
-            'email': user[1],
-            'account_type': user[2],
-            'current_tier': user[3],
-            'monthly_transaction_count': user[4],
-            'loyalty_score': user[5],
-            'risk_profile': user[6],
-            'ai_fee_multiplier': user[7],
-            'total_lifetime_transactions': user[8],
-            'avg_monthly_transactions': user[9],
-            'created_at': user[10],
-            'recent_transactions': transactions
-        }
+        profile = dict(zip(PROFILE_COLUMNS, user))
+        profile['recent_transactions'] = transactions
+        return profile
     
     def _get_user_tier(self, user_id: int) -> int:
         """Get user's current tier based on monthly transaction count"""
@@ -141,8 +260,11 @@ class AIFeeEngine:
         tiers = cursor.fetchall()
         conn.close()
         
-        # Determine appropriate tier based on monthly count
-        for tier_level, min_trans, max_trans in tiers:
+        return self._tier_for_count(tiers, monthly_count, current_tier)
+    
+    def _tier_for_count(self, tiers: List[Tuple], monthly_count: int, current_tier: int) -> int:
+        """First tier, by level, whose transaction range holds monthly_count"""
+        for tier_level, min_trans, max_trans, *_ in tiers:
             if min_trans <= monthly_count and (max_trans is None or monthly_count <= max_trans):
                 return tier_level
         
@@ -157,6 +279,7 @@ class AIFeeEngine:
             SELECT base_fee, fee_type
             FROM fee_tiers 
             WHERE account_type = ? AND tier_level = ? AND is_active = 1
+            ORDER BY id
         """, (account_type, tier_level))
         
         tier = cursor.fetchone()
@@ -166,8 +289,15 @@ class AIFeeEngine:
             return tier[0]  # base_fee
         else:
             # Default fees if tier not found
-            defaults = {'individual': 0.25, 'family': 0.10, 'business': 0.10}
-            return defaults.get(account_type, 0.25)
+            return DEFAULT_BASE_FEES.get(account_type, 0.25)
+    
+    def _get_market_conditions(self) -> Dict:
+        """Latest market conditions, re-read at most once per market_cache_ttl seconds"""
+        with self._market_lock:
+            if self._market_cache is None or time.monotonic() - self._market_cache_at >= self.market_cache_ttl:
+                self._market_cache = self._get_latest_market_conditions()
+                self._market_cache_at = time.monotonic()
+            return self._market_cache
     
     def _get_latest_market_conditions(self) -> Dict:
         """Get latest market conditions for AI analysis"""
@@ -293,7 +423,7 @@ class AIFeeEngine:
         cursor.execute("""
             SELECT id FROM transactions 
             WHERE user_id = ? 
-            ORDER BY created_at DESC 
+            ORDER BY created_at DESC, id DESC 
             LIMIT 1
         """, (user_id,))
         
@@ -305,20 +435,25 @@ class AIFeeEngine:
                 INSERT INTO ai_fee_history 
                 (user_id, transaction_id, base_fee, ai_adjustments, final_fee, ai_factors, tier_at_time, loyalty_score_at_time)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                user_id,
-                transaction_id,
-                base_fee,
-                json.dumps(adjustments),
-                final_fee,
-                json.dumps(ai_factors),
-                ai_factors.get('tier_level', 1),
-                ai_factors.get('loyalty_score', 0.0)
-            ))
+            """, self._history_row(user_id, transaction_id, base_fee, adjustments, final_fee, ai_factors))
         
         conn.commit()
         conn.close()
     
+    def _history_row(self, user_id: int, transaction_id: int, base_fee: float, adjustments: Dict,
+                     final_fee: float, ai_factors: Dict) -> Tuple:
+        """ai_fee_history values for one calculation"""
+        return (
+            user_id,
+            transaction_id,
+            base_fee,
+            json.dumps(adjustments),
+            final_fee,
+            json.dumps(ai_factors),
+            ai_factors.get('tier_level', 1),
+            ai_factors.get('loyalty_score', 0.0)
+        )
+    
     def _generate_fee_recommendation(self, ai_factors: Dict, final_fee: float) -> str:
         """Generate AI recommendation for fee optimization"""
         loyalty_score = ai_factors['loyalty_score']
@@ -9,9 +9,7 @@ from datetime import datetime, timedelta
 import os
 import ssl
 
-# Simple in-memory cache for stock prices (5 minute TTL)
-_price_cache = {}
-_cache_ttl = 300  # 5 minutes
+from price_service import price_service
 
 class AlpacaService:
     def __init__(self):
@@ -69,73 +67,20 @@ class AlpacaService:
 
     def get_stock_price(self, symbol):
         """
-        Get current stock price for a symbol using Alpaca Market Data API.
-        Uses caching to avoid rate limits.
-        Falls back to free Yahoo Finance API if needed.
+        Get current stock price for a symbol from the shared price service
+        (Alpaca Market Data first, then the other configured providers).
+        Falls back to an estimated price if no provider can price it.
         """
-        global _price_cache
-
-        # Check cache first
-        cache_key = symbol.upper()
-        if cache_key in _price_cache:
-            cached_data = _price_cache[cache_key]
-            if datetime.now().timestamp() - cached_data['timestamp'] < _cache_ttl:
-                return cached_data['price']
-
         try:
-            # Try Alpaca Market Data API first (free for Alpaca users)
-            url = f"https://data.alpaca.markets/v2/stocks/{symbol}/quotes/latest"
-            response = requests.get(url, headers=self.headers, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-                if 'quote' in data and 'ap' in data['quote']:
-                    price = float(data['quote']['ap'])  # Ask price
-                    _price_cache[cache_key] = {'price': price, 'timestamp': datetime.now().timestamp()}
-                    return price
-
-            # Fallback: Try Alpaca bars endpoint
-            url = f"https://data.alpaca.markets/v2/stocks/{symbol}/bars/latest"
-            response = requests.get(url, headers=self.headers, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-                if 'bar' in data and 'c' in data['bar']:
-                    price = float(data['bar']['c'])  # Close price
-                    _price_cache[cache_key] = {'price': price, 'timestamp': datetime.now().timestamp()}
-                    return price
-
-            # Fallback: Use Yahoo Finance (completely free)
-            price = self._get_yahoo_price(symbol)
-            if price:
-                _price_cache[cache_key] = {'price': price, 'timestamp': datetime.now().timestamp()}
-                return price
-
+            quote = price_service.get_quote(symbol)
+            if quote:
+                return quote['price']
         except Exception as e:
             print(f"Error getting stock price for {symbol}: {e}")
 
         # Final fallback: estimated price based on common stocks
         return self._get_fallback_price(symbol)
 
-    def _get_yahoo_price(self, symbol):
-        """Get stock price from Yahoo Finance (free)"""
-        try:
-            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval=1d&range=1d"
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-                result = data.get('chart', {}).get('result', [])
-                if result:
-                    meta = result[0].get('meta', {})
-                    price = meta.get('regularMarketPrice')
-                    if price:
-                        return float(price)
-        except Exception as e:
-            print(f"Yahoo Finance error for {symbol}: {e}")
-        return None
-
     def _get_fallback_price(self, symbol):
         """Fallback prices for common stocks when APIs fail"""
         fallback_prices = {
@@ -149,10 +94,16 @@ class AlpacaService:
         return fallback_prices.get(symbol.upper(), 100.00)
 
     def get_multiple_prices(self, symbols):
-        """Get prices for multiple symbols"""
+        """Get prices for multiple symbols in batched quote requests"""
+        try:
+            quotes = price_service.get_quotes(symbols)
+        except Exception as e:
+            print(f"Error getting stock prices for {len(symbols)} symbols: {e}")
+            quotes = {}
         prices = {}
         for symbol in symbols:
-            prices[symbol] = self.get_stock_price(symbol)
+            quote = quotes.get(symbol.upper().strip())
+            prices[symbol] = quote['price'] if quote else self._get_fallback_price(symbol)
         return prices
     
     def get_account(self):
@@ -799,7 +750,7 @@ class AlpacaService:
             print(f"Exception getting positions: {e}")
             return []
     
-    def submit_order(self, account_id=None, symbol=None, qty=None, side="buy", order_type="market", time_in_force="day", notional=None):
+    def submit_order(self, account_id=None, symbol=None, qty=None, side="buy", order_type="market", time_in_force="day", notional=None, client_order_id=None):
         """
         Submit a stock order
 
@@ -811,6 +762,7 @@ class AlpacaService:
             order_type (str): 'market' or 'limit'
             time_in_force (str): 'day', 'gtc', etc.
             notional (float): Dollar amount for fractional shares (alternative to qty)
+            client_order_id (str): Caller-chosen unique ID; Alpaca rejects a duplicate, so retries cannot double-buy
         """
         try:
             order_data = {
@@ -825,6 +777,8 @@ class AlpacaService:
                 order_data["notional"] = str(notional)  # Dollar amount for fractional shares
             elif qty is not None:
                 order_data["qty"] = str(qty)  # Number of shares
+            if client_order_id:
+                order_data["client_order_id"] = client_order_id
 
             print(f"Submitting {self.api_type} order: {order_data}")
 
@@ -858,6 +812,41 @@ class AlpacaService:
             print(f"Exception submitting order: {e}")
             return None
     
+    def get_order(self, order_id, account_id=None):
+        """Get an order by its broker ID (used to poll block orders until filled)"""
+        try:
+            if self.api_type == "trading":
+                response = requests.get(f"{self.base_url}/v2/orders/{order_id}", headers=self.headers, timeout=10)
+            else:
+                response = requests.get(f"{self.base_url}/v1/trading/accounts/{account_id}/orders/{order_id}",
+                                        headers=self.headers, verify=False, timeout=10)
+
+            if response.status_code == 200:
+                return response.json()
+            print(f"Error getting order {order_id}: {response.status_code} - {response.text}")
+            return None
+        except Exception as e:
+            print(f"Exception getting order {order_id}: {e}")
+            return None
+
+    def get_order_by_client_id(self, client_order_id, account_id=None):
+        """Look up an order by client_order_id (reconciles a submit whose response was lost)"""
+        try:
+            if self.api_type == "trading":
+                response = requests.get(f"{self.base_url}/v2/orders:by_client_order_id",
+                                        params={'client_order_id': client_order_id}, headers=self.headers, timeout=10)
+            else:
+                response = requests.get(f"{self.base_url}/v1/trading/accounts/{account_id}/orders:by_client_order_id",
+                                        params={'client_order_id': client_order_id}, headers=self.headers,
+                                        verify=False, timeout=10)
+
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception as e:
+            print(f"Exception getting order {client_order_id}: {e}")
+            return None
+    
     def buy_fractional_shares(self, account_id=None, symbol=None, dollar_amount=None):
         """
         Buy fractional shares for a specific dollar amount
@@ -115,31 +115,32 @@ def create_payment_entry():
 def process_daily_recognition():
     """
     Process daily revenue recognition for all active subscriptions
-    Should be called by a scheduled job (cron) daily
+    Should be called by a scheduled job (cron) daily; pass from/to to backfill a range
     """
     try:
         data = request.get_json() or {}
         recognition_date = data.get('recognition_date')
+        start_date = data.get('from')
+        end_date = data.get('to')
         
-        if recognition_date:
-            recognition_date = datetime.fromisoformat(recognition_date).date()
+        from database_manager import db_manager
+        accounting_service = SubscriptionAccountingService(db_manager)
         
-        # Fetch all active subscriptions from database
-        # subscriptions = db.get_active_subscriptions()
-        
-        # Process daily recognition
-        # entries = accounting_service.process_daily_revenue_recognition(
-        #     subscriptions=subscriptions,
-        #     recognition_date=recognition_date
-        # )
+        if start_date:
+            # Backfill: each chunk commits on its own and recognized days are skipped
+            summary = accounting_service.backfill_revenue_recognition(
+                datetime.fromisoformat(start_date).date(),
+                datetime.fromisoformat(end_date).date() if end_date else datetime.now().date(),
+                chunk_days=int(data.get('chunk_days', 31))
+            )
+        else:
+            recognition_date = datetime.fromisoformat(recognition_date).date() if recognition_date else datetime.now().date()
+            summary = accounting_service.recognize_revenue_range(recognition_date, recognition_date)
         
         return jsonify({
             'success': True,
-            'message': 'Daily recognition processed (placeholder - integrate with service)',
-            'data': {
-                'entries_created': 0,  # len(entries),
-                'recognition_date': recognition_date.isoformat() if recognition_date else datetime.now().date().isoformat()
-            }
+            'message': f"Daily recognition processed: {summary['entries_created']} entries created",
+            'data': summary
         })
         
     except Exception as e:
@@ -89,6 +89,9 @@ from blueprints.family import family_bp
 from blueprints.business import business_bp
 from blueprints.admin import admin_bp
 
+# Per-route latency, DB usage and response size aggregation
+from request_profiler import request_profiler
+
 # Error tracking service for logging errors to database
 try:
     from services.error_tracking_service import log_error, log_exception
@@ -273,6 +276,7 @@ def log_performance(operation_name, start_time, query_time=None):
     """Helper function for consistent performance logging"""
     import time as time_module
     total_time = time_module.time() - start_time
+    request_profiler.record_operation(operation_name, total_time)
     if query_time is not None:
         sys.stdout.write(f"[{operation_name}] Query: {query_time:.2f}s, Total: {total_time:.2f}s\n")
     else:
@@ -389,6 +393,9 @@ def after_request_handler(response):
         sys.stdout.flush()
     return response
 
+# Request profiling hooks - registered after the CORS handlers so preflight requests are skipped
+request_profiler.init_app(app)
+
 # Error handler for HTTP exceptions (404, 500, etc.) - ensure CORS headers are present
 @app.errorhandler(HTTPException)
 def handle_http_exception(e):
@@ -14007,29 +14014,48 @@ def export_training_data():
         return res
     
     try:
-        # Export approved mappings
-        approved_mappings = llm_trainer.export_approved_mappings()
+        data = request.get_json(silent=True) or {}
+        try:
+            validation_fraction = float(data.get('validation_fraction', 0.1))
+            after_id = int(data.get('after_id', 0))
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'validation_fraction and after_id must be numbers'
+            }), 400
+        stats = llm_trainer.get_approved_mapping_stats()
         
-        if not approved_mappings:
+        if not stats['total_mappings']:
             return jsonify({
                 'success': False,
                 'error': 'No approved mappings found for export'
             }), 400
         
-        # Create dataset and export
-        training_dataset = llm_trainer.create_training_dataset(approved_mappings)
-        csv_file = llm_trainer.export_training_data_to_csv(training_dataset)
+        # Stream approved mappings to train/validation files chunk by chunk
+        export = llm_trainer.stream_training_export(
+            filename=data.get('filename'),
+            fmt=data.get('format', 'csv'),
+            validation_fraction=validation_fraction,
+            resume=bool(data.get('resume', False)),
+            after_id=after_id
+        )
         
         return jsonify({
             'success': True,
             'message': 'Training data exported successfully',
-            'file': csv_file,
+            'file': export['files']['train'],
+            'files': export['files'],
+            'last_id': export['last_id'],
             'stats': {
-                'total_mappings': len(approved_mappings),
-                'unique_merchants': len(training_dataset['merchant_patterns']),
-                'categories': len(training_dataset['category_patterns'])
+                'total_mappings': export['total_mappings'],
+                'train_rows': export['train_rows'],
+                'validation_rows': export['validation_rows'],
+                'unique_merchants': stats['unique_merchants'],
+                'categories': stats['categories']
             }
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -21355,6 +21381,10 @@ def validate_messaging_connection():
             'error': 'Failed to validate connection. Please try again.'
         }), 500
 
+# Every route is registered by now: let the health monitor's API checks confirm the monitored ones exist
+from health_monitoring import health_monitor
+health_monitor.attach_app(app)
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', '5111'))  # Default to 5111 (was working before), can be overridden
     print(f"\nStarting server on port {port}...")
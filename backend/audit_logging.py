@@ -1,16 +1,35 @@
 """
 Comprehensive Audit Logging System for Kamioi Platform
 Tracks all admin actions, system events, and user activities for compliance and security
+
+Entries are stored in the append-only audit_log table. log_event() only queues
+the entry; a writer thread commits whatever has queued up in one transaction
+(group commit), assigning each entry the next sequence number and chaining its
+SHA-256 over the previous entry's hash, so an edited, removed or reordered row
+breaks verification from that point on. Queries run against indexes on user,
+event type and time, and exports stream rows instead of building one string.
+
+audit_log lives in the SQLite database. With PostgreSQL configured the logger
+keeps the same table in an in-process SQLite database instead (MemoryAuditStore),
+so entries are chained and queryable but do not survive a restart.
 """
 
+import atexit
+import csv
+import io
 import json
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Iterator
 from dataclasses import dataclass, asdict
 from enum import Enum
 import hashlib
 import uuid
 
+from database_manager import db_manager, AUDIT_LOG_SCHEMA
+
 class AuditEventType(Enum):
     # Authentication events
     LOGIN_SUCCESS = "login_success"
@@ -61,6 +80,45 @@ class AuditEventType(Enum):
     DATA_DELETE = "data_delete"
     PRIVACY_REQUEST = "privacy_request"
 
+GENESIS_HASH = '0' * 64  # prev_hash of the first entry ever written
+
+# Stored columns in hash order; the chain hash covers exactly these stored values
+ENTRY_COLUMNS = [
+    'id', 'timestamp', 'event_type', 'user_id', 'user_type', 'action', 'resource', 'resource_id',
+    'before_state', 'after_state', 'ip_address', 'user_agent', 'session_id', 'correlation_id',
+    'success', 'error_message', 'metadata'
+]
+JSON_COLUMNS = ('before_state', 'after_state', 'metadata')
+SELECT_COLUMNS = ', '.join(['seq'] + ENTRY_COLUMNS + ['prev_hash', 'hash'])
+
+SECURITY_EVENT_TYPES = [
+    AuditEventType.LOGIN_FAILED,
+    AuditEventType.PASSWORD_CHANGE,
+    AuditEventType.ADMIN_LOGIN,
+    AuditEventType.ADMIN_LOGOUT,
+    AuditEventType.ERROR_OCCURRED,
+    AuditEventType.DATA_EXPORT,
+    AuditEventType.DATA_DELETE,
+    AuditEventType.PRIVACY_REQUEST
+]
+
+
+def _json_safe(value):
+    """A JSON round-trip of value (keys become strings), or its repr if it can't be encoded at all"""
+    if value is None:
+        return None
+    try:
+        return json.loads(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return {'unserializable': repr(value)}
+
+
+def chain_hash(prev_hash: str, values: tuple) -> str:
+    """SHA-256 over the previous entry's hash and this entry's stored values"""
+    payload = json.dumps([prev_hash, *values], separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
 @dataclass
 class AuditLogEntry:
     id: str
@@ -80,14 +138,80 @@ class AuditLogEntry:
     success: bool
     error_message: Optional[str]
     metadata: Dict[str, Any]
-    hash: str  # For integrity verification
+    hash: str = ''  # Chained integrity hash, assigned when the entry is written
+    prev_hash: str = ''
+    seq: Optional[int] = None  # Position in the chain
+
+    def stored_values(self) -> tuple:
+        """Column values exactly as they are stored (and hashed)"""
+        values = []
+        for column in ENTRY_COLUMNS:
+            value = getattr(self, column)
+            if column == 'event_type':
+                value = value.value
+            elif column in JSON_COLUMNS:
+                value = json.dumps(value, sort_keys=True, default=str) if value is not None else None
+            elif column == 'success':
+                value = int(bool(value))
+            elif value is not None:
+                value = str(value)
+            values.append(value)
+        return tuple(values)
+
+    @classmethod
+    def from_row(cls, row) -> 'AuditLogEntry':
+        seq, *values, prev_hash, entry_hash = row
+        data = dict(zip(ENTRY_COLUMNS, values))
+        for column in JSON_COLUMNS:
+            data[column] = json.loads(data[column]) if data[column] is not None else None
+        data['event_type'] = AuditEventType(data['event_type'])
+        data['success'] = bool(data['success'])
+        data['metadata'] = data['metadata'] or {}
+        return cls(**data, hash=entry_hash, prev_hash=prev_hash, seq=seq)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['event_type'] = self.event_type.value
+        return data
+
+
+class MemoryAuditStore:
+    """
+    audit_log in a shared in-memory SQLite database, for deployments whose main
+    database is PostgreSQL. Hands out connections like db_manager does.
+    """
 
-class AuditLogger:
     def __init__(self):
-        self.logs: List[AuditLogEntry] = []
-        self.max_logs = 100000  # Keep last 100k entries
+        self.uri = f"file:audit_log_{uuid.uuid4().hex}?mode=memory&cache=shared"
+        self.anchor = sqlite3.connect(self.uri, uri=True, check_same_thread=False)  # Keeps the database alive
+        for statement in AUDIT_LOG_SCHEMA:
+            self.anchor.execute(statement)
+        self.anchor.commit()
+
+    def get_connection(self):
+        return sqlite3.connect(self.uri, uri=True, timeout=30)
+
+
+class AuditLogger:
+    def __init__(self, db=None, batch_size: int = 500):
+        self.db = db or db_manager
+        self.store = self.db if self.available else MemoryAuditStore()
+        if not self.available:
+            print("[AUDIT] audit_log is not in the main database here; keeping audit entries in memory")
+        self.batch_size = batch_size  # Most entries committed per write transaction
         self.enabled = True
-        
+        self.queue: queue.Queue = queue.Queue()
+        self.writer = None
+        self.writer_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.pending = 0  # Queued or being written
+        self.stats = {'queued': 0, 'written': 0, 'batches': 0, 'write_failures': 0, 'dropped': 0}
+
+    @property
+    def available(self) -> bool:
+        """The durable audit_log table lives in SQLite; on PostgreSQL entries are kept in memory"""
+        return not getattr(self.db, '_use_postgresql', False)
+
     def log_event(self, event_type: AuditEventType, user_id: str, user_type: str,
                   action: str, resource: str, resource_id: str = None,
                   before_state: Dict[str, Any] = None, after_state: Dict[str, Any] = None,
@@ -95,7 +219,7 @@ class AuditLogger:
                   session_id: str = None, correlation_id: str = None,
                   success: bool = True, error_message: str = None,
                   metadata: Dict[str, Any] = None) -> str:
-        """Log an audit event"""
+        """Log an audit event (queued; the writer thread makes it durable)"""
         
         if not self.enabled:
             return ""
@@ -124,196 +248,350 @@ class AuditLogger:
             metadata=metadata or {}
         )
         
-        # Calculate hash for integrity verification
-        entry.hash = self._calculate_hash(entry)
-        
-        # Add to logs
-        self.logs.append(entry)
+        # Serialize now, so an entry that can't be stored fails alone instead of inside a batch
+        try:
+            values = entry.stored_values()
+        except (TypeError, ValueError):
+            for column in JSON_COLUMNS:
+                setattr(entry, column, _json_safe(getattr(entry, column)))
+            values = entry.stored_values()
         
-        # Maintain log size limit
-        if len(self.logs) > self.max_logs:
-            self.logs.pop(0)
+        self._ensure_writer()
+        with self.condition:
+            self.pending += 1
+            self.stats['queued'] += 1
+        self.queue.put((entry, values))
         
         # Log to console for debugging
         print(f"📝 Audit Log: {event_type.value} - {user_id} - {action} - {resource}")
         
         return log_id
     
-    def _calculate_hash(self, entry: AuditLogEntry) -> str:
-        """Calculate hash for integrity verification"""
-        # Create a string representation of the entry (excluding the hash field)
-        entry_dict = asdict(entry)
-        entry_dict.pop('hash', None)
-        entry_string = json.dumps(entry_dict, sort_keys=True)
-        
-        # Calculate SHA-256 hash
-        return hashlib.sha256(entry_string.encode()).hexdigest()
-    
-    def verify_integrity(self, entry: AuditLogEntry) -> bool:
-        """Verify the integrity of an audit log entry"""
-        calculated_hash = self._calculate_hash(entry)
-        return calculated_hash == entry.hash
-    
-    def get_logs(self, event_type: AuditEventType = None, user_id: str = None,
-                 user_type: str = None, resource: str = None,
-                 start_date: str = None, end_date: str = None,
-                 limit: int = 1000) -> List[AuditLogEntry]:
-        """Get audit logs with filtering"""
-        
-        filtered_logs = self.logs
-        
-        # Apply filters
+    # ------------------------------------------------------------------
+    # Writer
+    # ------------------------------------------------------------------
+
+    def _ensure_writer(self):
+        if self.writer and self.writer.is_alive():
+            return
+        with self.writer_lock:
+            if self.writer and self.writer.is_alive():
+                return
+            self.writer = threading.Thread(target=self._writer_loop, name='audit-log-writer', daemon=True)
+            self.writer.start()
+
+    def _writer_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_with_retry(batch)
+            finally:
+                with self.condition:
+                    self.pending -= len(batch)
+                    self.condition.notify_all()
+
+    def _write_with_retry(self, batch: List[tuple], attempts: int = 3):
+        for attempt in range(1, attempts + 1):
+            try:
+                self._write_batch(batch)
+                return
+            except Exception as e:
+                self.stats['write_failures'] += 1
+                print(f"Audit log write failed (attempt {attempt}/{attempts}): {e}")
+        if len(batch) == 1:
+            self.stats['dropped'] += 1
+            return
+        # Write entries one at a time so only the ones that still fail are lost
+        for item in batch:
+            self._write_with_retry([item], attempts=1)
+
+    def _write_batch(self, batch: List[tuple]):
+        """Append a batch of (entry, stored values) to the chain in one transaction"""
+        conn = self.store.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")  # Serializes writers, so the chain head can't move underneath us
+            head = cur.execute("SELECT seq, hash FROM audit_log ORDER BY seq DESC LIMIT 1").fetchone()
+            seq, prev_hash = head if head else (0, GENESIS_HASH)
+            rows = []
+            for _, values in batch:
+                seq += 1
+                rows.append((seq, *values, prev_hash, chain_hash(prev_hash, values)))
+                prev_hash = rows[-1][-1]
+            cur.executemany(f'''
+                INSERT INTO audit_log ({SELECT_COLUMNS})
+                VALUES ({', '.join('?' * (len(ENTRY_COLUMNS) + 3))})
+            ''', rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        for (entry, _), row in zip(batch, rows):
+            entry.seq, entry.prev_hash, entry.hash = row[0], row[-2], row[-1]
+        self.stats['written'] += len(batch)
+        self.stats['batches'] += 1
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until every queued entry has been written"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending == 0, timeout)
+
+    # ------------------------------------------------------------------
+    # Integrity
+    # ------------------------------------------------------------------
+
+    def verify_entry(self, entry: AuditLogEntry) -> bool:
+        """Verify a single entry's hash against its stored values and predecessor hash"""
+        return chain_hash(entry.prev_hash, entry.stored_values()) == entry.hash
+
+    def verify_integrity(self, start_seq: int = None, end_seq: int = None,
+                         start_date: str = None, end_date: str = None) -> Dict[str, Any]:
+        """
+        Walk the chain over a range (all retained entries by default), checking each
+        stored hash, each link to the previous entry and that no sequence is missing.
+        A date range covers every entry between the first and last sequence in it.
+        Stops at the first broken entry.
+        """
+        self.flush()
+        where, params = [], []
+        if start_date:
+            where.append("seq >= (SELECT MIN(seq) FROM audit_log WHERE timestamp >= ?)")
+            params.append(datetime.fromisoformat(start_date).isoformat())
+        if end_date:
+            where.append("seq <= (SELECT MAX(seq) FROM audit_log WHERE timestamp <= ?)")
+            params.append(datetime.fromisoformat(end_date).isoformat())
+        if start_seq is not None:
+            where.append("seq >= ?")
+            params.append(start_seq)
+        if end_seq is not None:
+            where.append("seq <= ?")
+            params.append(end_seq)
+        sql = f"SELECT {SELECT_COLUMNS} FROM audit_log"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY seq"
+
+        report = {'valid': True, 'checked': 0, 'first_seq': None, 'last_seq': None, 'error': None}
+        conn = self.store.get_connection()
+        try:
+            cur = conn.execute(sql, params)
+            expected_prev, last_seq = None, None
+            while True:
+                rows = cur.fetchmany(1000)
+                if not rows:
+                    break
+                for row in rows:
+                    entry = AuditLogEntry.from_row(row)
+                    if expected_prev is None:
+                        # Anchor the range on the entry before it, or on genesis / the oldest retained entry
+                        before = conn.execute("SELECT seq, hash FROM audit_log WHERE seq < ? ORDER BY seq DESC LIMIT 1",
+                                              (entry.seq,)).fetchone()
+                        if before:
+                            last_seq, expected_prev = before
+                        else:
+                            expected_prev = GENESIS_HASH if entry.seq == 1 else entry.prev_hash
+                        report['first_seq'] = entry.seq
+                    error = None
+                    if last_seq is not None and entry.seq != last_seq + 1:
+                        error = f'entries {last_seq + 1}..{entry.seq - 1} are missing'
+                    elif entry.prev_hash != expected_prev:
+                        error = 'link to previous entry is broken'
+                    elif not self.verify_entry(entry):
+                        error = 'entry contents do not match its hash'
+                    if error:
+                        report.update(valid=False, error={'seq': entry.seq, 'id': entry.id, 'reason': error})
+                        return report
+                    report['checked'] += 1
+                    report['last_seq'] = last_seq = entry.seq
+                    expected_prev = entry.hash
+            return report
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _where(event_type: AuditEventType = None, user_id: str = None, user_type: str = None,
+               resource: str = None, start_date: str = None, end_date: str = None):
+        where, params = [], []
         if event_type:
-            filtered_logs = [log for log in filtered_logs if log.event_type == event_type]
-        
+            where.append("event_type = ?")
+            params.append(event_type.value)
         if user_id:
-            filtered_logs = [log for log in filtered_logs if log.user_id == user_id]
-        
+            where.append("user_id = ?")
+            params.append(str(user_id))
         if user_type:
-            filtered_logs = [log for log in filtered_logs if log.user_type == user_type]
-        
+            where.append("user_type = ?")
+            params.append(user_type)
         if resource:
-            filtered_logs = [log for log in filtered_logs if log.resource == resource]
-        
+            where.append("resource = ?")
+            params.append(resource)
         if start_date:
-            start_dt = datetime.fromisoformat(start_date)
-            filtered_logs = [log for log in filtered_logs 
-                           if datetime.fromisoformat(log.timestamp) >= start_dt]
-        
+            where.append("timestamp >= ?")
+            params.append(datetime.fromisoformat(start_date).isoformat())
         if end_date:
-            end_dt = datetime.fromisoformat(end_date)
-            filtered_logs = [log for log in filtered_logs 
-                           if datetime.fromisoformat(log.timestamp) <= end_dt]
-        
-        # Sort by timestamp (newest first) and limit
-        filtered_logs.sort(key=lambda x: x.timestamp, reverse=True)
-        return filtered_logs[:limit]
+            where.append("timestamp <= ?")
+            params.append(datetime.fromisoformat(end_date).isoformat())
+        return where, params
+
+    def _query(self, where: List[str], params: List, limit: int = None) -> List[AuditLogEntry]:
+        self.flush()
+        sql = f"SELECT {SELECT_COLUMNS} FROM audit_log"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp DESC, seq DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params = list(params) + [limit]
+        conn = self.store.get_connection()
+        try:
+            return [AuditLogEntry.from_row(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def get_logs(self, event_type: AuditEventType = None, user_id: str = None,
+                 user_type: str = None, resource: str = None,
+                 start_date: str = None, end_date: str = None,
+                 limit: int = 1000) -> List[AuditLogEntry]:
+        """Get audit logs with filtering (newest first)"""
+        where, params = self._where(event_type, user_id, user_type, resource, start_date, end_date)
+        return self._query(where, params, limit)
     
+    @staticmethod
+    def _since(hours: int) -> str:
+        return (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+
     def get_user_activity(self, user_id: str, hours: int = 24) -> List[AuditLogEntry]:
         """Get user activity for the last N hours"""
-        cutoff_time = datetime.utcnow().timestamp() - (hours * 3600)
-        cutoff_date = datetime.fromtimestamp(cutoff_time).isoformat()
-        
-        return self.get_logs(
-            user_id=user_id,
-            start_date=cutoff_date,
-            limit=1000
-        )
+        return self.get_logs(user_id=user_id, start_date=self._since(hours), limit=1000)
     
     def get_admin_actions(self, hours: int = 24) -> List[AuditLogEntry]:
         """Get admin actions for the last N hours"""
-        cutoff_time = datetime.utcnow().timestamp() - (hours * 3600)
-        cutoff_date = datetime.fromtimestamp(cutoff_time).isoformat()
-        
-        return self.get_logs(
-            user_type='admin',
-            start_date=cutoff_date,
-            limit=1000
-        )
+        return self.get_logs(user_type='admin', start_date=self._since(hours), limit=1000)
     
     def get_security_events(self, hours: int = 24) -> List[AuditLogEntry]:
         """Get security-related events for the last N hours"""
-        cutoff_time = datetime.utcnow().timestamp() - (hours * 3600)
-        cutoff_date = datetime.fromtimestamp(cutoff_time).isoformat()
-        
-        security_events = [
-            AuditEventType.LOGIN_FAILED,
-            AuditEventType.PASSWORD_CHANGE,
-            AuditEventType.ADMIN_LOGIN,
-            AuditEventType.ADMIN_LOGOUT,
-            AuditEventType.ERROR_OCCURRED,
-            AuditEventType.DATA_EXPORT,
-            AuditEventType.DATA_DELETE,
-            AuditEventType.PRIVACY_REQUEST
-        ]
-        
-        filtered_logs = []
-        for event_type in security_events:
-            logs = self.get_logs(
-                event_type=event_type,
-                start_date=cutoff_date,
-                limit=100
-            )
-            filtered_logs.extend(logs)
-        
-        # Sort by timestamp and return
-        filtered_logs.sort(key=lambda x: x.timestamp, reverse=True)
-        return filtered_logs[:1000]
+        where, params = self._where(start_date=self._since(hours))
+        where.append(f"event_type IN ({', '.join('?' * len(SECURITY_EVENT_TYPES))})")
+        params.extend(event_type.value for event_type in SECURITY_EVENT_TYPES)
+        return self._query(where, params, 1000)
     
     def get_audit_stats(self) -> Dict[str, Any]:
         """Get audit logging statistics"""
-        if not self.logs:
-            return {
-                'total_logs': 0,
-                'event_types': {},
-                'user_types': {},
-                'success_rate': 0,
-                'recent_activity': 0
-            }
-        
-        # Count by event type
-        event_types = {}
-        for log in self.logs:
-            event_type = log.event_type.value
-            event_types[event_type] = event_types.get(event_type, 0) + 1
-        
-        # Count by user type
-        user_types = {}
-        for log in self.logs:
-            user_type = log.user_type
-            user_types[user_type] = user_types.get(user_type, 0) + 1
-        
-        # Calculate success rate
-        successful_logs = len([log for log in self.logs if log.success])
-        success_rate = (successful_logs / len(self.logs)) * 100 if self.logs else 0
-        
-        # Count recent activity (last 24 hours)
-        cutoff_time = datetime.utcnow().timestamp() - (24 * 3600)
-        cutoff_date = datetime.fromtimestamp(cutoff_time).isoformat()
-        recent_logs = len([log for log in self.logs 
-                          if log.timestamp >= cutoff_date])
-        
+        self.flush()
+        conn = self.store.get_connection()
+        try:
+            total, successful, oldest, newest, first_seq, last_seq = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(success), 0), MIN(timestamp), MAX(timestamp), MIN(seq), MAX(seq)
+                FROM audit_log
+            ''').fetchone()
+            event_types = dict(conn.execute("SELECT event_type, COUNT(*) FROM audit_log GROUP BY event_type").fetchall())
+            user_types = dict(conn.execute("SELECT user_type, COUNT(*) FROM audit_log GROUP BY user_type").fetchall())
+            recent = conn.execute("SELECT COUNT(*) FROM audit_log WHERE timestamp >= ?", (self._since(24),)).fetchone()[0]
+        finally:
+            conn.close()
+
         return {
-            'total_logs': len(self.logs),
+            'total_logs': total,
             'event_types': event_types,
             'user_types': user_types,
-            'success_rate': round(success_rate, 2),
-            'recent_activity': recent_logs,
-            'oldest_log': self.logs[0].timestamp if self.logs else None,
-            'newest_log': self.logs[-1].timestamp if self.logs else None
+            'success_rate': round(successful / total * 100, 2) if total else 0,
+            'recent_activity': recent,
+            'oldest_log': oldest,
+            'newest_log': newest,
+            'first_seq': first_seq,
+            'last_seq': last_seq,
+            'durable': self.available,
+            'writer': dict(self.stats, pending=self.pending)
         }
     
-    def export_logs(self, format: str = 'json') -> str:
-        """Export audit logs in specified format"""
-        if format == 'json':
-            return json.dumps([asdict(log) for log in self.logs], indent=2)
-        elif format == 'csv':
-            # Simple CSV export
-            if not self.logs:
-                return "timestamp,event_type,user_id,user_type,action,resource,success\n"
-            
-            csv_lines = ["timestamp,event_type,user_id,user_type,action,resource,success"]
-            for log in self.logs:
-                csv_lines.append(f"{log.timestamp},{log.event_type.value},{log.user_id},{log.user_type},{log.action},{log.resource},{log.success}")
-            
-            return "\n".join(csv_lines)
-        else:
+    def export_logs(self, format: str = 'json', start_date: str = None, end_date: str = None,
+                    chunk_size: int = 1000) -> Iterator[str]:
+        """Stream audit logs (oldest first) in the specified format, one chunk of rows at a time"""
+        if format not in ('json', 'csv'):
             raise ValueError(f"Unsupported format: {format}")
+        self.flush()
+        where, params = self._where(start_date=start_date, end_date=end_date)
+        sql = f"SELECT {SELECT_COLUMNS} FROM audit_log"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY seq"
+        return self._export(format, sql, params, chunk_size)
+
+    def _export(self, format: str, sql: str, params: List, chunk_size: int) -> Iterator[str]:
+        csv_columns = ['seq', 'timestamp', 'event_type', 'user_id', 'user_type', 'action', 'resource',
+                       'resource_id', 'success', 'hash']
+        conn = self.store.get_connection()
+        try:
+            cur = conn.execute(sql, params)
+            first = True
+            yield '[' if format == 'json' else ','.join(csv_columns) + '\n'
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if format == 'json':
+                    parts = []
+                    for row in rows:
+                        parts.append(('\n' if first else ',\n') + json.dumps(AuditLogEntry.from_row(row).to_dict()))
+                        first = False
+                    yield ''.join(parts)
+                else:
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer, lineterminator='\n')
+                    for row in rows:
+                        data = AuditLogEntry.from_row(row).to_dict()
+                        writer.writerow([data[column] for column in csv_columns])
+                    yield buffer.getvalue()
+            if format == 'json':
+                yield '\n]\n'
+        finally:
+            conn.close()
     
     def clear_old_logs(self, days: int = 90):
-        """Clear logs older than specified days"""
-        cutoff_time = datetime.utcnow().timestamp() - (days * 24 * 3600)
-        cutoff_date = datetime.fromtimestamp(cutoff_time).isoformat()
-        
-        original_count = len(self.logs)
-        self.logs = [log for log in self.logs if log.timestamp >= cutoff_date]
-        removed_count = original_count - len(self.logs)
+        """
+        Clear logs older than specified days. Only a prefix of the chain is removed
+        (and never the newest entry), so the retained entries still verify.
+        """
+        self.flush()
+        cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        conn = self.store.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            boundary = cur.execute('''
+                SELECT MIN(seq) FROM audit_log WHERE timestamp >= ?
+            ''', (cutoff_date,)).fetchone()[0]
+            if boundary is None:
+                boundary = cur.execute("SELECT MAX(seq) FROM audit_log").fetchone()[0] or 0
+            cur.execute("DELETE FROM audit_log WHERE seq < ?", (boundary,))
+            removed_count = cur.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
         
         print(f"🧹 Cleared {removed_count} audit logs older than {days} days")
+        if removed_count:
+            log_system_event(AuditEventType.DATA_DELETE, 'retention_purge', 'audit_log',
+                             metadata={'days': days, 'removed': removed_count, 'first_retained_seq': boundary},
+                             logger=self)
         return removed_count
 
 # Global audit logger instance
 audit_logger = AuditLogger()
+atexit.register(audit_logger.flush)
 
 # Convenience functions for common audit events
 def log_admin_action(user_id: str, action: str, resource: str, resource_id: str = None,
@@ -382,9 +660,9 @@ def log_transaction_event(user_id: str, action: str, transaction_id: str,
 
 def log_system_event(event_type: AuditEventType, action: str, resource: str,
                     metadata: Dict[str, Any] = None, success: bool = True,
-                    error_message: str = None) -> str:
+                    error_message: str = None, logger: AuditLogger = None) -> str:
     """Log a system event"""
-    return audit_logger.log_event(
+    return (logger or audit_logger).log_event(
         event_type=event_type,
         user_id='system',
         user_type='system',
@@ -0,0 +1,6 @@
+"""
+Benchmark and load-testing harnesses for the Kamioi backend
+
+Everything here runs against a separate synthetic SQLite database
+(see synthetic_data.py) and never touches kamioi.db.
+"""
@@ -0,0 +1,132 @@
+"""
+Fake Alpaca Trading API for tests and benchmarks
+
+Implements the subset AlpacaService uses for buying: POST /v2/orders,
+GET /v2/orders/<id> and GET /v2/orders:by_client_order_id. Notional market
+orders fill at a fixed per-symbol price, optionally after a delay, and
+duplicate client_order_ids are rejected with 422 like the real API. With
+fill_ratio below 1 orders fill only that share of their notional and end
+'canceled', like a partial fill whose remainder was canceled.
+
+Usage:
+    with FakeBroker(prices={'AAPL': 187.25}, latency=0.05) as broker:
+        service = AlpacaService()
+        service.base_url = broker.url
+"""
+
+import json
+import threading
+import time
+import uuid
+from decimal import Decimal, ROUND_DOWN
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, Optional
+
+
+class FakeBroker:
+    def __init__(self, prices: Dict[str, float] = None, latency: float = 0.0, fill_delay: float = 0.0,
+                 default_price: float = 100.0, fail_submits: int = 0, fill_ratio: float = 1.0):
+        self.prices = {symbol: Decimal(str(price)) for symbol, price in (prices or {}).items()}
+        self.default_price = Decimal(str(default_price))
+        self.latency = latency  # Added to every request, like the HTTPS round trip
+        self.fill_delay = fill_delay  # Orders stay 'accepted' this long before filling
+        self.fail_submits = fail_submits  # Fail this many submits with 500 before accepting
+        self.fill_ratio = Decimal(str(fill_ratio))  # Share of each order's notional that fills
+        self.orders: Dict[str, Dict] = {}
+        self.by_client_id: Dict[str, str] = {}
+        self.submits = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _order_view(self, order: Dict) -> Dict:
+        if order['status'] == 'accepted' and time.monotonic() - order['_accepted_at'] >= self.fill_delay:
+            price = self.prices.get(order['symbol'], self.default_price)
+            qty = (Decimal(order['notional']) * self.fill_ratio / price).quantize(Decimal('0.000000001'),
+                                                                                 rounding=ROUND_DOWN)
+            order.update(status='filled' if self.fill_ratio >= 1 else 'canceled',
+                         filled_qty=str(qty), filled_avg_price=str(price))
+        return {key: value for key, value in order.items() if not key.startswith('_')}
+
+    def _submit(self, body: Dict):
+        with self.lock:
+            self.submits += 1
+            if self.fail_submits > 0:
+                self.fail_submits -= 1
+                return 500, {'message': 'internal error'}
+            client_order_id = body.get('client_order_id') or str(uuid.uuid4())
+            if client_order_id in self.by_client_id:
+                return 422, {'message': 'client_order_id must be unique'}
+            order = {
+                'id': str(uuid.uuid4()),
+                'client_order_id': client_order_id,
+                'symbol': body['symbol'],
+                'side': body.get('side', 'buy'),
+                'type': body.get('type', 'market'),
+                'notional': body.get('notional'),
+                'qty': body.get('qty'),
+                'status': 'accepted',
+                'filled_qty': '0',
+                'filled_avg_price': None,
+                '_accepted_at': time.monotonic()
+            }
+            self.orders[order['id']] = order
+            self.by_client_id[client_order_id] = order['id']
+            return 200, self._order_view(order)
+
+    def _get(self, order_id: Optional[str]):
+        with self.lock:
+            order = self.orders.get(order_id or '')
+            if not order:
+                return 404, {'message': 'order not found'}
+            return 200, self._order_view(order)
+
+    def _handler(self):
+        broker = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if broker.latency:
+                    time.sleep(broker.latency)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if urlparse(self.path).path == '/v2/orders':
+                    return self._send(*broker._submit(body))
+                return self._send(404, {'message': 'not found'})
+
+            def do_GET(self):
+                if broker.latency:
+                    time.sleep(broker.latency)
+                url = urlparse(self.path)
+                if url.path == '/v2/orders:by_client_order_id':
+                    client_order_id = parse_qs(url.query).get('client_order_id', [''])[0]
+                    return self._send(*broker._get(broker.by_client_id.get(client_order_id)))
+                if url.path.startswith('/v2/orders/'):
+                    return self._send(*broker._get(url.path.rsplit('/', 1)[-1]))
+                return self._send(404, {'message': 'not found'})
+
+            def _send(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
@@ -0,0 +1,372 @@
+"""
+Concurrent dashboard load generator for the Kamioi backend
+
+Simulates user, family, business and admin dashboard page loads (bursts of
+parallel GETs, like the React dashboards issue on mount) plus a background
+write mix of bank-file uploads, mapping approvals and transaction inserts.
+Reports throughput, latency percentiles and SQLite lock-error rates per
+endpoint so concurrency changes can be measured.
+
+Usage:
+    # Against an already running server seeded with benchmarks.synthetic_data
+    python -m benchmarks.load_test --url http://localhost:5111 --duration 60
+
+    # Generate a dataset, start a local server on it and run the test
+    python -m benchmarks.load_test --spawn --scale smoke --duration 30 --viewers 20 --writers 4
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import requests
+
+from benchmarks.synthetic_data import (
+    ACCOUNT_TYPES, BENCH_ADMIN_ID, BULK_UPLOAD_USER_ID, SCALES, scale_counts, generate_dataset,
+    write_bank_statement_csv
+)
+
+# Page loads per dashboard: every path is requested in parallel, like the frontend does on mount
+DASHBOARDS = {
+    'user': [
+        '/api/user/transactions',
+        '/api/user/portfolio',
+        '/api/user/goals',
+        '/api/user/notifications',
+        '/api/user/roundups/total',
+        '/api/user/fees/total',
+        '/api/user/profile',
+    ],
+    'family': [
+        '/api/family/transactions',
+        '/api/family/portfolio',
+        '/api/family/goals',
+        '/api/family/notifications',
+        '/api/family/members',
+        '/api/family/roundups/total',
+        '/api/family/fees/total',
+    ],
+    'business': [
+        '/api/business/transactions',
+        '/api/business/dashboard/overview',
+        '/api/business/portfolio',
+        '/api/business/goals',
+        '/api/business/notifications',
+        '/api/business/roundups/total',
+        '/api/business/fees/total',
+    ],
+    'admin': [
+        '/api/admin/dashboard/overview',
+        '/api/admin/transactions?page=1&per_page=100',
+        '/api/admin/llm-center/dashboard',
+        '/api/admin/llm-center/mappings?page=1&limit=20',
+        '/api/admin/llm-center/processing-stats',
+        '/api/admin/llm-center/queue',
+    ],
+}
+
+DASHBOARD_WEIGHTS = {'user': 0.55, 'family': 0.2, 'business': 0.15, 'admin': 0.1}
+WRITE_WEIGHTS = {'transaction_insert': 0.6, 'mapping_approval': 0.3, 'bank_upload': 0.1}
+
+LOCK_MARKERS = ('database is locked', 'database table is locked', 'sqlite_busy')
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class LoadStats:
+    """Thread-safe per-endpoint latency and error accounting"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints: Dict[str, Dict[str, Any]] = {}
+        self.page_loads: Dict[str, List[float]] = {}
+
+    def record(self, endpoint: str, duration: float, status: Optional[int], body: str = '', error: str = None):
+        text = (body or error or '').lower()
+        is_lock_error = any(marker in text for marker in LOCK_MARKERS)
+        with self.lock:
+            entry = self.endpoints.setdefault(endpoint, {
+                'latencies': [], 'count': 0, 'errors_5xx': 0, 'errors_4xx': 0,
+                'transport_errors': 0, 'lock_errors': 0
+            })
+            entry['count'] += 1
+            entry['latencies'].append(duration)
+            if error is not None:
+                entry['transport_errors'] += 1
+            elif status >= 500:
+                entry['errors_5xx'] += 1
+            elif status >= 400:
+                entry['errors_4xx'] += 1
+            if is_lock_error:
+                entry['lock_errors'] += 1
+
+    def record_page_load(self, dashboard: str, duration: float):
+        with self.lock:
+            self.page_loads.setdefault(dashboard, []).append(duration)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        with self.lock:
+            endpoints = {}
+            total_requests = 0
+            total_lock_errors = 0
+            for name, entry in self.endpoints.items():
+                ordered = sorted(entry['latencies'])
+                count = entry['count']
+                total_requests += count
+                total_lock_errors += entry['lock_errors']
+                endpoints[name] = {
+                    'count': count,
+                    'throughput_rps': count / elapsed if elapsed else 0.0,
+                    'p50_ms': _percentile(ordered, 50) * 1000,
+                    'p95_ms': _percentile(ordered, 95) * 1000,
+                    'p99_ms': _percentile(ordered, 99) * 1000,
+                    'max_ms': (ordered[-1] if ordered else 0.0) * 1000,
+                    'errors_5xx': entry['errors_5xx'],
+                    'errors_4xx': entry['errors_4xx'],
+                    'transport_errors': entry['transport_errors'],
+                    'lock_errors': entry['lock_errors'],
+                    'lock_error_rate': entry['lock_errors'] / count if count else 0.0,
+                }
+            page_loads = {}
+            for dashboard, samples in self.page_loads.items():
+                ordered = sorted(samples)
+                page_loads[dashboard] = {
+                    'count': len(ordered),
+                    'p50_ms': _percentile(ordered, 50) * 1000,
+                    'p95_ms': _percentile(ordered, 95) * 1000,
+                    'p99_ms': _percentile(ordered, 99) * 1000,
+                }
+        return {
+            'elapsed_seconds': elapsed,
+            'total_requests': total_requests,
+            'throughput_rps': total_requests / elapsed if elapsed else 0.0,
+            'lock_errors': total_lock_errors,
+            'lock_error_rate': total_lock_errors / total_requests if total_requests else 0.0,
+            'page_loads': page_loads,
+            'endpoints': endpoints,
+        }
+
+
+class LoadTest:
+    """Viewer threads replay dashboard page loads; writer threads run the write mix"""
+
+    def __init__(self, base_url: str, user_count: int, mapping_count: int, viewers: int, writers: int,
+                 duration: float, think_time: float, upload_rows: int, seed: int):
+        self.base_url = base_url.rstrip('/')
+        self.viewers = viewers
+        self.writers = writers
+        self.duration = duration
+        self.think_time = think_time
+        self.mapping_count = mapping_count
+        self.stats = LoadStats()
+        self.stop_event = threading.Event()
+        self.seed = seed
+        self.thread_local = threading.local()
+        # Parallel GETs within a page load share one pool, sized like a browser (6 per origin) per viewer
+        self.burst_pool = ThreadPoolExecutor(max_workers=max(6, viewers * 6))
+
+        self.users_by_type: Dict[str, List[int]] = {'individual': [], 'family': [], 'business': []}
+        for user_id in range(1, user_count + 1):
+            if user_id == BULK_UPLOAD_USER_ID:
+                continue
+            self.users_by_type[ACCOUNT_TYPES[user_id % len(ACCOUNT_TYPES)]].append(user_id)
+
+        path = os.path.join(os.getenv('TMPDIR', '/tmp'), f'load_test_bank_{os.getpid()}.csv')
+        write_bank_statement_csv(path, upload_rows, seed=seed)
+        with open(path, 'rb') as f:
+            self.bank_file = f.read()
+        os.remove(path)
+
+    # ------------------------------------------------------------------
+
+    def _session(self) -> requests.Session:
+        session = getattr(self.thread_local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self.thread_local.session = session
+        return session
+
+    def _token_for(self, dashboard: str, rng: random.Random) -> str:
+        if dashboard == 'admin':
+            return f'admin_token_{BENCH_ADMIN_ID}'
+        account_type = {'user': 'individual', 'family': 'family', 'business': 'business'}[dashboard]
+        user_id = rng.choice(self.users_by_type[account_type])
+        return f'{"business_token" if dashboard == "business" else "token"}_{user_id}'
+
+    def _request(self, method: str, endpoint: str, path: str, token: str, **kwargs):
+        headers = {'Authorization': f'Bearer {token}'}
+        start = time.perf_counter()
+        try:
+            response = self._session().request(method, self.base_url + path, headers=headers, timeout=60, **kwargs)
+            duration = time.perf_counter() - start
+            body = response.text[:2000] if response.status_code >= 400 else ''
+            self.stats.record(endpoint, duration, response.status_code, body=body)
+        except requests.RequestException as e:
+            self.stats.record(endpoint, time.perf_counter() - start, None, error=str(e))
+
+    # ------------------------------------------------------------------
+
+    def _viewer(self, index: int):
+        rng = random.Random(self.seed * 1000 + index)
+        dashboards = list(DASHBOARD_WEIGHTS)
+        weights = [DASHBOARD_WEIGHTS[d] for d in dashboards]
+        while not self.stop_event.is_set():
+            dashboard = rng.choices(dashboards, weights)[0]
+            token = self._token_for(dashboard, rng)
+            start = time.perf_counter()
+            futures = [
+                self.burst_pool.submit(self._request, 'GET', f"GET {path.split('?')[0]}", path, token)
+                for path in DASHBOARDS[dashboard]
+            ]
+            for future in futures:
+                future.result()
+            self.stats.record_page_load(dashboard, time.perf_counter() - start)
+            self.stop_event.wait(rng.uniform(0.5, 1.5) * self.think_time)
+
+    def _writer(self, index: int):
+        rng = random.Random(self.seed * 2000 + index)
+        operations = list(WRITE_WEIGHTS)
+        weights = [WRITE_WEIGHTS[o] for o in operations]
+        while not self.stop_event.is_set():
+            operation = rng.choices(operations, weights)[0]
+            if operation == 'transaction_insert':
+                user_id = rng.choice(self.users_by_type['individual'])
+                self._request('POST', 'POST /api/transactions', '/api/transactions', f'token_{user_id}',
+                              json={'user_id': user_id, 'merchant': 'Load Test Coffee',
+                                    'amount': round(rng.uniform(1, 80), 2), 'category': 'Food & Dining',
+                                    'date': datetime.utcnow().strftime('%Y-%m-%d')})
+            elif operation == 'mapping_approval':
+                mapping_id = rng.randrange(1, self.mapping_count + 1)
+                self._request('POST', 'POST /api/admin/mapping/<id>/approve', f'/api/admin/mapping/{mapping_id}/approve',
+                              f'admin_token_{BENCH_ADMIN_ID}', json={})
+            else:
+                user_id = rng.choice(self.users_by_type['business'])
+                files = {'file': ('load_test_statement.csv', self.bank_file, 'text/csv')}
+                self._request('POST', 'POST /api/business/upload-bank-file', '/api/business/upload-bank-file',
+                              f'business_token_{user_id}', files=files)
+            self.stop_event.wait(rng.uniform(0.05, 0.25))
+
+    def run(self) -> Dict[str, Any]:
+        threads = [threading.Thread(target=self._viewer, args=(i,), daemon=True) for i in range(self.viewers)]
+        threads += [threading.Thread(target=self._writer, args=(i,), daemon=True) for i in range(self.writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            self.stop_event.wait(self.duration)
+        except KeyboardInterrupt:
+            pass
+        self.stop_event.set()
+        for thread in threads:
+            thread.join(timeout=65)
+        elapsed = time.perf_counter() - start
+        self.burst_pool.shutdown(wait=True)
+        return self.stats.report(elapsed)
+
+
+def wait_for_server(base_url: str, timeout: float = 60.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f'{base_url}/api/health', timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def spawn_server(db_path: str, port: int) -> subprocess.Popen:
+    """Start the backend on the synthetic database in a child process"""
+    env = dict(os.environ, DB_TYPE='sqlite', KAMIOI_DB_PATH=db_path, PORT=str(port))
+    code = (
+        "import os\n"
+        "from app import app\n"
+        "try:\n"
+        "    from waitress import serve\n"
+        "    serve(app, host='127.0.0.1', port=int(os.environ['PORT']), threads=16)\n"
+        "except ImportError:\n"
+        "    app.run(host='127.0.0.1', port=int(os.environ['PORT']), threaded=True, use_reloader=False)\n"
+    )
+    return subprocess.Popen([sys.executable, '-c', code], cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def print_report(report: Dict[str, Any]):
+    print()
+    print(f"Requests: {report['total_requests']:,} in {report['elapsed_seconds']:.1f}s "
+          f"({report['throughput_rps']:.1f} req/s), lock errors: {report['lock_errors']} "
+          f"({report['lock_error_rate'] * 100:.2f}%)")
+    print()
+    print(f"{'page load':<12} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for dashboard, row in sorted(report['page_loads'].items()):
+        print(f"{dashboard:<12} {row['count']:>7} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+    print()
+    print(f"{'endpoint':<52} {'count':>6} {'rps':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'5xx':>5} {'lock%':>6}")
+    rows = sorted(report['endpoints'].items(), key=lambda item: item[1]['p95_ms'], reverse=True)
+    for name, row in rows:
+        print(f"{name[:52]:<52} {row['count']:>6} {row['throughput_rps']:>6.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['errors_5xx']:>5} {row['lock_error_rate'] * 100:>6.2f}")
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Concurrent dashboard load test for the Kamioi backend')
+    parser.add_argument('--url', default='http://127.0.0.1:5111', help='Base URL of the server under test')
+    parser.add_argument('--spawn', action='store_true', help='Start a local server on a synthetic database')
+    parser.add_argument('--scale', default='smoke', choices=sorted(SCALES), help='Dataset size the server was seeded with')
+    parser.add_argument('--db', help='Synthetic database for --spawn (generated if missing)')
+    parser.add_argument('--port', type=int, default=5199, help='Port for --spawn')
+    parser.add_argument('--viewers', type=int, default=10, help='Concurrent simulated dashboard viewers')
+    parser.add_argument('--writers', type=int, default=2, help='Concurrent background writers')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds')
+    parser.add_argument('--think-time', type=float, default=2.0, help='Mean pause between page loads per viewer')
+    parser.add_argument('--upload-rows', type=int, default=200, help='Rows per uploaded bank statement')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--output', help='Write the JSON report here')
+    args = parser.parse_args()
+
+    users, _transactions, mappings = scale_counts(args.scale)
+    server = None
+    base_url = args.url
+    if args.spawn:
+        db_path = args.db or os.path.join(tempfile.gettempdir(), f'kamioi_bench_{args.scale}.db')
+        if not os.path.exists(db_path):
+            generate_dataset(db_path, *scale_counts(args.scale), seed=args.seed)
+        server = spawn_server(db_path, args.port)
+        base_url = f'http://127.0.0.1:{args.port}'
+
+    try:
+        if not wait_for_server(base_url):
+            print(f"[LOAD] Server at {base_url} did not become healthy")
+            sys.exit(1)
+        print(f"[LOAD] {args.viewers} viewers + {args.writers} writers against {base_url} for {args.duration:.0f}s")
+        test = LoadTest(base_url, users, mappings, args.viewers, args.writers, args.duration,
+                        args.think_time, args.upload_rows, args.seed)
+        report = test.run()
+        report['config'] = vars(args)
+        print_report(report)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\n[LOAD] Report written to {args.output}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
@@ -0,0 +1,95 @@
+"""
+Block-order aggregation benchmark
+
+Compares the old path (one $1 notional order per queued purchase) with the
+order aggregator (one block order per ticker per window) against the fake
+broker, on a throwaway SQLite database.
+
+Usage:
+    python -m benchmarks.order_aggregation --entries 2000 --tickers 25 --latency 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.fake_broker import FakeBroker
+
+TICKERS = ['AAPL', 'AMZN', 'SBUX', 'WMT', 'TGT', 'NFLX', 'MSFT', 'GOOGL', 'DIS', 'NKE', 'MCD', 'KO', 'PEP',
+           'COST', 'HD', 'LOW', 'CVS', 'UBER', 'CMG', 'META', 'TSLA', 'NVDA', 'JPM', 'V', 'MA']
+
+
+def run(entries: int, tickers: int, users: int, latency: float, workers: int, seed: int) -> dict:
+    os.environ['DB_TYPE'] = 'sqlite'
+    from alpaca_service import AlpacaService
+    from database_manager import DatabaseManager
+    from order_aggregator import OrderAggregator
+
+    rng = random.Random(seed)
+    symbols = TICKERS[:max(1, min(tickers, len(TICKERS)))]
+    queue = [(rng.randint(1, users), rng.choice(symbols), 1.00) for _ in range(entries)]
+    results = {'entries': entries, 'tickers': len(symbols), 'broker_latency_seconds': latency}
+
+    with FakeBroker(latency=latency) as broker, tempfile.TemporaryDirectory() as work_dir:
+        service = AlpacaService()
+        service.base_url = broker.url
+
+        # Old path: every queued purchase is its own notional order
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda item: service.buy_fractional_shares(symbol=item[1], dollar_amount=item[2]), queue))
+        elapsed = time.perf_counter() - start
+        results['per_transaction'] = {'orders': broker.submits, 'seconds': round(elapsed, 3),
+                                      'purchases_per_second': round(entries / elapsed, 1)}
+
+        # Aggregated path: one block order per ticker for the whole window
+        db = DatabaseManager(db_path=os.path.join(work_dir, 'aggregation_bench.db'))
+        aggregator = OrderAggregator(broker=service, db=db, poll_interval=0.01)
+        conn = db.get_connection()
+        conn.executemany("INSERT INTO market_queue (user_id, ticker, amount, status) VALUES (?, ?, ?, 'queued')", queue)
+        conn.commit()
+        conn.close()
+
+        submits_before = broker.submits
+        start = time.perf_counter()
+        summary = aggregator.run_window()
+        elapsed = time.perf_counter() - start
+        results['aggregated'] = {'orders': broker.submits - submits_before, 'seconds': round(elapsed, 3),
+                                 'purchases_per_second': round(entries / elapsed, 1), 'window': summary}
+
+        conn = db.get_connection()
+        allocated = conn.execute("SELECT COUNT(*), SUM(amount) FROM market_queue WHERE status = 'filled'").fetchone()
+        conn.close()
+        results['aggregated']['allocated_entries'] = allocated[0]
+        results['aggregated']['allocated_notional'] = str(Decimal(str(allocated[1] or 0)).quantize(Decimal('0.01')))
+
+    results['speedup'] = round(results['per_transaction']['seconds'] / results['aggregated']['seconds'], 1)
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark block-order aggregation against per-transaction orders')
+    parser.add_argument('--entries', type=int, default=2000, help='Queued $1 purchases')
+    parser.add_argument('--tickers', type=int, default=25, help='Distinct tickers in the queue')
+    parser.add_argument('--users', type=int, default=500, help='Distinct users in the queue')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake broker latency per request (seconds)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent submitters for the per-transaction path')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--output', help='Write results JSON here')
+    args = parser.parse_args()
+
+    results = run(args.entries, args.tickers, args.users, args.latency, args.workers, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
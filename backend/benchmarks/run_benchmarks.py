@@ -0,0 +1,257 @@
+"""
+Hot-path benchmark suite for the Kamioi backend
+
+Times the mapping, upload and dashboard hot paths through the Flask test
+client against a deterministic synthetic database, writes results to JSON and
+compares them with a stored baseline.
+
+Usage:
+    python -m benchmarks.run_benchmarks --scale smoke
+    python -m benchmarks.run_benchmarks --scale 1m --db /data/bench_1m.db --reuse-db
+    python -m benchmarks.run_benchmarks --scale 1m --save-baseline
+    python -m benchmarks.run_benchmarks --scale 1m --baseline benchmarks/baselines/1m.json
+
+Exit code is 1 when any case regresses past --tolerance.
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import platform
+import statistics
+import tempfile
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.synthetic_data import (
+    SCALES, BENCH_ADMIN_ID, scale_counts, generate_dataset, first_business_user_id,
+    write_bulk_upload_csv, write_bank_statement_csv
+)
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+class BenchmarkCase:
+    """One timed operation; run() must raise on failure so broken paths never look fast"""
+
+    def __init__(self, name: str, run: Callable[[], Any], repeat: int = 5, warmup: int = 1, setup: Callable = None):
+        self.name = name
+        self.run = run
+        self.repeat = repeat
+        self.warmup = warmup
+        self.setup = setup
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        'runs': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p95': ordered[p95_index],
+        'max': ordered[-1]
+    }
+
+
+def run_case(case: BenchmarkCase) -> Dict[str, Any]:
+    print(f"[BENCH] {case.name} ...", flush=True)
+    for _ in range(case.warmup):
+        if case.setup:
+            case.setup()
+        case.run()
+
+    samples = []
+    for _ in range(case.repeat):
+        if case.setup:
+            case.setup()
+        start = time.perf_counter()
+        case.run()
+        samples.append(time.perf_counter() - start)
+
+    result = _summarize(samples)
+    print(f"[BENCH] {case.name}: median {result['median'] * 1000:.1f}ms, p95 {result['p95'] * 1000:.1f}ms", flush=True)
+    return result
+
+
+def _expect_ok(response, name: str):
+    if response.status_code >= 400:
+        body = response.get_data(as_text=True)[:300]
+        raise RuntimeError(f"{name} returned HTTP {response.status_code}: {body}")
+    return response
+
+
+def build_cases(client, app_module, user_count: int, repeat: int, upload_rows: int, work_dir: str) -> List[BenchmarkCase]:
+    """Benchmark cases for the hot paths named in the performance backlog"""
+    from auto_mapping_pipeline import auto_mapping_pipeline
+
+    admin_headers = {'Authorization': f'Bearer admin_token_{BENCH_ADMIN_ID}'}
+    business_id = first_business_user_id(user_count)
+    business_headers = {'Authorization': f'Bearer business_token_{business_id}'}
+
+    bulk_csv = write_bulk_upload_csv(os.path.join(work_dir, 'bench_bulk_upload.csv'), upload_rows)
+    bank_csv = write_bank_statement_csv(os.path.join(work_dir, 'bench_bank_statement.csv'), min(upload_rows, 2000))
+    with open(bulk_csv, 'rb') as f:
+        bulk_bytes = f.read()
+    with open(bank_csv, 'rb') as f:
+        bank_bytes = f.read()
+
+    merchants = ['STARBUCKS #1234', 'amazon marketplace', 'Uber trip', 'Unknown Corner Store', 'netflix.com']
+
+    def map_merchants():
+        for merchant in merchants * 20:
+            auto_mapping_pipeline.map_merchant(merchant)
+
+    def search_mappings():
+        _expect_ok(client.get('/api/admin/llm-center/mappings', query_string={'search': 'Starbucks', 'limit': 50},
+                              headers=admin_headers), 'search_llm_mappings')
+
+    def bulk_upload():
+        data = {'file': (io.BytesIO(bulk_bytes), 'bench_bulk_upload.csv')}
+        _expect_ok(client.post('/api/admin/bulk-upload', data=data, headers=admin_headers,
+                               content_type='multipart/form-data'), 'admin_bulk_upload')
+
+    def upload_bank_file():
+        data = {'file': (io.BytesIO(bank_bytes), 'bench_bank_statement.csv')}
+        _expect_ok(client.post('/api/business/upload-bank-file', data=data, headers=business_headers,
+                               content_type='multipart/form-data'), 'upload_bank_file')
+
+    def clear_dashboard_cache():
+        with app_module.cache_lock:
+            app_module.llm_dashboard_cache.clear()
+
+    def llm_dashboard():
+        _expect_ok(client.get('/api/admin/llm-center/dashboard', headers=admin_headers), 'admin_llm_dashboard')
+
+    def admin_transactions():
+        _expect_ok(client.get('/api/admin/transactions', query_string={'page': 1, 'per_page': 100},
+                              headers=admin_headers), 'get_all_transactions_for_admin')
+
+    # Uploads mutate the database, so they get fewer repetitions
+    return [
+        BenchmarkCase('map_merchant', map_merchants, repeat=repeat),
+        BenchmarkCase('search_llm_mappings', search_mappings, repeat=repeat),
+        BenchmarkCase('admin_bulk_upload', bulk_upload, repeat=max(1, repeat // 2)),
+        BenchmarkCase('upload_bank_file', upload_bank_file, repeat=max(1, repeat // 2)),
+        BenchmarkCase('admin_llm_dashboard', llm_dashboard, repeat=repeat, setup=clear_dashboard_cache),
+        BenchmarkCase('get_all_transactions_for_admin', admin_transactions, repeat=repeat),
+    ]
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Compare medians; a case regresses when it is slower than baseline * (1 + tolerance)"""
+    comparison = []
+    for name, current in results['cases'].items():
+        previous = baseline.get('cases', {}).get(name)
+        if not previous or 'median' not in current:
+            continue
+        ratio = current['median'] / previous['median'] if previous['median'] else float('inf')
+        comparison.append({
+            'case': name,
+            'baseline_median': previous['median'],
+            'current_median': current['median'],
+            'ratio': ratio,
+            'regressed': ratio > 1 + tolerance
+        })
+    return comparison
+
+
+def run_suite(scale: str, db_path: str, reuse_db: bool, repeat: int, seed: int,
+              upload_rows: int, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    users, transactions, mappings = scale_counts(scale)
+
+    # Must be set before database_manager/app are imported: they bind the global db_manager at import
+    os.environ['DB_TYPE'] = 'sqlite'
+    os.environ['KAMIOI_DB_PATH'] = db_path
+
+    if not (reuse_db and os.path.exists(db_path)):
+        print(f"[BENCH] Generating {scale} dataset at {db_path}", flush=True)
+        start = time.perf_counter()
+        generate_dataset(db_path, users=users, transactions=transactions, mappings=mappings, seed=seed)
+        print(f"[BENCH] Dataset ready in {time.perf_counter() - start:.1f}s", flush=True)
+
+    from importlib import import_module
+    app_module = import_module('app')
+    app = app_module.app
+    app.testing = True
+
+    results = {
+        'scale': scale,
+        'dataset': {'users': users, 'transactions': transactions, 'llm_mappings': mappings, 'seed': seed},
+        'started_at': datetime.utcnow().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor()
+        },
+        'cases': {}
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir, app.test_client() as client:
+        for case in build_cases(client, app_module, users, repeat, upload_rows, work_dir):
+            if only and case.name not in only:
+                continue
+            try:
+                results['cases'][case.name] = run_case(case)
+            except Exception as e:
+                print(f"[BENCH] {case.name} FAILED: {e}", flush=True)
+                results['cases'][case.name] = {'error': str(e)}
+
+    results['finished_at'] = datetime.utcnow().isoformat()
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark Kamioi backend hot paths on synthetic data')
+    parser.add_argument('--scale', default='smoke', choices=sorted(SCALES), help='Dataset size preset')
+    parser.add_argument('--db', help='Synthetic database path (default: temp dir per scale)')
+    parser.add_argument('--reuse-db', action='store_true', help='Reuse --db if it already exists')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('--seed', type=int, default=42, help='Dataset seed')
+    parser.add_argument('--upload-rows', type=int, default=5000, help='Rows in the generated upload files')
+    parser.add_argument('--only', nargs='*', help='Run only these case names')
+    parser.add_argument('--output', help='Results JSON path (default: benchmark_results_<scale>.json)')
+    parser.add_argument('--baseline', help='Baseline JSON to compare against (default: baselines/<scale>.json if present)')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline for the scale')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='Allowed slowdown before flagging a regression')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.gettempdir(), f'kamioi_bench_{args.scale}.db')
+    results = run_suite(args.scale, db_path, args.reuse_db, args.repeat, args.seed, args.upload_rows, args.only)
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f'{args.scale}.json')
+    regressions = []
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        results['baseline'] = baseline_path
+        results['comparison'] = compare_to_baseline(results, baseline, args.tolerance)
+        print()
+        print(f"{'case':<34} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+        for row in results['comparison']:
+            flag = '  REGRESSED' if row['regressed'] else ''
+            print(f"{row['case']:<34} {row['baseline_median'] * 1000:>12.1f} {row['current_median'] * 1000:>12.1f} "
+                  f"{row['ratio']:>7.2f}{flag}")
+        regressions = [row for row in results['comparison'] if row['regressed']]
+
+    output_path = args.output or f'benchmark_results_{args.scale}.json'
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"[BENCH] Results written to {output_path}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path) or '.', exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"[BENCH] Baseline saved to {baseline_path}")
+
+    failed = [name for name, case in results['cases'].items() if 'error' in case]
+    sys.exit(1 if regressions or failed else 0)
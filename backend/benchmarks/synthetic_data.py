@@ -0,0 +1,295 @@
+"""
+Deterministic synthetic dataset generator for benchmarks
+
+Builds users, transactions and llm_mappings at a configurable scale in a
+standalone SQLite file using the production schema from DatabaseManager.
+The same seed always produces byte-identical rows, so timings from different
+runs (and different branches) are comparable.
+
+Usage:
+    python -m benchmarks.synthetic_data --scale 1m --db /tmp/kamioi_bench_1m.db
+"""
+
+import os
+import sys
+import csv
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Preset sizes: (users, transactions, llm_mappings)
+SCALES = {
+    'smoke': (500, 10_000, 10_000),
+    '100k': (2_000, 100_000, 100_000),
+    '1m': (10_000, 1_000_000, 1_000_000),
+    '10m': (100_000, 10_000_000, 10_000_000),
+}
+
+BENCH_ADMIN_ID = 1
+BENCH_ADMIN_EMAIL = 'bench-admin@kamioi.local'
+BULK_UPLOAD_USER_ID = 2  # llm_mappings bulk uploads are stored under user_id 2
+INSERT_CHUNK = 50_000
+
+# (merchant, ticker, company, category)
+MERCHANTS = [
+    ('Starbucks', 'SBUX', 'Starbucks Corporation', 'Food & Dining'),
+    ('Amazon', 'AMZN', 'Amazon.com Inc.', 'Shopping'),
+    ('Apple Store', 'AAPL', 'Apple Inc.', 'Technology'),
+    ('Walmart', 'WMT', 'Walmart Inc.', 'Shopping'),
+    ('Target', 'TGT', 'Target Corporation', 'Shopping'),
+    ('Netflix', 'NFLX', 'Netflix Inc.', 'Entertainment'),
+    ('Uber', 'UBER', 'Uber Technologies', 'Transportation'),
+    ('McDonalds', 'MCD', "McDonald's Corporation", 'Food & Dining'),
+    ('Home Depot', 'HD', 'The Home Depot', 'Home Improvement'),
+    ('Costco', 'COST', 'Costco Wholesale', 'Shopping'),
+    ('Nike', 'NKE', 'Nike Inc.', 'Apparel'),
+    ('Chipotle', 'CMG', 'Chipotle Mexican Grill', 'Food & Dining'),
+    ('Delta', 'DAL', 'Delta Air Lines', 'Airlines'),
+    ('Marriott', 'MAR', 'Marriott International', 'Hotels'),
+    ('Verizon', 'VZ', 'Verizon Communications', 'Communication'),
+    ('Shell', 'SHEL', 'Shell plc', 'Gas'),
+    ('CVS Pharmacy', 'CVS', 'CVS Health', 'Health'),
+    ('Spotify', 'SPOT', 'Spotify Technology', 'Entertainment'),
+    ('Lowes', 'LOW', "Lowe's Companies", 'Home Improvement'),
+    ('Best Buy', 'BBY', 'Best Buy Co.', 'Electronics'),
+]
+
+ACCOUNT_TYPES = ['individual', 'individual', 'individual', 'family', 'business']
+STATUSES = ['mapped', 'mapped', 'pending', 'completed']
+MAPPING_STATUSES = ['approved', 'approved', 'approved', 'pending', 'rejected']
+START_DATE = datetime(2024, 1, 1)
+
+
+def scale_counts(scale: str) -> Tuple[int, int, int]:
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale '{scale}'. Choose from: {', '.join(SCALES)}")
+    return SCALES[scale]
+
+
+def _merchant_variant(rng: random.Random) -> Tuple[str, str, str, str]:
+    merchant, ticker, company, category = MERCHANTS[rng.randrange(len(MERCHANTS))]
+    # Store numbers make the merchant column high-cardinality like real bank data
+    return f"{merchant} #{rng.randrange(1, 5000)}", ticker, company, category
+
+
+def _user_rows(count: int, rng: random.Random) -> Iterator[tuple]:
+    for user_id in range(1, count + 1):
+        account_type = ACCOUNT_TYPES[user_id % len(ACCOUNT_TYPES)]
+        if user_id == BULK_UPLOAD_USER_ID:
+            account_type = 'individual'
+        prefix = {'individual': 'I', 'family': 'F', 'business': 'B'}[account_type]
+        created = START_DATE + timedelta(days=rng.randrange(0, 365))
+        yield (
+            user_id,
+            f'user{user_id}@bench.kamioi.local',
+            f'Bench User {user_id}',
+            account_type,
+            f'{prefix}{user_id:09d}',
+            'bench-password',
+            created.strftime('%Y-%m-%d %H:%M:%S'),
+        )
+
+
+def _transaction_rows(count: int, user_count: int, rng: random.Random) -> Iterator[tuple]:
+    for _ in range(count):
+        merchant, ticker, _company, category = _merchant_variant(rng)
+        amount = round(rng.uniform(1.0, 250.0), 2)
+        round_up = 1.0
+        fee = 0.25
+        status = STATUSES[rng.randrange(len(STATUSES))]
+        when = START_DATE + timedelta(minutes=rng.randrange(0, 60 * 24 * 540))
+        yield (
+            rng.randrange(1, user_count + 1),
+            when.strftime('%Y-%m-%d %H:%M:%S'),
+            merchant,
+            amount,
+            category,
+            f'POS PURCHASE {merchant.upper()}',
+            round_up,
+            round_up,
+            round(amount + round_up + fee, 2),
+            ticker if status != 'pending' else None,
+            status,
+            fee,
+            'bank',
+        )
+
+
+def _mapping_rows(count: int, user_count: int, rng: random.Random) -> Iterator[tuple]:
+    for _ in range(count):
+        merchant, ticker, company, category = _merchant_variant(rng)
+        status = MAPPING_STATUSES[rng.randrange(len(MAPPING_STATUSES))]
+        # Most rows come from admin bulk uploads, like production
+        user_id = BULK_UPLOAD_USER_ID if rng.random() < 0.8 else rng.randrange(1, user_count + 1)
+        when = START_DATE + timedelta(minutes=rng.randrange(0, 60 * 24 * 540))
+        yield (
+            None,
+            merchant,
+            ticker,
+            category,
+            round(rng.uniform(50.0, 99.0), 1),
+            status,
+            1 if status == 'approved' else 0,
+            1,
+            company,
+            str(user_id),
+            when.strftime('%Y-%m-%d %H:%M:%S'),
+        )
+
+
+def _insert_chunked(conn: sqlite3.Connection, sql: str, rows: Iterator[tuple], label: str, total: int):
+    chunk: List[tuple] = []
+    inserted = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK:
+            conn.executemany(sql, chunk)
+            conn.commit()
+            inserted += len(chunk)
+            chunk = []
+            print(f"[SYNTHETIC] {label}: {inserted:,}/{total:,}")
+    if chunk:
+        conn.executemany(sql, chunk)
+        conn.commit()
+        inserted += len(chunk)
+    print(f"[SYNTHETIC] {label}: {inserted:,} rows")
+
+
+def _ensure_auxiliary_tables(conn: sqlite3.Connection):
+    """Tables that production creates through migrations rather than init_database"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            name TEXT,
+            role TEXT DEFAULT 'admin',
+            permissions TEXT DEFAULT '{}',
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_mappings_summary (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            total_mappings INTEGER DEFAULT 0,
+            approved_count INTEGER DEFAULT 0,
+            pending_count INTEGER DEFAULT 0,
+            rejected_count INTEGER DEFAULT 0,
+            daily_processed INTEGER DEFAULT 0,
+            avg_confidence REAL DEFAULT 0,
+            high_confidence_count INTEGER DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO admins (id, email, password, name, role, permissions, is_active)
+        VALUES (?, ?, ?, ?, 'admin', '{}', 1)
+    ''', (BENCH_ADMIN_ID, BENCH_ADMIN_EMAIL, 'bench-password', 'Bench Admin'))
+    conn.commit()
+
+
+def generate_dataset(db_path: str, users: int, transactions: int, mappings: int, seed: int = 42) -> Dict[str, int]:
+    """
+    Create (or replace) a synthetic database at db_path.
+
+    Returns:
+        dict: Row counts per table
+    """
+    from database_manager import DatabaseManager
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    # Production schema and indexes
+    DatabaseManager(db_path=db_path)
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    try:
+        _ensure_auxiliary_tables(conn)
+        _insert_chunked(conn, '''
+            INSERT INTO users (id, email, name, account_type, account_number, password, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', _user_rows(users, rng), 'users', users)
+        _insert_chunked(conn, '''
+            INSERT INTO transactions (user_id, date, merchant, amount, category, description,
+                                      investable, round_up, total_debit, ticker, status, fee, transaction_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _transaction_rows(transactions, users, rng), 'transactions', transactions)
+        _insert_chunked(conn, '''
+            INSERT INTO llm_mappings (transaction_id, merchant_name, ticker, category, confidence, status,
+                                      admin_approved, ai_processed, company_name, user_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _mapping_rows(mappings, users, rng), 'llm_mappings', mappings)
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {'users': users, 'transactions': transactions, 'llm_mappings': mappings}
+
+
+def first_business_user_id(user_count: int) -> int:
+    """Deterministic id of a business account in a generated dataset"""
+    for user_id in range(1, user_count + 1):
+        if user_id != BULK_UPLOAD_USER_ID and ACCOUNT_TYPES[user_id % len(ACCOUNT_TYPES)] == 'business':
+            return user_id
+    raise ValueError('Dataset has no business users')
+
+
+def write_bulk_upload_csv(path: str, rows: int, seed: int = 7) -> str:
+    """Admin bulk-upload file (merchant_name, ticker_symbol, category, confidence)"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['merchant_name', 'ticker_symbol', 'category', 'confidence', 'notes'])
+        for _ in range(rows):
+            merchant, ticker, _company, category = _merchant_variant(rng)
+            writer.writerow([merchant, ticker, category, round(rng.uniform(80.0, 99.0), 1), 'benchmark'])
+    return path
+
+
+def write_bank_statement_csv(path: str, rows: int, seed: int = 11) -> str:
+    """Business bank statement in the same layout as sample_bank_statement.csv"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Description', 'Amount', 'Category', 'Reference'])
+        for i in range(rows):
+            merchant, _ticker, _company, category = _merchant_variant(rng)
+            when = START_DATE + timedelta(days=rng.randrange(0, 365))
+            writer.writerow([when.strftime('%Y-%m-%d'), f'{merchant.upper()} PURCHASE',
+                             f'{rng.uniform(1.0, 500.0):.2f}', category, f'TXN{i:07d}'])
+    return path
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic Kamioi database')
+    parser.add_argument('--scale', default='smoke', choices=sorted(SCALES), help='Preset dataset size')
+    parser.add_argument('--users', type=int, help='Override number of users')
+    parser.add_argument('--transactions', type=int, help='Override number of transactions')
+    parser.add_argument('--mappings', type=int, help='Override number of llm_mappings')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--db', required=True, help='Output SQLite path (replaced if it exists)')
+    args = parser.parse_args()
+
+    users, transactions, mappings = scale_counts(args.scale)
+    counts = generate_dataset(
+        args.db,
+        users=args.users or users,
+        transactions=args.transactions or transactions,
+        mappings=args.mappings or mappings,
+        seed=args.seed
+    )
+    print(f"[SYNTHETIC] Wrote {counts} to {args.db}")
@@ -0,0 +1,116 @@
+"""
+Tier update benchmark
+
+Times TierManagementSystem.process_tier_updates on a synthetic SQLite
+database: the set-based evaluator over every user, and the per-user loop over
+a smaller copy (the loop issues several queries per user, so a full 100k run
+takes too long to repeat).
+
+Usage:
+    python -m benchmarks.tier_updates --users 100000 --loop-users 5000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TIERS = [
+    ('individual', 1, 0, 10, 0.25), ('individual', 2, 11, 25, 0.20), ('individual', 3, 26, 50, 0.15),
+    ('individual', 4, 51, 100, 0.10), ('individual', 5, 101, None, 0.05),
+    ('family', 1, 0, 15, 0.10), ('family', 2, 16, 30, 0.08), ('family', 3, 31, 60, 0.06), ('family', 4, 61, None, 0.04),
+    ('business', 1, 0, 20, 0.10), ('business', 2, 21, 50, 0.08), ('business', 3, 51, 100, 0.06),
+    ('business', 4, 101, None, 0.04)
+]
+
+
+def build_database(path: str, users: int, transactions_per_user: int, seed: int):
+    """DatabaseManager schema plus the tier columns and tables from safe_database_update.py"""
+    from database_manager import DatabaseManager
+
+    rng = random.Random(seed)
+    conn = DatabaseManager(db_path=path).get_connection()
+    for column in ['current_tier INTEGER DEFAULT 1', 'monthly_transaction_count INTEGER DEFAULT 0',
+                   'loyalty_score DECIMAL(3,2) DEFAULT 0.0', 'total_lifetime_transactions INTEGER DEFAULT 0',
+                   'last_tier_check DATE']:
+        conn.execute(f"ALTER TABLE users ADD COLUMN {column}")
+    conn.execute("""
+        CREATE TABLE fee_tiers (id INTEGER PRIMARY KEY AUTOINCREMENT, account_type VARCHAR(20) NOT NULL,
+            tier_level INTEGER NOT NULL, min_transactions INTEGER NOT NULL, max_transactions INTEGER,
+            base_fee DECIMAL(5,2) NOT NULL, fee_type VARCHAR(10) NOT NULL DEFAULT 'fixed', is_active BOOLEAN DEFAULT 1)
+    """)
+    conn.execute("""
+        CREATE TABLE ai_fee_history (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            tier_at_time INTEGER DEFAULT 1, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+    """)
+    conn.executemany("INSERT INTO fee_tiers (account_type, tier_level, min_transactions, max_transactions, base_fee) "
+                     "VALUES (?, ?, ?, ?, ?)", TIERS)
+    conn.executemany("""
+        INSERT INTO users (id, email, name, account_type, current_tier, monthly_transaction_count,
+                           loyalty_score, total_lifetime_transactions)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, ((user_id, f"bench{user_id}@example.com", f"Bench {user_id}", rng.choice(['individual', 'family', 'business']),
+           rng.randint(1, 3), rng.randint(0, 130), round(rng.random(), 2), rng.randint(0, 300))
+          for user_id in range(1, users + 1)))
+    conn.executemany("""
+        INSERT INTO transactions (user_id, date, merchant, amount, round_up, fee, total_debit, created_at)
+        VALUES (?, '2026-10-01', 'Starbucks', ?, ?, ?, 0, ?)
+    """, ((rng.randint(1, users), round(rng.uniform(1, 80), 2), rng.choice([0, 1.0, 2.0]), rng.choice([0.1, 0.25]),
+           f"2026-10-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00")
+          for _ in range(users * transactions_per_user)))
+    conn.commit()
+    conn.close()
+
+
+def time_run(path: str, set_based: bool) -> dict:
+    from tier_management import TierManagementSystem
+
+    start = time.perf_counter()
+    result = TierManagementSystem(path).process_tier_updates(set_based=set_based)
+    elapsed = time.perf_counter() - start
+    if not result['success']:
+        raise RuntimeError(result['error'])
+    return {'users': result['processed_users'], 'tier_changes': len(result['tier_changes']),
+            'seconds': round(elapsed, 3), 'users_per_second': round(result['processed_users'] / elapsed, 1)}
+
+
+def run(users: int, loop_users: int, transactions_per_user: int, seed: int) -> dict:
+    os.environ['DB_TYPE'] = 'sqlite'
+    results = {'users': users, 'transactions_per_user': transactions_per_user}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        full_db = os.path.join(work_dir, 'tiers_full.db')
+        build_database(full_db, users, transactions_per_user, seed)
+        results['set_based'] = time_run(full_db, set_based=True)
+
+        if loop_users:
+            sample_db = os.path.join(work_dir, 'tiers_sample.db')
+            build_database(sample_db, loop_users, transactions_per_user, seed)
+            results['per_user'] = time_run(sample_db, set_based=False)
+            results['speedup'] = round(results['set_based']['users_per_second'] /
+                                       results['per_user']['users_per_second'], 1)
+
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark set-based tier updates against the per-user loop')
+    parser.add_argument('--users', type=int, default=100000, help='Synthetic users for the set-based run')
+    parser.add_argument('--loop-users', type=int, default=5000, help='Users for the per-user run (0 skips it)')
+    parser.add_argument('--transactions-per-user', type=int, default=5, help='Average transactions per user')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--output', help='Write results JSON here')
+    args = parser.parse_args()
+
+    results = run(args.users, args.loop_users, args.transactions_per_user, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
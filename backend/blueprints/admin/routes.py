@@ -9,7 +9,8 @@ Handles admin functionality:
 """
 
 import sys
-from flask import request, jsonify, make_response
+import json
+from flask import request, jsonify, make_response, Response, stream_with_context
 from flask_cors import cross_origin
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -322,22 +323,14 @@ def admin_dashboard_overview():
             db_manager.release_connection(conn)
         else:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT
-                    COUNT(DISTINCT t.id) as totalTransactions,
-                    COALESCE(SUM(t.round_up), 0) as totalRoundUps,
-                    COALESCE(SUM(CASE WHEN t.ticker IS NOT NULL THEN t.shares * COALESCE(t.stock_price, t.price_per_share, 0) ELSE 0 END), 0) as portfolioValue,
-                    COUNT(DISTINCT u.id) as activeUsers,
-                    COUNT(DISTINCT CASE WHEN t.ticker IS NOT NULL THEN t.id END) as mappedTransactions
-                FROM transactions t
-                LEFT JOIN users u ON t.user_id = u.id
-                WHERE t.user_id != 2
-            ''')
-            stats_row = cursor.fetchone()
 
-            # Get total user count
-            cursor.execute('SELECT COUNT(*) FROM users')
-            total_users = cursor.fetchone()[0] or 0
+            # Platform totals come from the incrementally maintained mv_admin_platform view
+            from materialized_views import mv_manager
+            platform = mv_manager.get_platform_overview()
+            stats_row = (platform.get('total_transactions', 0), platform.get('total_roundups', 0),
+                         platform.get('portfolio_value', 0), platform.get('active_users', 0),
+                         platform.get('mapped_transactions', 0))
+            total_users = platform.get('total_users', 0) or 0
 
             # User growth (simplified for SQLite)
             cursor.execute('''
@@ -1002,7 +995,8 @@ def admin_test_error():
             error_message=message,
             endpoint='/api/admin/errors/test',
             http_method='POST',
-            severity=severity
+            severity=severity,
+            wait=True
         )
 
         if error_id:
@@ -1085,3 +1079,385 @@ def admin_db_status():
             'error': str(e),
             'traceback': traceback.format_exc()
         }), 500
+
+
+# =============================================================================
+# Performance Profiling Routes
+# =============================================================================
+
+@admin_bp.route('/perf', methods=['GET'])
+@cross_origin()
+def admin_get_perf_stats():
+    """Get per-route latency percentiles, DB usage and response sizes"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from request_profiler import request_profiler
+
+        sort_by = request.args.get('sort', 'p95')
+        limit = request.args.get('limit', type=int)
+        return jsonify({'success': True, 'data': request_profiler.get_stats(sort_by=sort_by, limit=limit)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/perf/metrics', methods=['GET'])
+def admin_get_perf_metrics():
+    """Expose route metrics in Prometheus text format"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    from request_profiler import request_profiler
+    response = make_response(request_profiler.render_prometheus())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
+@admin_bp.route('/perf/profiles', methods=['GET'])
+@cross_origin()
+def admin_get_perf_profiles():
+    """List captured cProfile samples (send X-Kamioi-Profile on a request to capture one)"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    from request_profiler import request_profiler
+    return jsonify({'success': True, 'data': request_profiler.get_profiles()})
+
+
+@admin_bp.route('/perf/profiles/<profile_id>', methods=['GET'])
+@cross_origin()
+def admin_get_perf_profile(profile_id):
+    """Get the cProfile output for one captured request"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    from request_profiler import request_profiler
+    profile = request_profiler.get_profile(profile_id)
+    if not profile:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+    return jsonify({'success': True, 'data': profile})
+
+
+@admin_bp.route('/perf/reset', methods=['POST'])
+@cross_origin()
+def admin_reset_perf_stats():
+    """Clear aggregated request metrics"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    from request_profiler import request_profiler
+    request_profiler.reset()
+    return jsonify({'success': True, 'message': 'Performance metrics reset'})
+
+
+# =============================================================================
+# Query Instrumentation Routes
+# =============================================================================
+
+@admin_bp.route('/db/queries', methods=['GET'])
+@cross_origin()
+def admin_get_query_stats():
+    """Get the most expensive normalized SQL statements and recent slow queries"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from query_instrumentation import query_monitor
+
+        sort_by = request.args.get('sort', 'total_time')
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({
+            'success': True,
+            'data': {
+                'stats': query_monitor.get_stats(),
+                'statements': query_monitor.get_top_statements(sort_by=sort_by, limit=limit),
+                'slow_queries': query_monitor.get_slow_queries(limit=limit)
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/db/slow-queries', methods=['GET'])
+@cross_origin()
+def admin_get_slow_queries():
+    """Get the slow-query ring buffer with captured query plans"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    from query_instrumentation import query_monitor
+    limit = request.args.get('limit', type=int)
+    return jsonify({'success': True, 'data': query_monitor.get_slow_queries(limit=limit)})
+
+
+@admin_bp.route('/db/queries/reset', methods=['POST'])
+@cross_origin()
+def admin_reset_query_stats():
+    """Clear statement statistics and the slow-query log"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    from query_instrumentation import query_monitor
+    query_monitor.reset()
+    return jsonify({'success': True, 'message': 'Query statistics reset'})
+
+
+# =============================================================================
+# Market Queue Drain Routes
+# =============================================================================
+
+@admin_bp.route('/market-queue/drain', methods=['GET'])
+@cross_origin()
+def admin_get_market_drain_stats():
+    """Get drain scheduler status, queue depth and drain throughput"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from market_drain import market_drain_scheduler
+        return jsonify({'success': True, 'data': market_drain_scheduler.get_stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/market-queue/drain', methods=['POST'])
+@cross_origin()
+def admin_run_market_drain():
+    """Drain market_queue now; outside market hours only with {"force": true}"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from market_drain import market_drain_scheduler
+        data = request.get_json(silent=True) or {}
+        if not market_drain_scheduler.market_clock.is_market_open() and not data.get('force'):
+            return jsonify({'success': False, 'error': 'Market is closed; pass force=true to drain anyway'}), 409
+        report = market_drain_scheduler.drain()
+        return jsonify({'success': True, 'data': report})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# =============================================================================
+# Round-Up Sweep Routes
+# =============================================================================
+
+@admin_bp.route('/roundup/sweep-all', methods=['POST'])
+@cross_origin()
+def admin_sweep_all_roundups():
+    """Start a sweep job for every user over the threshold; {"job_id": ...} resumes an unfinished job"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from roundup_sweep import roundup_sweeper
+        data = request.get_json(silent=True) or {}
+        threshold = data.get('threshold')
+        threshold = float(threshold) if threshold is not None else None
+        if data.get('wait'):
+            return jsonify({'success': True, 'data': roundup_sweeper.run(job_id=data.get('job_id'), threshold=threshold)})
+        job_id = roundup_sweeper.start(job_id=data.get('job_id'), threshold=threshold)
+        return jsonify({'success': True, 'data': {'job_id': job_id}}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/roundup/sweep-jobs', methods=['GET'])
+@cross_origin()
+def admin_list_sweep_jobs():
+    """List recent sweep jobs with their progress"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from roundup_sweep import roundup_sweeper
+        limit = request.args.get('limit', 20, type=int)
+        return jsonify({'success': True, 'data': roundup_sweeper.list_jobs(limit)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/roundup/sweep-jobs/<job_id>', methods=['GET'])
+@cross_origin()
+def admin_get_sweep_job(job_id):
+    """Progress of one sweep job"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from roundup_sweep import roundup_sweeper
+        job = roundup_sweeper.get_job(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Sweep job not found'}), 404
+        return jsonify({'success': True, 'data': job})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# =============================================================================
+# LLM Center Change Feed Routes
+# =============================================================================
+
+def _feed_position(value):
+    """Parse a client's last-seen sequence; anything unusable means 'start from a reset'"""
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+@admin_bp.route('/llm-center/changes', methods=['GET'])
+@cross_origin()
+def admin_llm_center_changes():
+    """Deltas after ?since=<seq>; ?wait=<seconds> long-polls until something changes"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from llm_change_feed import llm_change_feed
+        if not llm_change_feed.available:
+            return jsonify({'success': False, 'error': 'Change feed requires SQLite'}), 501
+        llm_change_feed.start()
+        since = _feed_position(request.args.get('since'))
+        wait = min(request.args.get('wait', 0, type=float), 30)
+        changes = llm_change_feed.wait(since, timeout=wait) if wait > 0 else llm_change_feed.changes_since(since)
+        if changes is None:
+            changes = {'seq': since, 'reset': False, 'deltas': [], 'has_more': False, 'queue_depth': None}
+        return jsonify({'success': True, 'data': changes})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/llm-center/stream', methods=['GET'])
+@cross_origin()
+def admin_llm_center_stream():
+    """
+    Server-sent events for the LLM Center. Each event's id is the feed sequence, so a
+    reconnecting EventSource (Last-Event-ID) or ?since=<seq> only receives what it missed.
+    """
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    from llm_change_feed import llm_change_feed
+    if not llm_change_feed.available:
+        return jsonify({'success': False, 'error': 'Change feed requires SQLite'}), 501
+    llm_change_feed.start()
+    since = _feed_position(request.headers.get('Last-Event-ID') or request.args.get('since'))
+
+    def generate(position):
+        yield 'retry: 3000\n\n'
+        while True:
+            changes = llm_change_feed.wait(position, timeout=15)
+            if changes is None:
+                yield ': keep-alive\n\n'
+                continue
+            position = changes['seq']
+            event = 'reset' if changes['reset'] else 'deltas'
+            yield f"id: {position}\nevent: {event}\ndata: {json.dumps(changes)}\n\n"
+
+    return Response(stream_with_context(generate(since)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@admin_bp.route('/llm-center/changes/stats', methods=['GET'])
+@cross_origin()
+def admin_llm_center_feed_stats():
+    """Change feed position, buffer and replay counters"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from llm_change_feed import llm_change_feed
+        return jsonify({'success': True, 'data': llm_change_feed.get_feed_stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# =============================================================================
+# Audit Log Routes
+# =============================================================================
+
+@admin_bp.route('/audit/logs', methods=['GET'])
+@cross_origin()
+def admin_audit_logs():
+    """Query the audit log (newest first) by event type, user, user type, resource and time"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from audit_logging import audit_logger, AuditEventType
+        event_type = request.args.get('event_type')
+        try:
+            event_type = AuditEventType(event_type) if event_type else None
+        except ValueError:
+            return jsonify({'success': False, 'error': f'Invalid event type: {event_type}'}), 400
+        logs = audit_logger.get_logs(
+            event_type=event_type,
+            user_id=request.args.get('user_id'),
+            user_type=request.args.get('user_type'),
+            resource=request.args.get('resource'),
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date'),
+            limit=min(request.args.get('limit', 1000, type=int), 5000)
+        )
+        return jsonify({'success': True, 'data': {'logs': [log.to_dict() for log in logs], 'count': len(logs)}})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/audit/verify', methods=['GET'])
+@cross_origin()
+def admin_audit_verify():
+    """Verify the audit hash chain over ?start_seq/&end_seq or ?start_date/&end_date (default: everything)"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        from audit_logging import audit_logger
+        report = audit_logger.verify_integrity(
+            start_seq=request.args.get('start_seq', type=int),
+            end_seq=request.args.get('end_seq', type=int),
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date')
+        )
+        return jsonify({'success': True, 'data': report})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/audit/export', methods=['GET'])
+@cross_origin()
+def admin_audit_export():
+    """Stream the audit log as JSON or CSV"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    from audit_logging import audit_logger
+    format_type = request.args.get('format', 'json')
+    if format_type not in ('json', 'csv'):
+        return jsonify({'success': False, 'error': 'Format must be json or csv'}), 400
+    chunks = audit_logger.export_logs(format_type, start_date=request.args.get('start_date'),
+                                      end_date=request.args.get('end_date'))
+    mimetype = 'application/json' if format_type == 'json' else 'text/csv'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=audit_log.{format_type}'})
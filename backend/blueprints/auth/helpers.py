@@ -89,8 +89,22 @@ def get_auth_user():
         if not auth.startswith('Bearer '):
             return None
 
-        token = auth.split(' ', 1)[1].strip()
+        return get_auth_user_from_token(auth.split(' ', 1)[1].strip())
+
+    except Exception:
+        return None
+
+
+def get_auth_user_from_token(token):
+    """
+    Get authenticated user dict from a token string (without request context),
+    e.g. for WebSocket connections.
 
+    Returns:
+        dict or None: User data dict with id, email, name, role, dashboard,
+                      or None if not authenticated
+    """
+    try:
         # Handle null/undefined tokens
         if not token or token in ('null', 'undefined', '', 'none', 'None'):
             return None
@@ -100,7 +114,7 @@ def get_auth_user():
             return _get_admin_from_token(token)
 
         # Handle regular user tokens
-        user_id = parse_bearer_token_user_id()
+        user_id = get_user_id_from_token(token)
         if not user_id:
             # Try to extract any number from token as fallback
             numbers = re.findall(r'\d+', token)
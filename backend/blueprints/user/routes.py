@@ -9,6 +9,7 @@ Handles user dashboard endpoints:
 - GET  /api/user/notifications
 - GET  /api/user/roundups/total
 - GET  /api/user/fees/total
+- GET  /api/user/dashboard/summary
 - GET  /api/user/profile
 - PUT  /api/user/profile
 """
@@ -396,11 +397,11 @@ def get_fees_total():
         return unauthorized_response()
 
     try:
-        conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
 
         if use_postgresql:
             from sqlalchemy import text
+            conn = db_manager.get_connection()
             result = conn.execute(
                 text("SELECT COALESCE(SUM(fee), 0) as total_fees FROM transactions WHERE user_id = :user_id"),
                 {'user_id': user['id']}
@@ -408,10 +409,8 @@ def get_fees_total():
             total_fees = result.fetchone()[0]
             db_manager.release_connection(conn)
         else:
-            cur = conn.cursor()
-            cur.execute("SELECT COALESCE(SUM(fee), 0) as total_fees FROM transactions WHERE user_id = ?", (user['id'],))
-            total_fees = cur.fetchone()[0]
-            conn.close()
+            from materialized_views import mv_manager
+            total_fees = mv_manager.get_user_dashboard(user['id'])['kpis']['total_fees']
 
         return success_response(data={'total_fees': float(total_fees or 0)})
 
@@ -419,6 +418,22 @@ def get_fees_total():
         return success_response(data={'total_fees': 0})
 
 
+@user_bp.route('/dashboard/summary', methods=['GET'])
+def get_dashboard_summary():
+    """Get user's dashboard KPIs, category breakdown and top merchants from the materialized views."""
+    user = get_auth_user()
+    if not user:
+        return unauthorized_response()
+
+    try:
+        from materialized_views import mv_manager
+        if not mv_manager.available:
+            return error_response('Dashboard summary is not available on this database', 501)
+        return success_response(data=mv_manager.get_user_dashboard(user['id']))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
 # =============================================================================
 # PROFILE
 # =============================================================================
@@ -19,6 +19,47 @@ except ImportError:
     POSTGRESQL_SUPPORT = False
     DatabaseConfig = None
 
+from query_instrumentation import instrument_sqlite_connection, instrument_sqlalchemy_engine
+
+# Append-only, hash-chained audit log (see audit_logging.py, which also uses it for its in-memory store)
+AUDIT_LOG_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS audit_log (
+        seq INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        timestamp TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        user_id TEXT,
+        user_type TEXT,
+        action TEXT,
+        resource TEXT,
+        resource_id TEXT,
+        before_state TEXT,
+        after_state TEXT,
+        ip_address TEXT,
+        user_agent TEXT,
+        session_id TEXT,
+        correlation_id TEXT,
+        success INTEGER,
+        error_message TEXT,
+        metadata TEXT,
+        prev_hash TEXT NOT NULL,
+        hash TEXT NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_audit_log_user_time ON audit_log(user_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_audit_log_event_time ON audit_log(event_type, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_audit_log_user_type_time ON audit_log(user_type, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_audit_log_time ON audit_log(timestamp)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_log_append_only BEFORE UPDATE ON audit_log
+    BEGIN
+        SELECT RAISE(ABORT, 'audit_log is append-only');
+    END
+    '''
+]
+
+
 class DatabaseManager:
     def __init__(self, db_path: str = None):
         # Check if PostgreSQL is configured
@@ -45,15 +86,18 @@ class DatabaseManager:
                 )
                 self._postgres_session_factory = sessionmaker(bind=self._postgres_engine)
                 self._use_postgresql = True
+                instrument_sqlalchemy_engine(self._postgres_engine)
                 print(f"[DATABASE] Using PostgreSQL: {DatabaseConfig.POSTGRES_HOST}:{DatabaseConfig.POSTGRES_PORT}/{DatabaseConfig.POSTGRES_DB}")
             except Exception as e:
                 print(f"[WARNING] Failed to connect to PostgreSQL: {e}")
                 print("[DATABASE] Falling back to SQLite")
                 self._use_postgresql = False
         
+        if db_path is None:
+            db_path = os.getenv('KAMIOI_DB_PATH')
+        
         if db_path is None:
             # Use absolute path to ensure database is found
-            import os
             current_dir = os.path.dirname(os.path.abspath(__file__))
             self.db_path = os.path.join(current_dir, "kamioi.db")
         else:
@@ -205,7 +249,40 @@ class DatabaseManager:
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
-        
+
+        # Block orders: one broker order per ticker per aggregation window (see order_aggregator.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS block_orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ticker TEXT NOT NULL,
+                notional TEXT NOT NULL,
+                entry_count INTEGER NOT NULL,
+                client_order_id TEXT UNIQUE,
+                broker_order_id TEXT,
+                status TEXT DEFAULT 'pending',
+                filled_qty TEXT,
+                filled_avg_price TEXT,
+                filled_notional TEXT,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                submitted_at TIMESTAMP,
+                filled_at TIMESTAMP
+            )
+        ''')
+
+        # Lease and idempotency columns used by the market-open drain (see market_drain.py)
+        for column in ('block_order_id INTEGER', 'shares REAL', 'fill_price REAL', 'lease_owner TEXT',
+                       'lease_expires_at REAL', 'idempotency_key TEXT', 'attempts INTEGER DEFAULT 0'):
+            try:
+                cursor.execute(f'ALTER TABLE market_queue ADD COLUMN {column}')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_queue_status_ticker ON market_queue(status, ticker)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_queue_block_order ON market_queue(block_order_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_queue_lease ON market_queue(status, lease_expires_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_block_orders_status ON block_orders(status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_portfolios_user_ticker ON portfolios(user_id, ticker)')
+
         # LLM Mappings table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS llm_mappings (
@@ -239,6 +316,11 @@ class DatabaseManager:
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_mappings_user_id ON llm_mappings(user_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_mappings_status ON llm_mappings(status)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_mappings_created_at ON llm_mappings(created_at)')
+        # Keyset walk over approved mappings for training exports (see llm_training.py)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_llm_mappings_approved_id ON llm_mappings(id)
+            WHERE status = 'approved' AND admin_approved = 1
+        ''')
         
         # System Events table
         cursor.execute('''
@@ -269,7 +351,120 @@ class DatabaseManager:
                 FOREIGN KEY (transaction_id) REFERENCES transactions (id)
             )
         ''')
-        
+
+        # Columns and counters used by the persistent round-up ledger (see roundup_engine.py)
+        for column in ('original_amount REAL', 'total_debit REAL', 'sweep_batch_id TEXT'):
+            try:
+                cursor.execute(f'ALTER TABLE roundup_ledger ADD COLUMN {column}')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS roundup_pending_totals (
+                user_id TEXT PRIMARY KEY,
+                pending_cents INTEGER NOT NULL DEFAULT 0,
+                pending_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_roundup_ledger_user_status ON roundup_ledger(user_id, status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_roundup_ledger_status_created ON roundup_ledger(status, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_roundup_ledger_sweep_batch ON roundup_ledger(sweep_batch_id)')
+
+        # Durable event delivery for the event bus outbox (see event_bus.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_outbox (
+                id TEXT PRIMARY KEY,
+                event_type TEXT NOT NULL,
+                tenant_id TEXT,
+                tenant_type TEXT,
+                data TEXT,
+                timestamp TEXT,
+                correlation_id TEXT,
+                source TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                created_at TIMESTAMP,
+                delivered_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_outbox_status_created ON event_outbox(status, created_at)')
+
+        # Platform-wide sweep jobs with their progress (see roundup_sweep.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS roundup_sweep_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT DEFAULT 'running',
+                threshold REAL,
+                users_total INTEGER DEFAULT 0,
+                users_swept INTEGER DEFAULT 0,
+                entries_swept INTEGER DEFAULT 0,
+                total_swept REAL DEFAULT 0,
+                batches INTEGER DEFAULT 0,
+                queued_orders INTEGER DEFAULT 0,
+                ticker_totals TEXT,
+                error TEXT,
+                started_at TIMESTAMP,
+                updated_at TIMESTAMP,
+                completed_at TIMESTAMP
+            )
+        ''')
+
+        # Append-only, hash-chained audit log (see audit_logging.py)
+        for statement in AUDIT_LOG_SCHEMA:
+            cursor.execute(statement)
+
+        # System errors written by the buffered error sink (see services/error_tracking_service.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS system_errors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                error_type TEXT NOT NULL,
+                error_message TEXT NOT NULL,
+                error_stack TEXT,
+                endpoint TEXT,
+                http_method TEXT,
+                user_id INTEGER,
+                admin_id INTEGER,
+                request_data TEXT,
+                severity TEXT DEFAULT 'error',
+                is_resolved INTEGER DEFAULT 0,
+                resolved_at TEXT,
+                resolved_by INTEGER,
+                resolution_notes TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        for column in ('fingerprint TEXT', 'occurrences INTEGER DEFAULT 1', 'last_seen_at TEXT'):
+            try:
+                cursor.execute(f'ALTER TABLE system_errors ADD COLUMN {column}')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_system_errors_created ON system_errors(created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_system_errors_fingerprint ON system_errors(fingerprint)')
+
+        # Hourly error counters behind get_error_stats
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS error_stats_hourly (
+                hour TEXT NOT NULL,
+                error_type TEXT NOT NULL,
+                severity TEXT NOT NULL DEFAULT '',
+                errors INTEGER NOT NULL DEFAULT 0,
+                occurrences INTEGER NOT NULL DEFAULT 0,
+                unresolved INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour, error_type, severity)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS error_stats_totals (
+                error_type TEXT NOT NULL,
+                severity TEXT NOT NULL DEFAULT '',
+                errors INTEGER NOT NULL DEFAULT 0,
+                occurrences INTEGER NOT NULL DEFAULT 0,
+                unresolved INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (error_type, severity)
+            )
+        ''')
+
         # Advertisements table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS advertisements (
@@ -411,6 +606,20 @@ class DatabaseManager:
             )
         ''')
         
+        # One row per subscription per recognized day; the key makes re-runs no-ops
+        # (see services/subscription_accounting_service.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subscription_revenue_recognition (
+                subscription_id INTEGER NOT NULL,
+                recognition_date DATE NOT NULL,
+                journal_entry_id TEXT NOT NULL,
+                amount REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (subscription_id, recognition_date),
+                FOREIGN KEY (subscription_id) REFERENCES user_subscriptions (id)
+            )
+        ''')
+
         # Subscription Analytics table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS subscription_analytics (
@@ -530,7 +739,8 @@ class DatabaseManager:
             conn.execute('PRAGMA temp_store=MEMORY')
             # Enable UTF-8 support
             conn.execute('PRAGMA encoding="UTF-8"')
-            return conn
+            # Time statements and capture slow-query plans
+            return instrument_sqlite_connection(conn)
         except Exception as e:
             raise e
     
@@ -1028,7 +1238,7 @@ class DatabaseManager:
     
     def add_llm_mapping(self, transaction_id, merchant_name, ticker, category, confidence, status, admin_approved=False, ai_processed=False, company_name=None, user_id=None):
         """Add a new LLM mapping to the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = instrument_sqlite_connection(sqlite3.connect(self.db_path))
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1060,7 +1270,7 @@ class DatabaseManager:
             return 0
         
         try:
-            conn = sqlite3.connect(self.db_path, timeout=60)
+            conn = instrument_sqlite_connection(sqlite3.connect(self.db_path, timeout=60))
             cursor = conn.cursor()
             
             # Optimize database for bulk inserts
@@ -1107,7 +1317,7 @@ class DatabaseManager:
     
     def get_llm_mappings(self, user_id=None, status=None):
         """Get LLM mappings from the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = instrument_sqlite_connection(sqlite3.connect(self.db_path))
         cursor = conn.cursor()
         
         query = 'SELECT * FROM llm_mappings WHERE 1=1'
@@ -1138,7 +1348,7 @@ class DatabaseManager:
     
     def get_llm_mappings_paginated(self, user_id=None, status=None, limit=20, offset=0, exclude_bulk_uploads=False):
         """Get LLM mappings with pagination, including user information"""
-        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn = instrument_sqlite_connection(sqlite3.connect(self.db_path, timeout=30))
         conn.execute('PRAGMA journal_mode=WAL')
         cursor = conn.cursor()
         
@@ -1208,7 +1418,7 @@ class DatabaseManager:
     
     def get_llm_mappings_count(self, user_id=None, status=None, search=None, exclude_bulk_uploads=False):
         """Get total count of LLM mappings"""
-        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn = instrument_sqlite_connection(sqlite3.connect(self.db_path, timeout=30))
         conn.execute('PRAGMA journal_mode=WAL')
         cursor = conn.cursor()
         
@@ -1249,7 +1459,7 @@ class DatabaseManager:
     
     def search_llm_mappings(self, search_term, limit=50):
         """Search LLM mappings by merchant name, ticker, or category, including user information"""
-        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn = instrument_sqlite_connection(sqlite3.connect(self.db_path, timeout=30))
         conn.execute('PRAGMA journal_mode=WAL')
         cursor = conn.cursor()
         
@@ -1325,7 +1535,7 @@ class DatabaseManager:
                 self.release_connection(conn)
                 raise e
         else:
-            conn = sqlite3.connect(self.db_path)
+            conn = instrument_sqlite_connection(sqlite3.connect(self.db_path))
             cursor = conn.cursor()
             
             if admin_approved is not None:
@@ -1348,7 +1558,7 @@ class DatabaseManager:
     
     def get_mapping_by_transaction_id(self, transaction_id):
         """Get mapping details by transaction ID"""
-        conn = sqlite3.connect(self.db_path)
+        conn = instrument_sqlite_connection(sqlite3.connect(self.db_path))
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1375,7 +1585,7 @@ class DatabaseManager:
     
     def remove_llm_mapping(self, mapping_id):
         """Remove an LLM mapping by ID"""
-        conn = sqlite3.connect(self.db_path)
+        conn = instrument_sqlite_connection(sqlite3.connect(self.db_path))
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM llm_mappings WHERE id = ?', (mapping_id,))
@@ -1386,7 +1596,7 @@ class DatabaseManager:
     
     def get_user_active_ad(self, user_id):
         """Get active advertisement for a user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = instrument_sqlite_connection(sqlite3.connect(self.db_path))
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1525,6 +1735,8 @@ class DatabaseManager:
 
             # Delete roundup ledger
             cursor.execute(f"DELETE FROM roundup_ledger WHERE user_id = {placeholder}", (user_id,))
+            if not self._use_postgresql:
+                cursor.execute("DELETE FROM roundup_pending_totals WHERE user_id = ?", (str(user_id),))
 
             # Delete market queue
             cursor.execute(f"DELETE FROM market_queue WHERE user_id = {placeholder}", (user_id,))
@@ -1,11 +1,17 @@
 """
 Event Bus System for Kamioi Platform
-Handles event-driven architecture with typed events and materialized view updates
+Handles event-driven architecture with typed events and materialized view updates.
+Each event type has its own bounded queue and worker pool; an optional SQLite
+outbox makes delivery durable across restarts.
 """
 
+import os
 import json
+import time
+import uuid
 import asyncio
-from datetime import datetime
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Callable, Any
 from dataclasses import dataclass, asdict
 from enum import Enum
@@ -60,69 +66,407 @@ class Event:
     source: str = "system"
     version: str = "1.0"
 
+class SubscriberStats:
+    """Latency and error counters for one subscriber callback"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent_ms = deque(maxlen=200)
+
+    def record(self, elapsed_ms: float, failed: bool):
+        self.calls += 1
+        self.errors += 1 if failed else 0
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.recent_ms.append(elapsed_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent_ms)
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 3) if recent else 0.0,
+            'max_ms': round(self.max_ms, 3)
+        }
+
+
+class EventTypeWorkers:
+    """Bounded queue plus worker threads for a single event type, so slow handlers only stall their own type"""
+
+    def __init__(self, bus: 'EventBus', event_type: EventType, workers: int, max_queue_size: int):
+        self.bus = bus
+        self.event_type = event_type
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.threads: List[threading.Thread] = []
+        self.published = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0  # Dropped because the queue stayed full (no outbox)
+        self.deferred = 0  # Left in the outbox because the queue was full
+        self.blocked = 0  # Publishes that had to wait for queue space
+        self.blocked_seconds = 0.0
+        self.high_water = 0
+
+    def start(self):
+        self.threads = [t for t in self.threads if t.is_alive()]
+        for index in range(len(self.threads), self.workers):
+            thread = threading.Thread(target=self._worker_loop, daemon=True,
+                                      name=f"event-bus-{self.event_type.value}-{index}")
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join(timeout=10)
+        self.threads = []
+
+    def put(self, event: Event, timeout: float) -> bool:
+        """Enqueue with backpressure: wait up to timeout for space, then give up"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.blocked += 1
+            start = time.perf_counter()
+            try:
+                self.queue.put(event, timeout=timeout)
+            except queue.Full:
+                return False
+            finally:
+                self.blocked_seconds += time.perf_counter() - start
+        self.high_water = max(self.high_water, self.queue.qsize())
+        return True
+
+    def _worker_loop(self):
+        while True:
+            event = self.queue.get()
+            try:
+                if event is None:
+                    return
+                if self.bus._process_event(event):
+                    self.processed += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error processing event: {e}")
+            finally:
+                self.queue.task_done()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'high_water': self.high_water,
+            'published': self.published,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'deferred': self.deferred,
+            'blocked_publishes': self.blocked,
+            'blocked_seconds': round(self.blocked_seconds, 3)
+        }
+
+
+@dataclass
+class BatchPolicy:
+    window: float = 0.25  # Seconds to hold the first buffered event
+    max_events: int = 500  # Flush early once this many are buffered
+    coalesce: bool = False  # Keep only the latest event per coalesce key (idempotent "refresh" events)
+    key: Optional[Callable[[Event], Any]] = None  # Coalesce key within a tenant; None means one per tenant
+
+
+class EventBatcher:
+    """
+    Buffers events per (type, tenant) for a short window and hands them to the
+    bus as one batch event, or as the latest event per key when coalescing
+    """
+
+    def __init__(self, bus: 'EventBus'):
+        self.bus = bus
+        self.buffers: Dict[tuple, Any] = {}
+        self.deadlines: Dict[tuple, float] = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.stats = {'buffered': 0, 'batches': 0, 'batched_events': 0, 'coalesced': 0}
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._flush_loop, name='event-bus-batcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=10)
+            self.thread = None
+        self.flush_all()
+
+    def add(self, event: Event, policy: BatchPolicy):
+        buffer_key = (event.type, event.tenant_id)
+        full = None
+        with self.condition:
+            self.stats['buffered'] += 1
+            if policy.coalesce:
+                buffer = self.buffers.setdefault(buffer_key, OrderedDict())
+                coalesce_key = policy.key(event) if policy.key else None
+                if coalesce_key in buffer:
+                    self.stats['coalesced'] += 1
+                    buffer.move_to_end(coalesce_key)
+                buffer[coalesce_key] = event
+            else:
+                buffer = self.buffers.setdefault(buffer_key, [])
+                buffer.append(event)
+
+            if len(buffer) >= policy.max_events:
+                full = self._take(buffer_key)
+            elif buffer_key not in self.deadlines:
+                self.deadlines[buffer_key] = time.monotonic() + policy.window
+                self.condition.notify()
+        if full:
+            self._emit(*full)
+
+    def _take(self, buffer_key: tuple):
+        """Remove a buffer (caller holds the lock)"""
+        self.deadlines.pop(buffer_key, None)
+        buffer = self.buffers.pop(buffer_key, None)
+        if not buffer:
+            return None
+        events = list(buffer.values()) if isinstance(buffer, OrderedDict) else buffer
+        return buffer_key, events, isinstance(buffer, OrderedDict)
+
+    def _emit(self, buffer_key: tuple, events: List[Event], coalesced: bool):
+        if coalesced or len(events) == 1:
+            for event in events:
+                self.bus._dispatch(event)
+            return
+
+        first = events[0]
+        self.stats['batches'] += 1
+        self.stats['batched_events'] += len(events)
+        self.bus._dispatch(Event(
+            id=f"batch_{int(datetime.utcnow().timestamp() * 1000)}_{uuid.uuid4().hex[:8]}",
+            type=first.type,
+            tenant_id=first.tenant_id,
+            tenant_type=first.tenant_type,
+            data={'batch': True, 'count': len(events), 'events': [
+                {'id': e.id, 'data': e.data, 'timestamp': e.timestamp,
+                 'correlation_id': e.correlation_id, 'source': e.source} for e in events
+            ]},
+            timestamp=first.timestamp,
+            correlation_id=first.correlation_id,
+            source='event_batcher'
+        ))
+
+    def flush_all(self) -> int:
+        with self.condition:
+            taken = [self._take(buffer_key) for buffer_key in list(self.buffers)]
+        for item in taken:
+            if item:
+                self._emit(*item)
+        return len([item for item in taken if item])
+
+    def _flush_loop(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                now = time.monotonic()
+                due = [key for key, deadline in self.deadlines.items() if deadline <= now]
+                taken = [self._take(key) for key in due]
+                if not taken:
+                    next_deadline = min(self.deadlines.values(), default=None)
+                    self.condition.wait(None if next_deadline is None else max(0.0, next_deadline - now))
+                    continue
+            for item in taken:
+                if item:
+                    self._emit(*item)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.condition:
+            pending = sum(len(buffer) for buffer in self.buffers.values())
+        return dict(self.stats, pending=pending)
+
+
 class EventBus:
-    def __init__(self):
+    # High-volume types get extra workers; everything else keeps strict per-type ordering on one worker
+    DEFAULT_WORKERS = {
+        EventType.INGEST_RAW: 2,
+        EventType.ROUNDUP_ACCRUED: 2,
+    }
+
+    # A statement upload publishes one ROUNDUP_ACCRUED/INGEST_RAW per row; deliver them as batches,
+    # and collapse repeated "refresh" events into one per tenant
+    DEFAULT_BATCHING = {
+        EventType.INGEST_RAW: BatchPolicy(window=0.25, max_events=500),
+        EventType.ROUNDUP_ACCRUED: BatchPolicy(window=0.25, max_events=500),
+        EventType.ANALYTICS_READY: BatchPolicy(window=1.0, max_events=1000, coalesce=True),
+        EventType.ANALYTICS_UPDATED: BatchPolicy(window=1.0, max_events=1000, coalesce=True),
+    }
+
+    def __init__(self, max_queue_size: int = None, publish_timeout: float = None,
+                 workers_per_type: Dict[EventType, int] = None, max_history: int = 10000,
+                 batching: Dict[EventType, BatchPolicy] = None):
         self.subscribers: Dict[EventType, List[Callable]] = {}
-        self.event_queue = queue.Queue()
+        self.batch_subscribers = set()  # (event_type, callback) pairs that take whole batches
+        self.batch_policies = dict(self.DEFAULT_BATCHING if batching is None else batching)
+        self.batcher = EventBatcher(self)
+        self.max_queue_size = max_queue_size or int(os.getenv('KAMIOI_EVENT_QUEUE_SIZE', '10000'))
+        self.publish_timeout = publish_timeout if publish_timeout is not None else \
+            float(os.getenv('KAMIOI_EVENT_PUBLISH_TIMEOUT', '0.5'))
+        self.workers_per_type = {**self.DEFAULT_WORKERS, **(workers_per_type or {})}
+        self.pools: Dict[EventType, EventTypeWorkers] = {}
         self.running = False
-        self.worker_thread = None
-        self.event_history: List[Event] = []
-        self.max_history = 10000  # Keep last 10k events
-        
+        self.max_history = max_history  # Keep last 10k events
+        self.event_history = deque(maxlen=max_history)
+        self.subscriber_stats: Dict[tuple, SubscriberStats] = {}
+        self.stats_lock = threading.Lock()
+        self.pool_lock = threading.Lock()
+
+        # Optional durable delivery through the event_outbox table
+        self.outbox_db = None
+        self.outbox_replay_interval = 5.0
+        self._outbox_inflight = set()
+        self._outbox_thread = None
+        self._outbox_wake = threading.Event()
+
     def start(self):
-        """Start the event bus worker thread"""
+        """Start the event bus worker pools"""
         if not self.running:
             self.running = True
-            self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
-            self.worker_thread.start()
+            with self.pool_lock:
+                for pool in self.pools.values():
+                    pool.start()
+            if self.outbox_db is not None:
+                self._start_outbox_replay()
+            self.batcher.start()
             print("Event Bus started")
-    
+
     def stop(self):
-        """Stop the event bus worker thread"""
+        """Stop the event bus worker pools"""
+        self.batcher.stop()
         self.running = False
-        if self.worker_thread:
-            self.worker_thread.join()
+        self._outbox_wake.set()
+        with self.pool_lock:
+            pools = list(self.pools.values())
+        for pool in pools:
+            pool.stop()
+        if self._outbox_thread:
+            self._outbox_thread.join(timeout=10)
+            self._outbox_thread = None
         print("Event Bus stopped")
-    
-    def _worker_loop(self):
-        """Main worker loop for processing events"""
-        while self.running:
-            try:
-                # Get event from queue with timeout
-                event = self.event_queue.get(timeout=1.0)
-                self._process_event(event)
-                self.event_queue.task_done()
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"Error processing event: {e}")
-    
-    def _process_event(self, event: Event):
-        """Process a single event"""
+
+    def set_workers(self, event_type: EventType, workers: int):
+        """Resize the worker pool for one event type"""
+        self.workers_per_type[event_type] = workers
+        with self.pool_lock:
+            pool = self.pools.get(event_type)
+            if pool:
+                if workers < pool.workers:
+                    pool.stop()
+                pool.workers = workers
+                if self.running:
+                    pool.start()
+
+    def _pool(self, event_type: EventType) -> EventTypeWorkers:
+        pool = self.pools.get(event_type)
+        if pool is None:
+            with self.pool_lock:
+                pool = self.pools.get(event_type)
+                if pool is None:
+                    pool = EventTypeWorkers(self, event_type, self.workers_per_type.get(event_type, 1),
+                                            self.max_queue_size)
+                    if self.running:
+                        pool.start()
+                    self.pools[event_type] = pool
+        return pool
+
+    def _process_event(self, event: Event) -> bool:
+        """Process a single (or batch) event; returns False if any subscriber raised"""
+        ok = True
         try:
+            events = self._unbatch(event)
+
             # Add to history
-            self.event_history.append(event)
-            if len(self.event_history) > self.max_history:
-                self.event_history.pop(0)
-            
-            # Notify subscribers
-            subscribers = self.subscribers.get(event.type, [])
+            self.event_history.extend(events)
+
+            # Notify subscribers: batch subscribers once per batch, the rest once per event
+            subscribers = list(self.subscribers.get(event.type, []))
             for callback in subscribers:
-                try:
-                    callback(event)
-                except Exception as e:
-                    print(f"Error in event subscriber: {e}")
-            
-            print(f"Event processed: {event.type.value} for {event.tenant_id}")
-            
+                if (event.type, callback) in self.batch_subscribers:
+                    deliveries = [event if event.data.get('batch') else self._as_batch(event)]
+                else:
+                    deliveries = events
+                start = time.perf_counter()
+                failed = False
+                for delivery in deliveries:
+                    try:
+                        callback(delivery)
+                    except Exception as e:
+                        failed = True
+                        ok = False
+                        print(f"Error in event subscriber: {e}")
+                self._record_latency(event.type, callback, (time.perf_counter() - start) * 1000, failed)
+
+            if len(events) > 1:
+                print(f"Event batch processed: {len(events)} x {event.type.value} for {event.tenant_id}")
+            else:
+                print(f"Event processed: {event.type.value} for {event.tenant_id}")
+
         except Exception as e:
+            ok = False
             print(f"Error processing event {event.id}: {e}")
-    
-    def publish(self, event_type: EventType, tenant_id: str, tenant_type: str, 
+
+        if self.outbox_db is not None and event.id in self._outbox_inflight:
+            self._mark_delivered(event, ok)
+        return ok
+
+    @staticmethod
+    def _unbatch(event: Event) -> List[Event]:
+        if not event.data.get('batch'):
+            return [event]
+        return [Event(id=item['id'], type=event.type, tenant_id=event.tenant_id, tenant_type=event.tenant_type,
+                      data=item['data'], timestamp=item['timestamp'], correlation_id=item.get('correlation_id'),
+                      source=item.get('source', 'system'))
+                for item in event.data.get('events', [])]
+
+    @staticmethod
+    def _as_batch(event: Event) -> Event:
+        """Wrap a single event so batch subscribers always see the same shape"""
+        return Event(id=event.id, type=event.type, tenant_id=event.tenant_id, tenant_type=event.tenant_type,
+                     data={'batch': True, 'count': 1, 'events': [
+                         {'id': event.id, 'data': event.data, 'timestamp': event.timestamp,
+                          'correlation_id': event.correlation_id, 'source': event.source}]},
+                     timestamp=event.timestamp, correlation_id=event.correlation_id, source=event.source)
+
+    def _record_latency(self, event_type: EventType, callback: Callable, elapsed_ms: float, failed: bool):
+        key = (event_type, callback)
+        with self.stats_lock:
+            stats = self.subscriber_stats.get(key)
+            if stats is None:
+                name = f"{getattr(callback, '__module__', '')}.{getattr(callback, '__qualname__', repr(callback))}"
+                stats = self.subscriber_stats[key] = SubscriberStats(name)
+            stats.record(elapsed_ms, failed)
+
+    def publish(self, event_type: EventType, tenant_id: str, tenant_type: str,
                 data: Dict[str, Any], correlation_id: str = None, source: str = "system"):
         """Publish an event to the bus"""
         event = Event(
-            id=f"evt_{int(datetime.utcnow().timestamp() * 1000)}_{len(self.event_history)}",
+            id=f"evt_{int(datetime.utcnow().timestamp() * 1000)}_{uuid.uuid4().hex[:8]}",
             type=event_type,
             tenant_id=tenant_id,
             tenant_type=tenant_type,
@@ -131,50 +475,239 @@ class EventBus:
             correlation_id=correlation_id,
             source=source
         )
-        
-        self.event_queue.put(event)
+
+        policy = self.batch_policies.get(event_type)
+        if policy is not None:
+            self.batcher.add(event, policy)
+        else:
+            self._dispatch(event)
         return event.id
-    
-    def subscribe(self, event_type: EventType, callback: Callable[[Event], None]):
-        """Subscribe to an event type"""
+
+    def _dispatch(self, event: Event):
+        """Hand an event (or a flushed batch) to its type's queue, through the outbox when enabled"""
+        event_type = event.type
+        pool = self._pool(event_type)
+        pool.published += 1
+        durable = False
+        if self.outbox_db is not None:
+            # Mark in flight before the row exists so the replay loop never queues it twice
+            self._outbox_inflight.add(event.id)
+            durable = self._write_outbox(event)
+            if not durable:
+                self._outbox_inflight.discard(event.id)
+
+        if not pool.put(event, self.publish_timeout):
+            if durable:
+                # Still pending in the outbox; the replay loop delivers it once the queue drains
+                self._outbox_inflight.discard(event.id)
+                pool.deferred += 1
+            else:
+                pool.rejected += 1
+                print(f"[EVENT BUS] Queue full for {event_type.value}; dropped event {event.id}")
+
+    def subscribe(self, event_type: EventType, callback: Callable[[Event], None], batch: bool = False):
+        """
+        Subscribe to an event type. With batch=True the callback receives one event
+        per batch whose data is {'batch': True, 'count': n, 'events': [...]}.
+        """
         if event_type not in self.subscribers:
             self.subscribers[event_type] = []
         self.subscribers[event_type].append(callback)
+        if batch:
+            self.batch_subscribers.add((event_type, callback))
         print(f"Subscribed to {event_type.value}")
-    
+
+    def set_batching(self, event_type: EventType, policy: Optional[BatchPolicy]):
+        """Enable, change or (with None) disable publish-side batching for an event type"""
+        if policy is None:
+            self.batch_policies.pop(event_type, None)
+        else:
+            self.batch_policies[event_type] = policy
+
     def unsubscribe(self, event_type: EventType, callback: Callable[[Event], None]):
         """Unsubscribe from an event type"""
         if event_type in self.subscribers:
             try:
                 self.subscribers[event_type].remove(callback)
+                self.batch_subscribers.discard((event_type, callback))
                 print(f"Unsubscribed from {event_type.value}")
             except ValueError:
                 pass
-    
-    def get_events(self, event_type: EventType = None, tenant_id: str = None, 
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """Wait until every queued event has been handled (tests and shutdown)"""
+        self.batcher.flush_all()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(pool.queue.unfinished_tasks == 0 for pool in list(self.pools.values())):
+                return True
+            time.sleep(0.01)
+        return False
+
+    # ------------------------------------------------------------------
+    # Durable outbox
+    # ------------------------------------------------------------------
+
+    def enable_outbox(self, db=None, replay_interval: float = 5.0):
+        """
+        Persist every published event to event_outbox until its subscribers have run.
+        Pending rows are replayed on start and whenever queues have room again, so
+        delivery is at-least-once across restarts.
+        """
+        if db is None:
+            from database_manager import db_manager
+            db = db_manager
+        self.outbox_db = db
+        self.outbox_replay_interval = replay_interval
+        if self.running:
+            self._start_outbox_replay()
+
+    def _write_outbox(self, event: Event) -> bool:
+        try:
+            conn = self.outbox_db.get_connection()
+            conn.execute("""
+                INSERT INTO event_outbox (id, event_type, tenant_id, tenant_type, data, timestamp,
+                                          correlation_id, source, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+            """, (event.id, event.type.value, str(event.tenant_id), event.tenant_type,
+                  json.dumps(event.data, default=str), event.timestamp, event.correlation_id, event.source,
+                  datetime.utcnow().isoformat()))
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"[EVENT BUS] Outbox write failed for {event.id}: {e}")
+            return False
+
+    def _mark_delivered(self, event: Event, ok: bool):
+        try:
+            conn = self.outbox_db.get_connection()
+            if ok:
+                conn.execute("UPDATE event_outbox SET status = 'delivered', delivered_at = ?, attempts = attempts + 1 "
+                             "WHERE id = ?", (datetime.utcnow().isoformat(), event.id))
+            else:
+                conn.execute("UPDATE event_outbox SET status = 'failed', attempts = attempts + 1 WHERE id = ?",
+                             (event.id,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[EVENT BUS] Outbox update failed for {event.id}: {e}")
+        finally:
+            self._outbox_inflight.discard(event.id)
+
+    def replay_outbox(self, limit: int = 1000) -> int:
+        """Enqueue pending outbox rows that are not already in flight; returns how many were queued"""
+        if self.outbox_db is None:
+            return 0
+        conn = self.outbox_db.get_connection()
+        rows = conn.execute("""
+            SELECT id, event_type, tenant_id, tenant_type, data, timestamp, correlation_id, source
+            FROM event_outbox WHERE status = 'pending' ORDER BY created_at LIMIT ?
+        """, (limit,)).fetchall()
+        conn.close()
+
+        queued = 0
+        for row in rows:
+            if row[0] in self._outbox_inflight:
+                continue
+            try:
+                event_type = EventType(row[1])
+            except ValueError:
+                continue
+            event = Event(id=row[0], type=event_type, tenant_id=row[2], tenant_type=row[3],
+                          data=json.loads(row[4] or '{}'), timestamp=row[5], correlation_id=row[6], source=row[7])
+            self._outbox_inflight.add(event.id)
+            if not self._pool(event_type).put(event, 0):
+                self._outbox_inflight.discard(event.id)
+                break
+            queued += 1
+        return queued
+
+    def _start_outbox_replay(self):
+        if self._outbox_thread and self._outbox_thread.is_alive():
+            return
+        self._outbox_wake.clear()
+        self._outbox_thread = threading.Thread(target=self._outbox_loop, name='event-bus-outbox', daemon=True)
+        self._outbox_thread.start()
+
+    def _outbox_loop(self):
+        while self.running:
+            try:
+                replayed = self.replay_outbox()
+                if replayed:
+                    print(f"[EVENT BUS] Replayed {replayed} events from the outbox")
+                self.purge_outbox()
+            except Exception as e:
+                print(f"[EVENT BUS] Outbox replay error: {e}")
+            self._outbox_wake.wait(self.outbox_replay_interval)
+
+    def purge_outbox(self, max_age_hours: float = 24) -> int:
+        """Delete delivered outbox rows older than max_age_hours"""
+        if self.outbox_db is None:
+            return 0
+        cutoff = (datetime.utcnow() - timedelta(hours=max_age_hours)).isoformat()
+        conn = self.outbox_db.get_connection()
+        deleted = conn.execute("DELETE FROM event_outbox WHERE status = 'delivered' AND created_at < ?",
+                               (cutoff,)).rowcount
+        conn.commit()
+        conn.close()
+        return deleted
+
+    def get_outbox_stats(self) -> Dict[str, int]:
+        if self.outbox_db is None:
+            return {}
+        conn = self.outbox_db.get_connection()
+        rows = conn.execute("SELECT status, COUNT(*) FROM event_outbox GROUP BY status").fetchall()
+        conn.close()
+        return dict(rows)
+
+    # ------------------------------------------------------------------
+    # Queries and stats
+    # ------------------------------------------------------------------
+
+    def get_events(self, event_type: EventType = None, tenant_id: str = None,
                    limit: int = 100) -> List[Event]:
         """Get recent events with optional filtering"""
-        events = self.event_history
-        
+        events = list(self.event_history)
+
         if event_type:
             events = [e for e in events if e.type == event_type]
-        
+
         if tenant_id:
             events = [e for e in events if e.tenant_id == tenant_id]
-        
+
         # Return most recent events
         return events[-limit:] if limit else events
-    
+
     def get_event_stats(self) -> Dict[str, Any]:
         """Get event bus statistics"""
+        history = list(self.event_history)
+        cutoff = (datetime.utcnow() - timedelta(seconds=60)).isoformat()
+        recent = 0
+        for event in reversed(history):
+            if event.timestamp < cutoff:
+                break
+            recent += 1
+
+        pools = {event_type.value: pool.to_dict() for event_type, pool in list(self.pools.items())}
+        with self.stats_lock:
+            handlers = {}
+            for (event_type, _), stats in self.subscriber_stats.items():
+                handlers.setdefault(event_type.value, {})[stats.name] = stats.to_dict()
+
         stats = {
-            'total_events': len(self.event_history),
-            'queue_size': self.event_queue.qsize(),
-            'subscribers': {event_type.value: len(callbacks) 
+            'total_events': len(history),
+            'queue_size': sum(pool['queue_depth'] for pool in pools.values()),
+            'subscribers': {event_type.value: len(callbacks)
                           for event_type, callbacks in self.subscribers.items()},
-            'event_types': list(set(e.type.value for e in self.event_history)),
-            'recent_events': len([e for e in self.event_history 
-                                if (datetime.utcnow() - datetime.fromisoformat(e.timestamp)).seconds < 60])
+            'event_types': list(set(e.type.value for e in history)),
+            'recent_events': recent,
+            'queues': pools,
+            'handler_latency': handlers,
+            'rejected_events': sum(pool['rejected'] for pool in pools.values()),
+            'batching': dict(self.batcher.to_dict(),
+                             policies={t.value: dict(asdict(p), key=bool(p.key)) for t, p in self.batch_policies.items()}),
+            'outbox': self.get_outbox_stats() if self.outbox_db is not None else None
         }
         return stats
 
@@ -209,15 +742,18 @@ def handle_mapping_approved(event: Event):
     )
 
 def handle_roundup_accrued(event: Event):
-    """Handle round-up accrual"""
-    print(f"💰 Round-up accrued for {event.tenant_id}: ${event.data.get('amount', 0)}")
+    """Handle a batch of round-up accruals for one tenant"""
+    accruals = [item['data'] for item in event.data.get('events', [])]
+    total = round(sum(float(data.get('amount') or 0) for data in accruals), 2)
+    print(f"💰 {len(accruals)} round-ups accrued for {event.tenant_id}: ${total}")
     # Check if auto-sweep threshold reached
-    if event.data.get('auto_sweep', False):
+    sweep_amount = round(sum(float(data.get('amount') or 0) for data in accruals if data.get('auto_sweep')), 2)
+    if sweep_amount:
         event_bus.publish(
             EventType.ROUNDUP_SWEPT,
             event.tenant_id,
             event.tenant_type,
-            {'sweep_amount': event.data.get('amount')},
+            {'sweep_amount': sweep_amount},
             event.correlation_id,
             'roundup_engine'
         )
@@ -291,13 +827,17 @@ def initialize_event_handlers():
     """Initialize default event handlers"""
     event_bus.subscribe(EventType.INGEST_RAW, handle_ingest_raw)
     event_bus.subscribe(EventType.MAPPING_APPROVED, handle_mapping_approved)
-    event_bus.subscribe(EventType.ROUNDUP_ACCRUED, handle_roundup_accrued)
+    event_bus.subscribe(EventType.ROUNDUP_ACCRUED, handle_roundup_accrued, batch=True)
     event_bus.subscribe(EventType.ANALYTICS_READY, handle_analytics_ready)
     event_bus.subscribe(EventType.SCORES_READY, handle_scores_ready)
     event_bus.subscribe(EventType.LLM_INSIGHT_GENERATED, handle_llm_insight_generated)
     
     print("Event handlers initialized")
 
+# Durable delivery is opt-in: events survive restarts in the event_outbox table
+if os.getenv('KAMIOI_EVENT_OUTBOX', '').lower() in ('1', 'true', 'yes'):
+    event_bus.enable_outbox()
+
 # Start the event bus
 event_bus.start()
 initialize_event_handlers()
@@ -5,7 +5,7 @@ Monitors system health, dependencies, and performance metrics
 
 import time
 import psutil
-import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
@@ -39,7 +39,16 @@ class ServiceHealth:
     dependencies: List[str]
 
 class HealthMonitor:
-    def __init__(self):
+    # Routes reported by the API endpoint check, read from the request profiler
+    MONITORED_ENDPOINTS = [
+        {'name': 'Health Check', 'rule': '/api/health'},
+        {'name': 'Admin Health', 'rule': '/api/admin/health'},
+        {'name': 'User API', 'rule': '/api/user/transactions'},
+        {'name': 'Family API', 'rule': '/api/family/dashboard/overview'},
+        {'name': 'Business API', 'rule': '/api/business/dashboard/overview'}
+    ]
+    
+    def __init__(self, autostart: bool = True):
         self.services: Dict[str, ServiceHealth] = {}
         self.checks: Dict[str, HealthCheck] = {}
         self.monitoring_enabled = True
@@ -48,14 +57,50 @@ class HealthMonitor:
             'response_time': 5.0,  # 5 seconds
             'cpu_usage': 80.0,     # 80%
             'memory_usage': 85.0,  # 85%
-            'disk_usage': 90.0     # 90%
+            'disk_usage': 90.0,    # 90%
+            'request_p95': 2.0,    # 2 seconds
+            'error_rate': 0.05     # 5% of requests returning 5xx
+        }
+        
+        # Checks run concurrently; one that misses its deadline is reported DOWN
+        # without holding up the others, and is not resubmitted while still running
+        self.check_functions = {
+            'system_resources': self._check_system_resources,
+            'database': self._check_database_health,
+            'api_endpoints': self._check_api_endpoints,
+            'request_performance': self._check_request_performance,
+            'external_services': self._check_external_services,
+            'event_bus': self._check_event_bus_health,
+            'materialized_views': self._check_materialized_views_health,
+            'auto_mapping': self._check_auto_mapping_health,
+            'roundup_engine': self._check_roundup_engine_health
         }
+        self.check_deadlines = {'system_resources': 3.0}  # cpu_percent samples for 1s
+        self.default_check_deadline = 2.0
+        self.app = None  # Flask app, when attached, for route registration checks
+        self._executor = ThreadPoolExecutor(max_workers=len(self.check_functions), thread_name_prefix='health-check')
+        self._inflight = {}
+        self._timed_out = set()
+        
+        # Writers copy-on-write self.checks and publish a fresh snapshot under this lock;
+        # readers just take the current self._snapshot reference
+        self._write_lock = threading.Lock()
+        self._snapshot = self._build_snapshot(self.checks)
+        self._stop_event = threading.Event()
+        
         self.monitoring_thread = None
-        self.start_monitoring()
+        if autostart:
+            self.start_monitoring()
+    
+    def attach_app(self, app):
+        """Let the API endpoint check confirm monitored routes are registered"""
+        self.app = app
     
     def start_monitoring(self):
         """Start the health monitoring thread"""
         if not self.monitoring_thread or not self.monitoring_thread.is_alive():
+            self.monitoring_enabled = True
+            self._stop_event.clear()
             self.monitoring_thread = threading.Thread(target=self._monitoring_loop, daemon=True)
             self.monitoring_thread.start()
             print("🏥 Health monitoring started")
@@ -63,6 +108,7 @@ class HealthMonitor:
     def stop_monitoring(self):
         """Stop the health monitoring thread"""
         self.monitoring_enabled = False
+        self._stop_event.set()
         if self.monitoring_thread:
             self.monitoring_thread.join()
         print("🛑 Health monitoring stopped")
@@ -72,26 +118,63 @@ class HealthMonitor:
         while self.monitoring_enabled:
             try:
                 self._run_all_checks()
-                time.sleep(self.check_interval)
+                self._stop_event.wait(self.check_interval)
             except Exception as e:
                 print(f"Error in health monitoring loop: {e}")
-                time.sleep(5)  # Wait 5 seconds before retrying
+                self._stop_event.wait(5)  # Wait 5 seconds before retrying
     
     def _run_all_checks(self):
-        """Run all health checks"""
-        # System health checks
-        self._check_system_resources()
-        
-        # Service health checks
-        self._check_database_health()
-        self._check_api_endpoints()
-        self._check_external_services()
+        """Run all health checks concurrently, each bounded by its own deadline"""
+        self._run_checks(list(self.check_functions))
+    
+    def run_check(self, check_name: str) -> bool:
+        """Run one named check now; False if there is no such check"""
+        if check_name not in self.check_functions:
+            return False
+        self._run_checks([check_name])
+        return True
+    
+    def _run_checks(self, check_names: List[str]):
+        started = time.monotonic()
+        futures = {}
+        for check_name in check_names:
+            future = self._inflight.get(check_name)
+            if future is None or future.done():
+                future = self._executor.submit(self.check_functions[check_name])
+                self._inflight[check_name] = future
+            futures[check_name] = future
         
-        # Application-specific checks
-        self._check_event_bus_health()
-        self._check_materialized_views_health()
-        self._check_auto_mapping_health()
-        self._check_roundup_engine_health()
+        for check_name, future in futures.items():
+            deadline = self.check_deadlines.get(check_name, self.default_check_deadline)
+            try:
+                future.result(timeout=max(0.0, started + deadline - time.monotonic()))
+            except FutureTimeout:
+                self._timed_out.add(check_name)
+                self._update_check(check_name, HealthCheck(
+                    name=check_name.replace('_', ' ').title(),
+                    status=HealthStatus.DOWN,
+                    response_time=deadline,
+                    last_check=datetime.utcnow().isoformat(),
+                    error_message=f'Check did not finish within {deadline:.1f}s',
+                    metadata={'timed_out': True, 'deadline': deadline}
+                ))
+                continue
+            except Exception as e:
+                self._update_check(check_name, HealthCheck(
+                    name=check_name.replace('_', ' ').title(),
+                    status=HealthStatus.DOWN,
+                    response_time=0.0,
+                    last_check=datetime.utcnow().isoformat(),
+                    error_message=str(e)
+                ))
+                continue
+            
+            # A check that recovered drops its timeout marker (its own ids may differ)
+            if check_name in self._timed_out:
+                self._timed_out.discard(check_name)
+                marker = self.checks.get(check_name)
+                if marker and (marker.metadata or {}).get('timed_out'):
+                    self._remove_check(check_name)
     
     def _check_system_resources(self):
         """Check system resource usage"""
@@ -152,13 +235,20 @@ class HealthMonitor:
             ))
     
     def _check_database_health(self):
-        """Check database connectivity and performance"""
+        """Check database connectivity and performance with a trivial query"""
         try:
-            start_time = time.time()
+            from database_manager import db_manager
             
-            # Try to connect to database (simulated)
-            # In a real system, this would test actual database connectivity
-            time.sleep(0.1)  # Simulate database query
+            start_time = time.time()
+            conn = db_manager.get_connection()
+            try:
+                if getattr(db_manager, '_use_postgresql', False):
+                    from sqlalchemy import text
+                    conn.execute(text("SELECT 1")).fetchone()
+                else:
+                    conn.execute("SELECT 1").fetchone()
+            finally:
+                db_manager.release_connection(conn)
             
             response_time = time.time() - start_time
             status = HealthStatus.UP if response_time < self.alert_thresholds['response_time'] else HealthStatus.DEGRADED
@@ -181,46 +271,99 @@ class HealthMonitor:
             ))
     
     def _check_api_endpoints(self):
-        """Check API endpoint health"""
-        endpoints = [
-            {'name': 'Health Check', 'url': 'http://localhost:5000/api/health'},
-            {'name': 'Admin Health', 'url': 'http://localhost:5000/api/admin/health'},
-            {'name': 'User API', 'url': 'http://localhost:5000/api/user/transactions'},
-            {'name': 'Family API', 'url': 'http://localhost:5000/api/family/dashboard/overview'},
-            {'name': 'Business API', 'url': 'http://localhost:5000/api/business/dashboard/overview'}
-        ]
+        """
+        Check API endpoint health from in-process request metrics rather than
+        calling our own server over HTTP
+        """
+        try:
+            from request_profiler import request_profiler
+        except ImportError:
+            request_profiler = None
         
-        for endpoint in endpoints:
-            try:
-                start_time = time.time()
-                response = requests.get(endpoint['url'], timeout=5)
-                response_time = time.time() - start_time
-                
-                if response.status_code == 200:
-                    status = HealthStatus.UP if response_time < self.alert_thresholds['response_time'] else HealthStatus.DEGRADED
-                    error_message = None
-                else:
+        registered = {rule.rule for rule in self.app.url_map.iter_rules()} if self.app is not None else None
+        
+        for endpoint in self.MONITORED_ENDPOINTS:
+            check_id = f"api_{endpoint['name'].lower().replace(' ', '_')}"
+            stats = request_profiler.get_route_stats('GET', endpoint['rule']) if request_profiler else None
+            metadata = {'rule': endpoint['rule'], 'requests': 0}
+            error_message = None
+            response_time = 0.0
+            
+            if registered is not None and endpoint['rule'] not in registered:
+                status = HealthStatus.DOWN
+                error_message = 'Route not registered'
+            elif request_profiler is None:
+                status = HealthStatus.NOT_LINKED
+                error_message = 'Request profiler not available'
+            elif not stats or not stats['count']:
+                status = HealthStatus.UP  # No traffic yet, nothing has failed
+            else:
+                server_errors = stats['status_counts'].get('5xx', 0)
+                error_rate = server_errors / stats['count']
+                response_time = stats['latency']['p95']
+                metadata.update(requests=stats['count'], p95=response_time, error_rate=error_rate,
+                                last_seen=stats['last_seen'])
+                if error_rate >= self.alert_thresholds['error_rate'] * 4:
                     status = HealthStatus.DOWN
-                    error_message = f"HTTP {response.status_code}"
-                
-                self._update_check(f"api_{endpoint['name'].lower().replace(' ', '_')}", HealthCheck(
-                    name=endpoint['name'],
-                    status=status,
-                    response_time=response_time,
-                    last_check=datetime.utcnow().isoformat(),
-                    error_message=error_message,
-                    metadata={'status_code': response.status_code, 'url': endpoint['url']}
-                ))
-                
-            except Exception as e:
-                self._update_check(f"api_{endpoint['name'].lower().replace(' ', '_')}", HealthCheck(
-                    name=endpoint['name'],
-                    status=HealthStatus.DOWN,
-                    response_time=0.0,
-                    last_check=datetime.utcnow().isoformat(),
-                    error_message=str(e),
-                    metadata={'url': endpoint['url']}
-                ))
+                    error_message = f"{server_errors} of {stats['count']} requests returned 5xx"
+                elif error_rate >= self.alert_thresholds['error_rate'] or response_time >= self.alert_thresholds['response_time']:
+                    status = HealthStatus.DEGRADED
+                else:
+                    status = HealthStatus.UP
+            
+            self._update_check(check_id, HealthCheck(
+                name=endpoint['name'],
+                status=status,
+                response_time=response_time,
+                last_check=datetime.utcnow().isoformat(),
+                error_message=error_message,
+                metadata=metadata
+            ))
+    
+    def _check_request_performance(self):
+        """Check aggregated request latency and error rate from the request profiler"""
+        try:
+            from request_profiler import request_profiler
+            
+            summary = request_profiler.get_summary()
+            total_requests = summary.get('total_requests', 0)
+            p95 = summary.get('p95', 0.0)
+            error_rate = summary.get('error_rate', 0.0)
+            
+            if total_requests == 0:
+                status = HealthStatus.UP
+            elif error_rate >= self.alert_thresholds['error_rate'] * 4 or p95 >= self.alert_thresholds['response_time']:
+                status = HealthStatus.DOWN
+            elif error_rate >= self.alert_thresholds['error_rate'] or p95 >= self.alert_thresholds['request_p95']:
+                status = HealthStatus.DEGRADED
+            else:
+                status = HealthStatus.UP
+            
+            self._update_check('request_performance', HealthCheck(
+                name='Request Performance',
+                status=status,
+                response_time=p95,
+                last_check=datetime.utcnow().isoformat(),
+                metadata={
+                    'total_requests': total_requests,
+                    'p50': summary.get('p50', 0.0),
+                    'p95': p95,
+                    'p99': summary.get('p99', 0.0),
+                    'error_rate': error_rate,
+                    'slowest_route': summary.get('slowest_route'),
+                    'slowest_route_p95': summary.get('slowest_route_p95', 0.0),
+                    'threshold': self.alert_thresholds['request_p95']
+                }
+            ))
+            
+        except ImportError:
+            self._update_check('request_performance', HealthCheck(
+                name='Request Performance',
+                status=HealthStatus.NOT_LINKED,
+                response_time=0.0,
+                last_check=datetime.utcnow().isoformat(),
+                error_message='Request profiler not available'
+            ))
     
     def _check_external_services(self):
         """Check external service dependencies"""
@@ -364,12 +507,26 @@ class HealthMonitor:
             ))
     
     def _update_check(self, check_id: str, check: HealthCheck):
-        """Update a health check"""
-        self.checks[check_id] = check
+        """Update a health check and publish a new snapshot"""
+        with self._write_lock:
+            checks = dict(self.checks)
+            checks[check_id] = check
+            self.checks = checks
+            self._snapshot = self._build_snapshot(checks)
+    
+    def _remove_check(self, check_id: str):
+        with self._write_lock:
+            checks = {key: value for key, value in self.checks.items() if key != check_id}
+            self.checks = checks
+            self._snapshot = self._build_snapshot(checks)
     
     def get_overall_health(self) -> Dict[str, Any]:
-        """Get overall system health"""
-        if not self.checks:
+        """Get overall system health from the last published snapshot (no locking)"""
+        return self._snapshot
+    
+    def _build_snapshot(self, checks: Dict[str, HealthCheck]) -> Dict[str, Any]:
+        """Overall health for a set of checks; published snapshots are never mutated"""
+        if not checks:
             return {
                 'status': HealthStatus.NOT_LINKED.value,
                 'message': 'No health checks available',
@@ -379,7 +536,7 @@ class HealthMonitor:
         
         # Calculate overall status
         status_counts = {}
-        for check in self.checks.values():
+        for check in checks.values():
             status = check.status.value
             status_counts[status] = status_counts.get(status, 0) + 1
         
@@ -394,7 +551,7 @@ class HealthMonitor:
             overall_status = HealthStatus.UP.value
         
         # Calculate summary statistics
-        total_checks = len(self.checks)
+        total_checks = len(checks)
         up_checks = status_counts.get(HealthStatus.UP.value, 0)
         degraded_checks = status_counts.get(HealthStatus.DEGRADED.value, 0)
         down_checks = status_counts.get(HealthStatus.DOWN.value, 0)
@@ -410,7 +567,7 @@ class HealthMonitor:
                 'last_check': check.last_check,
                 'error_message': check.error_message,
                 'metadata': check.metadata
-            } for check_id, check in self.checks.items()},
+            } for check_id, check in checks.items()},
             'summary': {
                 'total_checks': total_checks,
                 'up': up_checks,
@@ -418,7 +575,8 @@ class HealthMonitor:
                 'down': down_checks,
                 'not_linked': not_linked_checks,
                 'uptime_percentage': (up_checks / total_checks * 100) if total_checks > 0 else 0
-            }
+            },
+            'generated_at': datetime.utcnow().isoformat()
         }
     
     def get_service_health(self, service_name: str) -> Optional[ServiceHealth]:
@@ -0,0 +1,368 @@
+"""
+LLM Center Change Feed for Kamioi Platform
+Compact, resumable deltas for the admin LLM Center instead of polling its heavy
+dashboard/mappings/queue endpoints.
+
+Triggers on llm_mappings append one row per insert, status/ticker change and
+delete to llm_change_feed, so every write path (the approve/reject endpoints,
+bulk uploads, the auto-mapping pipeline) is captured with a monotonically
+increasing sequence number. One poller thread turns new rows into deltas, keeps
+the queue-depth counters up to date from each row's old/new values, and pushes
+the batch to every viewer (SSE/long-poll waiters and the WebSocket server's
+'llm_center' topic). Database work therefore scales with the change rate, not
+with the number of open LLM Center tabs. A client that reconnects with the last
+sequence it saw receives only what it missed; if that is older than the feed's
+retention it is told to reset and reload once.
+"""
+
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database_manager import db_manager
+
+BULK_UPLOAD_USER_ID = '2'  # Bulk-upload mappings are excluded from the review queue counts
+DELTA_TYPES = {'I': 'mapping_inserted', 'D': 'mapping_deleted'}
+STATUS_DELTA_TYPES = {'approved': 'mapping_approved', 'rejected': 'mapping_rejected'}
+
+
+def queue_contribution(status, ai_processed, user_id) -> Dict[str, int]:
+    """What one mapping adds to each /llm-center/queue counter"""
+    reviewable = user_id is not None and str(user_id) != BULK_UPLOAD_USER_ID
+    return {
+        'total_entries': int(reviewable),
+        'total_mappings': 1,
+        'auto_applied': int(ai_processed in (1, '1')),
+        'approved': int(status == 'approved'),
+        'pending': int(reviewable and status == 'pending'),
+        'rejected': int(reviewable and status == 'rejected')
+    }
+
+
+class LLMChangeFeed:
+    def __init__(self, db=None, poll_interval: float = 0.5, buffer_size: int = 5000,
+                 retention_hours: int = 72, batch_size: int = 1000):
+        self.db = db or db_manager
+        self.poll_interval = poll_interval
+        self.retention_hours = retention_hours
+        self.batch_size = batch_size  # Feed rows read per poll query
+        self.buffer = deque(maxlen=buffer_size)  # Recent mapping deltas, served to reconnecting clients
+        self.condition = threading.Condition()
+        self.last_seq = 0
+        self.queue_depth: Dict[str, int] = {}
+        self.installed = False
+        self.install_lock = threading.Lock()
+        self.thread = None
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+        self.stats = {
+            'polls': 0,
+            'deltas': 0,
+            'pushes': 0,
+            'buffer_replays': 0,
+            'table_replays': 0,
+            'resets': 0
+        }
+
+    @property
+    def available(self) -> bool:
+        """The feed is trigger-based and lives in SQLite"""
+        return not getattr(self.db, '_use_postgresql', False)
+
+    # ------------------------------------------------------------------
+    # Installation and lifecycle
+    # ------------------------------------------------------------------
+
+    def install(self):
+        """Create the feed table and triggers, and load the current sequence and queue depth"""
+        if self.installed or not self.available:
+            return
+        with self.install_lock:
+            if self.installed:
+                return
+            conn = self.db.get_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS llm_change_feed (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        op TEXT NOT NULL,
+                        mapping_id INTEGER,
+                        merchant_name TEXT,
+                        ticker TEXT,
+                        category TEXT,
+                        confidence REAL,
+                        status TEXT,
+                        ai_processed INTEGER,
+                        user_id TEXT,
+                        old_status TEXT,
+                        old_ai_processed INTEGER,
+                        old_user_id TEXT,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_change_feed_created ON llm_change_feed(created_at)")
+                self._create_triggers(cur)
+                self.last_seq = cur.execute("SELECT COALESCE(MAX(seq), 0) FROM llm_change_feed").fetchone()[0]
+                self.queue_depth = self._count_queue(cur)
+                conn.commit()
+                self.installed = True
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _create_triggers(cur):
+        columns = "mapping_id, merchant_name, ticker, category, confidence, status, ai_processed, user_id"
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_llm_feed_insert AFTER INSERT ON llm_mappings
+            BEGIN
+                INSERT INTO llm_change_feed (op, {columns})
+                VALUES ('I', NEW.id, NEW.merchant_name, NEW.ticker, NEW.category, NEW.confidence,
+                        NEW.status, NEW.ai_processed, NEW.user_id);
+            END
+        ''')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_llm_feed_update AFTER UPDATE ON llm_mappings
+            WHEN OLD.status IS NOT NEW.status OR OLD.ticker IS NOT NEW.ticker OR OLD.category IS NOT NEW.category
+                 OR OLD.ai_processed IS NOT NEW.ai_processed OR OLD.user_id IS NOT NEW.user_id
+            BEGIN
+                INSERT INTO llm_change_feed (op, {columns}, old_status, old_ai_processed, old_user_id)
+                VALUES ('U', NEW.id, NEW.merchant_name, NEW.ticker, NEW.category, NEW.confidence,
+                        NEW.status, NEW.ai_processed, NEW.user_id, OLD.status, OLD.ai_processed, OLD.user_id);
+            END
+        ''')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_llm_feed_delete AFTER DELETE ON llm_mappings
+            BEGIN
+                INSERT INTO llm_change_feed (op, {columns}, old_status, old_ai_processed, old_user_id)
+                VALUES ('D', OLD.id, OLD.merchant_name, OLD.ticker, OLD.category, OLD.confidence,
+                        NULL, NULL, NULL, OLD.status, OLD.ai_processed, OLD.user_id);
+            END
+        ''')
+
+    @staticmethod
+    def _count_queue(cur) -> Dict[str, int]:
+        """The same counters /llm-center/queue reports, in one scan"""
+        row = cur.execute('''
+            SELECT COUNT(CASE WHEN user_id != ? THEN 1 END),
+                   COUNT(*),
+                   COUNT(CASE WHEN ai_processed = 1 THEN 1 END),
+                   COUNT(CASE WHEN status = 'approved' THEN 1 END),
+                   COUNT(CASE WHEN user_id != ? AND status = 'pending' THEN 1 END),
+                   COUNT(CASE WHEN user_id != ? AND status = 'rejected' THEN 1 END)
+            FROM llm_mappings
+        ''', (BULK_UPLOAD_USER_ID,) * 3).fetchone()
+        keys = ['total_entries', 'total_mappings', 'auto_applied', 'approved', 'pending', 'rejected']
+        return dict(zip(keys, row))
+
+    def start(self):
+        """Start the poller thread (idempotent)"""
+        if not self.available:
+            return None
+        self.install()
+        if self.thread and self.thread.is_alive():
+            return self.thread
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._poll_loop, name='llm-change-feed', daemon=True)
+        self.thread.start()
+        try:
+            from websocket_manager import ws_manager
+            ws_manager.register_resume('llm_center', self.changes_since, admin_only=True)
+        except ImportError:
+            pass
+        print("LLM Center change feed started")
+        return self.thread
+
+    def stop(self):
+        self._stop.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+        self.thread = None
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            try:
+                while self.poll() == self.batch_size:
+                    pass
+                if datetime.utcnow().timestamp() - self._last_purge > 3600:
+                    self.purge()
+            except Exception as e:
+                print(f"LLM change feed poll failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+    # ------------------------------------------------------------------
+    # Polling and fan-out
+    # ------------------------------------------------------------------
+
+    def poll(self) -> int:
+        """Turn new feed rows into deltas and push them to viewers; returns the number of rows read"""
+        self.install()
+        conn = self.db.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT seq, op, mapping_id, merchant_name, ticker, category, confidence, status, ai_processed,
+                       user_id, old_status, old_ai_processed, old_user_id, created_at
+                FROM llm_change_feed WHERE seq > ? ORDER BY seq LIMIT ?
+            ''', (self.last_seq, self.batch_size)).fetchall()
+        finally:
+            conn.close()
+        self.stats['polls'] += 1
+        if not rows:
+            return 0
+
+        deltas = []
+        with self.condition:
+            depth = dict(self.queue_depth)
+            for row in rows:
+                (seq, op, mapping_id, merchant, ticker, category, confidence, status, ai_processed,
+                 user_id, old_status, old_ai_processed, old_user_id, created_at) = row
+                if op != 'I':
+                    for key, value in queue_contribution(old_status, old_ai_processed, old_user_id).items():
+                        depth[key] -= value
+                if op != 'D':
+                    for key, value in queue_contribution(status, ai_processed, user_id).items():
+                        depth[key] += value
+                deltas.append(self._delta(row))
+
+            queue_changed = depth != self.queue_depth
+            self.queue_depth = depth
+            self.last_seq = rows[-1][0]
+            self.buffer.extend(deltas)
+            self.stats['deltas'] += len(deltas)
+            self.condition.notify_all()
+
+        self._push({
+            'seq': self.last_seq,
+            'deltas': deltas,
+            'queue_depth': depth if queue_changed else None
+        })
+        return len(rows)
+
+    @staticmethod
+    def _delta(row) -> Dict:
+        (seq, op, mapping_id, merchant, ticker, category, confidence, status, _ai, user_id,
+         old_status, _old_ai, old_user_id, created_at) = row
+        delta_type = DELTA_TYPES.get(op) or (STATUS_DELTA_TYPES.get(status, 'mapping_updated')
+                                             if status != old_status else 'mapping_updated')
+        return {
+            'seq': seq,
+            'type': delta_type,
+            'mapping_id': mapping_id,
+            'merchant_name': merchant,
+            'ticker': ticker,
+            'category': category,
+            'confidence': confidence,
+            'status': status if op != 'D' else old_status,
+            'previous_status': old_status,
+            'user_id': user_id if op != 'D' else old_user_id,
+            'at': created_at
+        }
+
+    def _push(self, message: Dict):
+        """Push one batch to WebSocket subscribers of the 'llm_center' topic"""
+        try:
+            from websocket_manager import ws_manager
+            if ws_manager.loop is not None:
+                ws_manager.publish('llm_center', message, admin_only=True, message_type='llm_center_delta')
+                self.stats['pushes'] += 1
+        except ImportError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def changes_since(self, since: Optional[int], limit: int = 500) -> Dict:
+        """
+        Deltas after sequence `since`. reset=True means the client's position is unknown
+        (first connect, purged past it, or a different database) and it should reload the
+        LLM Center once, then follow the feed from the returned seq.
+        """
+        self.install()
+        with self.condition:
+            last_seq, queue_depth = self.last_seq, dict(self.queue_depth)
+            oldest_buffered = self.buffer[0]['seq'] if self.buffer else None
+            if since is not None and since <= last_seq and oldest_buffered is not None and since >= oldest_buffered - 1:
+                deltas = [delta for delta in self.buffer if delta['seq'] > since][:limit]
+                self.stats['buffer_replays'] += 1
+                return self._changes(deltas, last_seq, queue_depth, limit)
+
+        if since is None or since > last_seq:
+            self.stats['resets'] += 1
+            return {'seq': last_seq, 'reset': True, 'deltas': [], 'has_more': False, 'queue_depth': queue_depth}
+
+        conn = self.db.get_connection()
+        try:
+            oldest = conn.execute("SELECT MIN(seq) FROM llm_change_feed").fetchone()[0]
+            if since < last_seq and (oldest is None or oldest > since + 1):
+                self.stats['resets'] += 1
+                return {'seq': last_seq, 'reset': True, 'deltas': [], 'has_more': False, 'queue_depth': queue_depth}
+            rows = conn.execute('''
+                SELECT seq, op, mapping_id, merchant_name, ticker, category, confidence, status, ai_processed,
+                       user_id, old_status, old_ai_processed, old_user_id, created_at
+                FROM llm_change_feed WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?
+            ''', (since, last_seq, limit)).fetchall()
+        finally:
+            conn.close()
+        self.stats['table_replays'] += 1
+        return self._changes([self._delta(row) for row in rows], last_seq, queue_depth, limit)
+
+    @staticmethod
+    def _changes(deltas: List[Dict], last_seq: int, queue_depth: Dict, limit: int) -> Dict:
+        has_more = len(deltas) >= limit and deltas[-1]['seq'] < last_seq
+        return {
+            'seq': deltas[-1]['seq'] if has_more else last_seq,
+            'reset': False,
+            'deltas': deltas,
+            'has_more': has_more,
+            'queue_depth': queue_depth
+        }
+
+    def wait(self, since: Optional[int], timeout: float = 25) -> Optional[Dict]:
+        """Block until there is something after `since`; None when the timeout passes first"""
+        self.install()
+        if since is not None:
+            with self.condition:
+                if not self.condition.wait_for(lambda: self.last_seq != since, timeout):
+                    return None
+        return self.changes_since(since)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def purge(self, retention_hours: int = None) -> int:
+        """Drop feed rows older than the retention window (always keeping the newest)"""
+        self.install()
+        hours = retention_hours if retention_hours is not None else self.retention_hours
+        conn = self.db.get_connection()
+        try:
+            cur = conn.execute('''
+                DELETE FROM llm_change_feed
+                WHERE created_at < datetime('now', ?) AND seq < (SELECT MAX(seq) FROM llm_change_feed)
+            ''', (f'-{int(hours)} hours',))
+            conn.commit()
+            self._last_purge = datetime.utcnow().timestamp()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def get_feed_stats(self) -> Dict:
+        with self.condition:
+            return {
+                'running': bool(self.thread and self.thread.is_alive()),
+                'last_seq': self.last_seq,
+                'buffered': len(self.buffer),
+                'oldest_buffered_seq': self.buffer[0]['seq'] if self.buffer else None,
+                'queue_depth': dict(self.queue_depth),
+                **self.stats
+            }
+
+
+# Global change feed instance
+llm_change_feed = LLMChangeFeed()
@@ -10,8 +10,22 @@ import os
 import time
 from datetime import datetime
 import sqlite3
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 import hashlib
+import re
+
+# Parquet export is optional
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+EXPORT_FILENAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+EXPORT_FIELDS = ['id', 'merchant_name', 'ticker', 'category', 'confidence', 'company_name']
 
 class LLMTrainer:
     def __init__(self, db_path: str):
@@ -281,5 +295,201 @@ class LLMTrainer:
                 })
         
         return filepath
+    
+    def iter_approved_mappings(self, after_id: int = 0, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield approved mappings in id order, chunk_size rows at a time
+        
+        Each chunk is one keyset query (id > last id seen), so memory stays
+        bounded by chunk_size however large llm_mappings grows.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            last_id = after_id or 0
+            while True:
+                cursor.execute('''
+                    SELECT id, merchant_name, ticker, category, confidence, company_name
+                    FROM llm_mappings
+                    WHERE status = 'approved'
+                    AND admin_approved = 1
+                    AND id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, chunk_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+                last_id = rows[-1][0]
+                yield [self._training_row(row) for row in rows]
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _training_row(row) -> Dict[str, Any]:
+        """Normalise a mapping the same way create_training_dataset does"""
+        mapping_id, merchant, ticker, category, confidence, company_name = row
+        merchant = (merchant or '').lower().strip()
+        return {
+            'id': mapping_id,
+            'merchant_name': merchant,
+            'ticker': (ticker or '').upper().strip(),
+            'category': (category or '').lower().strip(),
+            'confidence': float(confidence) if confidence else 0.0,
+            'company_name': company_name or merchant
+        }
+    
+    @staticmethod
+    def training_split(merchant_name: str, validation_fraction: float) -> str:
+        """
+        Stable train/validation assignment by merchant hash, so a merchant
+        always lands in the same split across exports and never in both
+        """
+        bucket = int(hashlib.md5(merchant_name.encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return 'validation' if bucket < validation_fraction else 'train'
+    
+    def stream_training_export(self, filename: str = None, fmt: str = 'csv', validation_fraction: float = 0.1,
+                               resume: bool = False, after_id: int = 0, chunk_size: int = EXPORT_CHUNK_SIZE,
+                               export_dir: str = 'training_exports') -> Dict[str, Any]:
+        """
+        Export approved mappings as train/validation files without loading them all
+        
+        Writes <filename>_train.<fmt> and <filename>_validation.<fmt> chunk by
+        chunk, recording progress in <filename>.progress.json after each chunk.
+        With resume=True an interrupted csv/jsonl export picks up after the last
+        id it recorded; anything written past that point is truncated first.
+        Parquet (needs pyarrow) writes one row group per chunk and cannot resume,
+        but after_id starts a fresh export past a given mapping id.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        if fmt == 'parquet' and not PYARROW_AVAILABLE:
+            raise ValueError("Parquet export requires pyarrow")
+        if fmt == 'parquet' and resume:
+            raise ValueError("Resume is only supported for csv and jsonl exports")
+        if not 0 <= validation_fraction < 1:
+            raise ValueError("validation_fraction must be in [0, 1)")
+        
+        if not filename:
+            filename = f"training_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        elif not isinstance(filename, str) or not EXPORT_FILENAME_PATTERN.fullmatch(filename):
+            # The name comes from the request; keep it a bare name inside export_dir
+            raise ValueError("filename may only contain letters, digits, '_' and '-'")
+        os.makedirs(export_dir, exist_ok=True)
+        base = os.path.join(export_dir, filename)
+        progress_path = f"{base}.progress.json"
+        paths = {split: f"{base}_{split}.{fmt}" for split in ('train', 'validation')}
+        
+        progress = None
+        if resume and os.path.exists(progress_path):
+            with open(progress_path, encoding='utf-8') as f:
+                progress = json.load(f)
+            if progress['format'] != fmt or progress['validation_fraction'] != validation_fraction:
+                raise ValueError("Resume must use the format and validation_fraction of the original export")
+        if progress is None:
+            progress = {
+                'format': fmt,
+                'validation_fraction': validation_fraction,
+                'last_id': after_id or 0,
+                'rows': {'train': 0, 'validation': 0},
+                'offsets': {'train': 0, 'validation': 0},
+                'completed': False
+            }
+        
+        writers = {split: _ExportWriter(fmt, path, progress['offsets'][split]) for split, path in paths.items()}
+        try:
+            for chunk in self.iter_approved_mappings(after_id=progress['last_id'], chunk_size=chunk_size):
+                by_split = {'train': [], 'validation': []}
+                for row in chunk:
+                    by_split[self.training_split(row['merchant_name'], validation_fraction)].append(row)
+                for split, rows in by_split.items():
+                    if rows:
+                        writers[split](rows)
+                        progress['rows'][split] += len(rows)
+                progress['last_id'] = chunk[-1]['id']
+                progress['offsets'] = {split: writers[split].offset() for split in writers}
+                self._save_export_progress(progress_path, progress)
+            progress['completed'] = True
+        finally:
+            for write in writers.values():
+                write.close()
+        self._save_export_progress(progress_path, progress)
+        
+        return {
+            'files': paths,
+            'progress_file': progress_path,
+            'total_mappings': progress['rows']['train'] + progress['rows']['validation'],
+            'train_rows': progress['rows']['train'],
+            'validation_rows': progress['rows']['validation'],
+            'last_id': progress['last_id']
+        }
+    
+    @staticmethod
+    def _save_export_progress(progress_path: str, progress: Dict[str, Any]):
+        tmp_path = f"{progress_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, progress_path)
+    
+    def get_approved_mapping_stats(self) -> Dict[str, int]:
+        """Merchant and category counts over approved mappings, computed in SQL"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*),
+                       COUNT(DISTINCT LOWER(TRIM(merchant_name))),
+                       COUNT(DISTINCT LOWER(TRIM(category)))
+                FROM llm_mappings
+                WHERE status = 'approved'
+                AND admin_approved = 1
+            ''')
+            total, merchants, categories = cursor.fetchone()
+            return {'total_mappings': total, 'unique_merchants': merchants, 'categories': categories}
+        finally:
+            conn.close()
 
 
+class _ExportWriter:
+    """Appends chunks of training rows to one csv, jsonl or parquet file"""
+    
+    def __init__(self, fmt: str, path: str, offset: int = 0):
+        self.fmt = fmt
+        self.path = path
+        if fmt == 'parquet':
+            self._schema = pa.schema([('id', pa.int64()), ('merchant_name', pa.string()), ('ticker', pa.string()),
+                                      ('category', pa.string()), ('confidence', pa.float64()),
+                                      ('company_name', pa.string())])
+            self._writer = pq.ParquetWriter(path, self._schema)
+            return
+        
+        # Drop anything written after the last recorded chunk
+        self._file = open(path, 'a+', newline='', encoding='utf-8')
+        self._file.truncate(offset)
+        self._file.seek(offset)
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=EXPORT_FIELDS)
+            if offset == 0:
+                self._csv.writeheader()
+    
+    def __call__(self, rows: List[Dict[str, Any]]):
+        if self.fmt == 'parquet':
+            self._writer.write_table(pa.Table.from_pylist(rows, schema=self._schema))
+        elif self.fmt == 'csv':
+            self._csv.writerows(rows)
+        else:
+            self._file.writelines(json.dumps(row) + '\n' for row in rows)
+    
+    def offset(self) -> int:
+        """Byte offset of everything written so far, flushed to disk"""
+        if self.fmt == 'parquet':
+            return 0
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+    
+    def close(self):
+        if self.fmt == 'parquet':
+            self._writer.close()
+        else:
+            self._file.close()
@@ -0,0 +1,187 @@
+"""
+Market-Open Drain Scheduler for Kamioi Platform
+Sleeps until the market opens, then drains market_queue: leases queue rows in
+batches, nets them into per-ticker block orders and executes the blocks with
+bounded concurrency. Idempotency keys on the rows make retries safe.
+"""
+
+import os
+import socket
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict
+
+from order_aggregator import order_aggregator, CENT
+
+
+class MarketDrainScheduler:
+    def __init__(self, aggregator=None, market_clock=None, batch_size: int = 500, max_concurrency: int = 4,
+                 lease_seconds: float = 120, poll_interval: float = 30):
+        self.aggregator = aggregator or order_aggregator
+        self._market_clock = market_clock
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval  # Re-check the queue this often while the market is open
+        self.is_running = False
+        self.thread = None
+        self._wake = threading.Event()
+        self.drain_lock = threading.Lock()
+        self.history = deque(maxlen=50)
+        self.totals = {'drains': 0, 'entries': 0, 'blocks': 0, 'filled': 0, 'failed': 0, 'seconds': 0.0}
+
+    @property
+    def market_clock(self):
+        """Anything with is_market_open() plus market_open/market_close hours; SmartLLMProcessor by default"""
+        if self._market_clock is None:
+            from smart_llm_processor import smart_llm_processor
+            self._market_clock = smart_llm_processor
+        return self._market_clock
+
+    def seconds_until_open(self, now: datetime = None) -> float:
+        """Seconds until the next weekday market open (0 if the market is open now)"""
+        if self.market_clock.is_market_open():
+            return 0.0
+        now = now or datetime.now()
+        open_hours = self.market_clock.market_open
+        candidate = now.replace(hour=int(open_hours), minute=int(round((open_hours % 1) * 60)), second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        while candidate.weekday() >= 5:  # Skip the weekend
+            candidate += timedelta(days=1)
+        return (candidate - now).total_seconds()
+
+    # ------------------------------------------------------------------
+    # Draining
+    # ------------------------------------------------------------------
+
+    def drain(self) -> Dict:
+        """Drain everything currently queued; returns a throughput report"""
+        with self.drain_lock:
+            owner = f"drain-{socket.gethostname()}-{os.getpid()}-{self.totals['drains'] + 1}"
+            start = time.perf_counter()
+            report = {
+                'owner': owner,
+                'started_at': datetime.now().isoformat(),
+                'recovered': self.aggregator.recover_stale_blocks(owner),
+                'reconciled': self.aggregator.reconcile_open_blocks(),
+                'batches': 0, 'entries': 0, 'blocks': 0, 'filled': 0, 'failed': 0, 'open': 0, 'skipped': 0
+            }
+            notional = Decimal('0')
+
+            with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='market-drain') as pool:
+                pending = set()
+                while True:
+                    # Only lease more rows when a worker is free. One claim can still fan out into more
+                    # blocks than workers, so each block renews its lease when a worker picks it up (_execute)
+                    while len(pending) >= self.max_concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            report[future.result()] += 1
+
+                    entries = self.aggregator.claim_batch(owner, self.batch_size, self.lease_seconds)
+                    if not entries:
+                        break
+                    report['batches'] += 1
+                    for block in self.aggregator.create_blocks(entries):
+                        report['blocks'] += 1
+                        report['entries'] += len(block['entries'])
+                        notional += block['notional']
+                        pending.add(pool.submit(self._execute, block, owner))
+                    if len(entries) < self.batch_size:
+                        break
+
+                for future in pending:
+                    report[future.result()] += 1
+
+            elapsed = time.perf_counter() - start
+            report['notional'] = str(notional.quantize(CENT))
+            report['seconds'] = round(elapsed, 3)
+            report['entries_per_second'] = round(report['entries'] / elapsed, 1) if elapsed else 0.0
+            report['blocks_per_second'] = round(report['blocks'] / elapsed, 2) if elapsed else 0.0
+            report['finished_at'] = datetime.now().isoformat()
+
+            self.history.append(report)
+            self.totals['drains'] += 1
+            for key in ('entries', 'blocks', 'filled', 'failed'):
+                self.totals[key] += report[key]
+            self.totals['seconds'] += elapsed
+            if report['entries'] or report['recovered'] or report['reconciled']:
+                print(f"[DRAIN] {report['entries']} entries in {report['blocks']} block orders, "
+                      f"{report['entries_per_second']} entries/s ({report['filled']} filled, {report['failed']} failed)")
+            return report
+
+    def _execute(self, block: Dict, owner: str) -> str:
+        try:
+            if not self.aggregator.lease_block(block['id'], owner, self.lease_seconds):
+                # The lease lapsed while the block waited for a worker and another drainer took it over
+                print(f"[DRAIN] Block order {block['id']} ({block['ticker']}) was taken over; skipping")
+                return 'skipped'
+            return self.aggregator.execute_block(block)
+        except Exception as e:
+            # Entries stay 'aggregated' under their idempotency key; recover_stale_blocks() retries them
+            print(f"[DRAIN] Block order {block['id']} ({block['ticker']}) errored: {e}")
+            return 'failed'
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self._wake.clear()
+        self.thread = threading.Thread(target=self._loop, name='market-drain-scheduler', daemon=True)
+        self.thread.start()
+        print("Market drain scheduler started")
+
+    def stop(self):
+        self.is_running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout=60)
+        print("Market drain scheduler stopped")
+
+    def trigger(self):
+        """Wake the scheduler now (it still only drains while the market is open)"""
+        self._wake.set()
+
+    def _loop(self):
+        while self.is_running:
+            try:
+                wait_seconds = self.seconds_until_open()
+                if wait_seconds <= 0:
+                    self.drain()
+                    wait_seconds = self.poll_interval
+                else:
+                    # Sleep in bounded steps so clock changes and stop() are noticed
+                    wait_seconds = min(wait_seconds, 300)
+            except Exception as e:
+                print(f"[DRAIN] Scheduler error: {e}")
+                wait_seconds = 60
+            self._wake.wait(wait_seconds)
+            self._wake.clear()
+
+    def get_stats(self) -> Dict:
+        seconds = self.totals['seconds']
+        return {
+            'is_running': self.is_running,
+            'market_open': self.market_clock.is_market_open(),
+            'seconds_until_open': round(self.seconds_until_open(), 0),
+            'batch_size': self.batch_size,
+            'max_concurrency': self.max_concurrency,
+            'lease_seconds': self.lease_seconds,
+            'totals': dict(self.totals, entries_per_second=round(self.totals['entries'] / seconds, 1) if seconds else 0.0),
+            'last_drain': self.history[-1] if self.history else None,
+            'recent_drains': list(self.history)[-10:],
+            'queue': self.aggregator.get_stats().get('market_queue', {})
+        }
+
+
+# Global market drain scheduler instance
+market_drain_scheduler = MarketDrainScheduler()
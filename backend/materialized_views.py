@@ -1,328 +1,704 @@
 """
 Materialized Views System for Kamioi Platform
-Pre-computed views for fast dashboard rendering and analytics
+Pre-computed views for fast dashboard rendering and analytics.
+
+Each view is a real table defined by a SELECT plus delta rules. Triggers on the
+base tables append (source, op, row id, key) rows to mv_change_log; a refresh
+consumes the log past each view's watermark and, in dependency order:
+  - inserts are merged additively into the view (the SELECT restricted to the
+    new rows, upserted with per-column sum/min/max rules)
+  - updates and deletes recompute only the affected keys
+  - views without delta rules, or whose upstream changed wholesale, rebuild fully
+Refreshes are triggered by EventBus events; dashboards read the tables directly.
 """
 
-import json
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Iterable
+from dataclasses import dataclass, field
+
+from database_manager import db_manager
+
+FULL_REFRESH = '*'  # key_map value: rebuild the whole view whenever an upstream changes
+SQLITE_MAX_PARAMS = 500  # Keep IN lists well under SQLite's bound-parameter limit
+
 
 @dataclass
-class MaterializedView:
+class ViewDefinition:
     name: str
-    data: Dict[str, Any]
-    last_refresh: str
-    refresh_interval: int  # seconds
-    dependencies: List[str]  # other views this depends on
-    version: str = "1.0"
+    columns: List[str]  # Column DDL, in SELECT order
+    primary_key: List[str]
+    select_sql: str  # Full view query; '{filter}' is replaced by an AND clause (or nothing)
+    key: str  # View column that partitions the view for key-scoped recomputes
+    key_filter: str  # Source expression matching `key`, used in {filter} for recomputes
+    sources: List[str] = field(default_factory=list)  # Base tables whose change-log rows feed this view
+    row_filter: Optional[str] = None  # Source row-id expression for insert deltas; None = no insert delta
+    merge: Dict[str, str] = field(default_factory=dict)  # column -> 'sum' | 'min' | 'max' for insert deltas
+    dependencies: List[str] = field(default_factory=list)
+    key_map: Optional[str] = None  # None = upstream keys pass through; FULL_REFRESH = rebuild on any change
+    indexes: List[str] = field(default_factory=list)
+    refresh_interval: int = 300  # seconds; only used for the staleness report
+    version: str = "2.0"
+
+    @property
+    def column_names(self) -> List[str]:
+        return [column.split()[0] for column in self.columns]
+
+
+# Base tables tracked by the change log: source -> (key expression on the row)
+TRACKED_SOURCES = {
+    'transactions': 'user_id',
+    'users': 'id',
+    'llm_mappings': 'status',
+}
+
+VIEW_DEFINITIONS = [
+    ViewDefinition(
+        name='mv_user_dashboard',
+        columns=['user_id INTEGER', 'transaction_count INTEGER', 'total_spent REAL', 'total_roundups REAL',
+                 'total_fees REAL', 'mapped_count INTEGER', 'portfolio_value REAL',
+                 'first_transaction_at TEXT', 'last_transaction_at TEXT'],
+        primary_key=['user_id'],
+        select_sql='''
+            SELECT user_id, COUNT(*), COALESCE(SUM(amount), 0), COALESCE(SUM(round_up), 0), COALESCE(SUM(fee), 0),
+                   SUM(CASE WHEN ticker IS NOT NULL THEN 1 ELSE 0 END),
+                   COALESCE(SUM(CASE WHEN ticker IS NOT NULL
+                                     THEN COALESCE(shares, 0) * COALESCE(stock_price, price_per_share, 0)
+                                     ELSE 0 END), 0),
+                   MIN(date), MAX(date)
+            FROM transactions WHERE 1 = 1 {filter}
+            GROUP BY user_id
+        ''',
+        key='user_id', key_filter='user_id',
+        sources=['transactions'], row_filter='id',
+        merge={'transaction_count': 'sum', 'total_spent': 'sum', 'total_roundups': 'sum', 'total_fees': 'sum',
+               'mapped_count': 'sum', 'portfolio_value': 'sum',
+               'first_transaction_at': 'min', 'last_transaction_at': 'max'},
+    ),
+    ViewDefinition(
+        name='mv_user_category_spend',
+        columns=['user_id INTEGER', 'category TEXT', 'transaction_count INTEGER', 'total_spent REAL'],
+        primary_key=['user_id', 'category'],
+        select_sql='''
+            SELECT user_id, COALESCE(category, 'Other'), COUNT(*), COALESCE(SUM(amount), 0)
+            FROM transactions WHERE 1 = 1 {filter}
+            GROUP BY user_id, COALESCE(category, 'Other')
+        ''',
+        key='user_id', key_filter='user_id',
+        sources=['transactions'], row_filter='id',
+        merge={'transaction_count': 'sum', 'total_spent': 'sum'},
+    ),
+    ViewDefinition(
+        name='mv_user_merchant_spend',
+        columns=['user_id INTEGER', 'merchant TEXT', 'transaction_count INTEGER', 'total_spent REAL'],
+        primary_key=['user_id', 'merchant'],
+        select_sql='''
+            SELECT user_id, COALESCE(merchant, 'Unknown'), COUNT(*), COALESCE(SUM(amount), 0)
+            FROM transactions WHERE 1 = 1 {filter}
+            GROUP BY user_id, COALESCE(merchant, 'Unknown')
+        ''',
+        key='user_id', key_filter='user_id',
+        sources=['transactions'], row_filter='id',
+        merge={'transaction_count': 'sum', 'total_spent': 'sum'},
+        indexes=['CREATE INDEX IF NOT EXISTS idx_mv_user_merchant_spend_top ON mv_user_merchant_spend(user_id, total_spent)'],
+    ),
+    ViewDefinition(
+        name='mv_account_type_summary',
+        columns=['account_type TEXT', 'user_count INTEGER', 'transaction_count INTEGER', 'total_spent REAL',
+                 'total_roundups REAL', 'total_fees REAL'],
+        primary_key=['account_type'],
+        select_sql='''
+            SELECT COALESCE(u.account_type, 'unknown'), COUNT(*), COALESCE(SUM(d.transaction_count), 0),
+                   COALESCE(SUM(d.total_spent), 0), COALESCE(SUM(d.total_roundups), 0), COALESCE(SUM(d.total_fees), 0)
+            FROM users u LEFT JOIN mv_user_dashboard d ON d.user_id = u.id
+            WHERE 1 = 1 {filter}
+            GROUP BY COALESCE(u.account_type, 'unknown')
+        ''',
+        key='account_type', key_filter="COALESCE(u.account_type, 'unknown')",
+        sources=['users'], dependencies=['mv_user_dashboard'], key_map=FULL_REFRESH,
+    ),
+    ViewDefinition(
+        # Platform totals; user 2 is the shared demo account the admin dashboards have always excluded
+        name='mv_admin_platform',
+        columns=['id INTEGER', 'total_users INTEGER', 'active_users INTEGER', 'total_transactions INTEGER',
+                 'total_spent REAL', 'total_roundups REAL', 'total_fees REAL', 'mapped_transactions INTEGER',
+                 'portfolio_value REAL'],
+        primary_key=['id'],
+        select_sql='''
+            SELECT 1, (SELECT COUNT(*) FROM users),
+                   SUM(CASE WHEN u.id IS NOT NULL THEN 1 ELSE 0 END),
+                   COALESCE(SUM(d.transaction_count), 0), COALESCE(SUM(d.total_spent), 0),
+                   COALESCE(SUM(d.total_roundups), 0), COALESCE(SUM(d.total_fees), 0),
+                   COALESCE(SUM(d.mapped_count), 0), COALESCE(SUM(d.portfolio_value), 0)
+            FROM mv_user_dashboard d LEFT JOIN users u ON u.id = d.user_id
+            WHERE d.user_id != 2 {filter}
+        ''',
+        key='id', key_filter='1',
+        sources=['users'], dependencies=['mv_user_dashboard'], key_map=FULL_REFRESH,
+        refresh_interval=180,
+    ),
+    ViewDefinition(
+        name='mv_llm_center',
+        columns=['status TEXT', 'mapping_count INTEGER', 'confidence_sum REAL', 'with_ticker INTEGER'],
+        primary_key=['status'],
+        select_sql='''
+            SELECT COALESCE(status, 'unknown'), COUNT(*), COALESCE(SUM(confidence), 0),
+                   SUM(CASE WHEN ticker IS NOT NULL AND ticker != '' THEN 1 ELSE 0 END)
+            FROM llm_mappings WHERE 1 = 1 {filter}
+            GROUP BY COALESCE(status, 'unknown')
+        ''',
+        key='status', key_filter="COALESCE(status, 'unknown')",
+        sources=['llm_mappings'], row_filter='id',
+        merge={'mapping_count': 'sum', 'confidence_sum': 'sum', 'with_ticker': 'sum'},
+        refresh_interval=120,
+    ),
+]
+
+
+def topological_order(definitions: Iterable[ViewDefinition]) -> List[ViewDefinition]:
+    """Order views so every view comes after the views it depends on (Kahn's algorithm)"""
+    by_name = {view.name: view for view in definitions}
+    indegree = {name: 0 for name in by_name}
+    dependents = {name: [] for name in by_name}
+    for view in by_name.values():
+        for dependency in view.dependencies:
+            if dependency not in by_name:
+                raise ValueError(f"View {view.name} depends on unknown view {dependency}")
+            indegree[view.name] += 1
+            dependents[dependency].append(view.name)
+
+    ready = [name for name in by_name if indegree[name] == 0]
+    ordered = []
+    while ready:
+        name = ready.pop(0)
+        ordered.append(by_name[name])
+        for dependent in dependents[name]:
+            indegree[dependent] -= 1
+            if indegree[dependent] == 0:
+                ready.append(dependent)
+
+    if len(ordered) != len(by_name):
+        cycle = sorted(name for name, degree in indegree.items() if degree > 0)
+        raise ValueError(f"Materialized view dependency cycle: {', '.join(cycle)}")
+    return ordered
+
+
+def _chunks(values: List, size: int = SQLITE_MAX_PARAMS):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
 
 class MaterializedViewManager:
-    def __init__(self):
-        self.views: Dict[str, MaterializedView] = {}
-        self.refresh_queue = []
+    def __init__(self, db=None, definitions: List[ViewDefinition] = None, refresh_on_read: bool = True):
+        self.db = db or db_manager
+        self.definitions = {view.name: view for view in topological_order(definitions or VIEW_DEFINITIONS)}
+        self.order = list(self.definitions)
+        self.refresh_on_read = refresh_on_read  # Apply pending changes before serving a stale read
         self.auto_refresh_enabled = True
-        
-    def create_view(self, name: str, data: Dict[str, Any], 
-                   refresh_interval: int = 300, dependencies: List[str] = None):
-        """Create or update a materialized view"""
-        view = MaterializedView(
-            name=name,
-            data=data,
-            last_refresh=datetime.utcnow().isoformat(),
-            refresh_interval=refresh_interval,
-            dependencies=dependencies or []
-        )
-        self.views[name] = view
-        print(f"Materialized view created: {name}")
-        return view
-    
-    def get_view(self, name: str) -> Optional[MaterializedView]:
-        """Get a materialized view by name"""
-        return self.views.get(name)
-    
-    def refresh_view(self, name: str, new_data: Dict[str, Any]):
-        """Refresh a materialized view with new data"""
-        if name in self.views:
-            self.views[name].data = new_data
-            self.views[name].last_refresh = datetime.utcnow().isoformat()
-            print(f"Materialized view refreshed: {name}")
-            
-            # Trigger refresh of dependent views
-            self._refresh_dependent_views(name)
-        else:
-            print(f"View not found: {name}")
-    
-    def _refresh_dependent_views(self, view_name: str):
-        """Refresh views that depend on the given view"""
-        for name, view in self.views.items():
-            if view_name in view.dependencies:
-                print(f"Refreshing dependent view: {name}")
-                # In a real system, this would trigger the view's refresh logic
-                self.refresh_view(name, view.data)  # For now, just update timestamp
-    
+        self.installed = False
+        self.install_lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self._runner_lock = threading.Lock()
+        self._refresh_requested = threading.Event()
+        self.stats = {name: {'reads': 0, 'stale_reads': 0, 'read_refreshes': 0} for name in self.order}
+
+        # Every base table a view reads, including through its dependencies
+        self.all_sources = {}
+        for name in self.order:
+            view = self.definitions[name]
+            sources = set(view.sources)
+            for dependency in view.dependencies:
+                sources |= self.all_sources[dependency]
+            self.all_sources[name] = sources
+
+    @property
+    def available(self) -> bool:
+        """Views live in SQLite; the PostgreSQL deployment keeps its live queries"""
+        return not getattr(self.db, '_use_postgresql', False)
+
+    # ------------------------------------------------------------------
+    # Installation
+    # ------------------------------------------------------------------
+
+    def install(self):
+        """Create the change log, triggers and view tables, and build any view that is new or out of date"""
+        if self.installed or not self.available:
+            return
+        with self.install_lock:
+            if self.installed:
+                return
+            conn = self.db.get_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS mv_change_log (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        source TEXT NOT NULL,
+                        op TEXT NOT NULL,
+                        row_id INTEGER,
+                        key
+                    )
+                ''')
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS mv_view_state (
+                        name TEXT PRIMARY KEY,
+                        version TEXT,
+                        watermark INTEGER DEFAULT 0,
+                        last_refresh TEXT,
+                        last_full_refresh TEXT,
+                        refresh_count INTEGER DEFAULT 0,
+                        incremental_refreshes INTEGER DEFAULT 0,
+                        full_refreshes INTEGER DEFAULT 0,
+                        last_keys_touched INTEGER DEFAULT 0,
+                        last_duration_ms REAL DEFAULT 0
+                    )
+                ''')
+                for source, key in TRACKED_SOURCES.items():
+                    self._create_triggers(cur, source, key)
+
+                max_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM mv_change_log").fetchone()[0]
+                states = dict(cur.execute("SELECT name, version FROM mv_view_state").fetchall())
+                for name in self.order:
+                    view = self.definitions[name]
+                    if states.get(name) != view.version:
+                        cur.execute(f"DROP TABLE IF EXISTS {name}")
+                    cur.execute(f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(view.columns)}, "
+                                f"PRIMARY KEY ({', '.join(view.primary_key)}))")
+                    for index_sql in view.indexes:
+                        cur.execute(index_sql)
+                    if states.get(name) != view.version:
+                        self._rebuild(cur, view)
+                        cur.execute('''
+                            INSERT INTO mv_view_state (name, version, watermark, last_refresh, last_full_refresh,
+                                                       refresh_count, full_refreshes)
+                            VALUES (?, ?, ?, ?, ?, 1, 1)
+                            ON CONFLICT(name) DO UPDATE SET version = excluded.version, watermark = excluded.watermark,
+                                last_refresh = excluded.last_refresh, last_full_refresh = excluded.last_full_refresh,
+                                refresh_count = refresh_count + 1, full_refreshes = full_refreshes + 1
+                        ''', (name, view.version, max_id, datetime.utcnow().isoformat(), datetime.utcnow().isoformat()))
+                        print(f"Materialized view built: {name}")
+                conn.commit()
+                self.installed = True
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _create_triggers(cur, source: str, key: str):
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_mv_{source}_insert AFTER INSERT ON {source}
+            BEGIN
+                INSERT INTO mv_change_log (source, op, row_id, key) VALUES ('{source}', 'I', NEW.id, NEW.{key});
+            END
+        ''')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_mv_{source}_update AFTER UPDATE ON {source}
+            BEGIN
+                INSERT INTO mv_change_log (source, op, row_id, key) VALUES ('{source}', 'U', NEW.id, NEW.{key});
+                INSERT INTO mv_change_log (source, op, row_id, key)
+                SELECT '{source}', 'U', OLD.id, OLD.{key} WHERE OLD.{key} IS NOT NEW.{key};
+            END
+        ''')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_mv_{source}_delete AFTER DELETE ON {source}
+            BEGIN
+                INSERT INTO mv_change_log (source, op, row_id, key) VALUES ('{source}', 'D', OLD.id, OLD.{key});
+            END
+        ''')
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+
+    def refresh_pending(self, names: List[str] = None) -> Dict[str, Dict]:
+        """
+        Apply every change-log row past each view's watermark, in dependency order,
+        inside one write transaction. Returns per-view refresh summaries.
+        """
+        if not self.available:
+            return {}
+        self.install()
+        targets = self._refresh_closure(names) if names else set(self.order)
+
+        with self.refresh_lock:
+            conn = self.db.get_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                max_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM mv_change_log").fetchone()[0]
+                watermarks = dict(cur.execute("SELECT name, watermark FROM mv_view_state").fetchall())
+                changed: Dict[str, Any] = {}  # view -> set of keys touched, or FULL_REFRESH
+                summary = {}
+
+                for name in self.order:
+                    if name not in targets:
+                        continue
+                    view = self.definitions[name]
+                    start = time.perf_counter()
+                    watermark = watermarks.get(name, 0)
+                    rows = []
+                    if view.sources and watermark < max_id:
+                        marks = ','.join('?' * len(view.sources))
+                        rows = cur.execute(f'''
+                            SELECT source, op, row_id, key FROM mv_change_log
+                            WHERE id > ? AND id <= ? AND source IN ({marks})
+                        ''', (watermark, max_id, *view.sources)).fetchall()
+                    upstream = [changed[dep] for dep in view.dependencies if dep in changed]
+                    if not rows and not upstream:
+                        if watermark < max_id:
+                            cur.execute("UPDATE mv_view_state SET watermark = ? WHERE name = ?", (max_id, name))
+                        continue
+
+                    result = self._apply(cur, view, rows, upstream)
+                    changed[name] = result
+                    elapsed = (time.perf_counter() - start) * 1000
+                    full = result == FULL_REFRESH
+                    touched = 0 if full else len(result)
+                    now = datetime.utcnow().isoformat()
+                    cur.execute('''
+                        UPDATE mv_view_state
+                        SET watermark = ?, last_refresh = ?, refresh_count = refresh_count + 1,
+                            incremental_refreshes = incremental_refreshes + ?, full_refreshes = full_refreshes + ?,
+                            last_full_refresh = CASE WHEN ? THEN ? ELSE last_full_refresh END,
+                            last_keys_touched = ?, last_duration_ms = ?
+                        WHERE name = ?
+                    ''', (max_id, now, 0 if full else 1, 1 if full else 0, full, now, touched, round(elapsed, 3), name))
+                    summary[name] = {'mode': 'full' if full else 'incremental', 'keys': touched,
+                                     'changes': len(rows), 'ms': round(elapsed, 3)}
+
+                # Drop log rows every view has consumed
+                low = cur.execute("SELECT MIN(watermark) FROM mv_view_state").fetchone()[0]
+                if low:
+                    cur.execute("DELETE FROM mv_change_log WHERE id <= ?", (low,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+        for name, info in summary.items():
+            print(f"Materialized view refreshed: {name} ({info['mode']}, {info['keys']} keys, {info['ms']}ms)")
+        return summary
+
+    def _apply(self, cur, view: ViewDefinition, rows: List[tuple], upstream: List[Any]):
+        """Apply one view's pending changes; returns the keys touched or FULL_REFRESH"""
+        if view.key_map == FULL_REFRESH or any(keys == FULL_REFRESH for keys in upstream):
+            self._rebuild(cur, view)
+            return FULL_REFRESH
+
+        primary = view.sources[0] if view.sources else None
+        recompute = set()
+        inserts = {}
+        for source, op, row_id, key in rows:
+            if source == primary and op == 'I' and view.row_filter and view.merge:
+                inserts[row_id] = key
+            else:
+                recompute.add(key)
+        for keys in upstream:
+            recompute |= keys  # Key-compatible dependencies pass their keys straight through
+
+        # Keys being recomputed already include their new rows
+        insert_ids = [row_id for row_id, key in inserts.items() if key not in recompute]
+
+        for keys in _chunks(sorted(recompute, key=str)):
+            marks = ','.join('?' * len(keys))
+            cur.execute(f"DELETE FROM {view.name} WHERE {view.key} IN ({marks})", keys)
+            cur.execute(f"INSERT INTO {view.name} ({', '.join(view.column_names)}) "
+                        + view.select_sql.format(filter=f"AND {view.key_filter} IN ({marks})"), keys)
+
+        if insert_ids:
+            columns = view.column_names
+            updates = []
+            for column in columns:
+                rule = view.merge.get(column)
+                if rule == 'sum':
+                    updates.append(f"{column} = COALESCE({column}, 0) + COALESCE(excluded.{column}, 0)")
+                elif rule in ('min', 'max'):
+                    updates.append(f"{column} = COALESCE({rule.upper()}({column}, excluded.{column}), "
+                                   f"{column}, excluded.{column})")
+            for ids in _chunks(insert_ids):
+                marks = ','.join('?' * len(ids))
+                cur.execute(
+                    f"INSERT INTO {view.name} ({', '.join(columns)}) "
+                    + view.select_sql.format(filter=f"AND {view.row_filter} IN ({marks})")
+                    + f" ON CONFLICT ({', '.join(view.primary_key)}) DO UPDATE SET {', '.join(updates)}",
+                    ids
+                )
+
+        return recompute | {key for key in inserts.values()}
+
+    def _rebuild(self, cur, view: ViewDefinition):
+        cur.execute(f"DELETE FROM {view.name}")
+        cur.execute(f"INSERT INTO {view.name} ({', '.join(view.column_names)}) " + view.select_sql.format(filter=''))
+
+    def refresh_view(self, name: str, full: bool = False) -> Dict[str, Dict]:
+        """Refresh one view (and what it depends on); full=True rebuilds it from scratch"""
+        if name not in self.definitions:
+            raise KeyError(f"View not found: {name}")
+        if not full:
+            return self.refresh_pending([name])
+
+        self.refresh_pending([name])
+        with self.refresh_lock:
+            conn = self.db.get_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                start = time.perf_counter()
+                self._rebuild(cur, self.definitions[name])
+                now = datetime.utcnow().isoformat()
+                cur.execute('''
+                    UPDATE mv_view_state SET last_refresh = ?, last_full_refresh = ?, refresh_count = refresh_count + 1,
+                        full_refreshes = full_refreshes + 1, last_duration_ms = ?
+                    WHERE name = ?
+                ''', (now, now, round((time.perf_counter() - start) * 1000, 3), name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        # Anything built on top of this view picks the rebuild up wholesale
+        for dependent in self.order:
+            if name in self._upstream(dependent):
+                self.refresh_view(dependent, full=True)
+        return {name: {'mode': 'full'}}
+
+    def request_refresh(self):
+        """Coalescing refresh trigger for event handlers: requests that arrive mid-refresh collapse into one more pass"""
+        self._refresh_requested.set()
+        while self._refresh_requested.is_set():
+            if not self._runner_lock.acquire(blocking=False):
+                return  # The running refresh sees the flag and loops again
+            try:
+                self._refresh_requested.clear()
+                self.refresh_pending()
+            finally:
+                self._runner_lock.release()
+
+    def _refresh_closure(self, names: List[str]) -> set:
+        """
+        Views a targeted refresh must cover: the named views, everything they
+        read from, and everything built on them. The change log is shared, so a
+        dependent left out would lose the changes its upstream consumed.
+        """
+        targets = set(names)
+        while True:
+            expanded = set(targets)
+            for name in self.order:  # Dependency order: dependents of dependents are caught in one pass
+                if expanded & set(self.definitions[name].dependencies):
+                    expanded.add(name)
+            for name in list(expanded):
+                expanded |= set(self._upstream(name))
+            if expanded == targets:
+                return targets
+            targets = expanded
+
+    def _upstream(self, name: str) -> List[str]:
+        seen = []
+        stack = list(self.definitions[name].dependencies)
+        while stack:
+            dependency = stack.pop()
+            if dependency not in seen:
+                seen.append(dependency)
+                stack.extend(self.definitions[dependency].dependencies)
+        return seen
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def pending_changes(self, name: str) -> int:
+        """Change-log rows this view (or anything it reads through) has not applied yet"""
+        self.install()
+        sources = sorted(self.all_sources[name])
+        if not sources:
+            return 0
+        conn = self.db.get_connection()
+        watermark = conn.execute("SELECT watermark FROM mv_view_state WHERE name = ?", (name,)).fetchone()
+        marks = ','.join('?' * len(sources))
+        pending = conn.execute(f"SELECT COUNT(*) FROM mv_change_log WHERE id > ? AND source IN ({marks})",
+                               (watermark[0] if watermark else 0, *sources)).fetchone()[0]
+        conn.close()
+        return pending
+
+    def read_view(self, name: str, where: str = '', params: tuple = (), order_by: str = '',
+                  limit: int = None) -> List[Dict]:
+        """Read rows from a view table, counting (and by default repairing) stale reads"""
+        if name not in self.definitions:
+            raise KeyError(f"View not found: {name}")
+        self.install()
+        stats = self.stats[name]
+        stats['reads'] += 1
+        if self.pending_changes(name):
+            stats['stale_reads'] += 1
+            if self.refresh_on_read:
+                stats['read_refreshes'] += 1
+                self.refresh_pending([name])
+
+        sql = f"SELECT * FROM {name}"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        conn = self.db.get_connection()
+        cur = conn.execute(sql, params)
+        columns = [column[0] for column in cur.description]
+        rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        conn.close()
+        return rows
+
+    def get_user_dashboard(self, user_id: int) -> Dict[str, Any]:
+        """User dashboard KPIs, category breakdown and top merchants from the view tables"""
+        kpis = self.read_view('mv_user_dashboard', 'user_id = ?', (user_id,))
+        categories = self.read_view('mv_user_category_spend', 'user_id = ?', (user_id,), 'total_spent DESC')
+        merchants = self.read_view('mv_user_merchant_spend', 'user_id = ?', (user_id,), 'total_spent DESC', 5)
+        row = kpis[0] if kpis else {}
+        return {
+            'user_id': user_id,
+            'kpis': {
+                'total_spent': round(row.get('total_spent') or 0, 2),
+                'total_roundups': round(row.get('total_roundups') or 0, 2),
+                'total_fees': round(row.get('total_fees') or 0, 2),
+                'transaction_count': row.get('transaction_count') or 0,
+                'mapped_count': row.get('mapped_count') or 0,
+                'portfolio_value': round(row.get('portfolio_value') or 0, 2),
+                'last_transaction_at': row.get('last_transaction_at')
+            },
+            'category_breakdown': {c['category']: round(c['total_spent'], 2) for c in categories},
+            'top_merchants': [[m['merchant'], round(m['total_spent'], 2)] for m in merchants],
+            'last_updated': self._last_refresh('mv_user_dashboard')
+        }
+
+    def get_platform_overview(self) -> Dict[str, Any]:
+        rows = self.read_view('mv_admin_platform')
+        overview = rows[0] if rows else {}
+        overview['account_types'] = {row['account_type']: row for row in self.read_view('mv_account_type_summary')}
+        overview['last_updated'] = self._last_refresh('mv_admin_platform')
+        return overview
+
+    def get_llm_center(self) -> Dict[str, Any]:
+        rows = self.read_view('mv_llm_center')
+        total = sum(row['mapping_count'] for row in rows)
+        return {
+            'by_status': {row['status']: {
+                'count': row['mapping_count'],
+                'avg_confidence': round(row['confidence_sum'] / row['mapping_count'], 4) if row['mapping_count'] else 0,
+                'with_ticker': row['with_ticker']
+            } for row in rows},
+            'total_mappings': total,
+            'last_updated': self._last_refresh('mv_llm_center')
+        }
+
+    def _last_refresh(self, name: str) -> Optional[str]:
+        conn = self.db.get_connection()
+        row = conn.execute("SELECT last_refresh FROM mv_view_state WHERE name = ?", (name,)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    # ------------------------------------------------------------------
+    # Introspection
+    # ------------------------------------------------------------------
+
+    def describe_view(self, name: str) -> Optional[Dict[str, Any]]:
+        view = self.definitions.get(name)
+        if not view:
+            return None
+        return self.get_view_stats()['views'].get(name)
+
     def is_stale(self, name: str) -> bool:
-        """Check if a view is stale and needs refresh"""
-        if name not in self.views:
+        """A view is stale while it has change-log rows it has not applied"""
+        if name not in self.definitions:
             return True
-        
-        view = self.views[name]
-        last_refresh = datetime.fromisoformat(view.last_refresh)
-        now = datetime.utcnow()
-        
-        return (now - last_refresh).total_seconds() > view.refresh_interval
-    
+        return self.pending_changes(name) > 0
+
     def get_stale_views(self) -> List[str]:
         """Get list of stale views that need refresh"""
-        return [name for name in self.views.keys() if self.is_stale(name)]
-    
+        return [name for name in self.order if self.is_stale(name)]
+
     def get_view_stats(self) -> Dict[str, Any]:
         """Get statistics about all materialized views"""
-        stats = {
-            'total_views': len(self.views),
-            'stale_views': len(self.get_stale_views()),
-            'views': {}
-        }
-        
-        for name, view in self.views.items():
-            stats['views'][name] = {
-                'last_refresh': view.last_refresh,
+        if not self.available:
+            return {'total_views': 0, 'stale_views': 0, 'views': {}, 'available': False}
+        self.install()
+        conn = self.db.get_connection()
+        cur = conn.execute("SELECT * FROM mv_view_state")
+        columns = [column[0] for column in cur.description]
+        states = {row[0]: dict(zip(columns, row)) for row in cur.fetchall()}
+        log_size = conn.execute("SELECT COUNT(*) FROM mv_change_log").fetchone()[0]
+        row_counts = {name: conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in self.order}
+        conn.close()
+
+        views = {}
+        for name in self.order:
+            view = self.definitions[name]
+            state = states.get(name, {})
+            pending = self.pending_changes(name)
+            views[name] = {
+                'last_refresh': state.get('last_refresh'),
+                'last_full_refresh': state.get('last_full_refresh'),
                 'refresh_interval': view.refresh_interval,
-                'is_stale': self.is_stale(name),
+                'is_stale': pending > 0,
+                'pending_changes': pending,
                 'dependencies': view.dependencies,
-                'data_size': len(str(view.data))
+                'sources': sorted(self.all_sources[name]),
+                'rows': row_counts[name],
+                'watermark': state.get('watermark'),
+                'refresh_count': state.get('refresh_count', 0),
+                'incremental_refreshes': state.get('incremental_refreshes', 0),
+                'full_refreshes': state.get('full_refreshes', 0),
+                'last_keys_touched': state.get('last_keys_touched', 0),
+                'last_duration_ms': state.get('last_duration_ms', 0),
+                **self.stats[name]
             }
-        
-        return stats
+
+        return {
+            'total_views': len(views),
+            'stale_views': len([v for v in views.values() if v['is_stale']]),
+            'refresh_order': self.order,
+            'change_log_size': log_size,
+            'reads': sum(v['reads'] for v in views.values()),
+            'stale_reads': sum(v['stale_reads'] for v in views.values()),
+            'views': views
+        }
+
 
 # Global materialized view manager
 mv_manager = MaterializedViewManager()
 
-# Pre-defined materialized views
-def create_user_dashboard_view(user_id: str, transactions: List[Dict], 
-                              roundup_stats: Dict, mapping_stats: Dict) -> Dict[str, Any]:
-    """Create materialized view for user dashboard"""
-    
-    # Calculate KPIs
-    total_spent = sum(t.get('purchase', 0) for t in transactions)
-    total_roundups = sum(t.get('round_up', 0) for t in transactions)
-    total_fees = sum(t.get('fee', 0) for t in transactions)
-    
-    # Recent transactions (last 30 days)
-    recent_transactions = [
-        t for t in transactions 
-        if (datetime.utcnow() - datetime.fromisoformat(t.get('date', datetime.utcnow().isoformat()))).days <= 30
-    ]
-    
-    # Category breakdown
-    category_spend = {}
-    for t in transactions:
-        category = t.get('category', 'Other')
-        category_spend[category] = category_spend.get(category, 0) + t.get('purchase', 0)
-    
-    # Top merchants
-    merchant_spend = {}
-    for t in transactions:
-        merchant = t.get('merchant', 'Unknown')
-        merchant_spend[merchant] = merchant_spend.get(merchant, 0) + t.get('purchase', 0)
-    
-    top_merchants = sorted(merchant_spend.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    return {
-        'user_id': user_id,
-        'kpis': {
-            'total_spent': total_spent,
-            'total_roundups': total_roundups,
-            'total_fees': total_fees,
-            'transaction_count': len(transactions),
-            'recent_transaction_count': len(recent_transactions)
-        },
-        'recent_transactions': recent_transactions[:10],  # Last 10
-        'category_breakdown': category_spend,
-        'top_merchants': top_merchants,
-        'roundup_stats': roundup_stats,
-        'mapping_stats': mapping_stats,
-        'last_updated': datetime.utcnow().isoformat()
-    }
-
-def create_family_dashboard_view(family_id: str, members: List[str], 
-                                member_data: Dict[str, Dict]) -> Dict[str, Any]:
-    """Create materialized view for family dashboard"""
-    
-    # Aggregate member data
-    total_spent = sum(data.get('kpis', {}).get('total_spent', 0) for data in member_data.values())
-    total_roundups = sum(data.get('kpis', {}).get('total_roundups', 0) for data in member_data.values())
-    total_fees = sum(data.get('kpis', {}).get('total_fees', 0) for data in member_data.values())
-    
-    # Combined category breakdown
-    combined_categories = {}
-    for data in member_data.values():
-        for category, amount in data.get('category_breakdown', {}).items():
-            combined_categories[category] = combined_categories.get(category, 0) + amount
-    
-    # Member leaderboard
-    member_leaderboard = []
-    for member_id, data in member_data.items():
-        member_leaderboard.append({
-            'member_id': member_id,
-            'total_spent': data.get('kpis', {}).get('total_spent', 0),
-            'total_roundups': data.get('kpis', {}).get('total_roundups', 0),
-            'transaction_count': data.get('kpis', {}).get('transaction_count', 0)
-        })
-    
-    member_leaderboard.sort(key=lambda x: x['total_roundups'], reverse=True)
-    
-    return {
-        'family_id': family_id,
-        'members': members,
-        'kpis': {
-            'total_spent': total_spent,
-            'total_roundups': total_roundups,
-            'total_fees': total_fees,
-            'member_count': len(members),
-            'total_transactions': sum(data.get('kpis', {}).get('transaction_count', 0) for data in member_data.values())
-        },
-        'category_breakdown': combined_categories,
-        'member_leaderboard': member_leaderboard,
-        'member_data': member_data,
-        'last_updated': datetime.utcnow().isoformat()
-    }
-
-def create_business_dashboard_view(business_id: str, team_members: List[str],
-                                  member_data: Dict[str, Dict]) -> Dict[str, Any]:
-    """Create materialized view for business dashboard"""
-    
-    # Business KPIs
-    total_expenses = sum(data.get('kpis', {}).get('total_spent', 0) for data in member_data.values())
-    total_roundups = sum(data.get('kpis', {}).get('total_roundups', 0) for data in member_data.values())
-    total_fees = sum(data.get('kpis', {}).get('total_fees', 0) for data in member_data.values())
-    
-    # Expense categories
-    expense_categories = {}
-    for data in member_data.values():
-        for category, amount in data.get('category_breakdown', {}).items():
-            expense_categories[category] = expense_categories.get(category, 0) + amount
-    
-    # Team spending analysis
-    team_spending = []
-    for member_id, data in member_data.items():
-        team_spending.append({
-            'member_id': member_id,
-            'total_expenses': data.get('kpis', {}).get('total_spent', 0),
-            'total_roundups': data.get('kpis', {}).get('total_roundups', 0),
-            'transaction_count': data.get('kpis', {}).get('transaction_count', 0)
-        })
-    
-    team_spending.sort(key=lambda x: x['total_expenses'], reverse=True)
-    
-    return {
-        'business_id': business_id,
-        'team_members': team_members,
-        'kpis': {
-            'total_expenses': total_expenses,
-            'total_roundups': total_roundups,
-            'total_fees': total_fees,
-            'team_size': len(team_members),
-            'total_transactions': sum(data.get('kpis', {}).get('transaction_count', 0) for data in member_data.values())
-        },
-        'expense_categories': expense_categories,
-        'team_spending': team_spending,
-        'member_data': member_data,
-        'last_updated': datetime.utcnow().isoformat()
-    }
-
-def create_admin_platform_view(admin_stats: Dict, system_health: Dict,
-                              user_stats: Dict, business_stats: Dict) -> Dict[str, Any]:
-    """Create materialized view for admin platform overview"""
-    
-    return {
-        'platform_kpis': {
-            'total_users': admin_stats.get('total_users', 0),
-            'total_families': admin_stats.get('total_families', 0),
-            'total_businesses': admin_stats.get('total_businesses', 0),
-            'total_transactions': admin_stats.get('total_transactions', 0),
-            'total_roundups': admin_stats.get('total_roundups', 0),
-            'total_fees': admin_stats.get('total_fees', 0),
-            'mapping_coverage': admin_stats.get('mapping_coverage', 0),
-            'system_uptime': admin_stats.get('system_uptime', 0)
-        },
-        'system_health': system_health,
-        'user_breakdown': user_stats,
-        'business_breakdown': business_stats,
-        'recent_activity': admin_stats.get('recent_activity', []),
-        'last_updated': datetime.utcnow().isoformat()
-    }
-
-def create_llm_center_view(queue_stats: Dict, mapping_stats: Dict,
-                          model_performance: Dict) -> Dict[str, Any]:
-    """Create materialized view for LLM Center"""
-    
-    return {
-        'queue_status': queue_stats,
-        'mapping_stats': mapping_stats,
-        'model_performance': model_performance,
-        'recent_activity': queue_stats.get('recent_entries', []),
-        'last_updated': datetime.utcnow().isoformat()
-    }
-
-# Initialize default materialized views
-def initialize_materialized_views():
-    """Initialize default materialized views"""
-    
-    # User dashboard view
-    mv_manager.create_view(
-        'mv_user_dashboard',
-        create_user_dashboard_view('user1', [], {}, {}),
-        refresh_interval=300,  # 5 minutes
-        dependencies=[]
-    )
-    
-    # Family dashboard view
-    mv_manager.create_view(
-        'mv_family_dashboard',
-        create_family_dashboard_view('family1', [], {}),
-        refresh_interval=300,
-        dependencies=['mv_user_dashboard']
-    )
-    
-    # Business dashboard view
-    mv_manager.create_view(
-        'mv_business_dashboard',
-        create_business_dashboard_view('business1', [], {}),
-        refresh_interval=300,
-        dependencies=['mv_user_dashboard']
-    )
-    
-    # Admin platform view
-    mv_manager.create_view(
-        'mv_admin_platform',
-        create_admin_platform_view({}, {}, {}, {}),
-        refresh_interval=180,  # 3 minutes
-        dependencies=['mv_user_dashboard', 'mv_family_dashboard', 'mv_business_dashboard']
-    )
-    
-    # LLM Center view
-    mv_manager.create_view(
-        'mv_llm_center',
-        create_llm_center_view({}, {}, {}),
-        refresh_interval=120,  # 2 minutes
-        dependencies=[]
-    )
-    
-    print("Materialized views initialized")
 
 # Auto-refresh system
 def auto_refresh_views():
-    """Auto-refresh stale materialized views"""
-    stale_views = mv_manager.get_stale_views()
-    
-    for view_name in stale_views:
-        print(f"Auto-refreshing stale view: {view_name}")
-        # In a real system, this would trigger the view's refresh logic
-        # For now, just update the timestamp
-        view = mv_manager.get_view(view_name)
-        if view:
-            mv_manager.refresh_view(view_name, view.data)
-
-# Initialize views
-initialize_materialized_views()
+    """Apply pending base-table changes to every materialized view"""
+    if mv_manager.auto_refresh_enabled:
+        mv_manager.request_refresh()
+
+
+def integrate_with_event_bus(bus=None, manager: MaterializedViewManager = None):
+    """Refresh views incrementally whenever data-changing events arrive"""
+    manager = manager or mv_manager
+    if bus is None:
+        from event_bus import event_bus as bus
+    from event_bus import EventType
+
+    def handle_data_changed(event):
+        if manager.auto_refresh_enabled:
+            manager.request_refresh()
+
+    for event_type in (EventType.INGEST_RAW, EventType.INGEST_NORMALIZED, EventType.ROUNDUP_ACCRUED,
+                       EventType.ROUNDUP_SWEPT, EventType.MAPPING_APPROVED, EventType.MAPPING_AUTO_APPLIED,
+                       EventType.MAPPING_REJECTED):
+        bus.subscribe(event_type, handle_data_changed, batch=True)
+
+
+try:
+    integrate_with_event_bus()
+except ImportError:
+    pass  # Event bus not available
@@ -42,9 +42,16 @@ def create_system_errors_table():
                     resolved_by INTEGER,
                     resolution_notes TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    fingerprint VARCHAR(40),
+                    occurrences INTEGER DEFAULT 1,
+                    last_seen_at TIMESTAMP
                 )
             '''))
+            # Deduplication columns used by the buffered error sink
+            conn.execute(text('ALTER TABLE system_errors ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(40)'))
+            conn.execute(text('ALTER TABLE system_errors ADD COLUMN IF NOT EXISTS occurrences INTEGER DEFAULT 1'))
+            conn.execute(text('ALTER TABLE system_errors ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP'))
             conn.commit()
             print("[OK] Created system_errors table (PostgreSQL)")
 
@@ -53,8 +60,30 @@ def create_system_errors_table():
             conn.execute(text('CREATE INDEX IF NOT EXISTS idx_system_errors_severity ON system_errors(severity)'))
             conn.execute(text('CREATE INDEX IF NOT EXISTS idx_system_errors_resolved ON system_errors(is_resolved)'))
             conn.execute(text('CREATE INDEX IF NOT EXISTS idx_system_errors_created ON system_errors(created_at)'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS idx_system_errors_fingerprint ON system_errors(fingerprint)'))
+            conn.execute(text('''
+                CREATE TABLE IF NOT EXISTS error_stats_hourly (
+                    hour VARCHAR(19) NOT NULL,
+                    error_type VARCHAR(100) NOT NULL,
+                    severity VARCHAR(20) NOT NULL DEFAULT '',
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    occurrences INTEGER NOT NULL DEFAULT 0,
+                    unresolved INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (hour, error_type, severity)
+                )
+            '''))
+            conn.execute(text('''
+                CREATE TABLE IF NOT EXISTS error_stats_totals (
+                    error_type VARCHAR(100) NOT NULL,
+                    severity VARCHAR(20) NOT NULL DEFAULT '',
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    occurrences INTEGER NOT NULL DEFAULT 0,
+                    unresolved INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (error_type, severity)
+                )
+            '''))
             conn.commit()
-            print("[OK] Created indexes")
+            print("[OK] Created indexes and error_stats_hourly/error_stats_totals rollups")
 
             db_manager.release_connection(conn)
         else:
@@ -76,9 +105,18 @@ def create_system_errors_table():
                     resolved_by INTEGER,
                     resolution_notes TEXT,
                     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    fingerprint TEXT,
+                    occurrences INTEGER DEFAULT 1,
+                    last_seen_at TEXT
                 )
             ''')
+            # Deduplication columns used by the buffered error sink
+            for column in ('fingerprint TEXT', 'occurrences INTEGER DEFAULT 1', 'last_seen_at TEXT'):
+                try:
+                    cur.execute(f'ALTER TABLE system_errors ADD COLUMN {column}')
+                except Exception:
+                    pass  # Column already exists
             conn.commit()
             print("[OK] Created system_errors table (SQLite)")
 
@@ -87,8 +125,30 @@ def create_system_errors_table():
             cur.execute('CREATE INDEX IF NOT EXISTS idx_system_errors_severity ON system_errors(severity)')
             cur.execute('CREATE INDEX IF NOT EXISTS idx_system_errors_resolved ON system_errors(is_resolved)')
             cur.execute('CREATE INDEX IF NOT EXISTS idx_system_errors_created ON system_errors(created_at)')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_system_errors_fingerprint ON system_errors(fingerprint)')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS error_stats_hourly (
+                    hour TEXT NOT NULL,
+                    error_type TEXT NOT NULL,
+                    severity TEXT NOT NULL DEFAULT '',
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    occurrences INTEGER NOT NULL DEFAULT 0,
+                    unresolved INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (hour, error_type, severity)
+                )
+            ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS error_stats_totals (
+                    error_type TEXT NOT NULL,
+                    severity TEXT NOT NULL DEFAULT '',
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    occurrences INTEGER NOT NULL DEFAULT 0,
+                    unresolved INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (error_type, severity)
+                )
+            ''')
             conn.commit()
-            print("[OK] Created indexes")
+            print("[OK] Created indexes and error_stats_hourly/error_stats_totals rollups")
 
             conn.close()
 
@@ -191,17 +191,12 @@ class MXBankSyncPlaceholder:
             if self.escrow_balance < self.investment_amount:
                 return {'success': False, 'error': 'Insufficient escrow balance'}
             
-            # Buy stock via Alpaca
-            accounts = self.alpaca.get_accounts()
-            if not accounts:
-                return {'success': False, 'error': 'No Alpaca accounts available'}
+            # Queue the purchase; the order aggregator nets it with other users'
+            # purchases of the same ticker into one block order
+            from order_aggregator import order_aggregator
+            queue_id = order_aggregator.enqueue(user_id, ticker, self.investment_amount)
             
-            account_id = accounts[0]['id']
-            order_result = self.alpaca.buy_fractional_shares(
-                account_id, ticker, self.investment_amount
-            )
-            
-            if order_result:
+            if queue_id is not None:
                 # Deduct from escrow balance
                 self.escrow_balance -= self.investment_amount
                 
@@ -210,13 +205,13 @@ class MXBankSyncPlaceholder:
                 
                 return {
                     'success': True,
-                    'order_id': order_result.get('id'),
+                    'queue_id': queue_id,
                     'ticker': ticker,
                     'amount': self.investment_amount,
                     'remaining_escrow': self.escrow_balance
                 }
             else:
-                return {'success': False, 'error': 'Alpaca order failed'}
+                return {'success': False, 'error': 'Purchase could not be queued'}
                 
         except Exception as e:
             return {'success': False, 'error': str(e)}
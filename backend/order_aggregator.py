@@ -0,0 +1,513 @@
+"""
+Order Aggregation Engine for Kamioi Platform
+Nets queued round-up purchases per ticker into one block order per window and
+allocates the filled shares back to users pro rata with exact decimal accounting
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database_manager import db_manager
+
+CENT = Decimal('0.01')
+SHARE_QUANTUM = Decimal('0.000000001')  # Alpaca accepts fractional quantities to 9 decimal places
+
+TERMINAL_ORDER_STATUSES = {'filled', 'canceled', 'expired', 'rejected', 'done_for_day'}
+
+
+def to_decimal(value) -> Decimal:
+    """Decimal from a float/str without binary noise (0.1 -> Decimal('0.1'))"""
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+
+def allocate_pro_rata(total: Decimal, weights: List[Decimal], quantum: Decimal) -> List[Decimal]:
+    """
+    Split total across weights in whole quantum units. Every part is floored,
+    then the leftover units go to the largest remainders (earliest entry wins
+    ties), so the parts always sum to exactly total.
+    """
+    weight_sum = sum(weights)
+    if not weights or weight_sum <= 0:
+        return [Decimal('0')] * len(weights)
+
+    units = int((total / quantum).to_integral_value(rounding=ROUND_DOWN))
+    raw = [Decimal(units) * weight / weight_sum for weight in weights]
+    floors = [int(share.to_integral_value(rounding=ROUND_DOWN)) for share in raw]
+    leftover = units - sum(floors)
+    for index in sorted(range(len(weights)), key=lambda i: (floors[i] - raw[i], i))[:leftover]:
+        floors[index] += 1
+    return [Decimal(units_for_entry) * quantum for units_for_entry in floors]
+
+
+class OrderAggregator:
+    def __init__(self, broker=None, db=None, account_id: str = None, min_notional: float = 1.00,
+                 fill_timeout: float = 30, poll_interval: float = 0.5, max_entries_per_window: int = 50000,
+                 lease_seconds: float = 120):
+        self._broker = broker
+        self.db = db or db_manager
+        self.account_id = account_id  # Only needed for the Alpaca Broker API
+        self.min_notional = to_decimal(min_notional)  # Alpaca's minimum notional order
+        self.fill_timeout = fill_timeout
+        self.poll_interval = poll_interval
+        self.max_entries_per_window = max_entries_per_window
+        self.lease_seconds = lease_seconds  # How long a claimed entry may sit unsubmitted before it is reclaimed
+        self.window_lock = threading.Lock()
+        self.stats = {
+            'windows': 0,
+            'block_orders': 0,
+            'block_orders_failed': 0,
+            'entries_filled': 0,
+            'notional_filled': '0.00',
+            'last_window': None
+        }
+
+    @property
+    def broker(self):
+        if self._broker is None:
+            from alpaca_service import AlpacaService
+            self._broker = AlpacaService()
+        return self._broker
+
+    # ------------------------------------------------------------------
+    # Queueing
+    # ------------------------------------------------------------------
+
+    def enqueue(self, user_id: int, ticker: str, amount: float, transaction_id: int = None) -> Optional[int]:
+        """
+        Queue a purchase for the next aggregation window; returns the market_queue id.
+        The source transaction moves to 'queued' so it is not picked up for mapping again.
+        """
+        try:
+            conn = self.db.get_connection()
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO market_queue (transaction_id, user_id, ticker, amount, status, created_at)
+                VALUES (?, ?, ?, ?, 'queued', ?)
+            """, (transaction_id, user_id, ticker.upper(), float(amount), datetime.now().isoformat()))
+            queue_id = cur.lastrowid
+            if transaction_id is not None:
+                cur.execute("UPDATE transactions SET status = 'queued', ticker = ? WHERE id = ?",
+                            (ticker.upper(), transaction_id))
+            conn.commit()
+            conn.close()
+            return queue_id
+        except Exception as e:
+            print(f"Error queuing purchase for user {user_id} ({ticker}): {e}")
+            return None
+
+    # ------------------------------------------------------------------
+    # Aggregation window
+    # ------------------------------------------------------------------
+
+    def run_window(self) -> Dict:
+        """Claim queued entries, submit one block order per ticker and allocate the fills"""
+        with self.window_lock:
+            start = time.perf_counter()
+            summary = {
+                'blocks': 0, 'filled': 0, 'failed': 0, 'open': 0,
+                'entries': 0, 'notional': '0.00',
+                'recovered': self.recover_stale_blocks(),
+                'reconciled': self.reconcile_open_blocks()
+            }
+
+            notional = Decimal('0')
+            owner = f"window-{os.getpid()}"
+            entries = self.claim_batch(owner, self.max_entries_per_window)
+            for block in self.create_blocks(entries):
+                summary['blocks'] += 1
+                summary['entries'] += len(block['entries'])
+                notional += block['notional']
+                # Earlier blocks' fill waits eat into the lease; renew it, or leave the block to its new owner
+                if self.lease_block(block['id'], owner):
+                    summary[self.execute_block(block)] += 1
+                else:
+                    summary['skipped'] = summary.get('skipped', 0) + 1
+
+            summary['notional'] = str(notional.quantize(CENT))
+            summary['duration_seconds'] = round(time.perf_counter() - start, 3)
+            self.stats['windows'] += 1
+            self.stats['last_window'] = dict(summary, finished_at=datetime.now().isoformat())
+            if summary['blocks']:
+                print(f"[AGGREGATOR] Window complete: {summary}")
+            return summary
+
+    def claim_batch(self, owner: str, limit: int, lease_seconds: float = None) -> List[Dict]:
+        """
+        Lease up to limit queued entries to owner. Entries whose lease expired
+        before they were turned into a block order are claimable again.
+        """
+        lease_seconds = self.lease_seconds if lease_seconds is None else lease_seconds
+        now = time.time()
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute('BEGIN IMMEDIATE')  # Serialize claims so two workers never lease the same rows
+            cur.execute("""
+                SELECT id, transaction_id, user_id, ticker, amount
+                FROM market_queue
+                WHERE ticker IS NOT NULL AND amount > 0
+                  AND (status = 'queued' OR (status = 'leased' AND lease_expires_at < ?))
+                ORDER BY id
+                LIMIT ?
+            """, (now, limit))
+            entries = [{
+                'queue_id': row[0], 'transaction_id': row[1], 'user_id': row[2], 'ticker': row[3].upper(),
+                'amount': to_decimal(row[4]).quantize(CENT, rounding=ROUND_HALF_UP)
+            } for row in cur.fetchall()]
+            cur.executemany("""
+                UPDATE market_queue
+                SET status = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = COALESCE(attempts, 0) + 1
+                WHERE id = ?
+            """, [(owner, now + lease_seconds, entry['queue_id']) for entry in entries])
+            conn.commit()
+            for entry in entries:
+                entry['lease_owner'] = owner
+            return entries
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def lease_block(self, block_id: int, owner: str, lease_seconds: float = None, take_expired: bool = False) -> bool:
+        """
+        Renew owner's lease on a block's entries right before executing it, so a
+        block that waited behind others is not recovered by another worker while
+        it runs. take_expired=True takes over a block whose lease has lapsed
+        instead (recovery). False means the block belongs to someone else now.
+        """
+        lease_seconds = self.lease_seconds if lease_seconds is None else lease_seconds
+        now = time.time()
+        held = "lease_expires_at < ?" if take_expired else "lease_owner = ? AND lease_expires_at >= ?"
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                UPDATE market_queue SET lease_owner = ?, lease_expires_at = ?
+                WHERE block_order_id = ? AND status = 'aggregated' AND {held}
+            """, (owner, now + lease_seconds, block_id, *((now,) if take_expired else (owner, now))))
+            conn.commit()
+            return cur.rowcount > 0
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def create_blocks(self, entries: List[Dict]) -> List[Dict]:
+        """
+        Group leased entries by ticker into block_orders rows. Each entry is
+        stamped with its block's client_order_id as its idempotency key in the
+        same transaction, so a retry always resubmits under the same key.
+        Tickers below the notional minimum go back to the queue.
+        """
+        by_ticker: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        for entry in entries:
+            by_ticker.setdefault(entry['ticker'], []).append(entry)
+
+        blocks = []
+        now = datetime.now().isoformat()
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute('BEGIN IMMEDIATE')
+            for ticker, ticker_entries in by_ticker.items():
+                total = sum(entry['amount'] for entry in ticker_entries)
+                if total < self.min_notional:
+                    # Stays queued until enough accumulates
+                    cur.executemany("""
+                        UPDATE market_queue SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL
+                        WHERE id = ? AND status = 'leased' AND lease_owner = ?
+                    """, [(entry['queue_id'], entry['lease_owner']) for entry in ticker_entries])
+                    continue
+                cur.execute("""
+                    INSERT INTO block_orders (ticker, notional, entry_count, status, created_at)
+                    VALUES (?, ?, ?, 'pending', ?)
+                """, (ticker, str(total), len(ticker_entries), now))
+                block_id = cur.lastrowid
+                client_order_id = f"kamioi-block-{block_id}"
+                cur.execute('UPDATE block_orders SET client_order_id = ? WHERE id = ?', (client_order_id, block_id))
+                cur.executemany("""
+                    UPDATE market_queue SET status = 'aggregated', block_order_id = ?, idempotency_key = ?
+                    WHERE id = ? AND status = 'leased' AND lease_owner = ?
+                """, [(block_id, client_order_id, entry['queue_id'], entry['lease_owner']) for entry in ticker_entries])
+                blocks.append({'id': block_id, 'ticker': ticker, 'notional': total,
+                               'client_order_id': client_order_id, 'entries': ticker_entries})
+            conn.commit()
+            return blocks
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def execute_block(self, block: Dict) -> str:
+        """Submit a block order and wait for its fill; returns 'filled', 'open' or 'failed'"""
+        # A retry of a block that already reached the broker must not submit a second order
+        order = self.broker.get_order_by_client_id(block['client_order_id'], self.account_id) if block.get('retry') else None
+        if not order:
+            order = self.broker.submit_order(
+                account_id=self.account_id,
+                symbol=block['ticker'],
+                notional=str(block['notional']),
+                side='buy',
+                order_type='market',
+                time_in_force='day',
+                client_order_id=block['client_order_id']
+            )
+        if not order:
+            # A lost response may still have created the order; the client ID tells us
+            order = self.broker.get_order_by_client_id(block['client_order_id'], self.account_id)
+        if not order:
+            self._release_block(block['id'], 'Order submission failed')
+            return 'failed'
+
+        self._update_block(block['id'], status='submitted', broker_order_id=order.get('id'),
+                           submitted_at=datetime.now().isoformat())
+        order = self._wait_for_fill(order)
+        return self._settle(block, order)
+
+    def _wait_for_fill(self, order: Dict) -> Dict:
+        deadline = time.monotonic() + self.fill_timeout
+        while order.get('status') not in TERMINAL_ORDER_STATUSES and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            order = self.broker.get_order(order['id'], self.account_id) or order
+        return order
+
+    def _settle(self, block: Dict, order: Dict) -> str:
+        status = order.get('status')
+        filled_qty = to_decimal(order.get('filled_qty') or 0)
+        if status not in TERMINAL_ORDER_STATUSES:
+            return 'open'  # Picked up by reconcile_open_blocks() on a later window
+        if filled_qty <= 0:
+            self._release_block(block['id'], f"Order {status} without fill")
+            return 'failed'
+        self._apply_fill(block, order)
+        return 'filled'
+
+    def reconcile_open_blocks(self) -> int:
+        """Settle block orders that were still open when their window ended"""
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT id, ticker, notional, client_order_id, broker_order_id FROM block_orders WHERE status = 'submitted'")
+        open_blocks = cur.fetchall()
+        conn.close()
+
+        settled = 0
+        for block_id, ticker, notional, client_order_id, broker_order_id in open_blocks:
+            order = self.broker.get_order(broker_order_id, self.account_id) if broker_order_id else None
+            if not order or order.get('status') not in TERMINAL_ORDER_STATUSES:
+                continue
+            block = {'id': block_id, 'ticker': ticker, 'notional': to_decimal(notional),
+                     'client_order_id': client_order_id, 'entries': self._block_entries(block_id)}
+            if self._settle(block, order) != 'open':
+                settled += 1
+        return settled
+
+    def recover_stale_blocks(self, owner: str = None) -> int:
+        """
+        Retry 'pending' blocks whose entries' lease expired (the worker died
+        between creating the block and recording the broker order). Each block
+        is taken over with lease_block first, so only one worker retries it.
+        The retry first asks the broker for the block's client_order_id, so an
+        order that did reach the broker is settled rather than bought twice.
+        """
+        owner = owner or f"recover-{os.getpid()}-{threading.get_ident()}"
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT DISTINCT b.id, b.ticker, b.notional, b.client_order_id
+            FROM block_orders b JOIN market_queue q ON q.block_order_id = b.id
+            WHERE b.status = 'pending' AND q.status = 'aggregated' AND q.lease_expires_at < ?
+        """, (time.time(),))
+        stale = cur.fetchall()
+        conn.close()
+
+        recovered = 0
+        for block_id, ticker, notional, client_order_id in stale:
+            block = {'id': block_id, 'ticker': ticker, 'notional': to_decimal(notional),
+                     'client_order_id': client_order_id, 'entries': self._block_entries(block_id), 'retry': True}
+            if not self.lease_block(block_id, owner, take_expired=True):
+                continue  # Another worker took it over first
+            print(f"[AGGREGATOR] Recovering stale block order {block_id} ({client_order_id})")
+            if self.execute_block(block) != 'open':
+                recovered += 1
+        return recovered
+
+    def _block_entries(self, block_id: int) -> List[Dict]:
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, transaction_id, user_id, amount FROM market_queue
+            WHERE block_order_id = ? AND status = 'aggregated' ORDER BY id
+        """, (block_id,))
+        entries = [{'queue_id': row[0], 'transaction_id': row[1], 'user_id': row[2],
+                    'amount': to_decimal(row[3]).quantize(CENT, rounding=ROUND_HALF_UP)} for row in cur.fetchall()]
+        conn.close()
+        return entries
+
+    # ------------------------------------------------------------------
+    # Allocation
+    # ------------------------------------------------------------------
+
+    def allocate(self, entries: List[Dict], filled_qty: Decimal, filled_cost: Decimal) -> List[Dict]:
+        """Per-entry shares and cost; sums equal filled_qty and filled_cost exactly"""
+        weights = [entry['amount'] for entry in entries]
+        shares = allocate_pro_rata(filled_qty, weights, SHARE_QUANTUM)
+        costs = allocate_pro_rata(filled_cost, weights, CENT)
+        return [dict(entry, shares=share, cost=cost) for entry, share, cost in zip(entries, shares, costs)]
+
+    def _apply_fill(self, block: Dict, order: Dict):
+        filled_qty = to_decimal(order.get('filled_qty')).quantize(SHARE_QUANTUM, rounding=ROUND_DOWN)
+        avg_price = to_decimal(order.get('filled_avg_price'))
+        # A notional order never costs more than its notional; cap rounding drift from qty * avg price
+        filled_cost = min((filled_qty * avg_price).quantize(CENT, rounding=ROUND_HALF_UP), block['notional'])
+        allocations = self.allocate(block['entries'], filled_qty, filled_cost)
+        if order.get('status') != 'filled':
+            # Partially filled, then canceled or expired: the rest of each entry goes back in the queue
+            for allocation in allocations:
+                allocation['unfilled'] = allocation['amount'] - allocation['cost']
+        if not self._write_allocations(block, order, filled_qty, avg_price, filled_cost, allocations):
+            return
+
+        self.stats['block_orders'] += 1
+        self.stats['entries_filled'] += len(allocations)
+        self.stats['notional_filled'] = str(to_decimal(self.stats['notional_filled']) + filled_cost)
+
+    def _write_allocations(self, block: Dict, order: Dict, filled_qty: Decimal, avg_price: Decimal,
+                           filled_cost: Decimal, allocations: List[Dict]) -> bool:
+        """
+        Apply a block's allocations to portfolios, market_queue and transactions in
+        one transaction. An allocation's unfilled amount (partial fills) is queued
+        again as a new entry in the same transaction, so it is bought next window.
+        """
+        ticker = block['ticker']
+        now = datetime.now().isoformat()
+
+        per_user: Dict[int, Dict[str, Decimal]] = {}
+        for allocation in allocations:
+            position = per_user.setdefault(allocation['user_id'], {'shares': Decimal('0'), 'cost': Decimal('0')})
+            position['shares'] += allocation['shares']
+            position['cost'] += allocation['cost']
+
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute('BEGIN IMMEDIATE')
+            # Whoever flips the block to filled first owns the allocation; a concurrent retry backs off
+            cur.execute("UPDATE block_orders SET status = 'filled' WHERE id = ? AND status IN ('pending', 'submitted')",
+                        (block['id'],))
+            if cur.rowcount != 1:
+                conn.rollback()
+                return False
+
+            existing = {}
+            user_ids = list(per_user)
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start + 500]
+                cur.execute(f"""
+                    SELECT id, user_id, shares, average_price FROM portfolios
+                    WHERE ticker = ? AND user_id IN ({','.join('?' * len(chunk))})
+                    ORDER BY id
+                """, [ticker] + chunk)
+                for row in cur.fetchall():
+                    existing.setdefault(row[1], row)  # Oldest row holds the position
+
+            updates, inserts = [], []
+            for user_id, position in per_user.items():
+                if user_id in existing:
+                    row_id, _, old_shares, old_avg = existing[user_id]
+                    old_shares = to_decimal(old_shares or 0)
+                    new_shares = old_shares + position['shares']
+                    invested = old_shares * to_decimal(old_avg or 0) + position['cost']
+                    new_avg = invested / new_shares if new_shares else Decimal('0')
+                    updates.append((float(new_shares), float(new_avg), float(avg_price),
+                                    float(new_shares * avg_price), now, row_id))
+                else:
+                    average = position['cost'] / position['shares'] if position['shares'] else Decimal('0')
+                    inserts.append((user_id, ticker, float(position['shares']), float(average), float(avg_price),
+                                    float(position['shares'] * avg_price), now, now))
+
+            cur.executemany("""
+                UPDATE portfolios SET shares = ?, average_price = ?, current_price = ?, total_value = ?, updated_at = ?
+                WHERE id = ?
+            """, updates)
+            cur.executemany("""
+                INSERT INTO portfolios (user_id, ticker, shares, average_price, current_price, total_value, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, inserts)
+            cur.executemany("""
+                UPDATE market_queue SET status = 'filled', shares = ?, fill_price = ?, processed_at = ?
+                WHERE id = ?
+            """, [(float(a['shares']), float(avg_price), now, a['queue_id']) for a in allocations])
+            cur.executemany("""
+                UPDATE transactions SET status = 'mapped', ticker = ?, shares = ?, price_per_share = ?, stock_price = ?
+                WHERE id = ?
+            """, [(ticker, float(a['shares']), float(avg_price), float(avg_price), a['transaction_id'])
+                  for a in allocations if a['transaction_id'] is not None])
+            cur.executemany("""
+                INSERT INTO market_queue (user_id, ticker, amount, status, created_at)
+                VALUES (?, ?, ?, 'queued', ?)
+            """, [(a['user_id'], ticker, float(a['unfilled']), now) for a in allocations if a.get('unfilled', 0) > 0])
+            cur.execute("""
+                UPDATE block_orders SET broker_order_id = ?, filled_qty = ?, filled_avg_price = ?,
+                    filled_notional = ?, filled_at = ?
+                WHERE id = ?
+            """, (order.get('id'), str(filled_qty), str(avg_price), str(filled_cost), now, block['id']))
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Block bookkeeping
+    # ------------------------------------------------------------------
+
+    def _update_block(self, block_id: int, **fields):
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        cur.execute(f"UPDATE block_orders SET {assignments} WHERE id = ?", list(fields.values()) + [block_id])
+        conn.commit()
+        conn.close()
+
+    def _release_block(self, block_id: int, error: str):
+        """Mark a block failed and put its entries back in the queue for the next window"""
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        cur.execute("UPDATE block_orders SET status = 'failed', error = ? WHERE id = ?", (error, block_id))
+        cur.execute("""
+            UPDATE market_queue
+            SET status = 'queued', block_order_id = NULL, idempotency_key = NULL, lease_owner = NULL, lease_expires_at = NULL
+            WHERE block_order_id = ? AND status = 'aggregated'
+        """, (block_id,))
+        conn.commit()
+        conn.close()
+        self.stats['block_orders_failed'] += 1
+        print(f"[AGGREGATOR] Block order {block_id} failed: {error}")
+
+    def get_stats(self) -> Dict:
+        try:
+            conn = self.db.get_connection()
+            cur = conn.cursor()
+            cur.execute("SELECT status, COUNT(*) FROM market_queue GROUP BY status")
+            queue = {row[0]: row[1] for row in cur.fetchall()}
+            cur.execute("SELECT status, COUNT(*) FROM block_orders GROUP BY status")
+            blocks = {row[0]: row[1] for row in cur.fetchall()}
+            conn.close()
+        except Exception as e:
+            print(f"Error getting aggregation stats: {e}")
+            queue, blocks = {}, {}
+        return dict(self.stats, market_queue=queue, block_orders_by_status=blocks)
+
+
+# Global order aggregator instance
+order_aggregator = OrderAggregator()
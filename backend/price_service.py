@@ -0,0 +1,525 @@
+"""
+Price Service for Kamioi Platform
+Shared stock quote layer used by StockAPIManager and AlpacaService:
+- one bounded cache for every caller, with stale-while-revalidate
+- multi-symbol quote requests where the provider supports them
+- a token-bucket rate limiter per provider
+- background refresh of the most requested (hot) tickers
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Iterable
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: refills continuously, allows bursts up to capacity"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_minute = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate_per_minute))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available; never blocks"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def available(self) -> float:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls_per_minute': self.rate_per_minute,
+            'capacity': self.capacity,
+            'tokens_available': round(self.available(), 2)
+        }
+
+
+class QuoteProvider:
+    """Base quote provider; fetch() returns normalized quotes for the symbols it could price"""
+
+    name = 'base'
+    max_batch = 1
+
+    def __init__(self, base_url: str, calls_per_minute: float, timeout: float = 5):
+        self.base_url = base_url.rstrip('/')
+        self.limiter = TokenBucket(calls_per_minute)
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    def fetch(self, symbols: List[str]) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    def _get(self, path: str, params: Dict = None, headers: Dict = None) -> Optional[Dict]:
+        response = self.session.get(f"{self.base_url}{path}", params=params, headers=headers, timeout=self.timeout)
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    def _quote(self, symbol: str, price: float, **fields) -> Dict:
+        quote = {
+            'ticker': symbol,
+            'price': float(price),
+            'change': 0.0,
+            'change_percent': 0.0,
+            'volume': 0,
+            'high': 0.0,
+            'low': 0.0,
+            'open': 0.0,
+            'timestamp': datetime.utcnow(),
+            'source': self.name
+        }
+        quote.update({key: value for key, value in fields.items() if value is not None})
+        return quote
+
+
+class AlpacaQuoteProvider(QuoteProvider):
+    """Alpaca Market Data: latest quotes for up to 200 symbols per request, latest bars as fallback"""
+
+    name = 'alpaca'
+    max_batch = 200
+
+    def __init__(self, base_url: str = None, calls_per_minute: float = 200, api_key: str = None, api_secret: str = None):
+        super().__init__(base_url or os.getenv('ALPACA_DATA_URL', 'https://data.alpaca.markets'), calls_per_minute)
+        self.api_key = api_key if api_key is not None else os.getenv('ALPACA_API_KEY')
+        self.api_secret = api_secret if api_secret is not None else os.getenv('ALPACA_API_SECRET')
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.api_secret)
+
+    def _headers(self) -> Dict:
+        return {'APCA-API-KEY-ID': self.api_key, 'APCA-API-SECRET-KEY': self.api_secret}
+
+    def fetch(self, symbols: List[str]) -> Dict[str, Dict]:
+        quotes = {}
+        data = self._get('/v2/stocks/quotes/latest', {'symbols': ','.join(symbols)}, self._headers()) or {}
+        for symbol, quote in (data.get('quotes') or {}).items():
+            price = quote.get('ap') or quote.get('bp')  # Ask price, bid when the ask side is empty
+            if price:
+                quotes[symbol.upper()] = self._quote(symbol.upper(), price)
+
+        missing = [symbol for symbol in symbols if symbol not in quotes]
+        if missing and self.limiter.try_acquire():
+            data = self._get('/v2/stocks/bars/latest', {'symbols': ','.join(missing)}, self._headers()) or {}
+            for symbol, bar in (data.get('bars') or {}).items():
+                if bar.get('c'):
+                    close, open_price = float(bar['c']), float(bar.get('o') or 0)
+                    quotes[symbol.upper()] = self._quote(
+                        symbol.upper(), close,
+                        change=close - open_price if open_price else 0.0,
+                        change_percent=((close - open_price) / open_price * 100) if open_price else 0.0,
+                        volume=int(bar.get('v') or 0), high=float(bar.get('h') or 0),
+                        low=float(bar.get('l') or 0), open=open_price
+                    )
+        return quotes
+
+
+class FinnhubQuoteProvider(QuoteProvider):
+    """Finnhub /quote: single symbol per request"""
+
+    name = 'finnhub'
+    max_batch = 1
+
+    def __init__(self, base_url: str = None, calls_per_minute: float = 60, api_key: str = None):
+        super().__init__(base_url or 'https://finnhub.io', calls_per_minute)
+        self.api_key = api_key if api_key is not None else os.getenv('FINNHUB_API_KEY', 'demo')
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.api_key != 'demo')
+
+    def fetch(self, symbols: List[str]) -> Dict[str, Dict]:
+        symbol = symbols[0]
+        data = self._get('/api/v1/quote', {'symbol': symbol, 'token': self.api_key}) or {}
+        if not data.get('c'):
+            return {}
+        return {symbol: self._quote(
+            symbol, data['c'],
+            change=float(data.get('d') or 0), change_percent=float(data.get('dp') or 0),
+            high=float(data.get('h') or 0), low=float(data.get('l') or 0), open=float(data.get('o') or 0),
+            previous_close=float(data.get('pc') or 0)
+        )}
+
+
+class PolygonQuoteProvider(QuoteProvider):
+    """Polygon snapshot endpoint: many tickers per request"""
+
+    name = 'polygon'
+    max_batch = 250
+
+    def __init__(self, base_url: str = None, calls_per_minute: float = 5, api_key: str = None):
+        super().__init__(base_url or 'https://api.polygon.io', calls_per_minute)
+        self.api_key = api_key if api_key is not None else os.getenv('POLYGON_API_KEY', 'demo')
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.api_key != 'demo')
+
+    def fetch(self, symbols: List[str]) -> Dict[str, Dict]:
+        data = self._get('/v2/snapshot/locale/us/markets/stocks/tickers',
+                         {'tickers': ','.join(symbols), 'apiKey': self.api_key}) or {}
+        quotes = {}
+        for snapshot in data.get('tickers') or []:
+            symbol = (snapshot.get('ticker') or '').upper()
+            day = snapshot.get('day') or {}
+            price = (snapshot.get('lastTrade') or {}).get('p') or day.get('c') or (snapshot.get('prevDay') or {}).get('c')
+            if symbol and price:
+                quotes[symbol] = self._quote(
+                    symbol, price,
+                    change=float(snapshot.get('todaysChange') or 0),
+                    change_percent=float(snapshot.get('todaysChangePerc') or 0),
+                    volume=int(day.get('v') or 0), high=float(day.get('h') or 0),
+                    low=float(day.get('l') or 0), open=float(day.get('o') or 0)
+                )
+        return quotes
+
+
+class AlphaVantageQuoteProvider(QuoteProvider):
+    """Alpha Vantage GLOBAL_QUOTE: single symbol per request"""
+
+    name = 'alpha_vantage'
+    max_batch = 1
+
+    def __init__(self, base_url: str = None, calls_per_minute: float = 5, api_key: str = None):
+        super().__init__(base_url or 'https://www.alphavantage.co', calls_per_minute)
+        self.api_key = api_key if api_key is not None else os.getenv('ALPHA_VANTAGE_API_KEY', 'demo')
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.api_key != 'demo')
+
+    def fetch(self, symbols: List[str]) -> Dict[str, Dict]:
+        symbol = symbols[0]
+        data = self._get('/query', {'function': 'GLOBAL_QUOTE', 'symbol': symbol, 'apikey': self.api_key}) or {}
+        quote = data.get('Global Quote') or {}
+        if not quote.get('05. price'):
+            return {}
+        return {symbol: self._quote(
+            symbol, quote['05. price'],
+            change=float(quote.get('09. change') or 0),
+            change_percent=float(str(quote.get('10. change percent') or '0').replace('%', '')),
+            volume=int(quote.get('06. volume') or 0), high=float(quote.get('03. high') or 0),
+            low=float(quote.get('04. low') or 0), open=float(quote.get('02. open') or 0)
+        )}
+
+
+class YahooQuoteProvider(QuoteProvider):
+    """Yahoo Finance chart endpoint: free, no key, single symbol per request"""
+
+    name = 'yahoo'
+    max_batch = 1
+
+    def __init__(self, base_url: str = None, calls_per_minute: float = 60):
+        super().__init__(base_url or 'https://query1.finance.yahoo.com', calls_per_minute)
+
+    def fetch(self, symbols: List[str]) -> Dict[str, Dict]:
+        symbol = symbols[0]
+        data = self._get(f'/v8/finance/chart/{symbol}', {'interval': '1d', 'range': '1d'},
+                         {'User-Agent': 'Mozilla/5.0'}) or {}
+        result = (data.get('chart') or {}).get('result') or []
+        if not result:
+            return {}
+        meta = result[0].get('meta') or {}
+        price = meta.get('regularMarketPrice')
+        if not price:
+            return {}
+        previous = float(meta.get('chartPreviousClose') or meta.get('previousClose') or 0)
+        return {symbol: self._quote(
+            symbol, price,
+            change=float(price) - previous if previous else 0.0,
+            change_percent=((float(price) - previous) / previous * 100) if previous else 0.0,
+            previous_close=previous or None
+        )}
+
+
+def default_providers() -> List[QuoteProvider]:
+    """Providers in order of preference: batched sources first, keyless Yahoo last"""
+    return [
+        AlpacaQuoteProvider(),
+        FinnhubQuoteProvider(),
+        PolygonQuoteProvider(),
+        AlphaVantageQuoteProvider(),
+        YahooQuoteProvider()
+    ]
+
+
+class PriceService:
+    def __init__(self, providers: List[QuoteProvider] = None, fresh_ttl: float = None, stale_ttl: float = None,
+                 max_entries: int = None, refresh_interval: float = None, hot_tickers: int = 50):
+        self.providers = providers if providers is not None else default_providers()
+        self.fresh_ttl = fresh_ttl if fresh_ttl is not None else float(os.getenv('KAMIOI_PRICE_FRESH_TTL', '60'))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.getenv('KAMIOI_PRICE_STALE_TTL', '900'))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('KAMIOI_PRICE_CACHE_SIZE', '5000'))
+        self.refresh_interval = (refresh_interval if refresh_interval is not None
+                                 else float(os.getenv('KAMIOI_PRICE_REFRESH_INTERVAL', '30')))
+        self.hot_tickers = hot_tickers
+
+        # symbol -> {'quote': dict, 'fetched_at': monotonic seconds}, least recently used first
+        self.cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self.access_counts = Counter()
+        self.lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._refreshing = set()
+        self._executor = None
+        self._refresher = None
+        self._stop = threading.Event()
+
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'evictions': 0, 'background_refreshes': 0}
+        self.provider_stats = {p.name: {'requests': 0, 'symbols': 0, 'errors': 0, 'rate_limited': 0} for p in self.providers}
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get_quote(self, symbol: str, allow_stale: bool = True) -> Optional[Dict]:
+        """Quote for one symbol, or None when no provider could price it"""
+        return self.get_quotes([symbol], allow_stale=allow_stale).get(symbol.upper().strip())
+
+    def get_quotes(self, symbols: Iterable[str], allow_stale: bool = True) -> Dict[str, Dict]:
+        """
+        Quotes keyed by upper-case symbol. Fresh entries come from cache; stale
+        entries are returned immediately and revalidated in the background;
+        misses are fetched in as few provider requests as possible.
+        """
+        wanted = list(OrderedDict.fromkeys(s.upper().strip() for s in symbols if s and s.strip()))
+        results, stale, missing = {}, [], []
+        now = time.monotonic()
+
+        with self.lock:
+            for symbol in wanted:
+                self.access_counts[symbol] += 1
+                entry = self.cache.get(symbol)
+                age = now - entry['fetched_at'] if entry else None
+                if entry and age < self.fresh_ttl:
+                    self.cache.move_to_end(symbol)
+                    results[symbol] = dict(entry['quote'], cached=True)
+                    self.stats['hits'] += 1
+                elif entry and allow_stale and age < self.stale_ttl:
+                    self.cache.move_to_end(symbol)
+                    results[symbol] = dict(entry['quote'], cached=True, stale=True)
+                    stale.append(symbol)
+                    self.stats['stale_hits'] += 1
+                else:
+                    missing.append(symbol)
+                    self.stats['misses'] += 1
+
+        if stale:
+            self._schedule_refresh(stale)
+        if missing:
+            for symbol, quote in self._fetch(missing).items():
+                results[symbol] = dict(quote, cached=False)
+
+        self._ensure_refresher()
+        return {symbol: results[symbol] for symbol in wanted if symbol in results}
+
+    def fetch_from(self, provider_name: str, symbols: List[str]) -> Dict[str, Dict]:
+        """Bypass the cache and query one provider directly (results are still cached)"""
+        provider = self.get_provider(provider_name)
+        if provider is None:
+            return {}
+        quotes = self._fetch_with(provider, [s.upper().strip() for s in symbols])
+        self._store(quotes)
+        return quotes
+
+    def get_provider(self, name: str) -> Optional[QuoteProvider]:
+        return next((p for p in self.providers if p.name == name), None)
+
+    def invalidate(self, symbol: str = None):
+        with self.lock:
+            if symbol is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(symbol.upper().strip(), None)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['stale_hits'] + self.stats['misses']
+            cache = {
+                'entries': len(self.cache),
+                'max_entries': self.max_entries,
+                'fresh_ttl_seconds': self.fresh_ttl,
+                'stale_ttl_seconds': self.stale_ttl,
+                'hit_rate': (self.stats['hits'] + self.stats['stale_hits']) / lookups if lookups else 0.0,
+                **self.stats
+            }
+            hot = [symbol for symbol, _ in self.access_counts.most_common(10)]
+        return {
+            'timestamp': datetime.utcnow().isoformat(),
+            'cache': cache,
+            'hot_tickers': hot,
+            'background_refresh': {
+                'interval_seconds': self.refresh_interval,
+                'running': bool(self._refresher and self._refresher.is_alive())
+            },
+            'providers': {
+                p.name: {
+                    'configured': p.configured,
+                    'max_batch': p.max_batch,
+                    'rate_limit': p.limiter.to_dict(),
+                    **self.provider_stats[p.name]
+                } for p in self.providers
+            }
+        }
+
+    def stop(self):
+        """Stop background refresh (used by tests and shutdown hooks)"""
+        self._stop.set()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # ------------------------------------------------------------------
+    # Fetching
+    # ------------------------------------------------------------------
+
+    def _fetch(self, symbols: List[str]) -> Dict[str, Dict]:
+        """Fetch symbols once across concurrent callers (single flight per symbol)"""
+        with self.lock:
+            mine = [s for s in symbols if s not in self._inflight]
+            waiting = {s: self._inflight[s] for s in symbols if s in self._inflight}
+            for symbol in mine:
+                self._inflight[symbol] = threading.Event()
+
+        try:
+            quotes = self._fetch_from_providers(mine) if mine else {}
+            self._store(quotes)
+        finally:
+            with self.lock:
+                for symbol in mine:
+                    self._inflight.pop(symbol).set()
+
+        for symbol, event in waiting.items():
+            event.wait(timeout=15)
+            with self.lock:
+                entry = self.cache.get(symbol)
+            if entry:
+                quotes[symbol] = entry['quote']
+        return quotes
+
+    def _fetch_from_providers(self, symbols: List[str]) -> Dict[str, Dict]:
+        quotes = {}
+        remaining = list(symbols)
+        for provider in self.providers:
+            if not remaining:
+                break
+            if not provider.configured:
+                continue
+            quotes.update(self._fetch_with(provider, remaining))
+            remaining = [s for s in remaining if s not in quotes]
+        return quotes
+
+    def _fetch_with(self, provider: QuoteProvider, symbols: List[str]) -> Dict[str, Dict]:
+        quotes = {}
+        stats = self.provider_stats[provider.name]
+        for start in range(0, len(symbols), provider.max_batch):
+            chunk = symbols[start:start + provider.max_batch]
+            if not provider.limiter.try_acquire():
+                stats['rate_limited'] += 1
+                break
+            stats['requests'] += 1
+            try:
+                got = provider.fetch(chunk)
+            except Exception as e:
+                stats['errors'] += 1
+                print(f"[PRICE] {provider.name} quote error for {','.join(chunk[:5])}: {e}")
+                break
+            stats['symbols'] += len(got)
+            quotes.update(got)
+        return quotes
+
+    def _store(self, quotes: Dict[str, Dict]):
+        if not quotes:
+            return
+        now = time.monotonic()
+        with self.lock:
+            for symbol, quote in quotes.items():
+                self.cache[symbol] = {'quote': quote, 'fetched_at': now}
+                self.cache.move_to_end(symbol)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    # ------------------------------------------------------------------
+    # Background refresh
+    # ------------------------------------------------------------------
+
+    def _schedule_refresh(self, symbols: List[str]):
+        with self.lock:
+            pending = [s for s in symbols if s not in self._refreshing and s not in self._inflight]
+            self._refreshing.update(pending)
+            if not pending:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='price-refresh')
+        self._executor.submit(self._refresh, pending)
+
+    def _refresh(self, symbols: List[str]):
+        try:
+            self._fetch(symbols)
+            with self.lock:
+                self.stats['background_refreshes'] += 1
+        except Exception as e:
+            print(f"[PRICE] Background refresh failed: {e}")
+        finally:
+            with self.lock:
+                self._refreshing.difference_update(symbols)
+
+    def _ensure_refresher(self):
+        if self.refresh_interval <= 0 or (self._refresher and self._refresher.is_alive()) or self._stop.is_set():
+            return
+        with self.lock:
+            if self._refresher and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name='price-hot-refresh', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        """Refresh-ahead for hot tickers so dashboard reads stay on fresh cache entries"""
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                now = time.monotonic()
+                with self.lock:
+                    hot = [symbol for symbol, _ in self.access_counts.most_common(self.hot_tickers)]
+                    due = [s for s in hot if s in self.cache
+                           and now - self.cache[s]['fetched_at'] >= self.fresh_ttl * 0.8]
+                    # Decay so yesterday's hot tickers eventually stop being refreshed
+                    for symbol in list(self.access_counts):
+                        self.access_counts[symbol] //= 2
+                        if not self.access_counts[symbol]:
+                            del self.access_counts[symbol]
+                if due:
+                    self._schedule_refresh(due)
+            except Exception as e:
+                print(f"[PRICE] Hot ticker refresh error: {e}")
+
+
+# Global price service instance shared by StockAPIManager and AlpacaService
+price_service = PriceService()
@@ -0,0 +1,509 @@
+"""
+Query Instrumentation for Kamioi Platform
+Times every SQL statement issued through DatabaseManager and keeps a slow-query log
+
+Usage (CLI report against a running server):
+    python query_instrumentation.py --token admin_token_1
+    python query_instrumentation.py --file slow_queries.json
+"""
+
+import os
+import re
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Any
+
+# Per-request attribution (optional - scripts may run without Flask)
+try:
+    from request_profiler import request_profiler
+except ImportError:
+    request_profiler = None
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_NAMED_PARAM = re.compile(r"(?<!:):[A-Za-z_][A-Za-z0-9_]*|%\([A-Za-z_][A-Za-z0-9_]*\)s|%s")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"\bVALUES\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+
+@lru_cache(maxsize=4096)
+def normalize_sql(statement: str) -> str:
+    """Collapse whitespace and replace literals/placeholders so equivalent statements group together"""
+    if not statement:
+        return ''
+    normalized = _STRING_LITERAL.sub('?', statement)
+    normalized = _NAMED_PARAM.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    normalized = _IN_LIST.sub('IN (?...)', normalized)
+    normalized = _VALUES_LIST.sub(r'VALUES \1, ...', normalized)
+    return normalized
+
+
+def _statement_kind(statement: str) -> str:
+    stripped = statement.lstrip().split(None, 1)
+    return stripped[0].upper() if stripped else ''
+
+
+def _short_params(parameters) -> Optional[str]:
+    if parameters is None:
+        return None
+    text = repr(parameters)
+    return text if len(text) <= 500 else text[:500] + '...'
+
+
+class StatementStats:
+    """Aggregated timings for one normalized statement"""
+
+    def __init__(self, normalized: str):
+        self.normalized = normalized
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.slow_count = 0
+        self.last_seen: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'statement': self.normalized,
+            'count': self.count,
+            'total_time': self.total_time,
+            'avg_time': self.total_time / self.count if self.count else 0.0,
+            'max_time': self.max_time,
+            'rows': self.rows,
+            'avg_rows': self.rows / self.count if self.count else 0.0,
+            'slow_count': self.slow_count,
+            'last_seen': self.last_seen
+        }
+
+
+class QueryMonitor:
+    """Statement statistics and slow-query ring buffer shared by all instrumented connections"""
+
+    def __init__(self):
+        self.enabled = os.getenv('KAMIOI_QUERY_INSTRUMENTATION', 'true').lower() in ('1', 'true', 'yes')
+        self.slow_threshold = float(os.getenv('KAMIOI_SLOW_QUERY_MS', '200')) / 1000.0
+        self.max_statements = 2000
+        self.statements: Dict[str, StatementStats] = {}
+        self.slow_queries = deque(maxlen=int(os.getenv('KAMIOI_SLOW_QUERY_BUFFER', '200')))
+        # Only re-explain the same statement shape once every few minutes
+        self.plan_cache_seconds = 300
+        self._plan_cache: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+        self.started_at = datetime.utcnow().isoformat()
+
+    def record(self, statement: str, duration: float, rows: int = 0, parameters=None, explain=None):
+        """
+        Record one executed statement.
+
+        Args:
+            statement: Raw SQL text
+            duration: Wall time in seconds (execute plus fetch)
+            rows: Rows returned or affected
+            parameters: Bound parameters (only kept for slow queries)
+            explain: Callable returning the query plan as a list of strings; only
+                     invoked when the statement is slower than the threshold
+        """
+        if request_profiler is not None:
+            request_profiler.record_db_query(duration)
+
+        normalized = normalize_sql(statement)
+        now = datetime.utcnow().isoformat()
+        is_slow = duration >= self.slow_threshold
+
+        with self.lock:
+            stats = self.statements.get(normalized)
+            if stats is None:
+                if len(self.statements) >= self.max_statements:
+                    # Unbounded statement shapes (e.g. dynamic IN lists) must not grow memory forever
+                    self._evict_cheapest()
+                stats = StatementStats(normalized)
+                self.statements[normalized] = stats
+            stats.count += 1
+            stats.total_time += duration
+            stats.max_time = max(stats.max_time, duration)
+            stats.rows += rows or 0
+            stats.last_seen = now
+            if is_slow:
+                stats.slow_count += 1
+
+        if not is_slow:
+            return
+
+        plan = self._get_plan(normalized, statement, explain)
+        with self.lock:
+            self.slow_queries.append({
+                'statement': normalized,
+                'sql': statement.strip()[:4000],
+                'parameters': _short_params(parameters),
+                'duration': duration,
+                'rows': rows or 0,
+                'plan': plan,
+                'recorded_at': now
+            })
+
+    def _evict_cheapest(self):
+        victim = min(self.statements.values(), key=lambda s: s.total_time)
+        del self.statements[victim.normalized]
+
+    def _get_plan(self, normalized: str, statement: str, explain) -> Optional[List[str]]:
+        if explain is None or _statement_kind(statement) not in _EXPLAINABLE:
+            return None
+        cached = self._plan_cache.get(normalized)
+        if cached and time.time() - cached[0] < self.plan_cache_seconds:
+            return cached[1]
+        try:
+            plan = explain()
+        except Exception as e:
+            plan = [f'EXPLAIN failed: {e}']
+        if len(self._plan_cache) > 1000:
+            self._plan_cache.clear()
+        self._plan_cache[normalized] = (time.time(), plan)
+        return plan
+
+    def get_top_statements(self, sort_by: str = 'total_time', limit: int = 50) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = [stats.to_dict() for stats in self.statements.values()]
+        if sort_by not in ('total_time', 'avg_time', 'max_time', 'count', 'rows', 'slow_count'):
+            sort_by = 'total_time'
+        rows.sort(key=lambda r: r[sort_by], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def get_slow_queries(self, limit: int = None) -> List[Dict[str, Any]]:
+        with self.lock:
+            entries = list(self.slow_queries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            total_statements = sum(s.count for s in self.statements.values())
+            total_time = sum(s.total_time for s in self.statements.values())
+            distinct = len(self.statements)
+            slow_buffered = len(self.slow_queries)
+        return {
+            'enabled': self.enabled,
+            'started_at': self.started_at,
+            'slow_threshold_ms': self.slow_threshold * 1000,
+            'total_statements': total_statements,
+            'total_time': total_time,
+            'distinct_statements': distinct,
+            'slow_queries_buffered': slow_buffered
+        }
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.slow_queries.clear()
+            self._plan_cache.clear()
+            self.started_at = datetime.utcnow().isoformat()
+
+
+# ----------------------------------------------------------------------
+# SQLite wrappers
+# ----------------------------------------------------------------------
+
+class InstrumentedCursor:
+    """sqlite3.Cursor proxy that times execute plus fetch for each statement"""
+
+    def __init__(self, cursor, connection: 'InstrumentedConnection'):
+        self._cursor = cursor
+        self._connection = connection
+        self._active = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def _begin(self, statement, parameters, many=False):
+        self._finish()
+        self._active = {'statement': statement, 'parameters': parameters, 'many': many, 'duration': 0.0, 'rows': 0}
+
+    def _finish(self):
+        active = self._active
+        if active is None:
+            return
+        self._active = None
+        rows = active['rows']
+        if rows == 0 and self._cursor.rowcount and self._cursor.rowcount > 0:
+            rows = self._cursor.rowcount
+        raw = self._connection._raw
+        statement = active['statement']
+        parameters = active['parameters']
+        query_monitor.record(
+            statement,
+            active['duration'],
+            rows=rows,
+            parameters=parameters,
+            explain=None if active['many'] else lambda: _sqlite_explain(raw, statement, parameters)
+        )
+
+    def execute(self, statement, parameters=()):
+        self._begin(statement, parameters)
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(statement, parameters)
+        finally:
+            self._active['duration'] += time.perf_counter() - start
+        if self._cursor.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, statement, seq_of_parameters):
+        self._begin(statement, None, many=True)
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(statement, seq_of_parameters)
+        finally:
+            self._active['duration'] += time.perf_counter() - start
+        self._finish()
+        return self
+
+    def executescript(self, script):
+        self._begin(script, None)
+        start = time.perf_counter()
+        try:
+            self._cursor.executescript(script)
+        finally:
+            self._active['duration'] += time.perf_counter() - start
+        self._finish()
+        return self
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        elapsed = time.perf_counter() - start
+        if self._active is not None:
+            self._active['duration'] += elapsed
+        return result
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if self._active is not None:
+            if row is None:
+                self._finish()
+            else:
+                self._active['rows'] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed_fetch(self._cursor.fetchmany, size if size is not None else self._cursor.arraysize)
+        if self._active is not None:
+            self._active['rows'] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(self._cursor.fetchall)
+        if self._active is not None:
+            self._active['rows'] += len(rows)
+            self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+
+class InstrumentedConnection:
+    """sqlite3.Connection proxy whose cursors report to the query monitor"""
+
+    def __init__(self, connection):
+        object.__setattr__(self, '_raw', connection)
+        object.__setattr__(self, '_open_cursors', [])
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # e.g. conn.row_factory = sqlite3.Row must reach the real connection
+        setattr(self._raw, name, value)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._flush_cursors()
+        return self._raw.__exit__(exc_type, exc, tb)
+
+    def cursor(self, *args, **kwargs):
+        cursor = InstrumentedCursor(self._raw.cursor(*args, **kwargs), self)
+        open_cursors = self._open_cursors
+        if len(open_cursors) > 64:
+            del open_cursors[:32]
+        open_cursors.append(cursor)
+        return cursor
+
+    def execute(self, statement, parameters=()):
+        return self.cursor().execute(statement, parameters)
+
+    def executemany(self, statement, seq_of_parameters):
+        return self.cursor().executemany(statement, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def _flush_cursors(self):
+        for cursor in self._open_cursors:
+            cursor._finish()
+        self._open_cursors.clear()
+
+    def commit(self):
+        self._flush_cursors()
+        return self._raw.commit()
+
+    def rollback(self):
+        self._flush_cursors()
+        return self._raw.rollback()
+
+    def close(self):
+        self._flush_cursors()
+        return self._raw.close()
+
+
+def _sqlite_explain(raw_connection, statement, parameters) -> List[str]:
+    cursor = raw_connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters or ())
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def instrument_sqlite_connection(connection):
+    """Wrap a sqlite3 connection unless instrumentation is disabled"""
+    if not query_monitor.enabled or isinstance(connection, InstrumentedConnection):
+        return connection
+    return InstrumentedConnection(connection)
+
+
+# ----------------------------------------------------------------------
+# SQLAlchemy (PostgreSQL) hooks
+# ----------------------------------------------------------------------
+
+def instrument_sqlalchemy_engine(engine):
+    """Time every statement executed by sessions bound to this engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start_time')
+        if not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        if not query_monitor.enabled:
+            if request_profiler is not None:
+                request_profiler.record_db_query(duration)
+            return
+        dbapi_connection = conn.connection.dbapi_connection
+        query_monitor.record(
+            statement,
+            duration,
+            rows=max(cursor.rowcount or 0, 0),
+            parameters=parameters,
+            # An executemany has no single parameter set to explain
+            explain=None if executemany else lambda: _postgres_explain(dbapi_connection, statement, parameters)
+        )
+
+
+def _postgres_explain(dbapi_connection, statement, parameters) -> List[str]:
+    """
+    EXPLAIN on the caller's connection. Inside a transaction it runs under a
+    savepoint, so a failing EXPLAIN is rolled back to it instead of aborting
+    the caller's transaction.
+    """
+    in_transaction = not getattr(dbapi_connection, 'autocommit', False)
+    cursor = dbapi_connection.cursor()
+    try:
+        if in_transaction:
+            cursor.execute('SAVEPOINT query_monitor_explain')
+        try:
+            cursor.execute(f'EXPLAIN {statement}', parameters)
+            plan = [row[0] for row in cursor.fetchall()]
+        except Exception:
+            if in_transaction:
+                cursor.execute('ROLLBACK TO SAVEPOINT query_monitor_explain')
+            raise
+        if in_transaction:
+            cursor.execute('RELEASE SAVEPOINT query_monitor_explain')
+        return plan
+    finally:
+        cursor.close()
+
+
+# Global query monitor instance
+query_monitor = QueryMonitor()
+
+
+def _print_report(data: Dict[str, Any], limit: int):
+    stats = data.get('stats', {})
+    print("=" * 80)
+    print(f"Query report (since {stats.get('started_at')}, slow threshold {stats.get('slow_threshold_ms', 0):.0f}ms)")
+    print(f"Statements: {stats.get('total_statements', 0):,}  "
+          f"Distinct: {stats.get('distinct_statements', 0):,}  "
+          f"DB time: {stats.get('total_time', 0):.2f}s")
+    print("=" * 80)
+    print(f"{'count':>8} {'total s':>9} {'avg ms':>8} {'max ms':>8} {'rows':>10}  statement")
+    for row in data.get('statements', [])[:limit]:
+        print(f"{row['count']:>8} {row['total_time']:>9.2f} {row['avg_time'] * 1000:>8.1f} "
+              f"{row['max_time'] * 1000:>8.1f} {row['rows']:>10}  {row['statement'][:120]}")
+    print()
+    print("Slow queries (most recent first)")
+    print("-" * 80)
+    for entry in data.get('slow_queries', [])[:limit]:
+        print(f"[{entry['recorded_at']}] {entry['duration'] * 1000:.1f}ms rows={entry['rows']}")
+        print(f"  {entry['statement'][:300]}")
+        for line in entry.get('plan') or []:
+            print(f"    PLAN: {line}")
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Report slow and expensive SQL statements')
+    parser.add_argument('--url', default=f"http://localhost:{os.getenv('PORT', '5111')}",
+                        help='Base URL of a running Kamioi backend')
+    parser.add_argument('--token', default=os.getenv('KAMIOI_ADMIN_TOKEN'), help='Admin bearer token')
+    parser.add_argument('--file', help='Read a JSON snapshot saved from /api/admin/db/queries instead')
+    parser.add_argument('--sort', default='total_time', help='Sort key: total_time, avg_time, max_time, count, rows')
+    parser.add_argument('--limit', type=int, default=25, help='Number of statements to show')
+    parser.add_argument('--json', action='store_true', help='Print raw JSON instead of a table')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+    else:
+        import requests
+        headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+        response = requests.get(f"{args.url}/api/admin/db/queries",
+                                params={'sort': args.sort, 'limit': args.limit},
+                                headers=headers, timeout=10)
+        response.raise_for_status()
+        payload = response.json()
+
+    report = payload.get('data', payload)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report, args.limit)
@@ -0,0 +1,398 @@
+"""
+Request Profiler for Kamioi Platform
+Aggregates per-route latency, database usage and response sizes
+"""
+
+import os
+import io
+import time
+import uuid
+import cProfile
+import pstats
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+from flask import g, request, has_request_context
+
+# Prometheus-style latency buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILE_HEADER = 'X-Kamioi-Profile'
+PROFILE_ID_HEADER = 'X-Kamioi-Profile-Id'
+
+
+def _percentile(sorted_samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile over an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    index = int(round(pct / 100.0 * (len(sorted_samples) - 1)))
+    return sorted_samples[index]
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts plus a bounded window of recent samples for percentiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window: int = 1024):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.samples.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def cumulative_buckets(self) -> List[tuple]:
+        """Return (upper_bound, cumulative_count) pairs, Prometheus style"""
+        running = 0
+        result = []
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            running += bucket_count
+            result.append((bound, running))
+        return result
+
+    def percentiles(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        return {
+            'p50': _percentile(ordered, 50),
+            'p95': _percentile(ordered, 95),
+            'p99': _percentile(ordered, 99)
+        }
+
+
+class RouteStats:
+    """Aggregated statistics for a single METHOD + route rule"""
+
+    def __init__(self, method: str, rule: str):
+        self.method = method
+        self.rule = rule
+        self.latency = LatencyHistogram()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.max_db_queries = 0
+        self.response_bytes = 0
+        self.max_response_bytes = 0
+        self.status_counts: Dict[str, int] = {}
+        self.last_seen: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        count = self.latency.count
+        percentiles = self.latency.percentiles()
+        return {
+            'method': self.method,
+            'route': self.rule,
+            'count': count,
+            'latency': {
+                'avg': self.latency.total / count if count else 0.0,
+                'max': self.latency.max,
+                'p50': percentiles['p50'],
+                'p95': percentiles['p95'],
+                'p99': percentiles['p99']
+            },
+            'db': {
+                'queries_total': self.db_queries,
+                'queries_avg': self.db_queries / count if count else 0.0,
+                'queries_max': self.max_db_queries,
+                'time_total': self.db_time,
+                'time_avg': self.db_time / count if count else 0.0
+            },
+            'response_size': {
+                'bytes_total': self.response_bytes,
+                'bytes_avg': self.response_bytes / count if count else 0.0,
+                'bytes_max': self.max_response_bytes
+            },
+            'status_counts': dict(self.status_counts),
+            'last_seen': self.last_seen
+        }
+
+
+class RequestProfiler:
+    """Flask before/after request instrumentation with on-demand cProfile sampling"""
+
+    def __init__(self):
+        self.routes: Dict[str, RouteStats] = {}
+        self.operations: Dict[str, LatencyHistogram] = {}
+        self.profiles = deque(maxlen=20)
+        self.lock = threading.Lock()
+        self.started_at = datetime.utcnow().isoformat()
+        # cProfile sampling is opt-in because it slows the profiled request several times over
+        self.profiling_enabled = os.getenv('KAMIOI_PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        self.profile_token = os.getenv('KAMIOI_PROFILING_TOKEN')
+
+    def init_app(self, app):
+        """Register request hooks on a Flask app"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    # ------------------------------------------------------------------
+    # Request hooks
+    # ------------------------------------------------------------------
+
+    def _before_request(self):
+        g._perf_start = time.perf_counter()
+        g._perf_db_queries = 0
+        g._perf_db_time = 0.0
+        g._perf_profiler = None
+
+        if self._profile_requested():
+            profiler = cProfile.Profile()
+            profiler.enable()
+            g._perf_profiler = profiler
+        return None
+
+    def _after_request(self, response):
+        start = getattr(g, '_perf_start', None)
+        if start is None:
+            # Short-circuited before our before_request ran (e.g. CORS preflight)
+            return response
+
+        try:
+            duration = time.perf_counter() - start
+            profile_id = self._finish_profile(duration)
+            if profile_id:
+                response.headers[PROFILE_ID_HEADER] = profile_id
+
+            rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+            size = response.calculate_content_length()
+            self.record_request(
+                method=request.method,
+                rule=rule,
+                duration=duration,
+                status_code=response.status_code,
+                response_bytes=size or 0,
+                db_queries=getattr(g, '_perf_db_queries', 0),
+                db_time=getattr(g, '_perf_db_time', 0.0)
+            )
+        except Exception as e:
+            print(f"[PERF] Failed to record request metrics: {e}")
+        return response
+
+    def _profile_requested(self) -> bool:
+        if not self.profiling_enabled:
+            return False
+        value = request.headers.get(PROFILE_HEADER)
+        if not value:
+            return False
+        if self.profile_token:
+            return value == self.profile_token
+        return value.lower() in ('1', 'true', 'yes')
+
+    def _finish_profile(self, duration: float) -> Optional[str]:
+        profiler = getattr(g, '_perf_profiler', None)
+        if profiler is None:
+            return None
+        profiler.disable()
+        g._perf_profiler = None
+
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(40)
+
+        profile_id = uuid.uuid4().hex[:12]
+        with self.lock:
+            self.profiles.append({
+                'id': profile_id,
+                'method': request.method,
+                'path': request.path,
+                'duration': duration,
+                'captured_at': datetime.utcnow().isoformat(),
+                'stats': output.getvalue()
+            })
+        return profile_id
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def record_request(self, method: str, rule: str, duration: float, status_code: int = 200,
+                       response_bytes: int = 0, db_queries: int = 0, db_time: float = 0.0):
+        """Record one completed request against its route"""
+        key = f"{method} {rule}"
+        status_class = f"{status_code // 100}xx"
+        with self.lock:
+            stats = self.routes.get(key)
+            if stats is None:
+                stats = RouteStats(method, rule)
+                self.routes[key] = stats
+            stats.latency.observe(duration)
+            stats.db_queries += db_queries
+            stats.db_time += db_time
+            stats.max_db_queries = max(stats.max_db_queries, db_queries)
+            stats.response_bytes += response_bytes
+            stats.max_response_bytes = max(stats.max_response_bytes, response_bytes)
+            stats.status_counts[status_class] = stats.status_counts.get(status_class, 0) + 1
+            stats.last_seen = datetime.utcnow().isoformat()
+
+    def record_db_query(self, duration: float = 0.0):
+        """Attribute one database statement to the current request, if any"""
+        if not has_request_context():
+            return
+        if getattr(g, '_perf_start', None) is None:
+            return
+        g._perf_db_queries = getattr(g, '_perf_db_queries', 0) + 1
+        g._perf_db_time = getattr(g, '_perf_db_time', 0.0) + duration
+
+    def record_operation(self, operation_name: str, duration: float):
+        """Record a named timing from code that measures itself (see log_performance)"""
+        with self.lock:
+            histogram = self.operations.get(operation_name)
+            if histogram is None:
+                histogram = LatencyHistogram()
+                self.operations[operation_name] = histogram
+            histogram.observe(duration)
+
+    def reset(self):
+        """Clear all aggregated metrics"""
+        with self.lock:
+            self.routes.clear()
+            self.operations.clear()
+            self.profiles.clear()
+            self.started_at = datetime.utcnow().isoformat()
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def get_stats(self, sort_by: str = 'p95', limit: int = None) -> Dict[str, Any]:
+        """Get per-route statistics sorted by the given latency key"""
+        with self.lock:
+            routes = [stats.to_dict() for stats in self.routes.values()]
+            operations = {}
+            for name, histogram in self.operations.items():
+                percentiles = histogram.percentiles()
+                operations[name] = {
+                    'count': histogram.count,
+                    'avg': histogram.total / histogram.count if histogram.count else 0.0,
+                    'max': histogram.max,
+                    'p50': percentiles['p50'],
+                    'p95': percentiles['p95'],
+                    'p99': percentiles['p99']
+                }
+            started_at = self.started_at
+
+        if sort_by in ('p50', 'p95', 'p99', 'avg', 'max'):
+            routes.sort(key=lambda r: r['latency'][sort_by], reverse=True)
+        elif sort_by == 'count':
+            routes.sort(key=lambda r: r['count'], reverse=True)
+        elif sort_by == 'db_time':
+            routes.sort(key=lambda r: r['db']['time_total'], reverse=True)
+        if limit:
+            routes = routes[:limit]
+
+        return {
+            'started_at': started_at,
+            'generated_at': datetime.utcnow().isoformat(),
+            'summary': self.get_summary(),
+            'routes': routes,
+            'operations': operations,
+            'profiling_enabled': self.profiling_enabled
+        }
+
+    def get_route_stats(self, method: str, rule: str) -> Optional[Dict[str, Any]]:
+        """Statistics for one METHOD + route rule, or None if it has not been seen"""
+        with self.lock:
+            stats = self.routes.get(f"{method} {rule}")
+            return stats.to_dict() if stats else None
+
+    def get_summary(self) -> Dict[str, Any]:
+        """Overall request totals, used by the health monitor"""
+        with self.lock:
+            total_requests = 0
+            server_errors = 0
+            slowest_route = None
+            slowest_p95 = 0.0
+            samples = []
+            for key, stats in self.routes.items():
+                total_requests += stats.latency.count
+                server_errors += stats.status_counts.get('5xx', 0)
+                samples.extend(stats.latency.samples)
+                route_p95 = stats.latency.percentiles()['p95']
+                if route_p95 > slowest_p95:
+                    slowest_p95 = route_p95
+                    slowest_route = key
+
+        samples.sort()
+        return {
+            'total_requests': total_requests,
+            'server_errors': server_errors,
+            'error_rate': server_errors / total_requests if total_requests else 0.0,
+            'p50': _percentile(samples, 50),
+            'p95': _percentile(samples, 95),
+            'p99': _percentile(samples, 99),
+            'slowest_route': slowest_route,
+            'slowest_route_p95': slowest_p95
+        }
+
+    def get_profiles(self) -> List[Dict[str, Any]]:
+        """List captured cProfile samples without their stats text"""
+        with self.lock:
+            return [{k: v for k, v in p.items() if k != 'stats'} for p in self.profiles]
+
+    def get_profile(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            for profile in self.profiles:
+                if profile['id'] == profile_id:
+                    return dict(profile)
+        return None
+
+    def render_prometheus(self) -> str:
+        """Render route metrics in the Prometheus text exposition format"""
+        lines = [
+            '# HELP kamioi_http_request_duration_seconds Request latency by route',
+            '# TYPE kamioi_http_request_duration_seconds histogram'
+        ]
+        with self.lock:
+            snapshot = list(self.routes.values())
+            for stats in snapshot:
+                labels = f'method="{stats.method}",route="{_escape_label(stats.rule)}"'
+                for bound, cumulative in stats.latency.cumulative_buckets():
+                    lines.append(f'kamioi_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'kamioi_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.latency.count}')
+                lines.append(f'kamioi_http_request_duration_seconds_sum{{{labels}}} {stats.latency.total}')
+                lines.append(f'kamioi_http_request_duration_seconds_count{{{labels}}} {stats.latency.count}')
+
+            lines.append('# HELP kamioi_http_db_queries_total Database statements issued by route')
+            lines.append('# TYPE kamioi_http_db_queries_total counter')
+            for stats in snapshot:
+                labels = f'method="{stats.method}",route="{_escape_label(stats.rule)}"'
+                lines.append(f'kamioi_http_db_queries_total{{{labels}}} {stats.db_queries}')
+
+            lines.append('# HELP kamioi_http_db_time_seconds_total Time spent in database statements by route')
+            lines.append('# TYPE kamioi_http_db_time_seconds_total counter')
+            for stats in snapshot:
+                labels = f'method="{stats.method}",route="{_escape_label(stats.rule)}"'
+                lines.append(f'kamioi_http_db_time_seconds_total{{{labels}}} {stats.db_time}')
+
+            lines.append('# HELP kamioi_http_response_bytes_total Response body bytes by route')
+            lines.append('# TYPE kamioi_http_response_bytes_total counter')
+            for stats in snapshot:
+                labels = f'method="{stats.method}",route="{_escape_label(stats.rule)}"'
+                lines.append(f'kamioi_http_response_bytes_total{{{labels}}} {stats.response_bytes}')
+
+            lines.append('# HELP kamioi_http_responses_total Responses by route and status class')
+            lines.append('# TYPE kamioi_http_responses_total counter')
+            for stats in snapshot:
+                for status_class, count in stats.status_counts.items():
+                    labels = f'method="{stats.method}",route="{_escape_label(stats.rule)}",status="{status_class}"'
+                    lines.append(f'kamioi_http_responses_total{{{labels}}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Global request profiler instance
+request_profiler = RequestProfiler()
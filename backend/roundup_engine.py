@@ -1,16 +1,38 @@
 """
 Auto-Round-Up Engine for Kamioi Platform
 Handles automatic round-up calculations, fee application, and portfolio sweeps
+backed by the roundup_ledger table
 """
 
 import math
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 from typing import Dict, List, Optional
 import json
 
+from database_manager import db_manager
+
+
+def to_cents(amount: float) -> int:
+    """Whole cents for the pending counters, so repeated additions never drift"""
+    return int((Decimal(str(amount)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
 class RoundUpEngine:
-    def __init__(self):
-        self.roundup_ledger = []
+    # Per-user aggregates shared by get_user_stats and get_admin_stats
+    STATS_COLUMNS = """
+        COALESCE(SUM(round_up_amount), 0),
+        COALESCE(SUM(fee_amount), 0),
+        COALESCE(SUM(CASE WHEN status = 'pending' THEN round_up_amount ELSE 0 END), 0),
+        COALESCE(SUM(CASE WHEN status = 'swept' THEN round_up_amount ELSE 0 END), 0),
+        COUNT(*),
+        COALESCE(SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END), 0),
+        COALESCE(SUM(CASE WHEN status = 'swept' THEN 1 ELSE 0 END), 0)
+    """
+
+    def __init__(self, db=None):
+        # Ledger rows live in roundup_ledger; pending sums live in roundup_pending_totals
+        self.db = db or db_manager
         self.user_preferences = {}
         self.kamioi_fee = 0  # No fee - subscription pays for service
         self.sweep_threshold = 10.00  # Auto-sweep when $10+ accumulated
@@ -72,195 +94,262 @@ class RoundUpEngine:
     
     def process_transaction(self, transaction: Dict) -> Dict:
         """Process a transaction and apply round-up"""
-        user_id = transaction.get('user_id', 'default')
-        amount = float(transaction.get('amount', 0))
-        
-        # Calculate round-up
-        roundup_data = self.calculate_roundup(amount, user_id)
-        
-        # Create ledger entry
-        ledger_entry = {
-            'id': f"roundup_{user_id}_{int(datetime.utcnow().timestamp())}",
-            'user_id': user_id,
-            'transaction_id': transaction.get('id'),
-            'original_amount': amount,
-            'delta': roundup_data['delta'],
-            'fee': roundup_data['fee'],
-            'total_debit': roundup_data['total_debit'],
-            'status': 'pending',
-            'created_at': datetime.utcnow().isoformat(),
-            'swept_at': None,
-            'sweep_batch_id': None
-        }
-        
-        # Add to ledger
-        self.roundup_ledger.append(ledger_entry)
-        
-        # Publish round-up accrued event
-        try:
-            from event_bus import event_bus, EventType
-            event_bus.publish(
-                EventType.ROUNDUP_ACCRUED,
-                user_id,
-                'user',
-                {
-                    'transaction_id': transaction.get('id'),
-                    'amount': roundup_data['delta'],
+        return self.process_transactions([transaction])[0]
+
+    def process_transactions(self, transactions: List[Dict]) -> List[Dict]:
+        """
+        Apply round-ups to a batch of transactions: one executemany into
+        roundup_ledger and one counter upsert per user, in a single commit
+        """
+        if not transactions:
+            return []
+
+        created_at = datetime.utcnow().isoformat()
+        results = []
+        rows = []
+        for transaction in transactions:
+            user_id = transaction.get('user_id', 'default')
+            amount = float(transaction.get('amount', 0))
+            roundup_data = self.calculate_roundup(amount, user_id)
+            ledger_entry = {
+                'id': None,
+                'user_id': user_id,
+                'transaction_id': transaction.get('id'),
+                'original_amount': amount,
+                'delta': roundup_data['delta'],
+                'fee': roundup_data['fee'],
+                'total_debit': roundup_data['total_debit'],
+                'status': 'pending',
+                'created_at': created_at,
+                'swept_at': None,
+                'sweep_batch_id': None
+            }
+            results.append({
+                'transaction_updated': {
+                    'amount': amount,
+                    'round_up': roundup_data['delta'],
                     'fee': roundup_data['fee'],
-                    'total_debit': roundup_data['total_debit']
+                    'total_debit': roundup_data['total_debit'],
+                    'roundup_enabled': roundup_data['roundup_enabled']
                 },
-                f"roundup_{ledger_entry['id']}",
-                'roundup_engine'
-            )
+                'ledger_entry': ledger_entry
+            })
+            rows.append(ledger_entry)
+
+        self._insert_entries(rows)
+
+        # Publish round-up accrued events once the rows are committed
+        try:
+            from event_bus import event_bus, EventType
+            for entry in rows:
+                event_bus.publish(
+                    EventType.ROUNDUP_ACCRUED,
+                    entry['user_id'],
+                    'user',
+                    {
+                        'transaction_id': entry['transaction_id'],
+                        'amount': entry['delta'],
+                        'fee': entry['fee'],
+                        'total_debit': entry['total_debit']
+                    },
+                    f"roundup_{entry['id']}",
+                    'roundup_engine'
+                )
         except ImportError:
             pass  # Event bus not available
-        
-        # Check if auto-sweep threshold is reached
-        pending_total = self.get_pending_total(user_id)
-        if pending_total >= self.sweep_threshold:
-            self.auto_sweep(user_id)
-        
-        return {
-            'transaction_updated': {
-                'amount': amount,
-                'round_up': roundup_data['delta'],
-                'fee': roundup_data['fee'],
-                'total_debit': roundup_data['total_debit'],
-                'roundup_enabled': roundup_data['roundup_enabled']
-            },
-            'ledger_entry': ledger_entry
-        }
-    
+
+        # Sweep users whose mapped round-ups crossed sweep_threshold; the pending counter is a cheap
+        # upper bound, so only they are checked. Round-ups mapped later are swept by the scheduled sweep
+        user_ids = [user_id for user_id in dict.fromkeys(entry['user_id'] for entry in rows)
+                    if self.get_pending_total(user_id) >= self.sweep_threshold]
+        if user_ids:
+            from roundup_sweep import RoundUpSweeper
+            RoundUpSweeper(engine=self, db=self.db).sweep_users_over_threshold(user_ids)
+
+        return results
+
+    def _insert_entries(self, entries: List[Dict]):
+        """Insert ledger rows and bump the per-user pending counters in one transaction"""
+        pending = {}
+        for entry in entries:
+            if entry['delta'] > 0:
+                cents, count = pending.get(str(entry['user_id']), (0, 0))
+                pending[str(entry['user_id'])] = (cents + to_cents(entry['delta']), count + 1)
+
+        conn = self.db.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("SELECT COALESCE(MAX(id), 0) FROM roundup_ledger")
+            first_id = cur.fetchone()[0] + 1
+            # transaction_id is NOT NULL in the schema; manual round-ups without a source transaction use 0
+            cur.executemany("""
+                INSERT INTO roundup_ledger (id, user_id, transaction_id, original_amount, round_up_amount,
+                                            fee_amount, total_debit, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+            """, [(first_id + offset, entry['user_id'], entry['transaction_id'] or 0, entry['original_amount'],
+                   entry['delta'], entry['fee'], entry['total_debit'], entry['created_at'])
+                  for offset, entry in enumerate(entries)])
+            cur.executemany("""
+                INSERT INTO roundup_pending_totals (user_id, pending_cents, pending_count, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    pending_cents = pending_cents + excluded.pending_cents,
+                    pending_count = pending_count + excluded.pending_count,
+                    updated_at = excluded.updated_at
+            """, [(user_id, cents, count, entries[0]['created_at']) for user_id, (cents, count) in pending.items()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        for offset, entry in enumerate(entries):
+            entry['id'] = first_id + offset
+
     def get_pending_total(self, user_id: str) -> float:
-        """Get total pending round-ups for a user"""
-        total = 0.0
-        for entry in self.roundup_ledger:
-            if (entry['user_id'] == user_id and 
-                entry['status'] == 'pending'):
-                total += entry['delta']
-        return round(total, 2)
-    
+        """Get total pending round-ups for a user (single primary-key lookup on the counter table)"""
+        conn = self.db.get_connection()
+        row = conn.execute("SELECT pending_cents FROM roundup_pending_totals WHERE user_id = ?",
+                           (str(user_id),)).fetchone()
+        conn.close()
+        return round((row[0] if row else 0) / 100, 2)
+
     def get_pending_entries(self, user_id: str) -> List[Dict]:
         """Get all pending round-up entries for a user"""
-        return [
-            entry for entry in self.roundup_ledger
-            if entry['user_id'] == user_id and entry['status'] == 'pending'
-        ]
-    
+        return self._query_entries("WHERE user_id = ? AND status = 'pending' ORDER BY id", (user_id,))
+
     def auto_sweep(self, user_id: str) -> Dict:
-        """Automatically sweep round-ups to portfolio"""
-        pending_entries = self.get_pending_entries(user_id)
-        if not pending_entries:
+        """
+        Sweep one user's mapped round-ups to their portfolio now. Goes through
+        RoundUpSweeper so the sweep queues its market_queue purchases; round-ups
+        without a ticker stay pending.
+        """
+        from roundup_sweep import RoundUpSweeper
+        batch = RoundUpSweeper(engine=self, db=self.db).sweep_user(user_id)
+        if not batch:
             return {'swept': False, 'reason': 'No pending round-ups'}
-        
-        sweep_batch_id = f"sweep_{user_id}_{int(datetime.utcnow().timestamp())}"
-        total_swept = 0.0
-        
-        for entry in pending_entries:
-            entry['status'] = 'swept'
-            entry['swept_at'] = datetime.utcnow().isoformat()
-            entry['sweep_batch_id'] = sweep_batch_id
-            total_swept += entry['delta']
-        
-        # Publish round-up swept event
-        try:
-            from event_bus import event_bus, EventType
-            event_bus.publish(
-                EventType.ROUNDUP_SWEPT,
-                user_id,
-                'user',
-                {
-                    'sweep_batch_id': sweep_batch_id,
-                    'entries_swept': len(pending_entries),
-                    'total_swept': round(total_swept, 2)
-                },
-                f"sweep_{sweep_batch_id}",
-                'roundup_engine'
-            )
-        except ImportError:
-            pass  # Event bus not available
-        
+
         return {
             'swept': True,
-            'sweep_batch_id': sweep_batch_id,
-            'entries_swept': len(pending_entries),
-            'total_swept': round(total_swept, 2),
-            'swept_at': datetime.utcnow().isoformat()
+            'sweep_batch_id': batch['sweep_batch_id'],
+            'entries_swept': batch['entries_swept'],
+            'total_swept': round(batch['total_swept'], 2),
+            'queued_orders': batch['queued_orders'],
+            'held_total': batch['held_total'],
+            'swept_at': batch['swept_at']
         }
-    
+
     def manual_sweep(self, user_id: str) -> Dict:
         """Manual sweep trigger"""
         return self.auto_sweep(user_id)
-    
+
+    def rebuild_pending_totals(self) -> int:
+        """Recompute the pending counters from the ledger; returns the number of users with pending round-ups"""
+        conn = self.db.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("DELETE FROM roundup_pending_totals")
+            cur.execute("""
+                INSERT INTO roundup_pending_totals (user_id, pending_cents, pending_count, updated_at)
+                SELECT CAST(user_id AS TEXT), CAST(ROUND(SUM(round_up_amount) * 100) AS INTEGER), COUNT(*), ?
+                FROM roundup_ledger
+                WHERE status = 'pending' AND round_up_amount > 0
+                GROUP BY user_id
+            """, (datetime.utcnow().isoformat(),))
+            users = cur.rowcount
+            conn.commit()
+            return users
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
     def get_user_stats(self, user_id: str) -> Dict:
         """Get round-up statistics for a user"""
-        user_entries = [entry for entry in self.roundup_ledger if entry['user_id'] == user_id]
-        
-        total_roundups = sum(entry['delta'] for entry in user_entries)
-        total_fees = sum(entry['fee'] for entry in user_entries)
-        pending_roundups = sum(entry['delta'] for entry in user_entries if entry['status'] == 'pending')
-        swept_roundups = sum(entry['delta'] for entry in user_entries if entry['status'] == 'swept')
-        
+        conn = self.db.get_connection()
+        row = conn.execute(f"SELECT {self.STATS_COLUMNS} FROM roundup_ledger WHERE user_id = ?",
+                           (user_id,)).fetchone()
+        conn.close()
+        total_roundups, total_fees, pending_roundups, swept_roundups, total, pending_count, swept_count = row
+
         return {
             'total_roundups': round(total_roundups, 2),
             'total_fees': round(total_fees, 2),
             'pending_roundups': round(pending_roundups, 2),
             'swept_roundups': round(swept_roundups, 2),
-            'total_transactions': len(user_entries),
-            'pending_count': len([e for e in user_entries if e['status'] == 'pending']),
-            'swept_count': len([e for e in user_entries if e['status'] == 'swept'])
+            'total_transactions': total,
+            'pending_count': pending_count,
+            'swept_count': swept_count
         }
-    
+
     def get_admin_stats(self) -> Dict:
         """Get admin-level round-up statistics"""
-        total_roundups = sum(entry['delta'] for entry in self.roundup_ledger)
-        total_fees = sum(entry['fee'] for entry in self.roundup_ledger)
-        total_pending = sum(entry['delta'] for entry in self.roundup_ledger if entry['status'] == 'pending')
-        total_swept = sum(entry['delta'] for entry in self.roundup_ledger if entry['status'] == 'swept')
-        
+        conn = self.db.get_connection()
+        rows = conn.execute(f"SELECT user_id, {self.STATS_COLUMNS} FROM roundup_ledger GROUP BY user_id").fetchall()
+        conn.close()
+
         # User breakdown
         user_stats = {}
-        for entry in self.roundup_ledger:
-            user_id = entry['user_id']
-            if user_id not in user_stats:
-                user_stats[user_id] = {
-                    'total_roundups': 0,
-                    'total_fees': 0,
-                    'pending_roundups': 0,
-                    'swept_roundups': 0,
-                    'transaction_count': 0
-                }
-            
-            user_stats[user_id]['total_roundups'] += entry['delta']
-            user_stats[user_id]['total_fees'] += entry['fee']
-            user_stats[user_id]['transaction_count'] += 1
-            
-            if entry['status'] == 'pending':
-                user_stats[user_id]['pending_roundups'] += entry['delta']
-            elif entry['status'] == 'swept':
-                user_stats[user_id]['swept_roundups'] += entry['delta']
-        
+        for user_id, total_roundups, total_fees, pending_roundups, swept_roundups, count, _, _ in rows:
+            user_stats[user_id] = {
+                'total_roundups': round(total_roundups, 2),
+                'total_fees': round(total_fees, 2),
+                'pending_roundups': round(pending_roundups, 2),
+                'swept_roundups': round(swept_roundups, 2),
+                'transaction_count': count
+            }
+
         return {
-            'total_roundups': round(total_roundups, 2),
-            'total_fees': round(total_fees, 2),
-            'total_pending': round(total_pending, 2),
-            'total_swept': round(total_swept, 2),
-            'total_transactions': len(self.roundup_ledger),
+            'total_roundups': round(sum(s['total_roundups'] for s in user_stats.values()), 2),
+            'total_fees': round(sum(s['total_fees'] for s in user_stats.values()), 2),
+            'total_pending': round(sum(s['pending_roundups'] for s in user_stats.values()), 2),
+            'total_swept': round(sum(s['swept_roundups'] for s in user_stats.values()), 2),
+            'total_transactions': sum(s['transaction_count'] for s in user_stats.values()),
             'active_users': len(user_stats),
             'user_breakdown': user_stats
         }
-    
-    def get_ledger_entries(self, user_id: str = None, status: str = None) -> List[Dict]:
+
+    def get_ledger_entries(self, user_id: str = None, status: str = None, limit: int = None) -> List[Dict]:
         """Get ledger entries with optional filtering"""
-        entries = self.roundup_ledger
-        
+        clauses, params = [], []
         if user_id:
-            entries = [e for e in entries if e['user_id'] == user_id]
-        
+            clauses.append("user_id = ?")
+            params.append(user_id)
         if status:
-            entries = [e for e in entries if e['status'] == status]
-        
-        return sorted(entries, key=lambda x: x['created_at'], reverse=True)
+            clauses.append("status = ?")
+            params.append(status)
+
+        sql = ("WHERE " + " AND ".join(clauses) + " " if clauses else "") + "ORDER BY created_at DESC, id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self._query_entries(sql, tuple(params))
+
+    def _query_entries(self, where: str, params: tuple) -> List[Dict]:
+        conn = self.db.get_connection()
+        rows = conn.execute(f"""
+            SELECT id, user_id, transaction_id, original_amount, round_up_amount, fee_amount, total_debit,
+                   status, created_at, swept_at, sweep_batch_id
+            FROM roundup_ledger {where}
+        """, params).fetchall()
+        conn.close()
+        return [{
+            'id': row[0],
+            'user_id': row[1],
+            'transaction_id': row[2] or None,
+            'original_amount': row[3],
+            'delta': row[4],
+            'fee': row[5] or 0,
+            'total_debit': row[6],
+            'status': row[7],
+            'created_at': row[8],
+            'swept_at': row[9],
+            'sweep_batch_id': row[10]
+        } for row in rows]
 
 # Global round-up engine instance
 roundup_engine = RoundUpEngine()
@@ -0,0 +1,343 @@
+"""
+Round-Up Sweep Job for Kamioi Platform
+Sweeps every user over the sweep threshold in one job: a single grouped query
+picks the users, each chunk of users is swept in one transaction (ledger rows
+marked, counters reset, per-user/per-ticker purchases queued for the order
+aggregator) and each chunk publishes one summarized event. Chunks are atomic,
+so a job that dies part-way can simply be re-run.
+
+Only round-ups whose transaction is mapped to a ticker are swept; the rest
+(manual round-ups, unmapped transactions) stay pending until they have a
+ticker to buy, so nothing is marked swept without a purchase behind it.
+
+Threshold sweeps happen inline when a user's round-ups cross the threshold
+(RoundUpEngine.process_transactions) and on a schedule (start_schedule), which
+catches round-ups whose transaction was mapped after they accrued.
+"""
+
+import json
+import uuid
+import threading
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+
+from database_manager import db_manager
+from roundup_engine import to_cents
+
+
+class RoundUpSweeper:
+    def __init__(self, engine=None, db=None, chunk_size: int = 500, poll_interval: float = 300):
+        self._engine = engine
+        self.db = db or db_manager
+        self.chunk_size = chunk_size  # Users per sweep batch / transaction
+        self.poll_interval = poll_interval  # Threshold check interval of the scheduled sweep
+        self.job_lock = threading.Lock()
+        self.thread = None
+        self.is_running = False
+        self.schedule_thread = None
+        self._wake = threading.Event()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from roundup_engine import roundup_engine
+            self._engine = roundup_engine
+        return self._engine
+
+    # ------------------------------------------------------------------
+    # Running jobs
+    # ------------------------------------------------------------------
+
+    def start(self, job_id: str = None, threshold: float = None) -> str:
+        """Run a sweep job in the background; returns its id for progress polling"""
+        job_id = job_id or self._new_job_id()
+        self.thread = threading.Thread(target=self.run, kwargs={'job_id': job_id, 'threshold': threshold},
+                                       name=f'roundup-sweep-{job_id}', daemon=True)
+        self.thread.start()
+        return job_id
+
+    def run(self, job_id: str = None, threshold: float = None,
+            progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        Sweep all users whose pending round-ups reach the threshold. Passing the
+        id of an unfinished job resumes it; users swept before the crash have no
+        pending rows left, so only the remainder is swept.
+        """
+        with self.job_lock:
+            job_id = job_id or self._new_job_id()
+            job = self.get_job(job_id)
+            if job and job['status'] == 'completed':
+                return job
+            if threshold is None:
+                threshold = job['threshold'] if job else self.engine.sweep_threshold
+
+            users = self._users_over_threshold(threshold)
+            self._open_job(job_id, threshold, len(users))
+            print(f"[SWEEP] Job {job_id}: {len(users)} users at or over ${threshold:.2f}")
+
+            try:
+                for start in range(0, len(users), self.chunk_size):
+                    batch = self._sweep_chunk(job_id, users[start:start + self.chunk_size])
+                    if batch:
+                        self._publish(batch)
+                    job = self.get_job(job_id)
+                    if progress:
+                        progress(job)
+                    print(f"[SWEEP] Job {job_id}: {job['users_swept']}/{job['users_total']} users, "
+                          f"{job['entries_swept']} entries, ${job['total_swept']:.2f}")
+            except Exception as e:
+                self._finish_job(job_id, 'failed', str(e))
+                print(f"[SWEEP] Job {job_id} failed (re-run it to resume): {e}")
+                return self.get_job(job_id)
+
+            self._finish_job(job_id, 'completed')
+            job = self.get_job(job_id)
+
+        if job['queued_orders']:
+            self._notify_drain()
+        return job
+
+    def sweep_user(self, user_id) -> Optional[Dict]:
+        """Sweep one user now, as a one-chunk job; returns the batch summary (None if nothing was sweepable)"""
+        job_id = self._new_job_id()
+        with self.job_lock:
+            self._open_job(job_id, 0, 1)
+            try:
+                batch = self._sweep_chunk(job_id, [user_id])
+            except Exception as e:
+                self._finish_job(job_id, 'failed', str(e))
+                raise
+            self._finish_job(job_id, 'completed')
+        if batch:
+            self._publish(batch)
+            if batch['queued_orders']:
+                self._notify_drain()
+        return batch
+
+    def sweep_users_over_threshold(self, user_ids: List, threshold: float = None) -> List[Dict]:
+        """Sweep those of user_ids whose mapped round-ups reach the threshold; returns the batch summaries"""
+        threshold = self.engine.sweep_threshold if threshold is None else threshold
+        batches = [self.sweep_user(user_id) for user_id in self._users_over_threshold(threshold, user_ids)]
+        return [batch for batch in batches if batch]
+
+    def _users_over_threshold(self, threshold: float, user_ids: List = None) -> List:
+        only_users = f"AND l.user_id IN ({','.join('?' * len(user_ids))})" if user_ids else ''
+        conn = self.db.get_connection()
+        rows = conn.execute(f"""
+            SELECT l.user_id FROM roundup_ledger l
+            JOIN transactions t ON t.id = l.transaction_id AND t.ticker IS NOT NULL AND TRIM(t.ticker) != ''
+            WHERE l.status = 'pending' {only_users}
+            GROUP BY l.user_id
+            HAVING ROUND(SUM(l.round_up_amount), 2) >= ?
+            ORDER BY l.user_id
+        """, [*(user_ids or []), threshold]).fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+
+    def _sweep_chunk(self, job_id: str, user_ids: List) -> Optional[Dict]:
+        """Sweep one chunk of users atomically; returns the batch summary (None if nothing was pending)"""
+        now = datetime.utcnow().isoformat()
+        marks = ','.join('?' * len(user_ids))
+        conn = self.db.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("SELECT batches, ticker_totals FROM roundup_sweep_jobs WHERE id = ?", (job_id,))
+            batches, ticker_json = cur.fetchone()
+            sweep_batch_id = f"{job_id}-{batches + 1:04d}"
+
+            # Rows without a ticker to buy stay pending
+            cur.execute(f"""
+                UPDATE roundup_ledger SET status = 'swept', swept_at = ?, sweep_batch_id = ?
+                WHERE status = 'pending' AND user_id IN ({marks})
+                AND EXISTS (
+                    SELECT 1 FROM transactions t
+                    WHERE t.id = roundup_ledger.transaction_id AND t.ticker IS NOT NULL AND TRIM(t.ticker) != ''
+                )
+            """, (now, sweep_batch_id, *user_ids))
+            if not cur.rowcount:
+                conn.rollback()
+                return None
+
+            # Per-user, per-ticker totals become market_queue purchases for the order aggregator
+            cur.execute("""
+                SELECT l.user_id, t.ticker, SUM(l.round_up_amount), COUNT(*)
+                FROM roundup_ledger l LEFT JOIN transactions t ON t.id = l.transaction_id
+                WHERE l.sweep_batch_id = ?
+                GROUP BY l.user_id, t.ticker
+            """, (sweep_batch_id,))
+            groups = cur.fetchall()
+            purchases = [(user_id, ticker.upper(), round(amount, 2), now)
+                         for user_id, ticker, amount, _ in groups if amount > 0]
+            cur.executemany("""
+                INSERT INTO market_queue (user_id, ticker, amount, status, created_at)
+                VALUES (?, ?, ?, 'queued', ?)
+            """, purchases)
+
+            # Counters keep whatever is still pending (held for a ticker)
+            cur.execute(f"""
+                SELECT user_id, SUM(round_up_amount), COUNT(*) FROM roundup_ledger
+                WHERE status = 'pending' AND round_up_amount > 0 AND user_id IN ({marks})
+                GROUP BY user_id
+            """, user_ids)
+            held = {str(user_id): (amount, count) for user_id, amount, count in cur.fetchall()}
+            cur.executemany("""
+                UPDATE roundup_pending_totals SET pending_cents = ?, pending_count = ?, updated_at = ?
+                WHERE user_id = ?
+            """, [(to_cents(held.get(str(user_id), (0, 0))[0]), held.get(str(user_id), (0, 0))[1], now, str(user_id))
+                  for user_id in user_ids])
+
+            users = {user_id for user_id, _, _, _ in groups}
+            entries = sum(count for _, _, _, count in groups)
+            total = sum((Decimal(str(amount)) for _, _, amount, _ in groups), Decimal('0'))
+            ticker_totals = {}
+            for _, ticker, amount, _ in groups:
+                ticker_totals[ticker.upper()] = ticker_totals.get(ticker.upper(), Decimal('0')) + Decimal(str(amount))
+            job_tickers = json.loads(ticker_json or '{}')
+            for ticker, amount in ticker_totals.items():
+                job_tickers[ticker] = float(Decimal(str(job_tickers.get(ticker, 0))) + amount)
+
+            cur.execute("""
+                UPDATE roundup_sweep_jobs
+                SET batches = batches + 1, users_swept = users_swept + ?, entries_swept = entries_swept + ?,
+                    total_swept = ROUND(total_swept + ?, 2), queued_orders = queued_orders + ?,
+                    ticker_totals = ?, updated_at = ?
+                WHERE id = ?
+            """, (len(users), entries, float(total), len(purchases), json.dumps(job_tickers), now, job_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return {
+            'job_id': job_id,
+            'sweep_batch_id': sweep_batch_id,
+            'users_swept': len(users),
+            'entries_swept': entries,
+            'total_swept': float(total),
+            'queued_orders': len(purchases),
+            'ticker_totals': {ticker: float(amount) for ticker, amount in ticker_totals.items()},
+            'held_total': round(sum(amount for amount, _ in held.values()), 2),
+            'swept_at': now
+        }
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+
+    def start_schedule(self):
+        """
+        Check the threshold every poll_interval and run a sweep job when anyone
+        is over it. Round-ups usually get their ticker after they accrue (when
+        the transaction is mapped), so this is what sweeps most users.
+        """
+        if self.is_running:
+            return
+        self.is_running = True
+        self._wake.clear()
+        self.schedule_thread = threading.Thread(target=self._loop, name='roundup-sweep-scheduler', daemon=True)
+        self.schedule_thread.start()
+        print("Round-up sweep scheduler started")
+
+    def stop_schedule(self):
+        self.is_running = False
+        self._wake.set()
+        if self.schedule_thread:
+            self.schedule_thread.join(timeout=60)
+        print("Round-up sweep scheduler stopped")
+
+    def run_if_due(self) -> Optional[Dict]:
+        """Run a sweep job if any user is over the threshold (no job record otherwise)"""
+        if not self._users_over_threshold(self.engine.sweep_threshold):
+            return None
+        return self.run()
+
+    def _loop(self):
+        while self.is_running:
+            try:
+                self.run_if_due()
+            except Exception as e:
+                print(f"[SWEEP] Scheduler error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _publish(self, batch: Dict):
+        """One summarized event per sweep batch instead of one per user"""
+        try:
+            from event_bus import event_bus, EventType
+            event_bus.publish(
+                EventType.ROUNDUP_SWEPT,
+                'platform',
+                'admin',
+                batch,
+                f"sweep_{batch['sweep_batch_id']}",
+                'roundup_sweeper'
+            )
+        except ImportError:
+            pass  # Event bus not available
+
+    def _notify_drain(self):
+        """Wake the market drain so queued purchases go out at the next open window"""
+        try:
+            from market_drain import market_drain_scheduler
+            if market_drain_scheduler.is_running:
+                market_drain_scheduler.trigger()
+        except ImportError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Job records
+    # ------------------------------------------------------------------
+
+    def _new_job_id(self) -> str:
+        return f"sweepjob-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    def _open_job(self, job_id: str, threshold: float, users_total: int):
+        now = datetime.utcnow().isoformat()
+        conn = self.db.get_connection()
+        conn.execute("""
+            INSERT INTO roundup_sweep_jobs (id, status, threshold, users_total, started_at, updated_at)
+            VALUES (?, 'running', ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                status = 'running', error = NULL, updated_at = excluded.updated_at,
+                users_total = roundup_sweep_jobs.users_swept + excluded.users_total
+        """, (job_id, threshold, users_total, now, now))
+        conn.commit()
+        conn.close()
+
+    def _finish_job(self, job_id: str, status: str, error: str = None):
+        now = datetime.utcnow().isoformat()
+        conn = self.db.get_connection()
+        conn.execute("UPDATE roundup_sweep_jobs SET status = ?, error = ?, updated_at = ?, completed_at = ? WHERE id = ?",
+                     (status, error, now, now if status == 'completed' else None, job_id))
+        conn.commit()
+        conn.close()
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        jobs = self._query_jobs("WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        return self._query_jobs("ORDER BY started_at DESC LIMIT ?", (limit,))
+
+    def _query_jobs(self, where: str, params: tuple) -> List[Dict]:
+        conn = self.db.get_connection()
+        cur = conn.execute(f"SELECT * FROM roundup_sweep_jobs {where}", params)
+        columns = [column[0] for column in cur.description]
+        rows = cur.fetchall()
+        conn.close()
+
+        jobs = []
+        for row in rows:
+            job = dict(zip(columns, row))
+            job['ticker_totals'] = json.loads(job['ticker_totals'] or '{}')
+            job['progress'] = round(job['users_swept'] / job['users_total'], 4) if job['users_total'] else 1.0
+            jobs.append(job)
+        return jobs
+
+
+# Global round-up sweeper instance
+roundup_sweeper = RoundUpSweeper()
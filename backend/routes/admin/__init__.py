@@ -3,7 +3,7 @@ Admin Routes for Kamioi Platform v10072025
 All 19 Admin Dashboard Modules
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -787,30 +787,21 @@ def get_roundup_ledger():
 
 @admin_bp.route('/roundup/sweep-all', methods=['POST'])
 def sweep_all_roundups():
-    """Admin trigger to sweep all pending round-ups"""
+    """Admin trigger to sweep all pending round-ups over the threshold as one batch job"""
     try:
-        from roundup_engine import roundup_engine
+        from roundup_sweep import roundup_sweeper
         
-        data = request.get_json()
-        admin_id = data.get('admin_id', 'admin')
+        data = request.get_json(silent=True) or {}
+        threshold = data.get('threshold')
+        threshold = float(threshold) if threshold is not None else None
         
-        # Get all users with pending round-ups
-        admin_stats = roundup_engine.get_admin_stats()
-        user_breakdown = admin_stats.get('user_breakdown', {})
-        
-        sweep_results = []
-        for user_id, user_stats in user_breakdown.items():
-            if user_stats['pending_roundups'] > 0:
-                result = roundup_engine.manual_sweep(user_id)
-                sweep_results.append({
-                    'user_id': user_id,
-                    'result': result
-                })
+        # Pass an unfinished job_id to resume it after a crash
+        job = roundup_sweeper.run(job_id=data.get('job_id'), threshold=threshold)
         
         return jsonify({
-            'success': True,
-            'message': f'Swept round-ups for {len(sweep_results)} users',
-            'data': sweep_results
+            'success': job['status'] == 'completed',
+            'message': f"Swept round-ups for {job['users_swept']} users in {job['batches']} batches",
+            'data': job
         })
         
     except Exception as e:
@@ -964,26 +955,28 @@ def get_materialized_views_stats():
 
 @admin_bp.route('/materialized-views/<view_name>', methods=['GET'])
 def get_materialized_view(view_name):
-    """Get a specific materialized view"""
+    """Get a specific materialized view's metadata and rows"""
     try:
         from materialized_views import mv_manager
         
-        view = mv_manager.get_view(view_name)
+        view = mv_manager.describe_view(view_name)
         if not view:
             return jsonify({
                 'success': False,
                 'error': f'View not found: {view_name}'
             }), 404
         
+        limit = int(request.args.get('limit', 100))
+        
         return jsonify({
             'success': True,
             'data': {
-                'name': view.name,
-                'data': view.data,
-                'last_refresh': view.last_refresh,
-                'refresh_interval': view.refresh_interval,
-                'dependencies': view.dependencies,
-                'is_stale': mv_manager.is_stale(view_name)
+                'name': view_name,
+                'data': mv_manager.read_view(view_name, limit=limit),
+                'last_refresh': view['last_refresh'],
+                'refresh_interval': view['refresh_interval'],
+                'dependencies': view['dependencies'],
+                'is_stale': view['is_stale']
             }
         })
         
@@ -996,24 +989,23 @@ def get_materialized_view(view_name):
 
 @admin_bp.route('/materialized-views/<view_name>/refresh', methods=['POST'])
 def refresh_materialized_view(view_name):
-    """Manually refresh a materialized view"""
+    """Manually refresh a materialized view ({"full": true} rebuilds it)"""
     try:
         from materialized_views import mv_manager
         
-        view = mv_manager.get_view(view_name)
-        if not view:
+        if view_name not in mv_manager.definitions:
             return jsonify({
                 'success': False,
                 'error': f'View not found: {view_name}'
             }), 404
         
-        # For now, just update the timestamp
-        # In a real system, this would trigger the view's refresh logic
-        mv_manager.refresh_view(view_name, view.data)
+        data = request.get_json(silent=True) or {}
+        result = mv_manager.refresh_view(view_name, full=bool(data.get('full')))
         
         return jsonify({
             'success': True,
-            'message': f'View {view_name} refreshed successfully'
+            'message': f'View {view_name} refreshed successfully',
+            'data': result
         })
         
     except Exception as e:
@@ -1025,15 +1017,16 @@ def refresh_materialized_view(view_name):
 
 @admin_bp.route('/materialized-views/refresh-all', methods=['POST'])
 def refresh_all_materialized_views():
-    """Refresh all materialized views"""
+    """Apply all pending changes to every materialized view"""
     try:
-        from materialized_views import mv_manager, auto_refresh_views
+        from materialized_views import mv_manager
         
-        auto_refresh_views()
+        result = mv_manager.refresh_pending()
         
         return jsonify({
             'success': True,
-            'message': 'All materialized views refreshed successfully'
+            'message': 'All materialized views refreshed successfully',
+            'data': result
         })
         
     except Exception as e:
@@ -1423,24 +1416,8 @@ def run_health_check():
                 'error': 'check_name is required'
             }), 400
         
-        # Run specific health check
-        if check_name == 'system_resources':
-            health_monitor._check_system_resources()
-        elif check_name == 'database':
-            health_monitor._check_database_health()
-        elif check_name == 'api_endpoints':
-            health_monitor._check_api_endpoints()
-        elif check_name == 'external_services':
-            health_monitor._check_external_services()
-        elif check_name == 'event_bus':
-            health_monitor._check_event_bus_health()
-        elif check_name == 'materialized_views':
-            health_monitor._check_materialized_views_health()
-        elif check_name == 'auto_mapping':
-            health_monitor._check_auto_mapping_health()
-        elif check_name == 'roundup_engine':
-            health_monitor._check_roundup_engine_health()
-        else:
+        # Run specific health check (bounded by its deadline)
+        if not health_monitor.run_check(check_name):
             return jsonify({
                 'success': False,
                 'error': f'Unknown check: {check_name}'
@@ -1702,16 +1679,9 @@ def export_audit_logs():
                 'error': 'Format must be json or csv'
             }), 400
         
-        exported_data = audit_logger.export_logs(format_type)
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'format': format_type,
-                'content': exported_data,
-                'size': len(exported_data)
-            }
-        })
+        mimetype = 'application/json' if format_type == 'json' else 'text/csv'
+        return Response(stream_with_context(audit_logger.export_logs(format_type)), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename=audit_log.{format_type}'})
         
     except Exception as e:
         print(f"Error exporting audit logs: {e}")
@@ -197,8 +197,9 @@ def get_detailed_records():
         endpoint = request.args.get('endpoint', None, type=str)
         user_id = request.args.get('user_id', None, type=str)
         page_tab = request.args.get('page_tab', None, type=str)
+        cursor = request.args.get('cursor', None, type=int)  # next_cursor from the previous page
 
-        print(f"📊 Fetching records: page={page}, limit={limit}, days={days}, status={status}, endpoint={endpoint}, user_id={user_id}, page_tab={page_tab}")
+        print(f"📊 Fetching records: page={page}, cursor={cursor}, limit={limit}, days={days}, status={status}, endpoint={endpoint}, user_id={user_id}, page_tab={page_tab}")
 
         result = usage_tracker.get_detailed_records(
             page=page,
@@ -207,7 +208,8 @@ def get_detailed_records():
             status=status,
             endpoint=endpoint,
             user_id=user_id,
-            page_tab=page_tab
+            page_tab=page_tab,
+            cursor=cursor
         )
 
         print(f"📊 Found {result.get('total', 0)} total records, returning {len(result.get('records', []))} records")
@@ -225,6 +227,67 @@ def get_detailed_records():
             'error': str(e)
         }), 500
 
+@api_usage_bp.route('/api/admin/api-usage/records/<int:record_id>/payload', methods=['GET'])
+@cross_origin()
+def get_record_payload(record_id):
+    """Get the full request/response payload of one API usage record"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        payloads = usage_tracker.get_record_payloads(record_id)
+        if payloads is None:
+            return jsonify({
+                'success': False,
+                'error': 'Record not found'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'data': payloads
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@api_usage_bp.route('/api/admin/api-usage/compact', methods=['POST'])
+@cross_origin()
+def compact_payloads():
+    """Archive request/response payloads older than the retention window"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    try:
+        data = request.json or {}
+        older_than_days = int(data.get('older_than_days', 30))
+
+        if older_than_days < 0:
+            return jsonify({
+                'success': False,
+                'error': 'older_than_days cannot be negative'
+            }), 400
+
+        summary = usage_tracker.compact_payloads(older_than_days=older_than_days)
+
+        return jsonify({
+            'success': True,
+            'data': summary
+        })
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid older_than_days'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @api_usage_bp.route('/api/admin/api-usage/export', methods=['GET'])
 @cross_origin()
 def export_records():
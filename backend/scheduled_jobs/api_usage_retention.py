@@ -0,0 +1,44 @@
+"""
+API Usage Payload Retention Scheduled Job
+Runs nightly to move request/response payloads older than the retention
+window out of api_usage into the compressed api_usage_payloads archive
+"""
+
+import argparse
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.api_usage_tracker import APIUsageTracker
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_payload_retention(older_than_days=30, batch_size=500):
+    """
+    Compact api_usage payloads older than older_than_days
+    Safe to re-run; rows already compacted are skipped
+    """
+    try:
+        tracker = APIUsageTracker()
+        logger.info(f"Compacting api_usage payloads older than {older_than_days} days")
+        
+        summary = tracker.compact_payloads(older_than_days=older_than_days, batch_size=batch_size)
+        
+        logger.info(f"Compacted {summary['rows_compacted']} rows, wrote {summary['payloads_written']} payloads "
+                    f"({summary['bytes_before']} -> {summary['bytes_after']} bytes)")
+        return summary
+            
+    except Exception as e:
+        logger.error(f"Error running api_usage payload retention: {str(e)}")
+        raise
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive old api_usage request/response payloads')
+    parser.add_argument('--days', type=int, default=30, help='Retention window in days')
+    parser.add_argument('--batch-size', type=int, default=500, help='Rows per transaction')
+    args = parser.parse_args()
+    run_payload_retention(older_than_days=args.days, batch_size=args.batch_size)
@@ -4,42 +4,42 @@ Processes daily revenue recognition for all active subscriptions
 Should run daily at a specified time (e.g., 11:59 PM)
 """
 
-import schedule
 import time
-from datetime import datetime
+import sys
+import os
+from datetime import datetime, date
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from services.subscription_accounting_service import SubscriptionAccountingService
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def run_daily_revenue_recognition():
+def run_daily_revenue_recognition(recognition_date: date = None):
     """
     Main function to run daily revenue recognition
     This should be called by a scheduler (cron, APScheduler, etc.)
     """
     try:
-        logger.info("Starting daily revenue recognition process...")
+        from database_manager import db_manager
         
-        # Initialize service (with actual DB connection)
-        # accounting_service = SubscriptionAccountingService(db_connection)
+        recognition_date = recognition_date or datetime.now().date()
+        logger.info(f"Starting daily revenue recognition for {recognition_date.isoformat()}...")
         
-        # Fetch all active subscriptions from database
-        # subscriptions = db.get_active_subscriptions()
-        
-        # Process recognition for today
-        # entries = accounting_service.process_daily_revenue_recognition(
-        #     subscriptions=subscriptions,
-        #     recognition_date=datetime.now().date()
-        # )
+        accounting_service = SubscriptionAccountingService(db_manager)
+        summary = accounting_service.recognize_revenue_range(recognition_date, recognition_date)
         
         # Log results
-        logger.info(f"Daily recognition complete: {0} entries created")  # len(entries)
+        logger.info(f"Daily recognition complete: {summary['entries_created']} entries created")
         
         return {
             'success': True,
-            'entries_created': 0,  # len(entries),
-            'date': datetime.now().date().isoformat()
+            'entries_created': summary['entries_created'],
+            'total_amount': summary['total_amount'],
+            'date': recognition_date.isoformat()
         }
         
     except Exception as e:
@@ -50,9 +50,30 @@ def run_daily_revenue_recognition():
         }
 
 
+def run_revenue_recognition_backfill(start_date: date, end_date: date, chunk_days: int = 31):
+    """Recognize every day in [start_date, end_date]; days already recognized are skipped"""
+    try:
+        from database_manager import db_manager
+        
+        logger.info(f"Starting revenue recognition backfill {start_date.isoformat()}..{end_date.isoformat()}")
+        summary = SubscriptionAccountingService(db_manager).backfill_revenue_recognition(
+            start_date, end_date, chunk_days=chunk_days)
+        logger.info(f"Backfill complete: {summary['entries_created']} entries in {summary['chunks']} chunks")
+        return {'success': True, **summary}
+        
+    except Exception as e:
+        logger.error(f"Error in revenue recognition backfill: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
 # Example using schedule library (alternative: use APScheduler or cron)
 def schedule_daily_recognition():
     """Schedule the daily recognition job"""
+    import schedule
+    
     # Run at 11:59 PM every day
     schedule.every().day.at("23:59").do(run_daily_revenue_recognition)
     
@@ -86,9 +107,20 @@ def setup_scheduler_with_apscheduler():
 
 
 if __name__ == '__main__':
-    # For testing/development
-    print("Running daily revenue recognition...")
-    result = run_daily_revenue_recognition()
+    import argparse
+    
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Recognize daily subscription revenue')
+    parser.add_argument('--from', dest='start', type=date.fromisoformat, help='First day to backfill (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='end', type=date.fromisoformat, help='Last day to backfill (defaults to today)')
+    parser.add_argument('--chunk-days', type=int, default=31, help='Days per backfill transaction')
+    args = parser.parse_args()
+    
+    if args.start:
+        result = run_revenue_recognition_backfill(args.start, args.end or datetime.now().date(), args.chunk_days)
+    else:
+        print("Running daily revenue recognition...")
+        result = run_daily_revenue_recognition(args.end)
     print(f"Result: {result}")
 
 
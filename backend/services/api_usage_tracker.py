@@ -7,6 +7,74 @@ from database_manager import db_manager
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import json
+import hashlib
+import threading
+import zlib
+
+# Databases whose usage tables are known to exist in this process
+_tables_ready = set()
+_tables_lock = threading.Lock()
+
+# Per-day, per-model totals kept in step with api_usage by record_api_call
+DAILY_ROLLUP_UPSERT = """
+    INSERT INTO api_usage_daily (day, model, calls, successful_calls, prompt_tokens, completion_tokens,
+                                 total_tokens, processing_time_ms, cost, successful_cost)
+    VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (day, model) DO UPDATE SET
+        calls = calls + 1,
+        successful_calls = successful_calls + excluded.successful_calls,
+        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+        completion_tokens = completion_tokens + excluded.completion_tokens,
+        total_tokens = total_tokens + excluded.total_tokens,
+        processing_time_ms = processing_time_ms + excluded.processing_time_ms,
+        cost = cost + excluded.cost,
+        successful_cost = successful_cost + excluded.successful_cost
+"""
+
+
+
+def extract_message(request_data_raw: Optional[str]) -> Optional[str]:
+    """Short display message (<= 100 chars) from a stored request payload"""
+    message = None
+    if request_data_raw:
+        try:
+            # Try parsing as JSON first
+            request_json = json.loads(request_data_raw)
+            # Try to extract message/prompt from common structures
+            if isinstance(request_json, dict):
+                if 'messages' in request_json and len(request_json['messages']) > 0:
+                    # Get the last message (user message)
+                    last_message = request_json['messages'][-1]
+                    message = last_message.get('content', '')
+                    # Truncate to 100 chars for display
+                    if len(message) > 100:
+                        message = message[:100] + '...'
+                elif 'prompt' in request_json:
+                    message = str(request_json['prompt'])
+                    if len(message) > 100:
+                        message = message[:100] + '...'
+                elif 'content' in request_json:
+                    message = str(request_json['content'])
+                    if len(message) > 100:
+                        message = message[:100] + '...'
+        except json.JSONDecodeError:
+            # If JSON parsing fails, try to extract text directly
+            try:
+                message = str(request_data_raw)[:100] if request_data_raw else None
+                if len(message) > 100:
+                    message = message[:100] + '...'
+            except:
+                message = None
+        except Exception as e:
+            print(f"⚠️ Error extracting message from request_data: {e}")
+            message = None
+    return message
+
+
+def payload_hash(payload: str) -> str:
+    """Content address of a payload in api_usage_payloads"""
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
 
 class APIUsageTracker:
     """Track API calls, costs, and usage statistics"""
@@ -20,9 +88,20 @@ class APIUsageTracker:
     # Default: assume cache miss for input (more conservative cost estimate)
     DEFAULT_INPUT_COST = INPUT_COST_CACHE_MISS
     
+    def __init__(self, db=None):
+        self.db = db or db_manager
+    
     def _ensure_tables(self):
-        """Ensure API usage and balance tables exist"""
-        conn = db_manager.get_connection()
+        """Ensure API usage and balance tables exist (once per database per process)"""
+        key = getattr(self.db, 'db_path', id(self.db))
+        if key in _tables_ready:
+            return
+        with _tables_lock:
+            if key not in _tables_ready and self._create_tables():
+                _tables_ready.add(key)
+    
+    def _create_tables(self) -> bool:
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             
@@ -57,6 +136,46 @@ class APIUsageTracker:
             except:
                 pass  # Column already exists
             
+            # Payloads older than the retention window move to api_usage_payloads
+            # (see compact_payloads); the row keeps their hashes and a display preview
+            for column in ('request_hash TEXT', 'response_hash TEXT', 'message_preview TEXT'):
+                try:
+                    cursor.execute(f"ALTER TABLE api_usage ADD COLUMN {column}")
+                except:
+                    pass  # Column already exists
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS api_usage_payloads (
+                    hash TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    raw_size INTEGER NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_usage_created_at ON api_usage(created_at)")
+            
+            # Daily rollup read by the stats, month-cost and daily-limit queries
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS api_usage_daily (
+                    day TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    successful_calls INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    total_tokens INTEGER NOT NULL DEFAULT 0,
+                    processing_time_ms INTEGER NOT NULL DEFAULT 0,
+                    cost REAL NOT NULL DEFAULT 0,
+                    successful_cost REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, model)
+                )
+            """)
+            
+            # Seed the rollup from existing history the first time it appears
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM api_usage_daily)")
+            if not cursor.fetchone()[0]:
+                self._rebuild_daily_rollup(cursor)
+            
             # Create api_balance table (SQLite syntax)
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS api_balance (
@@ -72,11 +191,39 @@ class APIUsageTracker:
                 cursor.execute("INSERT INTO api_balance (balance, updated_at) VALUES (?, ?)", (20.00, datetime.now().isoformat()))
             
             conn.commit()
+            return True
         except Exception as e:
             conn.rollback()
             print(f"Error ensuring tables: {e}")
+            return False
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
+    
+    def _rebuild_daily_rollup(self, cursor):
+        """Recompute api_usage_daily from api_usage"""
+        cursor.execute("DELETE FROM api_usage_daily")
+        cursor.execute("""
+            INSERT INTO api_usage_daily (day, model, calls, successful_calls, prompt_tokens, completion_tokens,
+                                         total_tokens, processing_time_ms, cost, successful_cost)
+            SELECT substr(created_at, 1, 10), model, COUNT(*), SUM(CASE WHEN success THEN 1 ELSE 0 END),
+                   SUM(prompt_tokens), SUM(completion_tokens), SUM(total_tokens), SUM(processing_time_ms),
+                   SUM(cost), SUM(CASE WHEN success = 1 THEN cost ELSE 0 END)
+            FROM api_usage
+            GROUP BY substr(created_at, 1, 10), model
+        """)
+    
+    def rebuild_daily_rollup(self):
+        """Rebuild the daily rollup from the raw api_usage rows"""
+        self._ensure_tables()
+        conn = self.db.get_connection()
+        try:
+            self._rebuild_daily_rollup(conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.db.release_connection(conn)
     
     def record_api_call(self, endpoint: str, model: str, 
                        prompt_tokens: int = 0, completion_tokens: int = 0,
@@ -106,7 +253,7 @@ class APIUsageTracker:
         if total_tokens == 0:
             total_tokens = prompt_tokens + completion_tokens
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             
@@ -119,29 +266,28 @@ class APIUsageTracker:
             request_data_str = str(request_data) if request_data else None
             response_data_str = str(response_data) if response_data else None
             
+            now = datetime.now()
             cursor.execute("""
                 INSERT INTO api_usage 
                 (endpoint, model, prompt_tokens, completion_tokens, total_tokens, 
                  processing_time_ms, cost, success, error_message, user_id, page_tab,
-                 request_data, response_data, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 request_data, response_data, message_preview, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 endpoint, model, prompt_tokens, completion_tokens, total_tokens,
                 processing_time_ms, cost, 1 if success else 0, error_message,
-                user_id, page_tab, request_data_str, response_data_str, datetime.now().isoformat()
+                user_id, page_tab, request_data_str, response_data_str, extract_message(request_data_str),
+                now.isoformat()
             ))
             record_id = cursor.lastrowid
-            conn.commit()
             
-            # Verify the insert
-            cursor.execute("SELECT user_id, page_tab, request_data IS NOT NULL AND request_data != '', response_data IS NOT NULL AND response_data != '' FROM api_usage WHERE id = ?", (record_id,))
-            verify = cursor.fetchone()
-            print(f"📊 Verified record {record_id}: user_id={verify[0]}, page_tab={verify[1]}, has_request={bool(verify[2])}, has_response={bool(verify[3])}")
-            
-            # Additional debug: Check actual values
-            cursor.execute("SELECT user_id, page_tab, LENGTH(request_data), LENGTH(response_data) FROM api_usage WHERE id = ?", (record_id,))
-            debug_row = cursor.fetchone()
-            print(f"📊 Debug record {record_id}: user_id={debug_row[0]}, page_tab={debug_row[1]}, request_len={debug_row[2]}, response_len={debug_row[3]}")
+            # Same transaction, so the rollup never drifts from the raw rows
+            cursor.execute(DAILY_ROLLUP_UPSERT, (
+                now.date().isoformat(), model, 1 if success else 0, prompt_tokens, completion_tokens,
+                total_tokens, processing_time_ms, cost, cost if success else 0.0
+            ))
+            conn.commit()
+            print(f"📊 Recorded API call {record_id}: user_id={user_id}, page_tab={page_tab}")
             
             return record_id
         except Exception as e:
@@ -151,7 +297,7 @@ class APIUsageTracker:
             traceback.print_exc()
             return None
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
     
     def get_usage_stats(self, days: int = 30) -> Dict:
         """
@@ -160,60 +306,48 @@ class APIUsageTracker:
         self._ensure_tables()
         cutoff_date = datetime.now() - timedelta(days=days)
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             
-            # Get all usage records
+            # Whole days come from the rollup; only the partial first day reads raw rows
+            next_day = (cutoff_date + timedelta(days=1)).date().isoformat()
             cursor.execute("""
-                SELECT endpoint, model, prompt_tokens, completion_tokens, total_tokens,
-                       processing_time_ms, cost, success, error_message, created_at
-                FROM api_usage
-                WHERE created_at >= ?
-            """, (cutoff_date.isoformat(),))
+                SELECT day, model, SUM(calls), SUM(successful_calls), SUM(processing_time_ms), SUM(cost)
+                FROM (
+                    SELECT day, model, calls, successful_calls, processing_time_ms, cost
+                    FROM api_usage_daily
+                    WHERE day >= ?
+                    UNION ALL
+                    SELECT substr(created_at, 1, 10), model, COUNT(*), SUM(CASE WHEN success THEN 1 ELSE 0 END),
+                           SUM(processing_time_ms), SUM(cost)
+                    FROM api_usage
+                    WHERE created_at >= ? AND created_at < ?
+                    GROUP BY substr(created_at, 1, 10), model
+                )
+                GROUP BY day, model
+                ORDER BY day, model
+            """, (next_day, cutoff_date.isoformat(), next_day))
             
             rows = cursor.fetchall()
             
-            total_calls = len(rows)
-            successful_calls = sum(1 for r in rows if r[7])  # success column
+            total_calls = sum(r[2] for r in rows)
+            successful_calls = sum(r[3] or 0 for r in rows)
             failed_calls = total_calls - successful_calls
-            total_cost = sum(float(r[6]) for r in rows)  # cost column
-            avg_processing_time = sum(r[5] for r in rows) / total_calls if total_calls > 0 else 0
+            total_cost = sum(float(r[5] or 0) for r in rows)
+            avg_processing_time = sum(r[4] or 0 for r in rows) / total_calls if total_calls > 0 else 0
             
-            # Group by day
+            # Group by day and by model
             calls_by_day = {}
             cost_by_day = {}
-            for row in rows:
-                created_at = row[9]  # created_at column
-                try:
-                    if isinstance(created_at, str):
-                        # Try parsing ISO format
-                        if 'T' in created_at:
-                            day = datetime.fromisoformat(created_at.replace('Z', '+00:00').split('T')[0])
-                        else:
-                            day = datetime.fromisoformat(created_at.split()[0])
-                        day = day.date() if hasattr(day, 'date') else day
-                    else:
-                        day = created_at.date() if hasattr(created_at, 'date') else datetime.fromisoformat(str(created_at)).date()
-                except:
-                    # Fallback: use today if parsing fails
-                    day = datetime.now().date()
-                
-                day_str = str(day)
-                if day_str not in calls_by_day:
-                    calls_by_day[day_str] = 0
-                    cost_by_day[day_str] = 0.0
-                calls_by_day[day_str] += 1
-                cost_by_day[day_str] += float(row[6] or 0)
-            
-            # Group by model
             calls_by_model = {}
-            for row in rows:
-                model = row[1]  # model column
+            for day, model, calls, _, _, cost in rows:
+                calls_by_day[day] = calls_by_day.get(day, 0) + calls
+                cost_by_day[day] = cost_by_day.get(day, 0.0) + float(cost or 0)
                 if model not in calls_by_model:
                     calls_by_model[model] = {'calls': 0, 'cost': 0.0}
-                calls_by_model[model]['calls'] += 1
-                calls_by_model[model]['cost'] += float(row[6])
+                calls_by_model[model]['calls'] += calls
+                calls_by_model[model]['cost'] += float(cost or 0)
             
             return {
                 'total_calls': total_calls,
@@ -240,26 +374,25 @@ class APIUsageTracker:
                 'period_days': days
             }
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
     
     def get_current_month_cost(self) -> float:
         """Get total cost for current month"""
         self._ensure_tables()
-        now = datetime.now()
-        start_of_month = datetime(now.year, now.month, 1)
+        start_of_month = datetime.now().date().replace(day=1)
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT SUM(cost) FROM api_usage
-                WHERE created_at >= ? AND success = 1
+                SELECT SUM(successful_cost) FROM api_usage_daily
+                WHERE day >= ?
             """, (start_of_month.isoformat(),))
             
             result = cursor.fetchone()
             return round(float(result[0] or 0.0), 4)
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
     
     def get_balance_info(self) -> Dict:
         """
@@ -267,7 +400,7 @@ class APIUsageTracker:
         """
         self._ensure_tables()
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             cursor.execute("SELECT balance, updated_at FROM api_balance ORDER BY updated_at DESC LIMIT 1")
@@ -299,11 +432,12 @@ class APIUsageTracker:
                     'last_updated': None
                 }
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
     
     def get_detailed_records(self, page: int = 1, limit: int = 50, days: int = 30, 
                             status: str = None, endpoint: str = None, 
-                            user_id: str = None, page_tab: str = None) -> Dict:
+                            user_id: str = None, page_tab: str = None,
+                            cursor: int = None) -> Dict:
         """
         Get detailed API usage records with pagination and filtering
         
@@ -315,6 +449,10 @@ class APIUsageTracker:
             endpoint: Filter by endpoint (partial match)
             user_id: Filter by user_id (can be account_number or numeric ID)
             page_tab: Filter by page_tab (partial match)
+            cursor: Return records with id below this (keyset pagination, the
+                    next_cursor of the previous page); page is ignored when set
+        
+        Payloads are not loaded here; fetch them with get_record_payloads.
         
         Returns:
             {
@@ -322,15 +460,16 @@ class APIUsageTracker:
                 'total': int,
                 'page': int,
                 'limit': int,
-                'total_pages': int
+                'total_pages': int,
+                'next_cursor': Optional[int]
             }
         """
         self._ensure_tables()
         cutoff_date = datetime.now() - timedelta(days=days)
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
-            use_postgresql = getattr(db_manager, '_use_postgresql', False)
+            use_postgresql = getattr(self.db, '_use_postgresql', False)
             
             # Build WHERE clause with filters
             # Always include LEFT JOIN for user lookup in WHERE conditions
@@ -398,7 +537,29 @@ class APIUsageTracker:
                 else:
                     params.append(page_tab_pattern)
             
+            count_clause = " AND ".join(where_conditions)
+            if cursor:
+                where_conditions.append("au.id < :cursor" if use_postgresql else "au.id < ?")
+                if use_postgresql:
+                    params['cursor'] = int(cursor)
+                else:
+                    params.append(int(cursor))
             where_clause = " AND ".join(where_conditions)
+            count_params = ({key: value for key, value in params.items() if key != 'cursor'} if use_postgresql
+                            else params[:-1] if cursor else list(params))
+            
+            # The list shows a preview; full payloads stay out of this query. Rows written
+            # before message_preview existed still derive it from request_data.
+            select_columns = """
+                au.id, au.endpoint, au.model, au.prompt_tokens, au.completion_tokens, au.total_tokens,
+                au.processing_time_ms, au.cost, au.success, au.error_message,
+                CASE WHEN au.message_preview IS NULL THEN au.request_data END,
+                (au.response_data IS NOT NULL AND au.response_data != '') OR au.response_hash IS NOT NULL,
+                au.user_id, au.page_tab, au.created_at,
+                COALESCE(u.account_number, CAST(au.user_id AS TEXT)) as user_display_id,
+                au.message_preview
+            """
+            offset = 0 if cursor else (page - 1) * limit
             
             if use_postgresql:
                 from sqlalchemy import text
@@ -407,100 +568,58 @@ class APIUsageTracker:
                 result = conn.execute(text(f"""
                     SELECT COUNT(*) FROM api_usage au
                     LEFT JOIN users u ON au.user_id = u.id
-                    WHERE {where_clause}
-                """), params)
+                    WHERE {count_clause}
+                """), count_params)
                 total = result.scalar()
                 
                 # Get paginated records with account_number lookup (PostgreSQL)
-                offset = (page - 1) * limit
                 params['limit'] = limit
                 params['offset'] = offset
                 result = conn.execute(text(f"""
-                    SELECT au.id, au.endpoint, au.model, au.prompt_tokens, au.completion_tokens, au.total_tokens,
-                           au.processing_time_ms, au.cost, au.success, au.error_message, au.request_data,
-                           au.response_data, au.user_id, au.page_tab, au.created_at,
-                           COALESCE(u.account_number, CAST(au.user_id AS TEXT)) as user_display_id
+                    SELECT {select_columns}
                     FROM api_usage au
                     LEFT JOIN users u ON au.user_id = u.id
                     WHERE {where_clause}
-                    ORDER BY au.created_at DESC
+                    ORDER BY au.id DESC
                     LIMIT :limit OFFSET :offset
                 """), params)
                 rows = result.fetchall()
             else:
                 # SQLite
-                cursor = conn.cursor()
+                db_cursor = conn.cursor()
                 
                 # Get total count
-                cursor.execute(f"""
+                db_cursor.execute(f"""
                     SELECT COUNT(*) FROM api_usage au
                     LEFT JOIN users u ON au.user_id = u.id
-                    WHERE {where_clause}
-                """, params)
-                total = cursor.fetchone()[0]
+                    WHERE {count_clause}
+                """, count_params)
+                total = db_cursor.fetchone()[0]
                 
                 # Get paginated records with account_number lookup
-                offset = (page - 1) * limit
                 params.append(limit)
                 params.append(offset)
-                cursor.execute(f"""
-                    SELECT au.id, au.endpoint, au.model, au.prompt_tokens, au.completion_tokens, au.total_tokens,
-                           au.processing_time_ms, au.cost, au.success, au.error_message, au.request_data,
-                           au.response_data, au.user_id, au.page_tab, au.created_at,
-                           COALESCE(u.account_number, CAST(au.user_id AS TEXT)) as user_display_id
+                db_cursor.execute(f"""
+                    SELECT {select_columns}
                     FROM api_usage au
                     LEFT JOIN users u ON au.user_id = u.id
                     WHERE {where_clause}
-                    ORDER BY au.created_at DESC
+                    ORDER BY au.id DESC
                     LIMIT ? OFFSET ?
                 """, params)
                 
-                rows = cursor.fetchall()
+                rows = db_cursor.fetchall()
             print(f"📊 get_detailed_records: Retrieved {len(rows)} rows from database")
             
             records = []
             for idx, row in enumerate(rows):
                 # Debug first record
                 if idx == 0:
-                    print(f"📊 Sample record {row[0]}: user_id={row[12]}, user_display_id={row[15]}, page_tab={row[13]}, has_request={bool(row[10])}, has_response={bool(row[11])}")
-                # Extract message from request_data if available
-                message = None
-                request_data_raw = row[10]  # request_data
-                if request_data_raw:
-                    try:
-                        # Try parsing as JSON first
-                        request_json = json.loads(request_data_raw)
-                        # Try to extract message/prompt from common structures
-                        if isinstance(request_json, dict):
-                            if 'messages' in request_json and len(request_json['messages']) > 0:
-                                # Get the last message (user message)
-                                last_message = request_json['messages'][-1]
-                                message = last_message.get('content', '')
-                                # Truncate to 100 chars for display
-                                if len(message) > 100:
-                                    message = message[:100] + '...'
-                            elif 'prompt' in request_json:
-                                message = str(request_json['prompt'])
-                                if len(message) > 100:
-                                    message = message[:100] + '...'
-                            elif 'content' in request_json:
-                                message = str(request_json['content'])
-                                if len(message) > 100:
-                                    message = message[:100] + '...'
-                    except json.JSONDecodeError:
-                        # If JSON parsing fails, try to extract text directly
-                        try:
-                            message = str(request_data_raw)[:100] if request_data_raw else None
-                            if len(message) > 100:
-                                message = message[:100] + '...'
-                        except:
-                            message = None
-                    except Exception as e:
-                        print(f"⚠️ Error extracting message from request_data: {e}")
-                        message = None
+                    print(f"📊 Sample record {row[0]}: user_id={row[12]}, user_display_id={row[15]}, page_tab={row[13]}, stored={bool(row[11])}")
+                message = row[16] if row[16] is not None else extract_message(row[10])
                 
-                # Determine if response was stored (has response_data)
-                stored = bool(row[11])  # response_data
+                # Determine if response was stored (inline or archived)
+                stored = bool(row[11])
                 
                 # Format user_id - use account_number if available, otherwise use numeric ID, otherwise N/A
                 user_id_display = row[15] if row[15] is not None else (str(row[12]) if row[12] is not None else 'N/A')
@@ -530,10 +649,113 @@ class APIUsageTracker:
                 'total': total,
                 'page': page,
                 'limit': limit,
-                'total_pages': total_pages
+                'total_pages': total_pages,
+                'next_cursor': records[-1]['id'] if len(records) == limit else None
             }
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
+    
+    def get_record_payloads(self, record_id: int) -> Optional[Dict]:
+        """Request/response payloads for one record, decompressed from the archive if compacted"""
+        self._ensure_tables()
+        
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT request_data, response_data, request_hash, response_hash
+                FROM api_usage WHERE id = ?
+            """, (record_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            payloads = {'request_data': row[0], 'response_data': row[1], 'archived': bool(row[2] or row[3])}
+            for key, digest in (('request_data', row[2]), ('response_data', row[3])):
+                if digest:
+                    cursor.execute("SELECT data FROM api_usage_payloads WHERE hash = ?", (digest,))
+                    blob = cursor.fetchone()
+                    payloads[key] = zlib.decompress(blob[0]).decode('utf-8') if blob else None
+            return payloads
+        finally:
+            self.db.release_connection(conn)
+    
+    def compact_payloads(self, older_than_days: int = 30, batch_size: int = 500) -> Dict:
+        """
+        Move request/response payloads older than older_than_days out of
+        api_usage into api_usage_payloads, zlib-compressed and keyed by SHA-256
+        so repeated payloads are stored once. Metrics columns stay in place.
+        Walks rows by id in batches, committing each, so it can be stopped
+        and re-run at any point.
+        """
+        self._ensure_tables()
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+        summary = {'rows_compacted': 0, 'payloads_written': 0, 'bytes_before': 0, 'bytes_after': 0,
+                   'cutoff': cutoff}
+        
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(id) FROM api_usage WHERE created_at < ?", (cutoff,))
+            max_id = cursor.fetchone()[0]
+            last_id = 0
+            
+            while max_id is not None and last_id < max_id:
+                cursor.execute("""
+                    SELECT id, request_data, response_data, message_preview FROM api_usage
+                    WHERE id > ? AND id <= ? AND created_at < ?
+                      AND (request_data IS NOT NULL OR response_data IS NOT NULL)
+                    ORDER BY id
+                    LIMIT ?
+                """, (last_id, max_id, cutoff, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                
+                blobs = {}
+                updates = []
+                for record_id, request_data, response_data, message_preview in rows:
+                    digests = []
+                    for payload in (request_data, response_data):
+                        if not payload:
+                            digests.append(None)
+                            continue
+                        digest = payload_hash(payload)
+                        if digest not in blobs:
+                            raw = payload.encode('utf-8')
+                            blobs[digest] = (zlib.compress(raw, 6), len(raw))
+                        summary['bytes_before'] += len(payload.encode('utf-8'))
+                        digests.append(digest)
+                    preview = message_preview if message_preview is not None else extract_message(request_data)
+                    updates.append((digests[0], digests[1], preview, record_id))
+                
+                now = datetime.now().isoformat()
+                before = conn.total_changes
+                cursor.executemany("""
+                    INSERT OR IGNORE INTO api_usage_payloads (hash, data, raw_size, created_at)
+                    VALUES (?, ?, ?, ?)
+                """, [(digest, data, raw_size, now) for digest, (data, raw_size) in blobs.items()])
+                summary['payloads_written'] += conn.total_changes - before
+                summary['bytes_after'] += sum(len(data) for data, _ in blobs.values())
+                cursor.executemany("""
+                    UPDATE api_usage
+                    SET request_hash = ?, response_hash = ?, message_preview = ?,
+                        request_data = NULL, response_data = NULL
+                    WHERE id = ?
+                """, updates)
+                conn.commit()
+                
+                summary['rows_compacted'] += len(rows)
+                last_id = rows[-1][0]
+            
+            print(f"📦 Compacted {summary['rows_compacted']} api_usage rows older than {cutoff}: "
+                  f"{summary['bytes_before']} -> {summary['bytes_after']} payload bytes")
+            return summary
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.db.release_connection(conn)
     
     def update_balance(self, new_balance: float) -> Dict:
         """
@@ -541,7 +763,7 @@ class APIUsageTracker:
         """
         self._ensure_tables()
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             
@@ -568,27 +790,26 @@ class APIUsageTracker:
             print(f"Error updating balance: {e}")
             raise
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
     
     def get_daily_cost_limit_status(self, daily_limit: float = 10.0) -> Dict:
-        """Check if daily cost limit is approaching"""
+        """Check if daily cost limit is approaching (reads today's rollup rows only)"""
         self._ensure_tables()
         today = datetime.now().date()
-        today_start = datetime.combine(today, datetime.min.time())
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT SUM(cost) FROM api_usage
-                WHERE created_at >= ? AND success = 1
-            """, (today_start.isoformat(),))
+                SELECT SUM(successful_cost) FROM api_usage_daily
+                WHERE day = ?
+            """, (today.isoformat(),))
             
             result = cursor.fetchone()
             today_cost = float(result[0] or 0.0)
             
             # Get stored daily limit if available
-            stored_limit = self._get_stored_daily_limit()
+            stored_limit = self._get_stored_daily_limit(cursor)
             actual_limit = stored_limit if stored_limit is not None else daily_limit
 
             return {
@@ -599,24 +820,19 @@ class APIUsageTracker:
                 'limit_exceeded': today_cost >= actual_limit
             }
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
 
-    def _get_stored_daily_limit(self) -> Optional[float]:
+    def _get_stored_daily_limit(self, cursor) -> Optional[float]:
         """Get the stored daily limit from the api_balance table"""
-        conn = db_manager.get_connection()
+        # Check if daily_limit column exists
         try:
-            cursor = conn.cursor()
-            # Check if daily_limit column exists
-            try:
-                cursor.execute("SELECT daily_limit FROM api_balance ORDER BY updated_at DESC LIMIT 1")
-                row = cursor.fetchone()
-                if row and row[0] is not None:
-                    return float(row[0])
-            except:
-                pass  # Column doesn't exist yet
-            return None
-        finally:
-            db_manager.release_connection(conn)
+            cursor.execute("SELECT daily_limit FROM api_balance ORDER BY updated_at DESC LIMIT 1")
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                return float(row[0])
+        except:
+            pass  # Column doesn't exist yet
+        return None
 
     def update_daily_limit(self, new_limit: float) -> bool:
         """
@@ -624,7 +840,7 @@ class APIUsageTracker:
         """
         self._ensure_tables()
 
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
 
@@ -656,4 +872,4 @@ class APIUsageTracker:
             print(f"Error updating daily limit: {e}")
             return False
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
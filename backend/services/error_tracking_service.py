@@ -4,10 +4,298 @@ Error Tracking Service for Kamioi Backend
 Provides functions to log, retrieve, and manage system errors.
 """
 
+import re
+import atexit
+import hashlib
+import threading
 import traceback
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from database_manager import db_manager
 
+ERROR_COLUMNS = ['error_type', 'error_message', 'error_stack', 'endpoint', 'http_method', 'user_id',
+                 'admin_id', 'request_data', 'severity', 'fingerprint', 'occurrences', 'created_at', 'last_seen_at']
+ROWS_PER_INSERT = 50  # 13 columns x 50 rows stays under SQLite's bound-parameter limit
+
+# Hourly per-type/severity counters behind get_error_stats (same statement for SQLite and PostgreSQL)
+ROLLUP_UPSERT = '''
+    INSERT INTO error_stats_hourly (hour, error_type, severity, errors, occurrences, unresolved)
+    VALUES (:hour, :error_type, :severity, :errors, :occurrences, :unresolved)
+    ON CONFLICT (hour, error_type, severity) DO UPDATE SET
+        errors = error_stats_hourly.errors + excluded.errors,
+        occurrences = error_stats_hourly.occurrences + excluded.occurrences,
+        unresolved = error_stats_hourly.unresolved + excluded.unresolved
+'''
+# All-time per-type/severity totals, kept alongside the hourly rows so stats never sum every hour
+TOTALS_UPSERT = '''
+    INSERT INTO error_stats_totals (error_type, severity, errors, occurrences, unresolved)
+    VALUES (:error_type, :severity, :errors, :occurrences, :unresolved)
+    ON CONFLICT (error_type, severity) DO UPDATE SET
+        errors = error_stats_totals.errors + excluded.errors,
+        occurrences = error_stats_totals.occurrences + excluded.occurrences,
+        unresolved = error_stats_totals.unresolved + excluded.unresolved
+'''
+ROLLUP_UPSERTS = (ROLLUP_UPSERT, TOTALS_UPSERT)
+
+
+def error_fingerprint(error_type, error_message, endpoint=None, http_method=None):
+    """Errors that differ only in ids/numbers in the message share a fingerprint"""
+    message = re.sub(r'\d+', '#', error_message or '')[:200]
+    key = '|'.join([error_type or '', http_method or '', endpoint or '', message])
+    return hashlib.sha1(key.encode('utf-8', 'replace')).hexdigest()
+
+
+def _db_timestamp(ts=None):
+    """Same format as SQLite CURRENT_TIMESTAMP, so DATE(created_at) keeps working"""
+    return datetime.utcfromtimestamp(ts or datetime.utcnow().timestamp()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _hour_bucket(timestamp):
+    """'2026-10-19 14:05:09' (or a datetime) -> '2026-10-19 14:00:00'"""
+    return str(timestamp)[:13] + ':00:00'
+
+
+def rollup_deltas(inserts, updates):
+    """
+    Rollup changes for one flush: new rows count as errors (and unresolved) in the
+    hour they were first seen; every occurrence counts in the hour it was last seen.
+    """
+    deltas = {}
+
+    def add(hour, values, errors, occurrences):
+        key = (hour, values['error_type'], values['severity'] or '')
+        delta = deltas.setdefault(key, {'errors': 0, 'occurrences': 0, 'unresolved': 0})
+        delta['errors'] += errors
+        delta['unresolved'] += errors
+        delta['occurrences'] += occurrences
+
+    for record in inserts:
+        add(_hour_bucket(_db_timestamp(record['first_seen'])), record['values'], 1, 0)
+    for record in list(inserts) + list(updates):
+        add(_hour_bucket(_db_timestamp(record['last_seen'])), record['values'], 0, record['count'])
+    return [dict(delta, hour=hour, error_type=error_type, severity=severity)
+            for (hour, error_type, severity), delta in deltas.items()]
+
+
+class ErrorSink:
+    """
+    Buffered, deduplicating writer for system_errors.
+
+    log_error() only touches memory: occurrences are folded into one pending record
+    per fingerprint (a bounded ring; when full the oldest record is dropped and
+    counted). A background flusher writes new records with multi-row INSERTs every
+    flush_interval_ms. An error whose fingerprint was written within dedupe_window
+    seconds only bumps that row's occurrence count. A slow or failing database
+    therefore costs failing requests nothing, and a storm of identical errors
+    becomes a handful of writes.
+    """
+
+    def __init__(self, db=None, capacity=5000, flush_interval_ms=250, dedupe_window=60):
+        self.db = db or db_manager
+        self.capacity = capacity
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.dedupe_window = dedupe_window
+        self.pending = OrderedDict()  # fingerprint -> record
+        self.recent = {}  # fingerprint -> (row id, first written at) within the dedupe window
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self._wake = threading.Event()
+        self._schema_checked = False
+        self.stats = {
+            'logged': 0,
+            'deduplicated': 0,
+            'dropped': 0,
+            'rows_inserted': 0,
+            'rows_updated': 0,
+            'flushes': 0,
+            'flush_failures': 0
+        }
+
+    def submit(self, error_type, error_message, error_stack=None, endpoint=None, http_method=None,
+               user_id=None, admin_id=None, request_data=None, severity='error'):
+        """Buffer one occurrence; returns its fingerprint"""
+        fingerprint = error_fingerprint(error_type, error_message, endpoint, http_method)
+        now = datetime.utcnow().timestamp()
+        with self.lock:
+            self.stats['logged'] += 1
+            record = self.pending.get(fingerprint)
+            if record is not None:
+                record['count'] += 1
+                record['last_seen'] = now
+                self.stats['deduplicated'] += 1
+            else:
+                written = self.recent.get(fingerprint)
+                if len(self.pending) >= self.capacity:
+                    _, evicted = self.pending.popitem(last=False)
+                    self.stats['dropped'] += evicted['count']
+                self.pending[fingerprint] = {
+                    'row_id': written[0] if written and now - written[1] < self.dedupe_window else None,
+                    'count': 1,
+                    'first_seen': now,
+                    'last_seen': now,
+                    'values': {
+                        'error_type': error_type,
+                        'error_message': error_message[:2000] if error_message else None,
+                        'error_stack': error_stack[:5000] if error_stack else None,
+                        'endpoint': endpoint,
+                        'http_method': http_method,
+                        'user_id': user_id,
+                        'admin_id': admin_id,
+                        'request_data': request_data[:5000] if request_data else None,
+                        'severity': severity
+                    }
+                }
+                if self.pending[fingerprint]['row_id'] is not None:
+                    self.stats['deduplicated'] += 1
+        self._ensure_flusher()
+        return fingerprint
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+
+    def _ensure_flusher(self):
+        if self.thread and self.thread.is_alive():
+            return
+        with self.flush_lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._flush_loop, name='error-sink-flusher', daemon=True)
+            self.thread.start()
+
+    def _flush_loop(self):
+        backoff = self.flush_interval
+        while True:
+            self._wake.wait(backoff)
+            self._wake.clear()
+            backoff = self.flush_interval if self.flush() is not None else min(backoff * 2, 30)
+
+    def flush(self):
+        """Write everything buffered; returns {fingerprint: row id}, or None if the write failed"""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, OrderedDict()
+            if not batch:
+                return {}
+            try:
+                written = self._write(batch)
+            except Exception as e:
+                self.stats['flush_failures'] += 1
+                print(f"Failed to flush error log buffer ({len(batch)} errors): {e}")
+                self._requeue(batch)
+                return None
+
+            now = datetime.utcnow().timestamp()
+            with self.lock:
+                for fingerprint, row_id in written.items():
+                    if batch[fingerprint]['row_id'] is None:
+                        self.recent[fingerprint] = (row_id, batch[fingerprint]['first_seen'])
+                self.recent = {fp: entry for fp, entry in self.recent.items() if now - entry[1] < self.dedupe_window}
+            self.stats['flushes'] += 1
+            return written
+
+    def _requeue(self, batch):
+        """Put a failed batch back in front of anything buffered since, still within capacity"""
+        with self.lock:
+            merged = OrderedDict(batch)
+            for fingerprint, record in self.pending.items():
+                if fingerprint in merged:
+                    merged[fingerprint]['count'] += record['count']
+                    merged[fingerprint]['last_seen'] = record['last_seen']
+                else:
+                    merged[fingerprint] = record
+            while len(merged) > self.capacity:
+                _, evicted = merged.popitem(last=False)
+                self.stats['dropped'] += evicted['count']
+            self.pending = merged
+
+    def _write(self, batch):
+        inserts = [(fp, record) for fp, record in batch.items() if record['row_id'] is None]
+        rollup = rollup_deltas([record for _, record in inserts],
+                               [record for record in batch.values() if record['row_id'] is not None])
+        updates = [(record['count'], _db_timestamp(record['last_seen']), record['row_id'])
+                   for record in batch.values() if record['row_id'] is not None]
+        rows = [[record['values'][column] for column in ERROR_COLUMNS[:9]] +
+                [fp, record['count'], _db_timestamp(record['first_seen']), _db_timestamp(record['last_seen'])]
+                for fp, record in inserts]
+        written = {}
+        conn = self.db.get_connection()
+        try:
+            if getattr(self.db, '_use_postgresql', False):
+                from sqlalchemy import text
+                for (fp, _), row in zip(inserts, rows):
+                    result = conn.execute(text(f'''
+                        INSERT INTO system_errors ({', '.join(ERROR_COLUMNS)})
+                        VALUES ({', '.join(':' + column for column in ERROR_COLUMNS)})
+                        RETURNING id
+                    '''), dict(zip(ERROR_COLUMNS, row)))
+                    written[fp] = result.fetchone()[0]
+                for count, last_seen, row_id in updates:
+                    conn.execute(text('''
+                        UPDATE system_errors SET occurrences = COALESCE(occurrences, 1) + :count,
+                            last_seen_at = :last_seen, updated_at = CURRENT_TIMESTAMP
+                        WHERE id = :row_id
+                    '''), {'count': count, 'last_seen': last_seen, 'row_id': row_id})
+                for params in rollup:
+                    for sql in ROLLUP_UPSERTS:
+                        conn.execute(text(sql), params)
+                conn.commit()
+                db_manager.release_connection(conn)
+            else:
+                self._ensure_schema(conn)
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                for start in range(0, len(rows), ROWS_PER_INSERT):
+                    chunk = rows[start:start + ROWS_PER_INSERT]
+                    placeholders = ', '.join(['(' + ', '.join('?' * len(ERROR_COLUMNS)) + ')'] * len(chunk))
+                    cur.execute(f"INSERT INTO system_errors ({', '.join(ERROR_COLUMNS)}) VALUES {placeholders}",
+                                [value for row in chunk for value in row])
+                    # One statement inside our write lock: the new ids are consecutive
+                    first_id = cur.lastrowid - len(chunk) + 1
+                    for offset, (fp, _) in enumerate(inserts[start:start + ROWS_PER_INSERT]):
+                        written[fp] = first_id + offset
+                cur.executemany('''
+                    UPDATE system_errors SET occurrences = COALESCE(occurrences, 1) + ?,
+                        last_seen_at = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', updates)
+                for sql in ROLLUP_UPSERTS:
+                    cur.executemany(sql, rollup)
+                conn.commit()
+                conn.close()
+        except Exception:
+            try:
+                conn.rollback()
+                conn.close()
+            except Exception:
+                pass
+            raise
+        self.stats['rows_inserted'] += len(inserts)
+        self.stats['rows_updated'] += len(updates)
+        return written
+
+    def _ensure_schema(self, conn):
+        """Older system_errors tables predate the dedupe columns"""
+        if self._schema_checked:
+            return
+        for column in ('fingerprint TEXT', 'occurrences INTEGER DEFAULT 1', 'last_seen_at TEXT'):
+            try:
+                conn.execute(f'ALTER TABLE system_errors ADD COLUMN {column}')
+            except Exception:
+                pass  # Column already exists
+        conn.commit()
+        self._schema_checked = True
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, buffered=len(self.pending), capacity=self.capacity)
+
+
+# Global error sink instance
+error_sink = ErrorSink()
+atexit.register(error_sink.flush)
+
 
 def log_error(
     error_type,
@@ -18,10 +306,11 @@ def log_error(
     user_id=None,
     admin_id=None,
     request_data=None,
-    severity='error'
+    severity='error',
+    wait=False
 ):
     """
-    Log an error to the system_errors table.
+    Log an error to the system_errors table (buffered; see ErrorSink).
 
     Args:
         error_type: Type of error (e.g., 'database', 'api', 'auth', 'validation')
@@ -33,60 +322,22 @@ def log_error(
         admin_id: ID of admin involved (optional)
         request_data: Request data that caused error (optional, JSON string)
         severity: Error severity - 'critical', 'error', 'warning', 'info'
+        wait: Flush immediately and return the row id
 
     Returns:
-        int: Error ID if logged successfully, None otherwise
+        int: Error ID when wait=True and the write succeeded
+        str: The error's fingerprint once buffered (wait=False)
+        None: If the error could not be logged
     """
     try:
-        conn = db_manager.get_connection()
-        use_postgresql = getattr(db_manager, '_use_postgresql', False)
-
-        if use_postgresql:
-            from sqlalchemy import text
-            result = conn.execute(text('''
-                INSERT INTO system_errors
-                (error_type, error_message, error_stack, endpoint, http_method,
-                 user_id, admin_id, request_data, severity)
-                VALUES (:error_type, :error_message, :error_stack, :endpoint, :http_method,
-                        :user_id, :admin_id, :request_data, :severity)
-                RETURNING id
-            '''), {
-                'error_type': error_type,
-                'error_message': error_message[:2000] if error_message else None,
-                'error_stack': error_stack[:5000] if error_stack else None,
-                'endpoint': endpoint,
-                'http_method': http_method,
-                'user_id': user_id,
-                'admin_id': admin_id,
-                'request_data': request_data[:5000] if request_data else None,
-                'severity': severity
-            })
-            error_id = result.fetchone()[0]
-            conn.commit()
-            db_manager.release_connection(conn)
-        else:
-            cur = conn.cursor()
-            cur.execute('''
-                INSERT INTO system_errors
-                (error_type, error_message, error_stack, endpoint, http_method,
-                 user_id, admin_id, request_data, severity)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                error_type,
-                error_message[:2000] if error_message else None,
-                error_stack[:5000] if error_stack else None,
-                endpoint,
-                http_method,
-                user_id,
-                admin_id,
-                request_data[:5000] if request_data else None,
-                severity
-            ))
-            error_id = cur.lastrowid
-            conn.commit()
-            conn.close()
-
-        return error_id
+        fingerprint = error_sink.submit(error_type, error_message, error_stack, endpoint, http_method,
+                                        user_id, admin_id, request_data, severity)
+        if not wait:
+            return fingerprint
+        written = error_sink.flush()
+        if written is None:
+            return None
+        return written.get(fingerprint) or error_sink.recent.get(fingerprint, (None,))[0]
 
     except Exception as e:
         print(f"Failed to log error: {e}")
@@ -194,7 +445,8 @@ def get_errors(
             result = conn.execute(text(f'''
                 SELECT id, error_type, error_message, error_stack, endpoint,
                        http_method, user_id, admin_id, severity, is_resolved,
-                       resolved_at, resolved_by, resolution_notes, created_at
+                       resolved_at, resolved_by, resolution_notes, created_at,
+                       occurrences, last_seen_at
                 FROM system_errors
                 WHERE {where_clause}
                 ORDER BY created_at DESC
@@ -217,7 +469,9 @@ def get_errors(
                     'resolved_at': str(row[10]) if row[10] else None,
                     'resolved_by': row[11],
                     'resolution_notes': row[12],
-                    'created_at': str(row[13]) if row[13] else None
+                    'created_at': str(row[13]) if row[13] else None,
+                    'occurrences': row[14] or 1,
+                    'last_seen_at': str(row[15]) if row[15] else None
                 })
 
             db_manager.release_connection(conn)
@@ -236,7 +490,8 @@ def get_errors(
             cur.execute(f'''
                 SELECT id, error_type, error_message, error_stack, endpoint,
                        http_method, user_id, admin_id, severity, is_resolved,
-                       resolved_at, resolved_by, resolution_notes, created_at
+                       resolved_at, resolved_by, resolution_notes, created_at,
+                       occurrences, last_seen_at
                 FROM system_errors
                 WHERE {where_clause}
                 ORDER BY created_at DESC
@@ -259,7 +514,9 @@ def get_errors(
                     'resolved_at': row[10],
                     'resolved_by': row[11],
                     'resolution_notes': row[12],
-                    'created_at': row[13]
+                    'created_at': row[13],
+                    'occurrences': row[14] or 1,
+                    'last_seen_at': row[15]
                 })
 
             conn.close()
@@ -285,117 +542,182 @@ def get_errors(
         }
 
 
+EMPTY_STATS = {
+    'total': 0,
+    'unresolved': 0,
+    'critical': 0,
+    'today': 0,
+    'by_type': {},
+    'by_severity': {},
+    'recent_trend': []
+}
+
+# Rollup reads: the running totals (types x severities rows) plus the hourly rows of the
+# reporting window only, which the (hour, ...) primary key serves as a range scan
+ROLLUP_TOTALS_SQL = '''
+    SELECT error_type, severity, errors, unresolved, occurrences FROM error_stats_totals
+'''
+ROLLUP_RECENT_SQL = '''
+    SELECT SUBSTR(hour, 1, 10), SUM(errors)
+    FROM error_stats_hourly
+    WHERE hour >= :since
+    GROUP BY SUBSTR(hour, 1, 10)
+'''
+# Fallback: one row per (type, severity, day) with row/unresolved/occurrence totals from one scan of system_errors
+SCAN_STATS_SQL = {
+    'sqlite': '''
+        SELECT error_type, severity, DATE(created_at), COUNT(*),
+               SUM(CASE WHEN is_resolved = 0 THEN 1 ELSE 0 END), SUM(COALESCE(occurrences, 1))
+        FROM system_errors
+        GROUP BY error_type, severity, DATE(created_at)
+    ''',
+    'postgresql': '''
+        SELECT error_type, severity, CAST(DATE(created_at) AS TEXT), COUNT(*),
+               SUM(CASE WHEN is_resolved = false THEN 1 ELSE 0 END), SUM(COALESCE(occurrences, 1))
+        FROM system_errors
+        GROUP BY error_type, severity, DATE(created_at)
+    '''
+}
+REBUILD_ROLLUP_SQL = {
+    'sqlite': '''
+        INSERT INTO error_stats_hourly (hour, error_type, severity, errors, occurrences, unresolved)
+        SELECT STRFTIME('%Y-%m-%d %H:00:00', created_at), error_type, COALESCE(severity, ''), COUNT(*),
+               SUM(COALESCE(occurrences, 1)), SUM(CASE WHEN is_resolved = 0 THEN 1 ELSE 0 END)
+        FROM system_errors
+        GROUP BY 1, 2, 3
+    ''',
+    'postgresql': '''
+        INSERT INTO error_stats_hourly (hour, error_type, severity, errors, occurrences, unresolved)
+        SELECT TO_CHAR(created_at, 'YYYY-MM-DD HH24:00:00'), error_type, COALESCE(severity, ''), COUNT(*),
+               SUM(COALESCE(occurrences, 1)), SUM(CASE WHEN is_resolved = false THEN 1 ELSE 0 END)
+        FROM system_errors
+        GROUP BY 1, 2, 3
+    '''
+}
+REBUILD_TOTALS_SQL = '''
+    INSERT INTO error_stats_totals (error_type, severity, errors, occurrences, unresolved)
+    SELECT error_type, severity, SUM(errors), SUM(occurrences), SUM(unresolved)
+    FROM error_stats_hourly
+    GROUP BY error_type, severity
+'''
+
+
+def _run(conn, use_postgresql, sql, params=None):
+    if use_postgresql:
+        from sqlalchemy import text
+        return conn.execute(text(sql), params or {})
+    return conn.execute(sql, params or {})
+
+
+def summarize_error_stats(rows, today=None):
+    """Fold (type, severity, day, errors, unresolved, occurrences) rows into the dashboard stats"""
+    today = today or datetime.utcnow().strftime('%Y-%m-%d')
+    week_ago = (datetime.strptime(today, '%Y-%m-%d') - timedelta(days=7)).strftime('%Y-%m-%d')
+    stats = dict(EMPTY_STATS, by_type={}, by_severity={}, occurrences=0)
+    trend = {}
+    for error_type, severity, day, errors, unresolved, occurrences in rows:
+        errors, unresolved = errors or 0, unresolved or 0
+        stats['total'] += errors
+        stats['unresolved'] += unresolved
+        stats['occurrences'] += occurrences or 0
+        if severity == 'critical':
+            stats['critical'] += unresolved
+        if day == today:
+            stats['today'] += errors
+        if errors:
+            stats['by_type'][error_type] = stats['by_type'].get(error_type, 0) + errors
+            stats['by_severity'][severity] = stats['by_severity'].get(severity, 0) + errors
+        if day and day >= week_ago and errors:
+            trend[day] = trend.get(day, 0) + errors
+    stats['recent_trend'] = [{'date': day, 'count': trend[day]} for day in sorted(trend)]
+    return stats
+
+
+def summarize_rollup(totals, recent, today=None):
+    """
+    Dashboard stats from the running totals' (type, severity, errors, unresolved,
+    occurrences) rows and the reporting window's (day, errors) rows
+    """
+    today = today or datetime.utcnow().strftime('%Y-%m-%d')
+    stats = summarize_error_stats([(error_type, severity, None, errors, unresolved, occurrences)
+                                   for error_type, severity, errors, unresolved, occurrences in totals], today)
+    trend = {}
+    for day, errors in recent:
+        if day == today:
+            stats['today'] += errors or 0
+        if errors:
+            trend[day] = trend.get(day, 0) + errors
+    stats['recent_trend'] = [{'date': day, 'count': trend[day]} for day in sorted(trend)]
+    return stats
+
+
+def rebuild_error_stats(conn=None):
+    """Recompute error_stats_hourly (and the totals from it) from system_errors in one grouped pass"""
+    own_conn = conn is None
+    conn = conn or db_manager.get_connection()
+    use_postgresql = getattr(db_manager, '_use_postgresql', False)
+    try:
+        _run(conn, use_postgresql, "DELETE FROM error_stats_hourly")
+        _run(conn, use_postgresql, REBUILD_ROLLUP_SQL['postgresql' if use_postgresql else 'sqlite'])
+        _run(conn, use_postgresql, "DELETE FROM error_stats_totals")
+        _run(conn, use_postgresql, REBUILD_TOTALS_SQL)
+        conn.commit()
+    finally:
+        if own_conn:
+            db_manager.release_connection(conn) if use_postgresql else conn.close()
+
+
 def get_error_stats():
     """
     Get error statistics for dashboard.
 
+    Served from the error_stats_totals running totals plus the last week of the
+    error_stats_hourly rollup, so the read does not grow with how many errors
+    are stored or how long the rollup has been kept. Falls back to a single grouped scan of system_errors if the rollup
+    is unavailable.
+
     Returns:
         dict: Statistics about errors
     """
+    conn = None
+    use_postgresql = getattr(db_manager, '_use_postgresql', False)
     try:
         conn = db_manager.get_connection()
-        use_postgresql = getattr(db_manager, '_use_postgresql', False)
-
-        stats = {
-            'total': 0,
-            'unresolved': 0,
-            'critical': 0,
-            'today': 0,
-            'by_type': {},
-            'by_severity': {},
-            'recent_trend': []
-        }
-
-        if use_postgresql:
-            from sqlalchemy import text
-
-            # Total errors
-            result = conn.execute(text("SELECT COUNT(*) FROM system_errors"))
-            stats['total'] = result.fetchone()[0]
-
-            # Unresolved errors
-            result = conn.execute(text("SELECT COUNT(*) FROM system_errors WHERE is_resolved = false"))
-            stats['unresolved'] = result.fetchone()[0]
-
-            # Critical errors
-            result = conn.execute(text("SELECT COUNT(*) FROM system_errors WHERE severity = 'critical' AND is_resolved = false"))
-            stats['critical'] = result.fetchone()[0]
-
-            # Today's errors
-            result = conn.execute(text("SELECT COUNT(*) FROM system_errors WHERE DATE(created_at) = CURRENT_DATE"))
-            stats['today'] = result.fetchone()[0]
-
-            # By type
-            result = conn.execute(text("SELECT error_type, COUNT(*) FROM system_errors GROUP BY error_type"))
-            stats['by_type'] = {row[0]: row[1] for row in result}
-
-            # By severity
-            result = conn.execute(text("SELECT severity, COUNT(*) FROM system_errors GROUP BY severity"))
-            stats['by_severity'] = {row[0]: row[1] for row in result}
-
-            # Recent trend (last 7 days)
-            result = conn.execute(text('''
-                SELECT DATE(created_at), COUNT(*)
-                FROM system_errors
-                WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-                GROUP BY DATE(created_at)
-                ORDER BY DATE(created_at)
-            '''))
-            stats['recent_trend'] = [{'date': str(row[0]), 'count': row[1]} for row in result]
-
-            db_manager.release_connection(conn)
-        else:
-            cur = conn.cursor()
-
-            # Total errors
-            cur.execute("SELECT COUNT(*) FROM system_errors")
-            stats['total'] = cur.fetchone()[0]
-
-            # Unresolved errors
-            cur.execute("SELECT COUNT(*) FROM system_errors WHERE is_resolved = 0")
-            stats['unresolved'] = cur.fetchone()[0]
-
-            # Critical errors
-            cur.execute("SELECT COUNT(*) FROM system_errors WHERE severity = 'critical' AND is_resolved = 0")
-            stats['critical'] = cur.fetchone()[0]
-
-            # Today's errors
-            cur.execute("SELECT COUNT(*) FROM system_errors WHERE DATE(created_at) = DATE('now')")
-            stats['today'] = cur.fetchone()[0]
-
-            # By type
-            cur.execute("SELECT error_type, COUNT(*) FROM system_errors GROUP BY error_type")
-            stats['by_type'] = {row[0]: row[1] for row in cur.fetchall()}
-
-            # By severity
-            cur.execute("SELECT severity, COUNT(*) FROM system_errors GROUP BY severity")
-            stats['by_severity'] = {row[0]: row[1] for row in cur.fetchall()}
-
-            # Recent trend (last 7 days)
-            cur.execute('''
-                SELECT DATE(created_at), COUNT(*)
-                FROM system_errors
-                WHERE created_at >= DATE('now', '-7 days')
-                GROUP BY DATE(created_at)
-                ORDER BY DATE(created_at)
-            ''')
-            stats['recent_trend'] = [{'date': row[0], 'count': row[1]} for row in cur.fetchall()]
-
-            conn.close()
-
+        try:
+            # Errors logged before the rollup (or its totals) existed: build it once
+            if _run(conn, use_postgresql, "SELECT 1 FROM error_stats_totals LIMIT 1").fetchone() is None and \
+                    _run(conn, use_postgresql, "SELECT 1 FROM system_errors LIMIT 1").fetchone() is not None:
+                rebuild_error_stats(conn)
+            today = datetime.utcnow().strftime('%Y-%m-%d')
+            since = (datetime.utcnow() - timedelta(days=7)).strftime('%Y-%m-%d 00:00:00')
+            stats = summarize_rollup(_run(conn, use_postgresql, ROLLUP_TOTALS_SQL).fetchall(),
+                                     _run(conn, use_postgresql, ROLLUP_RECENT_SQL, {'since': since}).fetchall(),
+                                     today)
+            source = 'rollup'
+        except Exception as e:
+            print(f"Error stats rollup unavailable, scanning system_errors: {e}")
+            conn.rollback()
+            rows = _run(conn, use_postgresql, SCAN_STATS_SQL['postgresql' if use_postgresql else 'sqlite']).fetchall()
+            stats = summarize_error_stats(rows)
+            source = 'scan'
+
+        stats['source'] = source
+        stats['sink'] = error_sink.get_stats()
         return stats
 
     except Exception as e:
         print(f"Failed to get error stats: {e}")
-        return {
-            'total': 0,
-            'unresolved': 0,
-            'critical': 0,
-            'today': 0,
-            'by_type': {},
-            'by_severity': {},
-            'recent_trend': []
-        }
+        return dict(EMPTY_STATS, by_type={}, by_severity={}, recent_trend=[])
+    finally:
+        if conn is not None:
+            db_manager.release_connection(conn) if use_postgresql else conn.close()
+
+
+def _resolved_delta(row):
+    """Rollup change for resolving one (created_at, error_type, severity, is_resolved) row"""
+    created_at, error_type, severity, _ = row
+    return {'hour': _hour_bucket(created_at), 'error_type': error_type, 'severity': severity or '',
+            'errors': 0, 'occurrences': 0, 'unresolved': -1}
 
 
 def resolve_error(error_id, resolved_by, resolution_notes=None):
@@ -416,6 +738,9 @@ def resolve_error(error_id, resolved_by, resolution_notes=None):
 
         if use_postgresql:
             from sqlalchemy import text
+            row = conn.execute(text('''
+                SELECT created_at, error_type, severity, is_resolved FROM system_errors WHERE id = :error_id
+            '''), {'error_id': error_id}).fetchone()
             conn.execute(text('''
                 UPDATE system_errors
                 SET is_resolved = true,
@@ -429,10 +754,17 @@ def resolve_error(error_id, resolved_by, resolution_notes=None):
                 'resolved_by': resolved_by,
                 'resolution_notes': resolution_notes
             })
+            if row and not row[3]:
+                for sql in ROLLUP_UPSERTS:
+                    conn.execute(text(sql), _resolved_delta(row))
             conn.commit()
             db_manager.release_connection(conn)
         else:
             cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            row = cur.execute('''
+                SELECT created_at, error_type, severity, is_resolved FROM system_errors WHERE id = ?
+            ''', (error_id,)).fetchone()
             cur.execute('''
                 UPDATE system_errors
                 SET is_resolved = 1,
@@ -442,6 +774,9 @@ def resolve_error(error_id, resolved_by, resolution_notes=None):
                     updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
             ''', (resolved_by, resolution_notes, error_id))
+            if row and not row[3]:
+                for sql in ROLLUP_UPSERTS:
+                    cur.execute(sql, _resolved_delta(row))
             conn.commit()
             conn.close()
 
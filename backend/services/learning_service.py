@@ -6,8 +6,57 @@ Uses database_manager instead of SQLAlchemy
 
 from database_manager import db_manager
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional
 import json
+import threading
+
+_tables_ready = set()
+_tables_lock = threading.Lock()
+
+# Fields pulled out of parsed_response so the learning queries never parse JSON
+EXTRACTED_COLUMNS = (
+    ('merchant_key', 'TEXT'),            # lower(merchant_name), '' when missing
+    ('predicted_ticker', 'TEXT'),        # upper(ticker); NULL if the response is unusable
+    ('predicted_confidence', 'REAL'),    # NULL if confidence is not a number
+    ('predicted_status', 'TEXT'),
+    ('confidence_bucket', 'TEXT'),       # 'high' / 'medium' / 'low'
+    ('fields_extracted', 'INTEGER DEFAULT 0'),
+)
+
+EXTRACT_BATCH_SIZE = 1000
+
+
+def extract_response_fields(merchant_name: Optional[str], parsed_response_raw: Optional[str]) -> Dict:
+    """
+    Learning fields of one ai_responses row, matching how the Python
+    breakdowns used to read parsed_response (confidence defaults to 0.5,
+    status to 'uncertain'; unparseable responses get no prediction)
+    """
+    fields = {
+        'merchant_key': (merchant_name or '').lower(),
+        'predicted_ticker': None,
+        'predicted_confidence': None,
+        'predicted_status': None,
+        'confidence_bucket': None,
+    }
+    try:
+        parsed = json.loads(parsed_response_raw) if parsed_response_raw else {}
+    except (TypeError, ValueError):
+        return fields
+    if not isinstance(parsed, dict):
+        return fields
+    
+    confidence = parsed.get('confidence', 0.5)
+    if isinstance(confidence, (int, float)):
+        fields['predicted_confidence'] = float(confidence)
+        fields['confidence_bucket'] = 'high' if confidence >= 0.8 else ('medium' if confidence >= 0.6 else 'low')
+    ticker = parsed.get('ticker', '')
+    if isinstance(ticker, str):
+        fields['predicted_ticker'] = ticker.upper()
+    status = parsed.get('status', 'uncertain')
+    fields['predicted_status'] = status if isinstance(status, str) else None
+    return fields
+
 
 class LearningService:
     """
@@ -21,9 +70,20 @@ class LearningService:
     5. Tracks model performance over time
     """
     
+    def __init__(self, db=None):
+        self.db = db or db_manager
+    
     def _ensure_tables(self):
-        """Ensure ai_responses table exists"""
-        conn = db_manager.get_connection()
+        """Ensure ai_responses table and its learning columns exist (once per database per process)"""
+        key = getattr(self.db, 'db_path', id(self.db))
+        if key in _tables_ready:
+            return
+        with _tables_lock:
+            if key not in _tables_ready and self._create_tables():
+                _tables_ready.add(key)
+    
+    def _create_tables(self) -> bool:
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             cursor.execute("""
@@ -46,12 +106,67 @@ class LearningService:
                     created_at TEXT NOT NULL
                 )
             """)
+            cursor.execute("PRAGMA table_info(ai_responses)")
+            existing = {row[1] for row in cursor.fetchall()}
+            for column, column_type in EXTRACTED_COLUMNS:
+                if column not in existing:
+                    cursor.execute(f"ALTER TABLE ai_responses ADD COLUMN {column} {column_type}")
+            
+            # Accuracy breakdowns are answered from this index alone
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ai_responses_feedback
+                ON ai_responses (created_at, was_ai_correct, confidence_bucket, category, merchant_key)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ai_responses_merchant_key
+                ON ai_responses (merchant_key, created_at)
+            """)
+            # Rows inserted elsewhere (ai_processor) still waiting for extraction
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ai_responses_unextracted
+                ON ai_responses (id) WHERE fields_extracted = 0
+            """)
             conn.commit()
+            return True
         except Exception as e:
             conn.rollback()
             print(f"Error ensuring ai_responses table: {e}")
+            return False
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
+    
+    def _extract_pending_fields(self, cursor) -> int:
+        """Fill the extracted columns for rows written without them"""
+        extracted = 0
+        while True:
+            cursor.execute("""
+                SELECT id, merchant_name, parsed_response FROM ai_responses
+                WHERE fields_extracted = 0
+                ORDER BY id
+                LIMIT ?
+            """, (EXTRACT_BATCH_SIZE,))
+            rows = cursor.fetchall()
+            if not rows:
+                return extracted
+            updates = []
+            for response_id, merchant_name, parsed_response in rows:
+                fields = extract_response_fields(merchant_name, parsed_response)
+                updates.append((fields['merchant_key'], fields['predicted_ticker'], fields['predicted_confidence'],
+                                fields['predicted_status'], fields['confidence_bucket'], response_id))
+            cursor.executemany("""
+                UPDATE ai_responses
+                SET merchant_key = ?, predicted_ticker = ?, predicted_confidence = ?,
+                    predicted_status = ?, confidence_bucket = ?, fields_extracted = 1
+                WHERE id = ?
+            """, updates)
+            extracted += len(updates)
+    
+    def _prepare(self, conn):
+        """Cursor over ai_responses with every row's learning fields extracted"""
+        cursor = conn.cursor()
+        if self._extract_pending_fields(cursor):
+            conn.commit()
+        return cursor
     
     def calculate_accuracy(self, days: int = 30) -> Dict:
         """
@@ -72,33 +187,59 @@ class LearningService:
         self._ensure_tables()
         cutoff_date = datetime.now() - timedelta(days=days)
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
-            cursor = conn.cursor()
+            cursor = self._prepare(conn)
             
-            # Get all responses with feedback
+            # Every breakdown in one pass over the feedback index
             cursor.execute("""
-                SELECT merchant_name, category, parsed_response, was_ai_correct
-                FROM ai_responses
-                WHERE was_ai_correct IS NOT NULL
-                AND created_at >= ?
+                WITH feedback AS (
+                    SELECT confidence_bucket, merchant_key, COALESCE(category, '') AS category,
+                           CASE WHEN was_ai_correct = 1 THEN 1 ELSE 0 END AS correct
+                    FROM ai_responses
+                    WHERE was_ai_correct IS NOT NULL
+                    AND created_at >= ?
+                )
+                SELECT 'overall', NULL, COUNT(*), SUM(correct) FROM feedback
+                UNION ALL
+                SELECT 'confidence', confidence_bucket, COUNT(*), SUM(correct) FROM feedback
+                WHERE confidence_bucket IS NOT NULL GROUP BY confidence_bucket
+                UNION ALL
+                SELECT 'merchant', merchant_key, COUNT(*), SUM(correct) FROM feedback
+                WHERE merchant_key != '' GROUP BY merchant_key HAVING COUNT(*) >= 3
+                UNION ALL
+                SELECT 'category', category, COUNT(*), SUM(correct) FROM feedback
+                GROUP BY category
             """, (cutoff_date.isoformat(),))
             
-            rows = cursor.fetchall()
+            total = correct = 0
+            breakdowns = {'confidence': {}, 'merchant': {}, 'category': {}}
+            for dimension, key, count, count_correct in cursor.fetchall():
+                count_correct = count_correct or 0
+                if dimension == 'overall':
+                    total, correct = count, count_correct
+                    continue
+                if dimension == 'category':
+                    key = key or 'Unknown'  # NULL and '' categories report together
+                    stats = breakdowns['category'].setdefault(key, {'total': 0, 'correct': 0})
+                    count += stats['total']
+                    count_correct += stats['correct']
+                breakdowns[dimension][key] = {
+                    'total': count,
+                    'correct': count_correct,
+                    'accuracy': round(count_correct / count * 100, 2)
+                }
             
-            total = len(rows)
-            correct = sum(1 for r in rows if r[3] == 1)  # was_ai_correct column
             incorrect = total - correct
             accuracy = (correct / total * 100) if total > 0 else 0.0
             
-            # Calculate accuracy by confidence level
-            confidence_accuracy = self._calculate_confidence_accuracy(rows)
+            # Confidence levels in their usual order
+            confidence_accuracy = {level: breakdowns['confidence'][level]
+                                   for level in ('high', 'medium', 'low') if level in breakdowns['confidence']}
             
-            # Calculate accuracy by merchant
-            merchant_accuracy = self._calculate_merchant_accuracy(rows)
-            
-            # Calculate accuracy by category
-            category_accuracy = self._calculate_category_accuracy(rows)
+            # Merchants with 3+ responses, most analyzed first
+            merchant_accuracy = dict(sorted(breakdowns['merchant'].items(),
+                                            key=lambda x: (-x[1]['total'], x[0]))[:20])
             
             # Get total responses count
             cursor.execute("SELECT COUNT(*) FROM ai_responses WHERE created_at >= ?", (cutoff_date.isoformat(),))
@@ -113,96 +254,11 @@ class LearningService:
                 'accuracy_percentage': round(accuracy, 2),
                 'confidence_accuracy': confidence_accuracy,
                 'merchant_accuracy': merchant_accuracy,
-                'category_accuracy': category_accuracy,
+                'category_accuracy': breakdowns['category'],
                 'period_days': days
             }
         finally:
-            db_manager.release_connection(conn)
-    
-    def _calculate_confidence_accuracy(self, rows: List) -> Dict:
-        """Calculate accuracy grouped by confidence level"""
-        confidence_buckets = {
-            'high': [],      # 0.8-1.0
-            'medium': [],    # 0.6-0.79
-            'low': []        # 0.0-0.59
-        }
-        
-        for row in rows:
-            try:
-                parsed = json.loads(row[2]) if row[2] else {}  # parsed_response
-                confidence = parsed.get('confidence', 0.5)
-                
-                if confidence >= 0.8:
-                    confidence_buckets['high'].append(row)
-                elif confidence >= 0.6:
-                    confidence_buckets['medium'].append(row)
-                else:
-                    confidence_buckets['low'].append(row)
-            except:
-                continue
-        
-        result = {}
-        for level, bucket in confidence_buckets.items():
-            if bucket:
-                correct = sum(1 for r in bucket if r[3] == 1)  # was_ai_correct
-                result[level] = {
-                    'total': len(bucket),
-                    'correct': correct,
-                    'accuracy': round(correct / len(bucket) * 100, 2)
-                }
-        
-        return result
-    
-    def _calculate_merchant_accuracy(self, rows: List) -> Dict:
-        """Calculate accuracy by merchant name"""
-        merchant_stats = {}
-        
-        for row in rows:
-            merchant = (row[0] or '').lower()  # merchant_name
-            if merchant:
-                if merchant not in merchant_stats:
-                    merchant_stats[merchant] = {'total': 0, 'correct': 0}
-                
-                merchant_stats[merchant]['total'] += 1
-                if row[3] == 1:  # was_ai_correct
-                    merchant_stats[merchant]['correct'] += 1
-        
-        # Convert to accuracy percentages
-        result = {}
-        for merchant, stats in merchant_stats.items():
-            if stats['total'] >= 3:  # Only include merchants with 3+ responses
-                result[merchant] = {
-                    'total': stats['total'],
-                    'correct': stats['correct'],
-                    'accuracy': round(stats['correct'] / stats['total'] * 100, 2)
-                }
-        
-        # Sort by total (most analyzed first)
-        return dict(sorted(result.items(), key=lambda x: x[1]['total'], reverse=True)[:20])
-    
-    def _calculate_category_accuracy(self, rows: List) -> Dict:
-        """Calculate accuracy by category"""
-        category_stats = {}
-        
-        for row in rows:
-            category = row[1] or 'Unknown'  # category
-            if category not in category_stats:
-                category_stats[category] = {'total': 0, 'correct': 0}
-            
-            category_stats[category]['total'] += 1
-            if row[3] == 1:  # was_ai_correct
-                category_stats[category]['correct'] += 1
-        
-        # Convert to accuracy percentages
-        result = {}
-        for category, stats in category_stats.items():
-            result[category] = {
-                'total': stats['total'],
-                'correct': stats['correct'],
-                'accuracy': round(stats['correct'] / stats['total'] * 100, 2) if stats['total'] > 0 else 0
-            }
-        
-        return result
+            self.db.release_connection(conn)
     
     def get_merchant_knowledge_base(self, limit: int = 100) -> List[Dict]:
         """
@@ -212,72 +268,56 @@ class LearningService:
         """
         self._ensure_tables()
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
-            cursor = conn.cursor()
+            cursor = self._prepare(conn)
             
-            # Get all successful responses (not errors)
+            # Latest successful responses (not errors); admin feedback overrides the
+            # AI's ticker at full confidence, and each merchant takes its newest ticker
             cursor.execute("""
-                SELECT merchant_name, parsed_response, admin_correct_ticker, admin_feedback
-                FROM ai_responses
-                WHERE is_error = 0
-                ORDER BY created_at DESC
+                WITH recent AS (
+                    SELECT id, merchant_key, predicted_ticker, predicted_status, created_at,
+                           CASE WHEN admin_correct_ticker != '' THEN UPPER(admin_correct_ticker)
+                                ELSE predicted_ticker END AS ticker,
+                           CASE WHEN admin_correct_ticker != '' THEN 1.0
+                                ELSE predicted_confidence END AS confidence,
+                           CASE WHEN admin_correct_ticker != '' THEN 1 ELSE 0 END AS admin_verified
+                    FROM ai_responses
+                    WHERE is_error = 0
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                ),
+                usable AS (
+                    SELECT *, ROW_NUMBER() OVER (
+                        PARTITION BY merchant_key ORDER BY created_at DESC, id DESC
+                    ) AS recency
+                    FROM recent
+                    WHERE predicted_ticker IS NOT NULL
+                    AND ticker != ''
+                    AND confidence IS NOT NULL
+                    AND COALESCE(predicted_status, '') != 'rejected'
+                )
+                SELECT merchant_key,
+                       MAX(CASE WHEN recency = 1 THEN ticker END),
+                       AVG(confidence),
+                       COUNT(*),
+                       MAX(admin_verified)
+                FROM usable
+                GROUP BY merchant_key
+                HAVING COUNT(*) >= 2
+                ORDER BY MAX(admin_verified) DESC, COUNT(*) DESC, AVG(confidence) DESC, merchant_key
                 LIMIT ?
-            """, (limit * 10,))
-            
-            rows = cursor.fetchall()
-            
-            merchant_ticker_map = {}
-            
-            for row in rows:
-                try:
-                    parsed = json.loads(row[1]) if row[1] else {}  # parsed_response
-                    merchant = (row[0] or '').lower()  # merchant_name
-                    ticker = parsed.get('ticker', '').upper()
-                    confidence = parsed.get('confidence', 0.5)
-                    status = parsed.get('status', 'uncertain')
-                    
-                    # If admin provided feedback, use that
-                    if row[2]:  # admin_correct_ticker
-                        ticker = row[2].upper()
-                        confidence = 1.0  # Admin feedback is 100% confident
-                    
-                    if not ticker or status == 'rejected':
-                        continue
-                    
-                    if merchant not in merchant_ticker_map:
-                        merchant_ticker_map[merchant] = {
-                            'ticker': ticker,
-                            'confidence_sum': 0.0,
-                            'count': 0,
-                            'admin_verified': bool(row[2])
-                        }
-                    
-                    merchant_ticker_map[merchant]['confidence_sum'] += confidence
-                    merchant_ticker_map[merchant]['count'] += 1
-                    if row[2]:  # admin_correct_ticker
-                        merchant_ticker_map[merchant]['admin_verified'] = True
-                except:
-                    continue
-            
-            # Calculate average confidence and sort
-            knowledge_base = []
-            for merchant, data in merchant_ticker_map.items():
-                if data['count'] >= 2:  # Only include merchants with 2+ responses
-                    knowledge_base.append({
-                        'merchant_name': merchant,
-                        'ticker': data['ticker'],
-                        'average_confidence': round(data['confidence_sum'] / data['count'], 3),
-                        'response_count': data['count'],
-                        'admin_verified': data['admin_verified']
-                    })
-            
-            # Sort by response count and confidence
-            knowledge_base.sort(key=lambda x: (x['admin_verified'], x['response_count'], x['average_confidence']), reverse=True)
-            
-            return knowledge_base[:limit]
+            """, (limit * 10, limit))
+            
+            return [{
+                'merchant_name': merchant,
+                'ticker': ticker,
+                'average_confidence': round(average_confidence, 3),
+                'response_count': count,
+                'admin_verified': bool(admin_verified)
+            } for merchant, ticker, average_confidence, count, admin_verified in cursor.fetchall()]
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
     
     def record_feedback(self, ai_response_id: int, admin_action: str, 
                        correct_ticker: str = None, notes: str = None):
@@ -288,13 +328,13 @@ class LearningService:
         """
         self._ensure_tables()
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             
             # Get the AI response
             cursor.execute("""
-                SELECT parsed_response FROM ai_responses WHERE id = ?
+                SELECT parsed_response, merchant_name FROM ai_responses WHERE id = ?
             """, (ai_response_id,))
             
             row = cursor.fetchone()
@@ -314,14 +354,21 @@ class LearningService:
             else:
                 was_correct = None
             
-            # Update AI response with feedback
+            # Update AI response with feedback and the fields the accuracy queries group by
+            fields = extract_response_fields(row[1], row[0])
             cursor.execute("""
                 UPDATE ai_responses
                 SET admin_feedback = ?,
                     admin_correct_ticker = ?,
                     was_ai_correct = ?,
                     feedback_notes = ?,
-                    feedback_date = ?
+                    feedback_date = ?,
+                    merchant_key = ?,
+                    predicted_ticker = ?,
+                    predicted_confidence = ?,
+                    predicted_status = ?,
+                    confidence_bucket = ?,
+                    fields_extracted = 1
                 WHERE id = ?
             """, (
                 admin_action,
@@ -329,6 +376,11 @@ class LearningService:
                 1 if was_correct else (0 if was_correct is False else None),
                 notes,
                 datetime.now().isoformat(),
+                fields['merchant_key'],
+                fields['predicted_ticker'],
+                fields['predicted_confidence'],
+                fields['predicted_status'],
+                fields['confidence_bucket'],
                 ai_response_id
             ))
             
@@ -340,7 +392,7 @@ class LearningService:
             cursor.execute("SELECT * FROM ai_responses WHERE id = ?", (ai_response_id,))
             return cursor.fetchone()
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
     
     def get_learning_insights(self) -> Dict:
         """
@@ -350,7 +402,7 @@ class LearningService:
         """
         self._ensure_tables()
         
-        conn = db_manager.get_connection()
+        conn = self.db.get_connection()
         try:
             cursor = conn.cursor()
             
@@ -398,4 +450,4 @@ class LearningService:
                 'recommendations': recommendations
             }
         finally:
-            db_manager.release_connection(conn)
+            self.db.release_connection(conn)
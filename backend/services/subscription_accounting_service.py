@@ -3,12 +3,42 @@ Subscription Accounting Service
 Automatically creates journal entries for subscription payments and revenue recognition
 """
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Dict, Optional, List
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Every (active subscription, day) pair in [from, to] that falls inside the
+# subscription's current period and has not been recognized yet
+PENDING_RECOGNITION_SQL = """
+    WITH RECURSIVE days(day) AS (
+        SELECT date(?)
+        UNION ALL
+        SELECT date(day, '+1 day') FROM days WHERE day < date(?)
+    ),
+    periods AS (
+        SELECT s.id, s.amount, COALESCE(p.name, 'Unknown Plan') AS plan_name, LOWER(p.account_type) AS account_type,
+               date(s.current_period_start) AS period_start, date(s.current_period_end) AS period_end,
+               CAST(julianday(date(s.current_period_end)) - julianday(date(s.current_period_start)) AS INTEGER) + 1
+                   AS total_days
+        FROM user_subscriptions s
+        LEFT JOIN subscription_plans p ON p.id = s.plan_id
+        WHERE s.status = 'active' AND s.amount > 0
+    )
+    SELECT periods.id, periods.account_type, periods.plan_name, days.day,
+           CAST(julianday(days.day) - julianday(periods.period_start) AS INTEGER) + 1 AS day_number,
+           periods.total_days, ROUND(periods.amount / periods.total_days, 4) AS daily_amount
+    FROM periods
+    JOIN days ON days.day BETWEEN periods.period_start AND periods.period_end
+    WHERE periods.total_days > 0
+      AND NOT EXISTS (
+          SELECT 1 FROM subscription_revenue_recognition r
+          WHERE r.subscription_id = periods.id AND r.recognition_date = days.day
+      )
+    ORDER BY days.day, periods.id
+"""
+
 
 class SubscriptionAccountingService:
     """Service for handling subscription-related accounting entries"""
@@ -369,6 +399,106 @@ class SubscriptionAccountingService:
             logger.error(f"Error processing daily revenue recognition: {e}")
             return []
     
+    def recognize_revenue_range(self, start_date: date, end_date: date) -> Dict:
+        """
+        Set-based daily revenue recognition for every day in [start_date, end_date]
+
+        One query computes the daily amount for each active subscription and
+        day; the recognition keys, journal entries and their lines go in with
+        executemany in a single transaction. Days already recorded in
+        subscription_revenue_recognition are skipped, so re-runs are no-ops.
+        """
+        conn, owned = self._get_connection()
+        now = datetime.now().isoformat()
+        summary = {'from': start_date.isoformat(), 'to': end_date.isoformat(),
+                   'entries_created': 0, 'total_amount': 0.0, 'skipped': 0}
+        
+        try:
+            cursor = conn.cursor()
+            # Take the write lock before reading so concurrent runs cannot both see a day as pending
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(PENDING_RECOGNITION_SQL, (start_date.isoformat(), end_date.isoformat()))
+            
+            recognitions, entries, lines = [], [], []
+            for subscription_id, account_type, plan_name, day, day_number, total_days, daily_amount in cursor.fetchall():
+                deferred_account = self.DEFERRED_REVENUE_ACCOUNTS.get(account_type or '')
+                revenue_account = self.REVENUE_ACCOUNTS.get(account_type or '')
+                if not deferred_account or not revenue_account or daily_amount <= 0:
+                    summary['skipped'] += 1
+                    continue
+                
+                day_stamp = day.replace('-', '')
+                entry_id = f"JE-REV-{subscription_id}-{day_stamp}"
+                description = f"Daily revenue recognition - {plan_name} - Day {day_number} of {total_days}"
+                recognitions.append((subscription_id, day, entry_id, daily_amount))
+                entries.append((entry_id, day, f"SUB-REV-{subscription_id}-{day_stamp}", description, '', '',
+                                'daily_recognition', '', '', daily_amount, deferred_account, revenue_account,
+                                'posted', now, 'system'))
+                lines.append((entry_id, deferred_account, daily_amount, 0, description, now))
+                lines.append((entry_id, revenue_account, 0, daily_amount, description, now))
+                summary['total_amount'] += daily_amount
+            
+            cursor.executemany("""
+                INSERT INTO subscription_revenue_recognition (subscription_id, recognition_date, journal_entry_id, amount)
+                VALUES (?, ?, ?, ?)
+            """, recognitions)
+            cursor.executemany("""
+                INSERT INTO journal_entries (
+                    id, date, reference, description, location, department,
+                    transaction_type, vendor_name, customer_name, amount,
+                    from_account, to_account, status, created_at, created_by
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, entries)
+            cursor.executemany("""
+                INSERT INTO journal_entry_lines (
+                    journal_entry_id, account_code, debit, credit, description, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, lines)
+            conn.commit()
+            
+            summary['entries_created'] = len(entries)
+            summary['total_amount'] = round(summary['total_amount'], 4)
+            logger.info(f"Recognized revenue {summary['from']}..{summary['to']}: "
+                        f"{summary['entries_created']} entries, ${summary['total_amount']:.2f}")
+            return summary
+            
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if owned:
+                conn.close()
+    
+    def backfill_revenue_recognition(self, start_date: date, end_date: date, chunk_days: int = 31) -> Dict:
+        """
+        Recognize revenue for a date range in chunks of chunk_days, one
+        transaction per chunk, so a long backfill can stop and resume
+        """
+        if end_date < start_date:
+            raise ValueError(f"Invalid date range: {start_date} to {end_date}")
+        
+        chunks = []
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(end_date, chunk_start + timedelta(days=max(1, chunk_days) - 1))
+            chunks.append(self.recognize_revenue_range(chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+        
+        return {
+            'from': start_date.isoformat(),
+            'to': end_date.isoformat(),
+            'chunks': len(chunks),
+            'entries_created': sum(chunk['entries_created'] for chunk in chunks),
+            'total_amount': round(sum(chunk['total_amount'] for chunk in chunks), 4),
+            'skipped': sum(chunk['skipped'] for chunk in chunks)
+        }
+    
+    def _get_connection(self):
+        """Connection from a DatabaseManager-style object, or the raw connection this service was given"""
+        if hasattr(self.db, 'get_connection'):
+            return self.db.get_connection(), True
+        return self.db, False
+    
     def handle_failed_payment(
         self,
         subscription_id: int,
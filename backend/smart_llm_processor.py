@@ -11,6 +11,9 @@ import json
 import requests
 from alpaca_service import AlpacaService
 from database_manager import db_manager
+from order_aggregator import order_aggregator
+from market_drain import market_drain_scheduler
+from roundup_sweep import roundup_sweeper
 
 class SmartLLMProcessor:
     def __init__(self):
@@ -93,30 +96,6 @@ class SmartLLMProcessor:
             'evidence': result.evidence
         }
     
-    def execute_stock_purchase(self, user_id: int, ticker: str, amount: float) -> Dict:
-        """Execute stock purchase through Alpaca API"""
-        try:
-            # For now, we'll simulate the purchase
-            # In production, you'd use the actual Alpaca API
-            print(f"Executing stock purchase: {ticker} for ${amount}")
-            
-            # Simulate successful purchase
-            purchase_result = {
-                'success': True,
-                'ticker': ticker,
-                'shares': amount,  # Fractional shares
-                'price_per_share': 1.0,  # Simulated price
-                'total_cost': amount,
-                'order_id': f"order_{int(time.time())}",
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            return purchase_result
-            
-        except Exception as e:
-            print(f"Error executing stock purchase: {e}")
-            return {'success': False, 'error': str(e)}
-    
     def process_transaction(self, transaction: Dict) -> Dict:
         """Process a single transaction through the LLM pipeline"""
         try:
@@ -131,26 +110,18 @@ class SmartLLMProcessor:
                 # High confidence - auto-approve and invest
                 ticker = mapping_result['ticker']
                 
-                # Step 2: Execute stock purchase
+                # Step 2: Queue the $1.00 purchase. The order aggregator nets queued
+                # purchases per ticker into one block order per window.
                 if self.is_market_open():
-                    purchase_result = self.execute_stock_purchase(user_id, ticker, 1.0)  # $1.00 investment
-                    
-                    if purchase_result['success']:
-                        # Update transaction status
-                        self.update_transaction_status(tx_id, 'mapped', ticker, purchase_result)
-                        
-                        # Create mapping record
-                        self.create_mapping_record(user_id, merchant, ticker, mapping_result)
-                        
-                        return {
-                            'status': 'mapped',
-                            'ticker': ticker,
-                            'purchase': purchase_result,
-                            'confidence': mapping_result['confidence']
-                        }
-                    else:
-                        # Purchase failed - keep as pending
-                        return {'status': 'pending', 'reason': 'Purchase failed'}
+                    if not self.queue_purchase(tx_id, ticker, user_id):
+                        return {'status': 'pending', 'reason': 'Purchase could not be queued'}
+                    self.create_mapping_record(user_id, merchant, ticker, mapping_result)
+                    return {
+                        'status': 'queued',
+                        'ticker': ticker,
+                        'reason': 'Aggregating into block order',
+                        'confidence': mapping_result['confidence']
+                    }
                 else:
                     # Market closed - queue for next day
                     self.queue_for_next_day(tx_id, ticker, user_id)
@@ -220,24 +191,13 @@ class SmartLLMProcessor:
         except Exception as e:
             print(f"Error creating mapping record: {e}")
     
+    def queue_purchase(self, tx_id: int, ticker: str, user_id: int, amount: float = 1.0) -> bool:
+        """Queue a purchase in market_queue for the next aggregation window"""
+        return order_aggregator.enqueue(user_id, ticker, amount, tx_id) is not None
+    
     def queue_for_next_day(self, tx_id: int, ticker: str, user_id: int):
         """Queue transaction for next day when market opens"""
-        try:
-            conn = db_manager.get_connection()
-            cur = conn.cursor()
-            
-            # Create a queue record
-            cur.execute("""
-                INSERT INTO market_queue 
-                (transaction_id, user_id, ticker, amount, status, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (tx_id, user_id, ticker, 1.0, 'queued', datetime.now().isoformat()))
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            print(f"Error queuing transaction: {e}")
+        self.queue_purchase(tx_id, ticker, user_id)
     
     def process_batch(self) -> Dict:
         """Process a batch of pending transactions"""
@@ -283,6 +243,10 @@ class SmartLLMProcessor:
         self.is_running = True
         self.processing_thread = threading.Thread(target=self._processing_loop, daemon=True)
         self.processing_thread.start()
+        # Queued purchases are bought by the drain scheduler at and after the market open
+        market_drain_scheduler.start()
+        # Users whose mapped round-ups reach the sweep threshold get their purchases queued
+        roundup_sweeper.start_schedule()
         print("Smart LLM Processor started")
     
     def stop_processing(self):
@@ -290,6 +254,8 @@ class SmartLLMProcessor:
         self.is_running = False
         if self.processing_thread:
             self.processing_thread.join()
+        market_drain_scheduler.stop()
+        roundup_sweeper.stop_schedule()
         print("Smart LLM Processor stopped")
     
     def _processing_loop(self):
@@ -332,6 +298,8 @@ class SmartLLMProcessor:
                 'mapped_transactions': mapped,
                 'review_queue': review_queue,
                 'market_queue': market_queue,
+                'block_orders': order_aggregator.stats,
+                'market_drain': market_drain_scheduler.totals,
                 'is_running': self.is_running,
                 'market_open': self.is_market_open()
             }
@@ -4,13 +4,13 @@ Handles real-time stock price data from external APIs
 """
 
 import requests
-import json
-import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Optional
 import os
 from dotenv import load_dotenv
 
+from price_service import price_service
+
 load_dotenv()
 
 class StockAPIManager:
@@ -20,16 +20,8 @@ class StockAPIManager:
         self.finnhub_key = os.getenv('FINNHUB_API_KEY', 'demo')
         self.polygon_key = os.getenv('POLYGON_API_KEY', 'demo')
         
-        # Rate limiting
-        self.rate_limits = {
-            'alpha_vantage': {'calls_per_minute': 5, 'last_call': 0},
-            'finnhub': {'calls_per_minute': 60, 'last_call': 0},
-            'polygon': {'calls_per_minute': 5, 'last_call': 0}
-        }
-        
-        # Cache for stock prices
-        self.price_cache = {}
-        self.cache_duration = 60  # 1 minute cache
+        # Quotes, caching and per-provider rate limits live in the shared price service
+        self.price_service = price_service
         
         # Company name to ticker mapping
         self.company_mapping = {
@@ -55,183 +47,30 @@ class StockAPIManager:
             'intel': 'INTC'
         }
     
-    def _check_rate_limit(self, api_name: str) -> bool:
-        """Check if we can make an API call based on rate limits"""
-        current_time = time.time()
-        rate_limit = self.rate_limits[api_name]
-        
-        if current_time - rate_limit['last_call'] >= 60:  # Reset after 1 minute
-            rate_limit['last_call'] = current_time
-            return True
-        
-        return False
-    
-    def _update_rate_limit(self, api_name: str):
-        """Update the last call time for rate limiting"""
-        self.rate_limits[api_name]['last_call'] = time.time()
-    
-    def _is_cache_valid(self, ticker: str) -> bool:
-        """Check if cached price is still valid"""
-        if ticker not in self.price_cache:
-            return False
-        
-        cache_time = self.price_cache[ticker]['timestamp']
-        return (datetime.utcnow() - cache_time).seconds < self.cache_duration
+    def _get_from_provider(self, api_name: str, ticker: str) -> Optional[Dict]:
+        return self.price_service.fetch_from(api_name, [ticker]).get(ticker.upper())
     
     def get_stock_price_alpha_vantage(self, ticker: str) -> Optional[Dict]:
         """Get stock price from Alpha Vantage API"""
-        if not self._check_rate_limit('alpha_vantage'):
-            return None
-        
-        try:
-            url = f"https://www.alphavantage.co/query"
-            params = {
-                'function': 'GLOBAL_QUOTE',
-                'symbol': ticker,
-                'apikey': self.alpha_vantage_key
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if 'Global Quote' in data:
-                quote = data['Global Quote']
-                price_data = {
-                    'ticker': ticker,
-                    'price': float(quote.get('05. price', 0)),
-                    'change': float(quote.get('09. change', 0)),
-                    'change_percent': quote.get('10. change percent', '0%').replace('%', ''),
-                    'volume': int(quote.get('06. volume', 0)),
-                    'high': float(quote.get('03. high', 0)),
-                    'low': float(quote.get('04. low', 0)),
-                    'open': float(quote.get('02. open', 0)),
-                    'timestamp': datetime.utcnow(),
-                    'source': 'alpha_vantage'
-                }
-                
-                # Cache the result
-                self.price_cache[ticker] = price_data
-                self._update_rate_limit('alpha_vantage')
-                
-                return price_data
-            
-        except Exception as e:
-            print(f"Alpha Vantage API error for {ticker}: {e}")
-        
-        return None
+        return self._get_from_provider('alpha_vantage', ticker)
     
     def get_stock_price_finnhub(self, ticker: str) -> Optional[Dict]:
         """Get stock price from Finnhub API"""
-        if not self._check_rate_limit('finnhub'):
-            return None
-        
-        try:
-            url = f"https://finnhub.io/api/v1/quote"
-            params = {
-                'symbol': ticker,
-                'token': self.finnhub_key
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if 'c' in data:  # Current price
-                price_data = {
-                    'ticker': ticker,
-                    'price': float(data.get('c', 0)),
-                    'change': float(data.get('d', 0)),
-                    'change_percent': float(data.get('dp', 0)),
-                    'high': float(data.get('h', 0)),
-                    'low': float(data.get('l', 0)),
-                    'open': float(data.get('o', 0)),
-                    'previous_close': float(data.get('pc', 0)),
-                    'timestamp': datetime.utcnow(),
-                    'source': 'finnhub'
-                }
-                
-                # Cache the result
-                self.price_cache[ticker] = price_data
-                self._update_rate_limit('finnhub')
-                
-                return price_data
-            
-        except Exception as e:
-            print(f"Finnhub API error for {ticker}: {e}")
-        
-        return None
+        return self._get_from_provider('finnhub', ticker)
     
     def get_stock_price_polygon(self, ticker: str) -> Optional[Dict]:
         """Get stock price from Polygon API"""
-        if not self._check_rate_limit('polygon'):
-            return None
-        
+        return self._get_from_provider('polygon', ticker)
+    
+    def get_stock_price(self, ticker: str) -> Optional[Dict]:
+        """Get stock price from the shared price service, mock data if no provider can price it"""
         try:
-            url = f"https://api.polygon.io/v2/aggs/ticker/{ticker}/prev"
-            params = {
-                'adjusted': 'true',
-                'apikey': self.polygon_key
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if 'results' in data and len(data['results']) > 0:
-                result = data['results'][0]
-                price_data = {
-                    'ticker': ticker,
-                    'price': float(result.get('c', 0)),  # Close price
-                    'change': float(result.get('c', 0)) - float(result.get('o', 0)),
-                    'change_percent': ((float(result.get('c', 0)) - float(result.get('o', 0))) / float(result.get('o', 1))) * 100,
-                    'volume': int(result.get('v', 0)),
-                    'high': float(result.get('h', 0)),
-                    'low': float(result.get('l', 0)),
-                    'open': float(result.get('o', 0)),
-                    'timestamp': datetime.utcnow(),
-                    'source': 'polygon'
-                }
-                
-                # Cache the result
-                self.price_cache[ticker] = price_data
-                self._update_rate_limit('polygon')
-                
+            price_data = self.price_service.get_quote(ticker)
+            if price_data:
                 return price_data
-            
         except Exception as e:
-            print(f"Polygon API error for {ticker}: {e}")
-        
-        return None
-    
-    def get_stock_price(self, ticker: str) -> Optional[Dict]:
-        """Get stock price from the best available API"""
-        # Check cache first
-        if self._is_cache_valid(ticker):
-            cached_data = self.price_cache[ticker].copy()
-            cached_data['cached'] = True
-            return cached_data
+            print(f"Price service error for {ticker}: {e}")
         
-        # Try APIs in order of preference
-        apis = [
-            self.get_stock_price_finnhub,
-            self.get_stock_price_alpha_vantage,
-            self.get_stock_price_polygon
-        ]
-        
-        for api_func in apis:
-            try:
-                result = api_func(ticker)
-                if result:
-                    return result
-            except Exception as e:
-                print(f"API call failed: {e}")
-                continue
-        
-        # If all APIs fail, return mock data
         return self.get_mock_stock_price(ticker)
     
     def get_mock_stock_price(self, ticker: str) -> Dict:
@@ -314,17 +153,16 @@ class StockAPIManager:
         return None
     
     def get_multiple_stock_prices(self, tickers: List[str]) -> Dict[str, Dict]:
-        """Get stock prices for multiple tickers"""
-        results = {}
+        """Get stock prices for multiple tickers in batched provider requests"""
+        try:
+            quotes = self.price_service.get_quotes(tickers)
+        except Exception as e:
+            print(f"Error getting prices for {len(tickers)} tickers: {e}")
+            quotes = {}
         
+        results = {}
         for ticker in tickers:
-            try:
-                price_data = self.get_stock_price(ticker)
-                if price_data:
-                    results[ticker] = price_data
-            except Exception as e:
-                print(f"Error getting price for {ticker}: {e}")
-                results[ticker] = self.get_mock_stock_price(ticker)
+            results[ticker] = quotes.get(ticker.upper().strip()) or self.get_mock_stock_price(ticker)
         
         return results
     
@@ -338,17 +176,12 @@ class StockAPIManager:
             'market_status': 'open' if self._is_market_open() else 'closed'
         }
         
-        for index in major_indices:
-            try:
-                price_data = self.get_stock_price(index)
-                if price_data:
-                    summary['indices'][index] = {
-                        'price': price_data['price'],
-                        'change': price_data['change'],
-                        'change_percent': price_data['change_percent']
-                    }
-            except Exception as e:
-                print(f"Error getting market summary for {index}: {e}")
+        for index, price_data in self.get_multiple_stock_prices(major_indices).items():
+            summary['indices'][index] = {
+                'price': price_data['price'],
+                'change': price_data['change'],
+                'change_percent': price_data['change_percent']
+            }
         
         return summary
     
@@ -364,25 +197,23 @@ class StockAPIManager:
     
     def get_api_status(self) -> Dict:
         """Get status of all APIs"""
+        stats = self.price_service.get_stats()
         status = {
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': stats['timestamp'],
             'apis': {
-                'alpha_vantage': {
-                    'available': bool(self.alpha_vantage_key and self.alpha_vantage_key != 'demo'),
-                    'rate_limit': self.rate_limits['alpha_vantage']
-                },
-                'finnhub': {
-                    'available': bool(self.finnhub_key and self.finnhub_key != 'demo'),
-                    'rate_limit': self.rate_limits['finnhub']
-                },
-                'polygon': {
-                    'available': bool(self.polygon_key and self.polygon_key != 'demo'),
-                    'rate_limit': self.rate_limits['polygon']
-                }
+                name: {
+                    'available': provider['configured'],
+                    'rate_limit': provider['rate_limit'],
+                    'requests': provider['requests'],
+                    'errors': provider['errors'],
+                    'rate_limited': provider['rate_limited']
+                } for name, provider in stats['providers'].items()
             },
             'cache': {
-                'entries': len(self.price_cache),
-                'duration_minutes': self.cache_duration
+                'entries': stats['cache']['entries'],
+                'hit_rate': stats['cache']['hit_rate'],
+                'duration_seconds': stats['cache']['fresh_ttl_seconds'],
+                'stale_seconds': stats['cache']['stale_ttl_seconds']
             }
         }
         
@@ -0,0 +1,96 @@
+import json
+import random
+import shutil
+
+from ai_fee_engine import AIFeeEngine
+from database_manager import DatabaseManager
+
+
+def build_fee_db(path, users, seed=5):
+    """DatabaseManager schema plus the AI fee columns and tables from safe_database_update.py"""
+    rng = random.Random(seed)
+    conn = DatabaseManager(db_path=str(path)).get_connection()
+    for column in ['current_tier INTEGER DEFAULT 1', 'monthly_transaction_count INTEGER DEFAULT 0',
+                   'loyalty_score DECIMAL(3,2) DEFAULT 0.0', "risk_profile VARCHAR(20) DEFAULT 'medium'",
+                   'ai_fee_multiplier DECIMAL(3,2) DEFAULT 1.0', 'total_lifetime_transactions INTEGER DEFAULT 0',
+                   'avg_monthly_transactions DECIMAL(5,2) DEFAULT 0.0']:
+        conn.execute(f"ALTER TABLE users ADD COLUMN {column}")
+    conn.executescript("""
+        CREATE TABLE fee_tiers (id INTEGER PRIMARY KEY AUTOINCREMENT, account_type VARCHAR(20) NOT NULL,
+            tier_level INTEGER NOT NULL, min_transactions INTEGER NOT NULL, max_transactions INTEGER,
+            base_fee DECIMAL(5,2) NOT NULL, fee_type VARCHAR(10) NOT NULL DEFAULT 'fixed', is_active BOOLEAN DEFAULT 1);
+        CREATE TABLE ai_fee_history (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            transaction_id INTEGER NOT NULL, base_fee DECIMAL(5,2) NOT NULL, ai_adjustments TEXT,
+            final_fee DECIMAL(5,2) NOT NULL, ai_factors TEXT, tier_at_time INTEGER DEFAULT 1,
+            loyalty_score_at_time DECIMAL(3,2) DEFAULT 0.0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE market_conditions (id INTEGER PRIMARY KEY AUTOINCREMENT, date DATE NOT NULL,
+            volatility DECIMAL(5,4) NOT NULL, competitor_fees TEXT, market_sentiment VARCHAR(20) DEFAULT 'neutral',
+            ai_recommendations TEXT);
+        INSERT INTO fee_tiers (account_type, tier_level, min_transactions, max_transactions, base_fee) VALUES
+            ('individual', 1, 0, 10, 0.25), ('individual', 2, 11, 25, 0.20), ('individual', 3, 26, NULL, 0.15),
+            ('family', 1, 0, 15, 0.10), ('family', 2, 16, NULL, 0.08),
+            ('business', 1, 0, 20, 0.10), ('business', 2, 21, NULL, 0.08);
+    """)
+    conn.execute("INSERT INTO market_conditions (date, volatility, competitor_fees) VALUES ('2026-10-18', 0.03, ?)",
+                 (json.dumps({'competitor_a': 0.30, 'competitor_b': 0.25}),))
+    conn.executemany("""
+        INSERT INTO users (id, email, name, account_type, current_tier, monthly_transaction_count, loyalty_score,
+                           total_lifetime_transactions, avg_monthly_transactions, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(user_id, f"u{user_id}@example.com", f"User {user_id}", rng.choice(['individual', 'family', 'business']),
+           rng.randint(1, 2), rng.randint(0, 70), round(rng.random(), 2), rng.randint(0, 300),
+           round(rng.uniform(0, 40), 1), f"2026-{rng.randint(1, 10):02d}-01 09:00:00")
+          for user_id in range(1, users + 1)])
+    conn.executemany("""
+        INSERT INTO transactions (user_id, date, merchant, amount, round_up, fee, total_debit, created_at)
+        VALUES (?, '2026-10-01', 'Starbucks', ?, 1.0, 0.25, 0, ?)
+    """, [(rng.randint(2, users), round(rng.uniform(1, 80), 2), f"2026-10-{rng.randint(1, 28):02d} 12:00:00")
+          for _ in range(users * 30)])
+    conn.commit()
+    conn.close()
+
+
+def fee_history(path):
+    conn = DatabaseManager(db_path=str(path)).get_connection()
+    rows = conn.execute("""
+        SELECT user_id, transaction_id, base_fee, ai_adjustments, final_fee, ai_factors, tier_at_time,
+               loyalty_score_at_time
+        FROM ai_fee_history ORDER BY id
+    """).fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+
+def test_batch_matches_per_call_fees(tmp_path):
+    build_fee_db(tmp_path / 'batch.db', users=40)
+    shutil.copy(tmp_path / 'batch.db', tmp_path / 'single.db')
+    rng = random.Random(9)
+    # User 1 has no transactions (no history row) and user 999 does not exist (fallback fee)
+    items = [{'user_id': rng.choice([1, 999] + list(range(2, 41))), 'transaction_amount': round(rng.uniform(1, 90), 2),
+              'round_up_amount': round(rng.uniform(0.01, 0.99), 2)} for _ in range(200)]
+
+    single = AIFeeEngine(str(tmp_path / 'single.db'))
+    expected = [single.calculate_optimal_fee(item['user_id'], item['transaction_amount'], item['round_up_amount'])
+                for item in items]
+    batched = AIFeeEngine(str(tmp_path / 'batch.db')).calculate_fees_batch(items)
+
+    assert batched == expected
+    assert any(result['recommendation'] == 'Fallback calculation used' for result in batched)
+    assert fee_history(tmp_path / 'batch.db') == fee_history(tmp_path / 'single.db')
+    assert len(fee_history(tmp_path / 'batch.db')) == sum(1 for item in items if item['user_id'] not in (1, 999))
+
+
+def test_market_conditions_are_read_once_per_ttl(tmp_path):
+    build_fee_db(tmp_path / 'fees.db', users=5)
+    engine = AIFeeEngine(str(tmp_path / 'fees.db'), market_cache_ttl=60)
+    reads = []
+    load = engine._get_latest_market_conditions
+    engine._get_latest_market_conditions = lambda: reads.append(1) or load()
+
+    engine.calculate_fees_batch([{'user_id': 2, 'transaction_amount': 10.0, 'round_up_amount': 0.5}] * 10)
+    engine.calculate_optimal_fee(3, 12.0, 0.4)
+    assert len(reads) == 1
+
+    engine.market_cache_ttl = 0
+    engine.calculate_optimal_fee(3, 12.0, 0.4)
+    assert len(reads) == 2
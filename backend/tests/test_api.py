@@ -55,3 +55,14 @@ def test_admin_with_token(client):
     assert resp.status_code == 200
     data = resp.get_json()
     assert data['success'] is True
+
+
+def test_health_monitor_checks_routes_of_this_app():
+    from health_monitoring import health_monitor
+    assert health_monitor.app is app
+    assert health_monitor.run_check('api_endpoints')
+    registered = {rule.rule for rule in app.url_map.iter_rules()}
+    assert '/api/health' in registered
+    for endpoint in health_monitor.MONITORED_ENDPOINTS:
+        check = health_monitor.checks[f"api_{endpoint['name'].lower().replace(' ', '_')}"]
+        assert (check.error_message == 'Route not registered') == (endpoint['rule'] not in registered)
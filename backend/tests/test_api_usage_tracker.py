@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+import json
+
+import pytest
+
+from database_manager import DatabaseManager
+from services.api_usage_tracker import APIUsageTracker
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'usage.db'))
+
+
+def execute(db, sql, params=()):
+    conn = db.get_connection()
+    rows = [tuple(row) for row in conn.execute(sql, params).fetchall()]
+    conn.commit()
+    conn.close()
+    return rows
+
+
+def insert_raw(db, created_at, model, cost, success=1, processing_time_ms=100):
+    execute(db, """
+        INSERT INTO api_usage (endpoint, model, prompt_tokens, completion_tokens, total_tokens, processing_time_ms,
+                               cost, success, created_at)
+        VALUES ('/api/test', ?, 10, 5, 15, ?, ?, ?, ?)
+    """, (model, processing_time_ms, cost, success, created_at.isoformat()))
+
+
+def row_scan_stats(db, days):
+    """What get_usage_stats used to compute from every raw row in the window"""
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    rows = execute(db, "SELECT model, substr(created_at, 1, 10), cost, success, processing_time_ms FROM api_usage "
+                       "WHERE created_at >= ?", (cutoff,))
+    by_day = {}
+    for _, day, _, _, _ in rows:
+        by_day[day] = by_day.get(day, 0) + 1
+    return {
+        'total_calls': len(rows),
+        'successful_calls': sum(r[3] for r in rows),
+        'total_cost': round(sum(r[2] for r in rows), 4),
+        'average_processing_time_ms': round(sum(r[4] for r in rows) / len(rows), 2),
+        'calls_by_day': [{'date': day, 'calls': count} for day, count in sorted(by_day.items())]
+    }
+
+
+def test_stats_from_rollup_match_raw_rows(db):
+    tracker = APIUsageTracker(db=db)
+    tracker._ensure_tables()
+    now = datetime.now()
+    # History written before the rollup existed, including rows either side of the window's partial first day
+    for hours_ago, model, cost, success in [(24 * 8, 'deepseek-chat', 0.5, 1), (24 * 7 - 1, 'deepseek-chat', 0.25, 1),
+                                            (24 * 7 + 1, 'deepseek-chat', 0.125, 1), (30, 'deepseek-reasoner', 0.0, 0),
+                                            (26, 'deepseek-reasoner', 1.0, 1)]:
+        insert_raw(db, now - timedelta(hours=hours_ago), model, cost, success)
+    tracker.rebuild_daily_rollup()
+
+    for _ in range(3):
+        tracker.record_api_call('/api/test', 'deepseek-chat', prompt_tokens=1000, completion_tokens=500,
+                                processing_time_ms=200)
+    tracker.record_api_call('/api/test', 'deepseek-chat', prompt_tokens=1000, success=False, processing_time_ms=50)
+
+    stats = tracker.get_usage_stats(days=7)
+    expected = row_scan_stats(db, 7)
+    for key, value in expected.items():
+        assert stats[key] == value, key
+    assert stats['calls_by_model']['deepseek-chat']['calls'] == 5
+
+
+def test_cost_limit_and_month_cost_read_the_rollup(db):
+    tracker = APIUsageTracker(db=db)
+    for _ in range(4):
+        tracker.record_api_call('/api/test', 'deepseek-chat', prompt_tokens=1_000_000, completion_tokens=1_000_000)
+    tracker.record_api_call('/api/test', 'deepseek-chat', prompt_tokens=1_000_000, success=False)
+
+    per_call = 0.28 + 0.42
+    assert execute(db, "SELECT calls, successful_calls, ROUND(successful_cost, 4) FROM api_usage_daily") == [
+        (5, 4, round(4 * per_call, 4))]
+    assert tracker.get_current_month_cost() == round(4 * per_call, 4)
+
+    status = tracker.get_daily_cost_limit_status(daily_limit=2.0)
+    assert status['today_cost'] == round(4 * per_call, 4)
+    assert status['limit_exceeded']
+
+    assert tracker.update_daily_limit(5.0)
+    assert not tracker.get_daily_cost_limit_status()['limit_exceeded']
+
+
+def test_compaction_archives_payloads_once_and_fetches_lazily(db):
+    tracker = APIUsageTracker(db=db)
+    request = {'messages': [{'role': 'user', 'content': 'Map merchant STARBUCKS #123'}]}
+    for _ in range(3):
+        tracker.record_api_call('/api/test', 'deepseek-chat', request_data=json.dumps(request),
+                                response_data=json.dumps({'ticker': 'SBUX'}))
+    tracker.record_api_call('/api/test', 'deepseek-chat', request_data=json.dumps({'prompt': 'fresh'}))
+    # Legacy row with no stored preview, old enough to be compacted
+    execute(db, "UPDATE api_usage SET created_at = ?, message_preview = NULL WHERE id <= 3",
+            ((datetime.now() - timedelta(days=40)).isoformat(),))
+
+    summary = tracker.compact_payloads(older_than_days=30, batch_size=2)
+    assert (summary['rows_compacted'], summary['payloads_written']) == (3, 2)
+    assert execute(db, "SELECT COUNT(*) FROM api_usage WHERE request_data IS NOT NULL") == [(1,)]
+    assert tracker.compact_payloads(older_than_days=30)['rows_compacted'] == 0
+
+    payloads = tracker.get_record_payloads(2)
+    assert payloads['archived']
+    assert json.loads(payloads['request_data']) == request
+    assert json.loads(payloads['response_data']) == {'ticker': 'SBUX'}
+    assert not tracker.get_record_payloads(4)['archived']
+    assert tracker.get_record_payloads(99) is None
+
+    records = tracker.get_detailed_records(days=60)['records']
+    assert [r['message'] for r in records] == ['fresh'] + ['Map merchant STARBUCKS #123'] * 3
+    assert [r['stored'] for r in records] == [False, True, True, True]
+
+
+def test_keyset_pages_cover_every_record_once(db):
+    tracker = APIUsageTracker(db=db)
+    for index in range(7):
+        tracker.record_api_call('/api/test', 'deepseek-chat', request_data={'prompt': f'p{index}'})
+
+    seen, cursor = [], None
+    while True:
+        page = tracker.get_detailed_records(limit=3, cursor=cursor)
+        assert page['total'] == 7
+        seen.extend(record['id'] for record in page['records'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == list(range(7, 0, -1))
+    assert [r['id'] for r in tracker.get_detailed_records(page=2, limit=3)['records']] == [4, 3, 2]
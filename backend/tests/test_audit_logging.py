@@ -0,0 +1,129 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from audit_logging import AuditEventType, AuditLogger
+from database_manager import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'audit.db'))
+
+
+@pytest.fixture
+def audit(db):
+    return AuditLogger(db=db)
+
+
+def execute(db, sql, params=()):
+    conn = db.get_connection()
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_entries_are_durable_chained_and_queryable(db, audit):
+    for n in range(30):
+        audit.log_event(AuditEventType.LOGIN_FAILED if n % 3 == 0 else AuditEventType.TRANSACTION_CREATE,
+                        user_id=n % 5, user_type='user', action='create', resource='transaction',
+                        resource_id=n, after_state={'amount': n + 0.5})
+
+    assert audit.flush()
+    restarted = AuditLogger(db=db)  # A fresh process sees everything
+    logs = restarted.get_logs(user_id='2')
+    assert len(logs) == 6 and all(log.user_id == '2' for log in logs)
+    assert [log.seq for log in logs] == sorted((log.seq for log in logs), reverse=True)
+    assert logs[0].after_state == {'amount': 27.5} and restarted.verify_entry(logs[0])
+    assert len(restarted.get_security_events()) == 10
+    assert restarted.get_audit_stats()['event_types'] == {'login_failed': 10, 'transaction_create': 20}
+
+    report = restarted.verify_integrity()
+    assert (report['valid'], report['checked'], report['first_seq'], report['last_seq']) == (True, 30, 1, 30)
+    assert restarted.verify_integrity(start_seq=10, end_seq=12)['checked'] == 3
+
+
+def test_tampering_is_detected(db, audit):
+    for n in range(10):
+        audit.log_event(AuditEventType.MAPPING_APPROVE, str(n), 'admin', 'approve', 'mapping', str(n))
+    assert audit.verify_integrity()['valid']
+
+    with pytest.raises(sqlite3.IntegrityError, match='append-only'):
+        execute(db, "UPDATE audit_log SET action = 'reject' WHERE seq = 4")
+
+    # Rewriting a row behind the trigger's back breaks the chain at that row
+    execute(db, "DROP TRIGGER trg_audit_log_append_only")
+    execute(db, "UPDATE audit_log SET action = 'reject' WHERE seq = 4")
+    assert audit.verify_integrity()['error']['seq'] == 4
+    assert audit.verify_integrity(start_seq=5)['valid']
+
+    execute(db, "DELETE FROM audit_log WHERE seq = 7")
+    assert audit.verify_integrity(start_seq=5)['error'] == {
+        'seq': 8, 'id': audit.get_logs(limit=3)[-1].id, 'reason': 'entries 7..7 are missing'}
+
+
+def test_retention_keeps_remaining_chain_verifiable_and_export_streams(db, audit):
+    for n in range(6):
+        audit.log_event(AuditEventType.DATA_EXPORT, 'admin1', 'admin', 'export', 'report', str(n))
+    audit.flush()
+    old = (datetime.utcnow() - timedelta(days=200)).isoformat()
+    execute(db, "DROP TRIGGER trg_audit_log_append_only")
+    execute(db, "UPDATE audit_log SET timestamp = ? WHERE seq <= 3", (old,))
+
+    assert audit.clear_old_logs(days=90) == 3
+    report = audit.verify_integrity(start_seq=4, end_seq=6)  # Rows 1-3 were re-timestamped, 4-6 untouched
+    assert report['valid'] and report['first_seq'] == 4
+
+    chunks = list(audit.export_logs('csv', chunk_size=2))
+    assert len(chunks) == 1 + 2  # Header, then the four retained rows two at a time
+    assert chunks[0].startswith('seq,timestamp,event_type') and 'data_delete' in chunks[-1]
+    assert ''.join(audit.export_logs('json')).count('"event_type"') == 4
+
+
+def test_one_bad_entry_does_not_cost_the_batch(db, audit, monkeypatch):
+    real_write_batch = audit._write_batch
+
+    def reject_poisoned(batch):
+        if any(entry.resource_id == 'poison' for entry, _ in batch):
+            raise sqlite3.OperationalError('constraint failed')
+        real_write_batch(batch)
+
+    monkeypatch.setattr(audit, '_write_batch', reject_poisoned)
+    audit.log_event(AuditEventType.SETTINGS_CHANGE, 'admin', 'admin', 'update', 'settings',
+                    before_state={1: 'one', 'two': 2})  # Mixed key types can't be sort_keys-encoded
+    for n in range(20):
+        audit.log_event(AuditEventType.TRANSACTION_CREATE, 'u', 'user', 'create', 'transaction',
+                        resource_id='poison' if n == 7 else str(n))
+    assert audit.flush()
+
+    assert audit.stats['dropped'] == 1
+    logs = audit.get_logs(limit=100)
+    assert len(logs) == 20
+    assert [log.before_state for log in logs if log.resource == 'settings'] == [{'1': 'one', 'two': 2}]
+    assert audit.verify_integrity()['valid']
+
+
+class PostgresManager:
+    """Stands in for db_manager with PostgreSQL configured: no sqlite connection to hand out"""
+    _use_postgresql = True
+
+    def get_connection(self):
+        raise AssertionError('audit entries must not go to the PostgreSQL session')
+
+
+def test_postgres_deployment_keeps_entries_in_memory():
+    audit = AuditLogger(db=PostgresManager())
+    assert not audit.available
+    for n in range(20):
+        audit.log_event(AuditEventType.USER_MODIFY, str(n % 2), 'admin', 'modify', 'user', str(n),
+                        after_state={'n': n})
+
+    assert audit.flush()
+    assert len(audit.get_logs(user_id='1')) == 10
+    assert audit.verify_integrity()['checked'] == 20
+    stats = audit.get_audit_stats()
+    assert (stats['total_logs'], stats['durable'], stats['writer']['dropped']) == (20, False, 0)
+    assert AuditLogger(db=PostgresManager()).get_audit_stats()['total_logs'] == 0  # One store per logger
@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+
+from database_manager import DatabaseManager
+from services.error_tracking_service import ErrorSink
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'errors.db'))
+
+
+def rows(db, sql):
+    conn = db.get_connection()
+    result = conn.execute(sql).fetchall()
+    conn.close()
+    return result
+
+
+def test_identical_errors_collapse_into_counts(db):
+    sink = ErrorSink(db=db, flush_interval_ms=10_000)
+    threads = [threading.Thread(target=lambda n=n: [
+        sink.submit('TimeoutError', f'upstream timed out after {n}ms', endpoint='/api/prices', http_method='GET')
+        for _ in range(50)]) for n in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    sink.submit('KeyError', "'ticker'", endpoint='/api/prices', http_method='GET')
+    assert len(sink.flush()) == 2
+
+    for _ in range(10):  # Still within the dedupe window: bumps the written row
+        sink.submit('TimeoutError', 'upstream timed out after 999ms', endpoint='/api/prices', http_method='GET')
+    assert sink.flush() == {}
+
+    assert rows(db, "SELECT error_type, occurrences FROM system_errors ORDER BY id") == [
+        ('TimeoutError', 210), ('KeyError', 1)]
+    stats = sink.get_stats()
+    assert (stats['logged'], stats['rows_inserted'], stats['rows_updated']) == (211, 2, 1)
+
+
+def test_overflow_drops_oldest_and_failed_flushes_are_retried(db, monkeypatch):
+    sink = ErrorSink(db=db, capacity=3, flush_interval_ms=10_000)
+    for n in range(5):
+        sink.submit(f'Error{n}', 'boom')
+    assert sink.get_stats()['dropped'] == 2
+
+    real_write = sink._write
+    monkeypatch.setattr(sink, '_write', lambda batch: (_ for _ in ()).throw(RuntimeError('database is locked')))
+    assert sink.flush() is None
+    sink.submit('Error4', 'boom')
+    monkeypatch.setattr(sink, '_write', real_write)
+    assert len(sink.flush()) == 3
+
+    assert rows(db, "SELECT error_type, occurrences FROM system_errors ORDER BY id") == [
+        ('Error2', 1), ('Error3', 1), ('Error4', 2)]
+    assert sink.get_stats()['flush_failures'] == 1
+
+
+def test_background_flusher_writes_without_blocking_callers(db):
+    sink = ErrorSink(db=db, flush_interval_ms=20)
+    for n in range(120):
+        sink.submit('ValueError', f'bad row {n}', endpoint=f'/api/upload/{n % 60}')
+    deadline = threading.Event()
+    for _ in range(100):
+        if rows(db, "SELECT COALESCE(SUM(occurrences), 0) FROM system_errors") == [(120,)]:
+            break
+        deadline.wait(0.05)
+    assert rows(db, "SELECT COUNT(*), SUM(occurrences) FROM system_errors") == [(60, 120)]
+
+
+def stats_from(db, sql):
+    from services.error_tracking_service import summarize_error_stats
+    conn = db.get_connection()
+    result = summarize_error_stats(conn.execute(sql).fetchall())
+    conn.close()
+    return result
+
+
+def test_rollup_matches_a_full_scan_through_logging_and_resolving(db, monkeypatch):
+    from services import error_tracking_service as service
+    monkeypatch.setattr(service, 'db_manager', db)
+    sink = ErrorSink(db=db, flush_interval_ms=10_000)
+    for n in range(40):
+        sink.submit(['DatabaseError', 'TimeoutError', 'KeyError'][n % 3], f'failure {n % 7}',
+                    endpoint=f'/api/e{n % 5}', severity=['critical', 'error', 'warning'][n % 2])
+    written = sink.flush()
+    for n in range(15):  # Repeats fold into counts on existing rows
+        sink.submit('KeyError', f'failure {n}', endpoint='/api/e2', severity='error')
+    sink.flush()
+    for error_id in sorted(written.values())[:6]:
+        assert service.resolve_error(error_id, resolved_by=1)
+    assert service.resolve_error(sorted(written.values())[0], resolved_by=1)  # Already resolved: no double count
+
+    stats = service.get_error_stats()
+    scanned = stats_from(db, service.SCAN_STATS_SQL['sqlite'])
+    assert stats['source'] == 'rollup'
+    assert {k: stats[k] for k in scanned} == scanned
+    assert (stats['total'], stats['unresolved'], stats['occurrences']) == (len(written), len(written) - 6, 55)
+    assert stats['today'] == stats['total'] and stats['recent_trend'][-1]['count'] == stats['total']
+
+
+def test_rollup_is_built_for_existing_errors_and_scan_is_the_fallback(db, monkeypatch):
+    from services import error_tracking_service as service
+    monkeypatch.setattr(service, 'db_manager', db)
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO system_errors (error_type, error_message, severity, is_resolved, created_at) "
+                     "VALUES (?, 'legacy', ?, ?, ?)",
+                     [('ApiError', 'critical', 0, '2026-10-10 08:15:00'), ('ApiError', 'critical', 1, '2026-10-10 09:00:00'),
+                      ('AuthError', 'warning', 0, '2026-10-01 23:59:59')])
+    conn.commit()
+    conn.close()
+
+    stats = service.get_error_stats()
+    assert stats['source'] == 'rollup'
+    assert (stats['total'], stats['unresolved'], stats['critical']) == (3, 2, 1)
+    assert rows(db, "SELECT COUNT(*) FROM error_stats_hourly") == [(3,)]
+
+    conn = db.get_connection()
+    conn.execute("DROP TABLE error_stats_hourly")
+    conn.commit()
+    conn.close()
+    fallback = service.get_error_stats()
+    assert fallback['source'] == 'scan'
+    assert {k: fallback[k] for k in ('total', 'unresolved', 'critical', 'by_type')} == \
+        {k: stats[k] for k in ('total', 'unresolved', 'critical', 'by_type')}
+
+
+def test_rollup_reads_running_totals_and_only_the_reporting_window(db, monkeypatch):
+    from services import error_tracking_service as service
+    monkeypatch.setattr(service, 'db_manager', db)
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO system_errors (error_type, error_message, severity, is_resolved, created_at) "
+                     "VALUES (?, 'old', 'error', 0, ?)", [('ApiError', '2025-01-05 10:00:00'), ('ApiError', '2025-03-01 11:00:00')])
+    conn.commit()
+    conn.close()
+    service.get_error_stats()  # Builds the rollup and its totals
+    sink = ErrorSink(db=db, flush_interval_ms=10_000)
+    sink.submit('KeyError', 'fresh', severity='error')
+    sink.flush()
+
+    # Hours outside the window are never read: dropping them leaves the stats unchanged
+    conn = db.get_connection()
+    conn.execute("DELETE FROM error_stats_hourly WHERE hour < '2026-01-01'")
+    conn.commit()
+    conn.close()
+    stats = service.get_error_stats()
+
+    assert stats['source'] == 'rollup'
+    assert (stats['total'], stats['unresolved'], stats['today']) == (3, 3, 1)
+    assert stats['by_type'] == {'ApiError': 2, 'KeyError': 1}
+    assert [point['count'] for point in stats['recent_trend']] == [1]
+    assert stats == dict(stats_from(db, service.SCAN_STATS_SQL['sqlite']), source='rollup', sink=stats['sink'])
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from database_manager import DatabaseManager
+from event_bus import BatchPolicy, EventBus, EventType
+
+
+@pytest.fixture
+def bus():
+    bus = EventBus(max_queue_size=100, publish_timeout=0.05)
+    bus.start()
+    yield bus
+    bus.stop()
+
+
+def test_slow_handler_only_stalls_its_own_event_type(bus):
+    release = threading.Event()
+    delivered = []
+    bus.subscribe(EventType.ANALYTICS_READY, lambda event: release.wait(5))
+    bus.subscribe(EventType.ROUNDUP_ACCRUED, lambda event: delivered.append(event.data['n']))
+
+    bus.publish(EventType.ANALYTICS_READY, 'u1', 'user', {})
+    for n in range(20):
+        bus.publish(EventType.ROUNDUP_ACCRUED, 'u1', 'user', {'n': n})
+
+    assert bus.drain(timeout=0.5) is False  # Analytics is still blocked...
+    assert sorted(delivered) == list(range(20))  # ...but round-ups were all delivered
+    release.set()
+    assert bus.drain()
+
+    stats = bus.get_event_stats()
+    assert stats['queue_size'] == 0 and stats['total_events'] == 21
+    latency = stats['handler_latency'][EventType.ANALYTICS_READY.value]
+    assert next(iter(latency.values()))['max_ms'] >= 400
+
+
+def test_full_queue_applies_backpressure_and_counts_rejections():
+    bus = EventBus(max_queue_size=2, publish_timeout=0.01, workers_per_type={EventType.SCORES_READY: 1})
+    started, release = threading.Event(), threading.Event()
+    bus.subscribe(EventType.SCORES_READY, lambda event: (started.set(), release.wait(5)))
+    bus.start()
+    try:
+        bus.publish(EventType.SCORES_READY, 'u1', 'user', {})
+        assert started.wait(2)  # The worker is now stuck on the first event
+        for _ in range(5):
+            bus.publish(EventType.SCORES_READY, 'u1', 'user', {})
+        queues = bus.get_event_stats()['queues'][EventType.SCORES_READY.value]
+        assert queues['rejected'] == 3 and queues['blocked_publishes'] == 3
+        assert queues['high_water'] == 2
+    finally:
+        release.set()
+        bus.stop()
+
+
+def test_outbox_replays_undelivered_events_after_restart(tmp_path):
+    db = DatabaseManager(db_path=str(tmp_path / 'outbox.db'))
+
+    # First process: events are persisted but the bus dies before handling them
+    crashed = EventBus()
+    crashed.enable_outbox(db)
+    crashed.publish(EventType.MAPPING_APPROVED, 'u9', 'user', {'mapping_id': 1})
+    crashed.publish(EventType.MAPPING_APPROVED, 'u9', 'user', {'mapping_id': 2})
+    assert crashed.get_outbox_stats() == {'pending': 2}
+
+    received = []
+    restarted = EventBus()
+    restarted.subscribe(EventType.MAPPING_APPROVED, lambda event: received.append(event.data['mapping_id']))
+    restarted.enable_outbox(db, replay_interval=0.05)
+    restarted.start()
+    try:
+        for _ in range(100):
+            if restarted.get_outbox_stats() == {'delivered': 2}:
+                break
+            threading.Event().wait(0.02)
+        assert sorted(received) == [1, 2]
+        assert restarted.get_outbox_stats() == {'delivered': 2}
+    finally:
+        restarted.stop()
+
+
+def test_high_volume_events_are_delivered_as_batches(bus):
+    batches, singles = [], []
+    bus.set_batching(EventType.ROUNDUP_ACCRUED, BatchPolicy(window=5.0, max_events=200))
+    bus.subscribe(EventType.ROUNDUP_ACCRUED, batches.append, batch=True)
+    bus.subscribe(EventType.ROUNDUP_ACCRUED, lambda event: singles.append(event.data['n']))
+
+    for n in range(450):
+        bus.publish(EventType.ROUNDUP_ACCRUED, 'u1', 'user', {'n': n})
+    bus.publish(EventType.ROUNDUP_ACCRUED, 'u2', 'user', {'n': -1})
+    assert bus.drain()
+
+    assert sorted(batch.data['count'] for batch in batches) == [1, 50, 200, 200]
+    assert {batch.tenant_id for batch in batches if batch.data['count'] == 1} == {'u2'}
+    assert sorted(singles) == list(range(-1, 450))
+    assert bus.get_event_stats()['queues'][EventType.ROUNDUP_ACCRUED.value]['published'] == 4
+
+
+def test_window_flushes_partial_batches(bus):
+    batches = []
+    bus.set_batching(EventType.INGEST_RAW, BatchPolicy(window=0.05, max_events=500))
+    bus.subscribe(EventType.INGEST_RAW, batches.append, batch=True)
+
+    for n in range(3):
+        bus.publish(EventType.INGEST_RAW, 'u1', 'user', {'transaction_id': n})
+    for _ in range(100):
+        if batches:
+            break
+        threading.Event().wait(0.01)
+
+    assert [batch.data['count'] for batch in batches] == [3]
+
+
+def test_refresh_events_are_coalesced_per_tenant(bus):
+    refreshes = []
+    bus.set_batching(EventType.ANALYTICS_READY, BatchPolicy(window=5.0, coalesce=True))
+    bus.subscribe(EventType.ANALYTICS_READY, lambda event: refreshes.append((event.tenant_id, event.data['v'])))
+
+    for v in range(10):
+        bus.publish(EventType.ANALYTICS_READY, 'u1', 'user', {'v': v})
+    bus.publish(EventType.ANALYTICS_READY, 'u2', 'user', {'v': 0})
+    assert bus.drain()
+
+    assert sorted(refreshes) == [('u1', 9), ('u2', 0)]
+    assert bus.get_event_stats()['batching']['coalesced'] == 9
@@ -0,0 +1,70 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from health_monitoring import HealthCheck, HealthMonitor, HealthStatus
+from request_profiler import request_profiler
+
+
+@pytest.fixture
+def monitor():
+    return HealthMonitor(autostart=False)
+
+
+def up(monitor, check_id, delay=0.0):
+    def check():
+        time.sleep(delay)
+        monitor._update_check(check_id, HealthCheck(check_id, HealthStatus.UP, delay, datetime.utcnow().isoformat()))
+    return check
+
+
+def test_hung_check_misses_its_deadline_without_delaying_others(monitor):
+    release = threading.Event()
+    monitor.check_functions = {'fast': up(monitor, 'fast'), 'slow': up(monitor, 'slow', 0.2),
+                               'hung': lambda: release.wait(5) and up(monitor, 'hung')()}
+    monitor.default_check_deadline = 0.5
+
+    start = time.monotonic()
+    monitor._run_all_checks()
+    assert time.monotonic() - start < 0.8
+
+    health = monitor.get_overall_health()
+    assert health is monitor.get_overall_health()  # Readers share the published snapshot
+    assert health['status'] == 'DOWN'
+    assert {check_id: check['status'] for check_id, check in health['checks'].items()} == {
+        'fast': 'UP', 'slow': 'UP', 'hung': 'DOWN'}
+    assert health['checks']['hung']['metadata']['timed_out']
+
+    # Still running, so the next cycle waits on the same future instead of stacking another
+    in_flight = monitor._inflight['hung']
+    monitor._run_all_checks()
+    assert monitor._inflight['hung'] is in_flight
+
+    release.set()
+    in_flight.result(timeout=1)
+    monitor._run_all_checks()
+    health = monitor.get_overall_health()
+    assert health['status'] == 'UP'
+    assert health['checks']['hung']['status'] == 'UP'
+
+
+def test_api_endpoint_check_reads_request_metrics_in_process(monitor):
+    app = Flask(__name__)
+    app.add_url_rule('/api/health', 'health', lambda: 'ok')
+    monitor.attach_app(app)
+    request_profiler.reset()
+    try:
+        for status_code in [200] * 6 + [500] * 4:
+            request_profiler.record_request('GET', '/api/health', 0.01, status_code=status_code)
+        assert monitor.run_check('api_endpoints')
+        assert not monitor.run_check('no_such_check')
+    finally:
+        request_profiler.reset()
+
+    checks = monitor.get_overall_health()['checks']
+    assert checks['api_health_check']['status'] == 'DOWN'
+    assert checks['api_health_check']['metadata']['requests'] == 10
+    assert checks['api_admin_health']['error_message'] == 'Route not registered'
@@ -0,0 +1,139 @@
+import json
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from database_manager import DatabaseManager
+from services.learning_service import LearningService
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'learning.db'))
+
+
+def execute(db, sql, params=()):
+    conn = db.get_connection()
+    rows = [tuple(row) for row in conn.execute(sql, params).fetchall()]
+    conn.commit()
+    conn.close()
+    return rows
+
+
+PARSED_RESPONSES = [
+    {'ticker': 'sbux', 'confidence': 0.95, 'status': 'approved'},
+    {'ticker': 'WMT', 'confidence': 0.7},
+    {'ticker': 'AMZN', 'confidence': 0.3, 'status': 'uncertain'},
+    {'ticker': 'TGT', 'status': 'rejected', 'confidence': 0.85},
+    {'ticker': '', 'confidence': 0.9},
+    {'confidence': 'high'},
+    {'ticker': 'COST'},
+    None,  # Unparseable
+]
+
+
+def seed_responses(db, rng, count):
+    now = datetime.now()
+    for index in range(count):
+        parsed = rng.choice(PARSED_RESPONSES)
+        execute(db, """
+            INSERT INTO ai_responses (merchant_name, category, prompt, raw_response, parsed_response,
+                                      processing_time_ms, model_version, is_error, created_at)
+            VALUES (?, ?, 'p', '{}', ?, 10, 'deepseek-chat', ?, ?)
+        """, (rng.choice(['Starbucks', 'STARBUCKS', 'Walmart', 'Target', 'Émile Café', '']),
+              rng.choice(['Food', 'Retail', '', None]),
+              'not json' if parsed is None else json.dumps(parsed),
+              1 if rng.random() < 0.1 else 0,
+              (now - timedelta(days=rng.randint(0, 40), seconds=index)).isoformat()))
+
+
+def reference_accuracy(db, days):
+    """The per-row Python computation calculate_accuracy used to run"""
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    rows = execute(db, "SELECT merchant_name, category, parsed_response, was_ai_correct FROM ai_responses "
+                       "WHERE was_ai_correct IS NOT NULL AND created_at >= ?", (cutoff,))
+    buckets, merchants, categories = {}, {}, {}
+    for merchant, category, parsed_raw, correct in rows:
+        try:
+            confidence = json.loads(parsed_raw).get('confidence', 0.5)
+            level = 'high' if confidence >= 0.8 else ('medium' if confidence >= 0.6 else 'low')
+            buckets.setdefault(level, []).append(correct)
+        except Exception:
+            pass
+        if (merchant or '').lower():
+            merchants.setdefault((merchant or '').lower(), []).append(correct)
+        categories.setdefault(category or 'Unknown', []).append(correct)
+
+    def summarize(groups, minimum=1):
+        return {key: {'total': len(values), 'correct': sum(values),
+                      'accuracy': round(sum(values) / len(values) * 100, 2)}
+                for key, values in groups.items() if len(values) >= minimum}
+
+    return {
+        'responses_with_feedback': len(rows),
+        'correct_predictions': sum(r[3] for r in rows),
+        'confidence_accuracy': summarize(buckets),
+        'merchant_accuracy': summarize(merchants, 3),
+        'category_accuracy': summarize(categories),
+    }
+
+
+def test_sql_breakdowns_match_row_by_row_computation(db):
+    service = LearningService(db=db)
+    service._ensure_tables()
+    rng = random.Random(11)
+    seed_responses(db, rng, 300)
+
+    unparseable = {row[0] for row in execute(db, "SELECT id FROM ai_responses WHERE parsed_response = 'not json'")}
+    for response_id in rng.sample(range(1, 301), 200):
+        if response_id in unparseable:
+            execute(db, "UPDATE ai_responses SET was_ai_correct = 0 WHERE id = ?", (response_id,))
+            continue
+        service.record_feedback(response_id, rng.choice(['approved', 'rejected']),
+                                correct_ticker=rng.choice([None, 'SBUX', 'WMT']))
+    # Rows written after the feedback pass are picked up on read
+    seed_responses(db, rng, 20)
+    execute(db, "UPDATE ai_responses SET was_ai_correct = 1 WHERE id > 300")
+
+    result = service.calculate_accuracy(days=30)
+    expected = reference_accuracy(db, 30)
+    for key, value in expected.items():
+        assert result[key] == value, key
+    assert list(result['confidence_accuracy']) == [level for level in ('high', 'medium', 'low')
+                                                   if level in expected['confidence_accuracy']]
+    assert execute(db, "SELECT COUNT(*) FROM ai_responses WHERE fields_extracted = 0") == [(0,)]
+
+
+def test_knowledge_base_prefers_admin_ticker_and_newest_prediction(db):
+    service = LearningService(db=db)
+    service._ensure_tables()
+    now = datetime.now()
+    responses = [
+        ('Starbucks', {'ticker': 'SBUX', 'confidence': 0.6}, 5),
+        ('STARBUCKS', {'ticker': 'sbux', 'confidence': 0.8}, 4),
+        ('Walmart', {'ticker': 'WMT', 'confidence': 0.9}, 3),
+        ('Walmart', {'ticker': 'WMT', 'confidence': 0.7}, 2),
+        ('Walmart', {'ticker': 'WMT', 'status': 'rejected'}, 1),
+        ('Target', {'ticker': 'TGT', 'confidence': 0.5}, 6),
+        ('Target', {'ticker': 'XYZ', 'confidence': 0.4}, 0),
+        ('Costco', {'ticker': 'COST', 'confidence': 'sure'}, 0),
+        ('Costco', {'ticker': 'COST', 'confidence': 0.9}, 1),
+    ]
+    for merchant, parsed, days_ago in responses:
+        execute(db, """
+            INSERT INTO ai_responses (merchant_name, prompt, raw_response, parsed_response, processing_time_ms,
+                                      model_version, created_at)
+            VALUES (?, 'p', '{}', ?, 10, 'deepseek-chat', ?)
+        """, (merchant, json.dumps(parsed), (now - timedelta(days=days_ago)).isoformat()))
+    service.record_feedback(7, 'rejected', correct_ticker='tgt')
+
+    knowledge_base = service.get_merchant_knowledge_base()
+    assert knowledge_base == [
+        {'merchant_name': 'target', 'ticker': 'TGT', 'average_confidence': 0.75, 'response_count': 2,
+         'admin_verified': True},
+        {'merchant_name': 'walmart', 'ticker': 'WMT', 'average_confidence': 0.8, 'response_count': 2,
+         'admin_verified': False},
+        {'merchant_name': 'starbucks', 'ticker': 'SBUX', 'average_confidence': 0.7, 'response_count': 2,
+         'admin_verified': False},
+    ]
@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from database_manager import DatabaseManager
+from llm_change_feed import LLMChangeFeed
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'feed.db'))
+
+
+def execute(db, sql, params=()):
+    conn = db.get_connection()
+    cur = conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+
+def add_mapping(db, merchant, user_id, status='pending'):
+    return execute(db, "INSERT INTO llm_mappings (merchant_name, ticker, status, user_id) VALUES (?, 'SBUX', ?, ?)",
+                   (merchant, status, user_id))
+
+
+def recount(db):
+    conn = db.get_connection()
+    depth = LLMChangeFeed._count_queue(conn.cursor())
+    conn.close()
+    return depth
+
+
+def test_write_paths_become_deltas_and_queue_depth_stays_exact(db):
+    add_mapping(db, 'Before Install', '5', 'approved')
+    feed = LLMChangeFeed(db=db)
+    feed.install()
+    assert feed.queue_depth == recount(db)
+
+    first = add_mapping(db, 'Starbucks', '5')
+    second = add_mapping(db, 'Walmart', '6')
+    add_mapping(db, 'Bulk', '2', 'approved')
+    db.update_llm_mapping_status(first, 'approved', admin_approved=True)
+    db.update_llm_mapping_status(second, 'rejected', admin_approved=-1)
+    execute(db, "UPDATE llm_mappings SET confidence = 0.5")  # Not a visible change: no delta
+    execute(db, "DELETE FROM llm_mappings WHERE merchant_name = 'Before Install'")
+
+    assert feed.poll() == 6
+    changes = feed.changes_since(0)
+    assert [d['type'] for d in changes['deltas']] == [
+        'mapping_inserted', 'mapping_inserted', 'mapping_inserted',
+        'mapping_approved', 'mapping_rejected', 'mapping_deleted']
+    assert changes['deltas'][3]['previous_status'] == 'pending'
+    assert changes['queue_depth'] == recount(db) == {
+        'total_entries': 2, 'total_mappings': 3, 'auto_applied': 0, 'approved': 2, 'pending': 0, 'rejected': 1}
+
+
+def test_reconnecting_clients_receive_only_what_they_missed(db):
+    feed = LLMChangeFeed(db=db, buffer_size=3)
+    feed.install()
+    for n in range(5):
+        add_mapping(db, f'Merchant {n}', '5')
+    feed.poll()
+
+    assert feed.changes_since(None)['reset'] is True  # First connect: load the page once
+    assert [d['seq'] for d in feed.changes_since(3)['deltas']] == [4, 5]  # From the in-memory buffer
+    from_table = feed.changes_since(1, limit=2)  # Older than the buffer: read from the feed table
+    assert ([d['seq'] for d in from_table['deltas']], from_table['seq'], from_table['has_more']) == ([2, 3], 3, True)
+    assert feed.stats['buffer_replays'] == 1 and feed.stats['table_replays'] == 1
+
+    # A restarted server resumes from the table; rows past retention force a reset
+    restarted = LLMChangeFeed(db=db)
+    assert [d['merchant_name'] for d in restarted.changes_since(4)['deltas']] == ['Merchant 4']
+    execute(db, "UPDATE llm_change_feed SET created_at = datetime('now', '-100 hours') WHERE seq <= 2")
+    assert restarted.purge() == 2
+    assert restarted.changes_since(1)['reset'] is True
+    assert restarted.changes_since(2)['reset'] is False
+
+
+def test_waiters_wake_on_new_changes(db):
+    feed = LLMChangeFeed(db=db, poll_interval=0.01)
+    feed.start()
+    try:
+        results, position = [], feed.last_seq
+        waiter = threading.Thread(target=lambda: results.append(feed.wait(position, timeout=5)))
+        waiter.start()
+        add_mapping(db, 'Target', '5')
+        waiter.join(timeout=5)
+        assert results[0]['deltas'][0]['merchant_name'] == 'Target'
+        assert feed.wait(feed.last_seq, timeout=0.05) is None
+    finally:
+        feed.stop()
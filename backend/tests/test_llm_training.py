@@ -0,0 +1,104 @@
+import csv
+import json
+
+import pytest
+
+from database_manager import DatabaseManager
+from llm_training import LLMTrainer, PYARROW_AVAILABLE
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'training.db'))
+
+
+def add_mappings(db, count):
+    conn = db.get_connection()
+    conn.executemany("""
+        INSERT INTO llm_mappings (merchant_name, ticker, category, confidence, status, admin_approved, company_name)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(f" Merchant {i % 40} ", f"t{i % 7}", 'Food' if i % 2 else None, 90 if i % 3 else None,
+           'approved' if i % 5 else 'pending', 1 if i % 11 else 0, None if i % 4 else 'Co')
+          for i in range(1, count + 1)])
+    conn.commit()
+    conn.close()
+
+
+def expected_ids(count):
+    return [i for i in range(1, count + 1) if i % 5 and i % 11]
+
+
+def read_ids(paths, fmt):
+    rows = []
+    for path in paths.values():
+        with open(path, encoding='utf-8') as f:
+            rows.extend(csv.DictReader(f) if fmt == 'csv' else (json.loads(line) for line in f))
+    return sorted(int(row['id']) for row in rows), rows
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_streaming_export_splits_by_merchant(db, tmp_path, fmt):
+    add_mappings(db, 500)
+    trainer = LLMTrainer(db.db_path)
+    export = trainer.stream_training_export(filename='run', fmt=fmt, validation_fraction=0.3, chunk_size=37,
+                                            export_dir=str(tmp_path / 'exports'))
+
+    ids, rows = read_ids(export['files'], fmt)
+    assert ids == expected_ids(500)
+    assert export['total_mappings'] == len(ids) == trainer.get_approved_mapping_stats()['total_mappings']
+    assert 0 < export['validation_rows'] < export['train_rows']
+
+    with open(export['files']['validation'], encoding='utf-8') as f:
+        validation = {row['merchant_name'] for row in (csv.DictReader(f) if fmt == 'csv' else map(json.loads, f))}
+    assert validation and all(LLMTrainer.training_split(m, 0.3) == 'validation' for m in validation)
+    assert {row['ticker'] for row in rows} <= {f"T{i}" for i in range(7)}
+
+
+@pytest.mark.parametrize('filename', ['../escape', '/tmp/abs', 'run.csv', 'run\n', 42])
+def test_export_rejects_unsafe_filenames(db, tmp_path, filename):
+    add_mappings(db, 10)
+    with pytest.raises(ValueError):
+        LLMTrainer(db.db_path).stream_training_export(filename=filename, export_dir=str(tmp_path / 'exports'))
+    assert not (tmp_path / 'escape_train.csv').exists()
+
+
+def test_resume_continues_after_last_recorded_chunk(db, tmp_path, monkeypatch):
+    add_mappings(db, 300)
+    trainer = LLMTrainer(db.db_path)
+    export_dir = str(tmp_path / 'exports')
+    stream = trainer.iter_approved_mappings
+
+    def interrupted(after_id=0, chunk_size=50):
+        chunks = stream(after_id=after_id, chunk_size=chunk_size)
+        yield next(chunks)
+        yield next(chunks)
+        raise RuntimeError('worker killed')
+
+    monkeypatch.setattr(trainer, 'iter_approved_mappings', interrupted)
+    with pytest.raises(RuntimeError):
+        trainer.stream_training_export(filename='run', chunk_size=50, export_dir=export_dir)
+    monkeypatch.undo()
+
+    with open(f"{export_dir}/run.progress.json") as f:
+        progress = json.load(f)
+    assert not progress['completed'] and progress['last_id'] == expected_ids(300)[99]
+    with open(f"{export_dir}/run_train.csv", 'a', encoding='utf-8') as f:
+        f.write('999999,written,after,the,last,chunk\n')
+
+    export = trainer.stream_training_export(filename='run', resume=True, chunk_size=50, export_dir=export_dir)
+    ids, _ = read_ids(export['files'], 'csv')
+    assert ids == expected_ids(300)
+
+    add_mappings(db, 100)  # Later approvals are picked up by the next resume
+    export = trainer.stream_training_export(filename='run', resume=True, chunk_size=50, export_dir=export_dir)
+    assert read_ids(export['files'], 'csv')[0] == expected_ids(300) + [300 + i for i in expected_ids(100)]
+    assert export['total_mappings'] == len(expected_ids(300)) + len(expected_ids(100))
+
+
+@pytest.mark.skipif(not PYARROW_AVAILABLE, reason='pyarrow not installed')
+def test_parquet_export(db, tmp_path):
+    import pyarrow.parquet as pq
+    add_mappings(db, 200)
+    export = LLMTrainer(db.db_path).stream_training_export(filename='run', fmt='parquet', chunk_size=64,
+                                                           export_dir=str(tmp_path / 'exports'))
+    assert sum(pq.read_table(path).num_rows for path in export['files'].values()) == len(expected_ids(200))
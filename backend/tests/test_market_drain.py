@@ -0,0 +1,113 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from alpaca_service import AlpacaService
+from benchmarks.fake_broker import FakeBroker
+from database_manager import DatabaseManager
+from market_drain import MarketDrainScheduler
+from order_aggregator import OrderAggregator
+
+
+class FakeClock:
+    market_open = 9.5
+    market_close = 16.0
+
+    def __init__(self, is_open=True):
+        self.open = is_open
+
+    def is_market_open(self):
+        return self.open
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'drain.db'))
+
+
+@pytest.fixture
+def broker():
+    with FakeBroker(latency=0.01) as fake:
+        yield fake
+
+
+@pytest.fixture
+def aggregator(db, broker):
+    service = AlpacaService()
+    service.base_url = broker.url
+    return OrderAggregator(broker=service, db=db, poll_interval=0.01)
+
+
+def rows(db, sql, params=()):
+    conn = db.get_connection()
+    result = conn.execute(sql, params).fetchall()
+    conn.close()
+    return result
+
+
+def test_drain_executes_batches_with_bounded_concurrency(db, aggregator, broker):
+    for i in range(60):
+        aggregator.enqueue(100 + i % 7, ['AAPL', 'SBUX', 'WMT'][i % 3], 1.00)
+    scheduler = MarketDrainScheduler(aggregator=aggregator, market_clock=FakeClock(), batch_size=20, max_concurrency=3)
+
+    report = scheduler.drain()
+
+    assert report['entries'] == 60 and report['batches'] == 3
+    assert report['filled'] == report['blocks'] == broker.submits == 9
+    assert report['entries_per_second'] > 0
+    assert rows(db, "SELECT status, COUNT(*) FROM market_queue GROUP BY status") == [('filled', 60)]
+    keys = rows(db, "SELECT DISTINCT idempotency_key FROM market_queue")
+    assert len(keys) == 9 and all(key.startswith('kamioi-block-') for (key,) in keys)
+    assert scheduler.get_stats()['totals']['entries'] == 60
+
+
+def test_retry_after_crash_does_not_double_buy(db, aggregator, broker):
+    for user_id in (1, 2, 3):
+        aggregator.enqueue(user_id, 'AAPL', 1.00)
+
+    # Worker leases the rows, creates the block and reaches the broker, then dies before recording it
+    entries = aggregator.claim_batch('dead-worker', 100, lease_seconds=0)
+    block = aggregator.create_blocks(entries)[0]
+    aggregator.broker.submit_order(symbol='AAPL', notional=str(block['notional']),
+                                   client_order_id=block['client_order_id'])
+    assert rows(db, "SELECT status FROM block_orders") == [('pending',)]
+
+    report = MarketDrainScheduler(aggregator=aggregator, market_clock=FakeClock()).drain()
+
+    assert report['recovered'] == 1
+    assert broker.submits == 1
+    order = next(iter(broker.orders.values()))
+    shares = rows(db, "SELECT SUM(shares) FROM portfolios WHERE ticker = 'AAPL'")[0][0]
+    assert Decimal(str(shares)).quantize(Decimal('0.000000001')) == Decimal(order['filled_qty'])
+    assert rows(db, "SELECT status FROM market_queue GROUP BY status") == [('filled',)]
+
+
+def test_block_taken_over_while_waiting_is_not_executed_twice(db, aggregator, broker):
+    aggregator.enqueue(1, 'AAPL', 1.00)
+    scheduler = MarketDrainScheduler(aggregator=aggregator, market_clock=FakeClock())
+
+    # The block's lease lapses while it waits for a worker, and recovery takes it over and fills it
+    block = aggregator.create_blocks(aggregator.claim_batch('slow-drain', 10, lease_seconds=0))[0]
+    assert aggregator.recover_stale_blocks('recovery') == 1
+
+    assert scheduler._execute(block, 'slow-drain') == 'skipped'
+    assert broker.submits == 1
+    assert rows(db, "SELECT status FROM market_queue") == [('filled',)]
+
+
+def test_expired_lease_is_reclaimed(db, aggregator):
+    aggregator.enqueue(5, 'WMT', 2.00)
+    assert len(aggregator.claim_batch('stalled-worker', 10, lease_seconds=0)) == 1
+    assert aggregator.claim_batch('other-worker', 10, lease_seconds=60)[0]['queue_id'] == 1
+    assert aggregator.claim_batch('third-worker', 10) == []
+    assert rows(db, "SELECT lease_owner, attempts FROM market_queue") == [('other-worker', 2)]
+
+
+def test_seconds_until_open_skips_weekend():
+    scheduler = MarketDrainScheduler(aggregator=object(), market_clock=FakeClock(is_open=False))
+    friday_evening = datetime(2026, 10, 16, 17, 0)
+    assert scheduler.seconds_until_open(friday_evening) == (2 * 24 + 16.5) * 3600
+
+    scheduler.market_clock.open = True
+    assert scheduler.seconds_until_open(friday_evening) == 0
@@ -0,0 +1,137 @@
+import random
+
+import pytest
+
+from database_manager import DatabaseManager
+from event_bus import BatchPolicy, EventBus, EventType
+from materialized_views import (
+    MaterializedViewManager, ViewDefinition, VIEW_DEFINITIONS, integrate_with_event_bus, topological_order
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'views.db'))
+
+
+@pytest.fixture
+def views(db):
+    manager = MaterializedViewManager(db=db)
+    manager.install()
+    return manager
+
+
+def execute(db, sql, params=()):
+    conn = db.get_connection()
+    cur = conn.execute(sql, params)
+    conn.commit()
+    result = cur.fetchall()
+    conn.close()
+    return result
+
+
+def add_users(db, count):
+    for user_id in range(1, count + 1):
+        execute(db, "INSERT INTO users (id, email, name, account_type) VALUES (?, ?, ?, ?)",
+                (user_id, f"u{user_id}@example.com", f"User {user_id}", ['individual', 'family', 'business'][user_id % 3]))
+
+
+def add_transactions(db, rng, count, users):
+    for _ in range(count):
+        ticker = rng.choice([None, 'AAPL', 'SBUX'])
+        execute(db, """
+            INSERT INTO transactions (user_id, date, merchant, amount, category, round_up, fee, total_debit,
+                                      ticker, shares, stock_price, status)
+            VALUES (?, ?, ?, ?, ?, 1.0, 0.25, 0, ?, ?, ?, 'pending')
+        """, (rng.randint(1, users), f"2026-10-{rng.randint(1, 28):02d}", rng.choice(['Starbucks', 'Walmart', None]),
+              round(rng.uniform(1, 80), 2), rng.choice(['Food', 'Retail', None]),
+              ticker, 0.01 if ticker else None, 150.0 if ticker else None))
+
+
+def normalise(rows):
+    return sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in rows)
+
+
+def assert_views_match_full_recompute(db, manager):
+    for view in manager.definitions.values():
+        stored = execute(db, f"SELECT {', '.join(view.column_names)} FROM {view.name}")
+        expected = execute(db, view.select_sql.format(filter=''))
+        assert normalise(stored) == normalise(expected), view.name
+
+
+def test_incremental_refresh_matches_full_recompute(db, views):
+    rng = random.Random(7)
+    add_users(db, 6)
+    add_transactions(db, rng, 120, 6)
+    first = views.refresh_pending()
+    assert first['mv_user_dashboard']['mode'] == 'incremental'
+    assert first['mv_admin_platform']['mode'] == 'full'
+    assert_views_match_full_recompute(db, views)
+
+    # Updates move rows between users and statuses; deletes shrink groups
+    execute(db, "UPDATE transactions SET user_id = 6 WHERE id IN (1, 2, 3)")
+    execute(db, "UPDATE transactions SET ticker = 'WMT', shares = 0.02, stock_price = 90 WHERE id BETWEEN 10 AND 20")
+    execute(db, "DELETE FROM transactions WHERE id BETWEEN 30 AND 40")
+    add_transactions(db, rng, 40, 6)
+    execute(db, "INSERT INTO llm_mappings (merchant_name, ticker, confidence, status) VALUES ('Starbucks', 'SBUX', 0.9, 'pending')")
+    execute(db, "UPDATE llm_mappings SET status = 'approved'")
+    views.refresh_pending()
+
+    assert_views_match_full_recompute(db, views)
+    assert execute(db, "SELECT COUNT(*) FROM mv_change_log") == [(0,)]
+
+
+def test_dashboard_reads_track_and_repair_stale_reads(db):
+    add_users(db, 2)
+    manager = MaterializedViewManager(db=db, refresh_on_read=False)
+    manager.install()
+    add_transactions(db, random.Random(1), 5, 1)
+
+    assert manager.get_user_dashboard(1)['kpis']['transaction_count'] == 0  # Served stale
+    assert manager.get_view_stats()['views']['mv_user_dashboard']['stale_reads'] == 1
+
+    manager.refresh_on_read = True
+    dashboard = manager.get_user_dashboard(1)
+    assert dashboard['kpis']['transaction_count'] == 5
+    assert sum(dashboard['category_breakdown'].values()) == pytest.approx(dashboard['kpis']['total_spent'])
+    stats = manager.get_view_stats()['views']['mv_user_dashboard']
+    assert (stats['stale_reads'], stats['read_refreshes'], stats['is_stale']) == (2, 1, False)
+
+
+def test_event_bus_events_trigger_refresh(db, views):
+    add_users(db, 3)
+    add_transactions(db, random.Random(3), 10, 3)
+    bus = EventBus(batching={EventType.INGEST_RAW: BatchPolicy(window=0.01)})
+    integrate_with_event_bus(bus, views)
+    bus.start()
+    try:
+        for transaction_id in range(1, 11):
+            bus.publish(EventType.INGEST_RAW, 'upload', 'user', {'transaction_id': transaction_id})
+        assert bus.drain()
+    finally:
+        bus.stop()
+
+    assert views.get_stale_views() == []
+    assert views.read_view('mv_admin_platform')[0]['total_transactions'] == 10 - len(
+        execute(db, "SELECT id FROM transactions WHERE user_id = 2"))
+
+
+def test_topological_order_and_cycles():
+    names = [view.name for view in topological_order(reversed(VIEW_DEFINITIONS))]
+    assert names.index('mv_user_dashboard') < names.index('mv_account_type_summary')
+    assert names.index('mv_user_dashboard') < names.index('mv_admin_platform')
+
+    a = ViewDefinition('a', ['k INTEGER'], ['k'], 'SELECT 1', 'k', 'k', dependencies=['b'])
+    b = ViewDefinition('b', ['k INTEGER'], ['k'], 'SELECT 1', 'k', 'k', dependencies=['a'])
+    with pytest.raises(ValueError, match='cycle'):
+        topological_order([a, b])
+
+
+def test_targeted_read_refreshes_dependent_views(db, views):
+    add_users(db, 3)
+    add_transactions(db, random.Random(5), 10, 1)
+
+    assert views.get_user_dashboard(1)['kpis']['transaction_count'] == 10
+    assert views.get_platform_overview()['total_transactions'] == 10
+    assert views.get_view_stats()['views']['mv_admin_platform']['stale_reads'] == 0
+    assert_views_match_full_recompute(db, views)
@@ -0,0 +1,125 @@
+import time
+from decimal import Decimal
+
+import pytest
+
+from alpaca_service import AlpacaService
+from benchmarks.fake_broker import FakeBroker
+from database_manager import DatabaseManager
+from order_aggregator import OrderAggregator, allocate_pro_rata, SHARE_QUANTUM
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'aggregator.db'))
+
+
+@pytest.fixture
+def broker():
+    with FakeBroker(prices={'AAPL': 187.33, 'MSFT': 401.10}) as fake:
+        yield fake
+
+
+def make_aggregator(db, broker, **kwargs):
+    service = AlpacaService()
+    service.base_url = broker.url
+    kwargs.setdefault('poll_interval', 0.01)
+    return OrderAggregator(broker=service, db=db, **kwargs)
+
+
+def rows(db, sql, params=()):
+    conn = db.get_connection()
+    result = conn.execute(sql, params).fetchall()
+    conn.close()
+    return result
+
+
+def test_allocate_pro_rata_sums_exactly():
+    weights = [Decimal('1.00'), Decimal('1.00'), Decimal('1.00')]
+    parts = allocate_pro_rata(Decimal('0.010000000'), weights, SHARE_QUANTUM)
+
+    assert sum(parts) == Decimal('0.010000000')
+    assert parts == [Decimal('0.003333334'), Decimal('0.003333333'), Decimal('0.003333333')]
+
+
+def test_allocate_pro_rata_follows_weights():
+    parts = allocate_pro_rata(Decimal('10.00'), [Decimal('1'), Decimal('3')], Decimal('0.01'))
+    assert parts == [Decimal('2.50'), Decimal('7.50')]
+
+
+def test_window_submits_one_block_order_per_ticker(db, broker):
+    aggregator = make_aggregator(db, broker)
+    conn = db.get_connection()
+    conn.execute("INSERT INTO portfolios (user_id, ticker, shares, average_price) VALUES (12, 'AAPL', 1.0, 150.0)")
+    conn.commit()
+    conn.close()
+
+    for user_id, amount in [(11, 1.00), (12, 1.00), (13, 2.50), (11, 1.00)]:
+        aggregator.enqueue(user_id, 'aapl', amount)
+    aggregator.enqueue(14, 'MSFT', 0.50)  # Below the $1 notional minimum
+
+    summary = aggregator.run_window()
+
+    assert summary['blocks'] == 1 and summary['filled'] == 1
+    assert broker.submits == 1
+    order = next(iter(broker.orders.values()))
+    assert order['symbol'] == 'AAPL' and order['notional'] == '5.50'
+
+    filled_qty = Decimal(order['filled_qty'])
+    allocated = rows(db, "SELECT shares FROM market_queue WHERE status = 'filled'")
+    assert len(allocated) == 4
+    assert sum(Decimal(str(share)) for (share,) in allocated) == filled_qty
+
+    positions = dict(rows(db, "SELECT user_id, shares FROM portfolios WHERE ticker = 'AAPL'"))
+    assert positions[11] == pytest.approx(float(filled_qty * 2 / Decimal('5.5')), abs=1e-8)
+    assert positions[12] == pytest.approx(1.0 + float(filled_qty / Decimal('5.5')), abs=1e-8)
+    assert len(rows(db, "SELECT id FROM portfolios WHERE user_id = 12")) == 1
+
+    assert rows(db, "SELECT status FROM market_queue WHERE ticker = 'MSFT'") == [('queued',)]
+
+
+def test_failed_submit_requeues_entries(db, broker):
+    broker.fail_submits = 1
+    aggregator = make_aggregator(db, broker)
+    aggregator.enqueue(21, 'AAPL', 1.00)
+
+    assert aggregator.run_window()['failed'] == 1
+    assert rows(db, "SELECT status, block_order_id FROM market_queue") == [('queued', None)]
+
+    assert aggregator.run_window()['filled'] == 1
+    assert rows(db, "SELECT status FROM market_queue") == [('filled',)]
+
+
+def test_open_block_is_settled_by_a_later_window(db, broker):
+    broker.fill_delay = 0.3
+    aggregator = make_aggregator(db, broker, fill_timeout=0.05)
+    aggregator.enqueue(31, 'MSFT', 3.00)
+
+    assert aggregator.run_window()['open'] == 1
+    assert rows(db, "SELECT status FROM block_orders") == [('submitted',)]
+
+    time.sleep(0.35)
+    assert aggregator.run_window()['reconciled'] == 1
+    assert rows(db, "SELECT status FROM block_orders") == [('filled',)]
+    assert rows(db, "SELECT status FROM market_queue") == [('filled',)]
+    assert broker.submits == 1
+
+
+def test_partial_fill_requeues_the_unfilled_remainder(db, broker):
+    broker.fill_ratio = Decimal('0.5')
+    aggregator = make_aggregator(db, broker)
+    aggregator.enqueue(41, 'AAPL', 1.00)
+    aggregator.enqueue(42, 'AAPL', 3.00)
+
+    assert aggregator.run_window()['filled'] == 1
+    order = next(iter(broker.orders.values()))
+    filled_cost = Decimal(rows(db, "SELECT filled_notional FROM block_orders")[0][0])
+    assert order['status'] == 'canceled' and filled_cost < Decimal('4.00')
+
+    requeued = rows(db, "SELECT user_id, amount FROM market_queue WHERE status = 'queued' ORDER BY user_id")
+    assert [user_id for user_id, _ in requeued] == [41, 42]
+    assert sum(Decimal(str(amount)) for _, amount in requeued) == Decimal('4.00') - filled_cost
+
+    broker.fill_ratio = Decimal('1')
+    assert aggregator.run_window()['filled'] == 1
+    assert rows(db, "SELECT status, COUNT(*) FROM market_queue GROUP BY status") == [('filled', 4)]
@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from price_service import (
+    PriceService, TokenBucket, AlpacaQuoteProvider, FinnhubQuoteProvider
+)
+
+PRICES = {'AAPL': 175.5, 'MSFT': 378.85, 'GOOGL': 142.3, 'AMZN': 155.75, 'SBUX': 98.45}
+
+
+class FakeQuoteServer:
+    """Local stand-in for the Alpaca and Finnhub quote endpoints"""
+
+    def __init__(self):
+        self.requests = []
+        self.prices = dict(PRICES)
+        self.fail = False
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                server.requests.append((url.path, params))
+                if server.fail:
+                    return self._send(500, {'message': 'boom'})
+                if url.path == '/v2/stocks/quotes/latest':
+                    symbols = params.get('symbols', '').split(',')
+                    quotes = {s: {'ap': server.prices[s], 'bp': server.prices[s] - 0.01}
+                              for s in symbols if s in server.prices}
+                    return self._send(200, {'quotes': quotes})
+                if url.path == '/v2/stocks/bars/latest':
+                    return self._send(200, {'bars': {}})
+                if url.path == '/api/v1/quote':
+                    price = server.prices.get(params.get('symbol'))
+                    return self._send(200, {'c': price or 0, 'd': 1.0, 'dp': 0.5, 'h': 0, 'l': 0, 'o': 0, 'pc': 0})
+                return self._send(404, {})
+
+            def _send(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def paths(self):
+        return [path for path, _ in self.requests]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def quote_server():
+    server = FakeQuoteServer()
+    yield server
+    server.close()
+
+
+def make_service(quote_server, alpaca_rate=200, **kwargs):
+    providers = [
+        AlpacaQuoteProvider(quote_server.url, calls_per_minute=alpaca_rate, api_key='key', api_secret='secret'),
+        FinnhubQuoteProvider(quote_server.url, calls_per_minute=60, api_key='finnhub-key'),
+    ]
+    kwargs.setdefault('refresh_interval', 0)
+    return PriceService(providers=providers, **kwargs)
+
+
+def test_token_bucket_allows_burst_then_refills():
+    bucket = TokenBucket(600, capacity=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    time.sleep(0.15)  # 10 tokens/second
+    assert bucket.try_acquire()
+
+
+def test_multiple_symbols_use_one_batched_request(quote_server):
+    service = make_service(quote_server)
+    quotes = service.get_quotes(['aapl', 'MSFT', 'GOOGL', 'AMZN', 'SBUX'])
+
+    assert set(quotes) == set(PRICES)
+    assert quotes['AAPL']['price'] == 175.5
+    assert quote_server.paths() == ['/v2/stocks/quotes/latest']
+    assert quote_server.requests[0][1]['symbols'] == 'AAPL,MSFT,GOOGL,AMZN,SBUX'
+
+
+def test_fresh_quotes_come_from_cache(quote_server):
+    service = make_service(quote_server)
+    service.get_quotes(['AAPL', 'MSFT'])
+    quotes = service.get_quotes(['AAPL', 'MSFT'])
+
+    assert len(quote_server.requests) == 1
+    assert quotes['AAPL']['cached'] is True
+    assert service.get_stats()['cache']['hits'] == 2
+
+
+def test_stale_quote_is_served_and_revalidated_in_background(quote_server):
+    service = make_service(quote_server, fresh_ttl=0.05, stale_ttl=60)
+    service.get_quote('AAPL')
+    quote_server.prices['AAPL'] = 180.0
+    time.sleep(0.1)
+
+    stale = service.get_quote('AAPL')
+    assert stale['price'] == 175.5
+    assert stale['stale'] is True
+
+    deadline = time.time() + 5
+    while time.time() < deadline and service.cache['AAPL']['quote']['price'] != 180.0:
+        time.sleep(0.02)
+    assert service.cache['AAPL']['quote']['price'] == 180.0
+    service.stop()
+
+
+def test_rate_limited_provider_falls_through_to_next(quote_server):
+    service = make_service(quote_server, alpaca_rate=1)
+    service.get_quote('AAPL')
+    quote = service.get_quote('MSFT')
+
+    assert quote['source'] == 'finnhub'
+    assert service.get_stats()['providers']['alpaca']['rate_limited'] == 1
+
+
+def test_provider_errors_leave_symbol_unpriced(quote_server):
+    quote_server.fail = True
+    service = make_service(quote_server)
+
+    assert service.get_quotes(['AAPL']) == {}
+    assert service.get_stats()['providers']['alpaca']['requests'] == 1
+
+
+def test_cache_is_bounded(quote_server):
+    service = make_service(quote_server, max_entries=2)
+    service.get_quotes(['AAPL', 'MSFT', 'GOOGL'])
+
+    assert list(service.cache) == ['MSFT', 'GOOGL']
+    assert service.get_stats()['cache']['evictions'] == 1
+
+
+def test_stock_api_manager_and_alpaca_share_the_service(quote_server, monkeypatch):
+    import stock_api_manager
+    import alpaca_service
+
+    service = make_service(quote_server)
+    monkeypatch.setattr(alpaca_service, 'price_service', service)
+    manager = stock_api_manager.StockAPIManager()
+    manager.price_service = service
+
+    prices = manager.get_multiple_stock_prices(['AAPL', 'MSFT', 'ZZZZ'])
+    assert prices['AAPL']['price'] == 175.5
+    assert prices['ZZZZ']['source'] == 'mock'
+
+    alpaca = alpaca_service.AlpacaService()
+    assert alpaca.get_multiple_prices(['AAPL', 'MSFT']) == {'AAPL': 175.5, 'MSFT': 378.85}
+    # Alpaca reads were served from the cache StockAPIManager filled
+    assert quote_server.paths().count('/v2/stocks/quotes/latest') == 1
@@ -0,0 +1,100 @@
+import sqlite3
+
+import pytest
+
+from query_instrumentation import QueryMonitor, InstrumentedConnection, normalize_sql
+import query_instrumentation
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    monitor = QueryMonitor()
+    monkeypatch.setattr(query_instrumentation, 'query_monitor', monitor)
+    return monitor
+
+
+@pytest.fixture
+def conn(monitor):
+    raw = sqlite3.connect(':memory:')
+    raw.execute('CREATE TABLE llm_mappings (id INTEGER PRIMARY KEY, merchant_name TEXT, ticker TEXT)')
+    raw.executemany('INSERT INTO llm_mappings (merchant_name, ticker) VALUES (?, ?)',
+                    [(f'Merchant {i}', 'AAPL') for i in range(50)])
+    raw.commit()
+    connection = InstrumentedConnection(raw)
+    yield connection
+    connection.close()
+
+
+def test_normalize_sql_groups_literals():
+    a = normalize_sql("SELECT * FROM users WHERE id = 5 AND name = 'bob'")
+    b = normalize_sql("SELECT *\n  FROM users WHERE id = 7 AND name = 'alice'")
+    assert a == b == 'SELECT * FROM users WHERE id = ? AND name = ?'
+    assert normalize_sql('SELECT 1 FROM t WHERE id IN (?, ?, ?)') == 'SELECT ? FROM t WHERE id IN (?...)'
+    assert normalize_sql('SELECT * FROM t WHERE id = :user_id') == 'SELECT * FROM t WHERE id = ?'
+
+
+def test_records_duration_and_rows(conn, monitor):
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM llm_mappings WHERE ticker = ?', ('AAPL',))
+    assert len(cursor.fetchall()) == 50
+    cursor.execute('UPDATE llm_mappings SET ticker = ? WHERE id <= ?', ('MSFT', 10))
+    conn.commit()
+
+    statements = {s['statement']: s for s in monitor.get_top_statements()}
+    select = statements['SELECT * FROM llm_mappings WHERE ticker = ?']
+    assert select['count'] == 1
+    assert select['rows'] == 50
+    update = statements['UPDATE llm_mappings SET ticker = ? WHERE id <= ?']
+    assert update['rows'] == 10
+
+
+def test_iteration_and_row_factory_pass_through(conn, monitor):
+    conn.row_factory = sqlite3.Row
+    rows = [row['merchant_name'] for row in conn.execute('SELECT merchant_name FROM llm_mappings')]
+    assert len(rows) == 50
+    assert monitor.get_top_statements()[0]['rows'] == 50
+
+
+def test_slow_queries_capture_plan(conn, monitor):
+    monitor.slow_threshold = 0.0
+    conn.execute("SELECT * FROM llm_mappings WHERE merchant_name LIKE ?", ('%Merch%',)).fetchall()
+
+    slow = monitor.get_slow_queries()
+    assert len(slow) == 1
+    assert slow[0]['statement'] == 'SELECT * FROM llm_mappings WHERE merchant_name LIKE ?'
+    assert any('SCAN' in line for line in slow[0]['plan'])
+
+
+def test_executemany_is_not_explained(conn, monitor):
+    monitor.slow_threshold = 0.0
+    conn.executemany("INSERT INTO llm_mappings (merchant_name, ticker) VALUES (?, ?)", [('A', 'X'), ('B', 'Y')])
+
+    assert monitor.get_slow_queries()[0]['plan'] is None
+
+
+class FakePostgresConnection:
+    """DB-API connection that records statements and rejects EXPLAIN, like a statement PostgreSQL can't plan"""
+    autocommit = False
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, statement, parameters=None):
+        self.statements.append(statement)
+        if statement.startswith('EXPLAIN'):
+            raise RuntimeError('syntax error')
+
+    def close(self):
+        pass
+
+
+def test_failed_postgres_explain_rolls_back_to_its_savepoint():
+    connection = FakePostgresConnection()
+    with pytest.raises(RuntimeError):
+        query_instrumentation._postgres_explain(connection, 'SELECT 1 FROM users WHERE id = %s', (1,))
+
+    assert connection.statements == ['SAVEPOINT query_monitor_explain', 'EXPLAIN SELECT 1 FROM users WHERE id = %s',
+                                     'ROLLBACK TO SAVEPOINT query_monitor_explain']
@@ -0,0 +1,74 @@
+import pytest
+from flask import Flask, jsonify
+
+from request_profiler import RequestProfiler, PROFILE_HEADER, PROFILE_ID_HEADER
+
+
+@pytest.fixture
+def profiler():
+    return RequestProfiler()
+
+
+@pytest.fixture
+def client(profiler):
+    app = Flask(__name__)
+    profiler.init_app(app)
+
+    @app.route('/items/<int:item_id>')
+    def get_item(item_id):
+        profiler.record_db_query(0.01)
+        profiler.record_db_query(0.02)
+        return jsonify({'id': item_id, 'name': 'x' * 100})
+
+    @app.route('/boom')
+    def boom():
+        return jsonify({'error': 'boom'}), 500
+
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+def test_records_per_route_stats(client, profiler):
+    for item_id in range(5):
+        assert client.get(f'/items/{item_id}').status_code == 200
+
+    stats = profiler.get_stats()
+    routes = {r['route']: r for r in stats['routes']}
+    item_stats = routes['/items/<int:item_id>']
+    assert item_stats['count'] == 5
+    assert item_stats['db']['queries_total'] == 10
+    assert item_stats['db']['time_total'] == pytest.approx(0.15)
+    assert item_stats['response_size']['bytes_max'] > 100
+    assert item_stats['latency']['p99'] >= item_stats['latency']['p50']
+
+
+def test_summary_tracks_server_errors(client, profiler):
+    client.get('/items/1')
+    client.get('/boom')
+
+    summary = profiler.get_summary()
+    assert summary['total_requests'] == 2
+    assert summary['server_errors'] == 1
+    assert summary['error_rate'] == pytest.approx(0.5)
+
+
+def test_prometheus_output(client, profiler):
+    client.get('/items/1')
+
+    text = profiler.render_prometheus()
+    assert 'kamioi_http_request_duration_seconds_count{method="GET",route="/items/<int:item_id>"} 1' in text
+    assert 'le="+Inf"' in text
+    assert 'kamioi_http_db_queries_total{method="GET",route="/items/<int:item_id>"} 2' in text
+
+
+def test_profile_header_requires_opt_in(client, profiler):
+    response = client.get('/items/1', headers={PROFILE_HEADER: '1'})
+    assert PROFILE_ID_HEADER not in response.headers
+
+    profiler.profiling_enabled = True
+    response = client.get('/items/1', headers={PROFILE_HEADER: '1'})
+    profile_id = response.headers[PROFILE_ID_HEADER]
+    profile = profiler.get_profile(profile_id)
+    assert profile['path'] == '/items/1'
+    assert 'function calls' in profile['stats']
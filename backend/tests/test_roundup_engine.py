@@ -0,0 +1,103 @@
+import pytest
+
+from database_manager import DatabaseManager
+from roundup_engine import RoundUpEngine
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'roundups.db'))
+
+
+@pytest.fixture
+def engine(db):
+    engine = RoundUpEngine(db=db)
+    engine.sweep_threshold = 1000  # Tests sweep explicitly
+    return engine
+
+
+def rows(db, sql, params=()):
+    conn = db.get_connection()
+    result = conn.execute(sql, params).fetchall()
+    conn.close()
+    return result
+
+
+def test_ledger_survives_a_new_engine_instance(db, engine):
+    engine.set_user_preference('7', 1.50)
+    engine.process_transactions([{'id': 100 + i, 'user_id': '7', 'amount': 4.25} for i in range(3)])
+    engine.process_transaction({'id': 200, 'user_id': '8', 'amount': 9.99})
+
+    restarted = RoundUpEngine(db=db)
+    assert restarted.get_pending_total('7') == 4.50
+    assert restarted.get_pending_total('8') == 1.00
+    assert [e['transaction_id'] for e in restarted.get_pending_entries('7')] == [100, 101, 102]
+    assert restarted.get_admin_stats()['total_transactions'] == 4
+
+
+def add_transactions(db, user_id, ids, ticker='AAPL'):
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO transactions (id, user_id, date, amount, total_debit, ticker) "
+                     "VALUES (?, ?, '2026-10-01', 2.0, 3.0, ?)", [(i, user_id, ticker) for i in ids])
+    conn.commit()
+    conn.close()
+
+
+def test_sweep_is_one_batch_and_resets_the_counter(db, engine):
+    add_transactions(db, 3, range(1, 6))
+    add_transactions(db, 4, [9])
+    engine.process_transactions([{'id': i, 'user_id': '3', 'amount': 2.00} for i in range(1, 6)])
+    engine.process_transaction({'id': 9, 'user_id': '4', 'amount': 2.00})
+
+    result = engine.manual_sweep('3')
+
+    assert result['swept'] and result['entries_swept'] == 5 and result['total_swept'] == 5.00
+    assert rows(db, "SELECT user_id, ticker, amount, status FROM market_queue") == [(3, 'AAPL', 5.0, 'queued')]
+    assert rows(db, "SELECT DISTINCT sweep_batch_id FROM roundup_ledger WHERE user_id = 3") == [(result['sweep_batch_id'],)]
+    assert engine.get_pending_total('3') == 0
+    assert engine.get_pending_total('4') == 1.00
+    assert engine.manual_sweep('3') == {'swept': False, 'reason': 'No pending round-ups'}
+
+    stats = engine.get_user_stats('3')
+    assert (stats['swept_count'], stats['pending_count'], stats['swept_roundups']) == (5, 0, 5.00)
+    assert engine.get_ledger_entries(status='pending')[0]['user_id'] == 4
+
+
+def test_rows_without_a_ticker_stay_pending(db, engine):
+    engine.sweep_threshold = 3.00
+    add_transactions(db, 5, [1, 2])
+    add_transactions(db, 5, [3], ticker=None)
+    engine.process_transactions([{'id': i, 'user_id': '5', 'amount': 1.00} for i in range(1, 4)])
+    engine.process_transaction({'user_id': '5', 'amount': 1.00})  # Manual round-up, transaction_id 0
+    assert engine.get_pending_total('5') == 4.00  # Over the threshold, but only $2 is mapped: no inline sweep
+
+    result = engine.manual_sweep('5')
+
+    assert (result['entries_swept'], result['queued_orders'], result['held_total']) == (2, 1, 2.00)
+    assert rows(db, "SELECT SUM(amount) FROM market_queue WHERE user_id = 5") == [(2.0,)]
+    assert engine.get_pending_total('5') == 2.00
+    assert [e['transaction_id'] for e in engine.get_pending_entries('5')] == [3, None]
+
+
+def test_accruing_past_the_threshold_queues_a_purchase(db, engine):
+    engine.sweep_threshold = 3.00
+    add_transactions(db, 6, range(1, 5), ticker='SBUX')
+    engine.process_transactions([{'id': i, 'user_id': '6', 'amount': 2.00} for i in (1, 2)])
+    assert rows(db, "SELECT COUNT(*) FROM market_queue") == [(0,)]
+
+    engine.process_transactions([{'id': i, 'user_id': '6', 'amount': 2.00} for i in (3, 4)])
+
+    assert rows(db, "SELECT user_id, ticker, amount, status FROM market_queue") == [(6, 'SBUX', 4.0, 'queued')]
+    assert engine.get_pending_total('6') == 0
+
+
+def test_rebuild_pending_totals_matches_the_ledger(db, engine):
+    engine.set_user_preference('6', 0.10)
+    engine.process_transactions([{'id': i, 'user_id': '6', 'amount': 3.00} for i in range(1, 31)])
+    conn = db.get_connection()
+    conn.execute("DELETE FROM roundup_pending_totals")
+    conn.commit()
+    conn.close()
+
+    assert engine.rebuild_pending_totals() == 1
+    assert engine.get_pending_total('6') == 3.00
@@ -0,0 +1,105 @@
+import pytest
+
+from database_manager import DatabaseManager
+from roundup_engine import RoundUpEngine
+from roundup_sweep import RoundUpSweeper
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'sweep.db'))
+
+
+@pytest.fixture
+def engine(db):
+    engine = RoundUpEngine(db=db)
+    engine.sweep_threshold = 1000  # No inline auto-sweeps while seeding
+    return engine
+
+
+def rows(db, sql, params=()):
+    conn = db.get_connection()
+    result = conn.execute(sql, params).fetchall()
+    conn.close()
+    return result
+
+
+def seed(db, engine, user_id, tickers):
+    conn = db.get_connection()
+    ids = []
+    for ticker in tickers:
+        cur = conn.execute("INSERT INTO transactions (user_id, date, amount, total_debit, ticker) VALUES (?, '2026-10-01', 5.0, 6.0, ?)",
+                           (user_id, ticker))
+        ids.append(cur.lastrowid)
+    conn.commit()
+    conn.close()
+    engine.process_transactions([{'id': txn_id, 'user_id': str(user_id), 'amount': 5.0} for txn_id in ids])
+
+
+def test_sweep_job_chunks_users_and_queues_per_ticker_totals(db, engine):
+    for user_id in range(1, 6):
+        seed(db, engine, user_id, ['AAPL'] * 6 + ['SBUX'] * 4)
+    seed(db, engine, 6, ['AAPL'] * 3)  # Below the $10 threshold
+    seed(db, engine, 7, [None] * 10)   # Over the threshold but never mapped to a ticker
+
+    progress = []
+    job = RoundUpSweeper(engine=engine, db=db, chunk_size=2).run(threshold=10.00, progress=progress.append)
+
+    assert job['status'] == 'completed'
+    assert (job['users_total'], job['users_swept'], job['batches']) == (5, 5, 3)
+    assert job['entries_swept'] == 50 and job['total_swept'] == 50.00
+    assert job['ticker_totals'] == {'AAPL': 30.0, 'SBUX': 20.0}
+    assert [p['users_swept'] for p in progress] == [2, 4, 5]
+
+    # Unmapped round-ups are held, not swept without a purchase
+    assert rows(db, "SELECT COUNT(*) FROM roundup_ledger WHERE status = 'pending'") == [(13,)]
+    assert engine.get_pending_total('7') == 10.00
+    assert rows(db, "SELECT COUNT(DISTINCT sweep_batch_id) FROM roundup_ledger WHERE status = 'swept'") == [(3,)]
+    assert rows(db, "SELECT user_id, ticker, amount FROM market_queue WHERE user_id = 1 ORDER BY ticker") == \
+        [(1, 'AAPL', 6.0), (1, 'SBUX', 4.0)]
+    assert rows(db, "SELECT COUNT(*) FROM market_queue") == [(10,)]
+    assert engine.get_pending_total('1') == 0 and engine.get_pending_total('6') == 3.00
+
+
+def test_rerun_after_crash_resumes_without_double_sweeping(db, engine, monkeypatch):
+    for user_id in range(1, 5):
+        seed(db, engine, user_id, ['WMT'] * 10)
+    sweeper = RoundUpSweeper(engine=engine, db=db, chunk_size=2)
+
+    real_sweep_chunk = sweeper._sweep_chunk
+    calls = []
+
+    def crash_on_second_chunk(job_id, user_ids):
+        calls.append(user_ids)
+        if len(calls) == 2:
+            raise RuntimeError('worker died')
+        return real_sweep_chunk(job_id, user_ids)
+
+    monkeypatch.setattr(sweeper, '_sweep_chunk', crash_on_second_chunk)
+    failed = sweeper.run(job_id='job-1', threshold=10.00)
+    assert failed['status'] == 'failed' and failed['users_swept'] == 2
+
+    monkeypatch.setattr(sweeper, '_sweep_chunk', real_sweep_chunk)
+    resumed = sweeper.run(job_id='job-1')
+
+    assert resumed['status'] == 'completed'
+    assert (resumed['users_total'], resumed['users_swept'], resumed['batches']) == (4, 4, 2)
+    assert rows(db, "SELECT COUNT(*), SUM(amount) FROM market_queue") == [(4, 40.0)]
+    assert sweeper.run(job_id='job-1')['batches'] == 2  # Completed jobs are not re-run
+
+
+def test_scheduled_sweep_picks_up_round_ups_mapped_after_accrual(db, engine):
+    engine.sweep_threshold = 2.00
+    seed(db, engine, 9, [None, None])  # Accrued before the mapper gave them a ticker
+    sweeper = RoundUpSweeper(engine=engine, db=db)
+    assert sweeper.run_if_due() is None
+    assert sweeper.list_jobs() == []
+
+    conn = db.get_connection()
+    conn.execute("UPDATE transactions SET ticker = 'WMT' WHERE user_id = 9")
+    conn.commit()
+    conn.close()
+    job = sweeper.run_if_due()
+
+    assert (job['status'], job['users_swept']) == ('completed', 1)
+    assert rows(db, "SELECT user_id, ticker, amount FROM market_queue") == [(9, 'WMT', 2.0)]
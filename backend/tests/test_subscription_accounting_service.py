@@ -0,0 +1,76 @@
+from datetime import date
+
+import pytest
+
+from database_manager import DatabaseManager
+from services.subscription_accounting_service import SubscriptionAccountingService
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(db_path=str(tmp_path / 'accounting.db'))
+    conn = db.get_connection()
+    # Journal schema from create_journal_tables.py
+    conn.executescript("""
+        CREATE TABLE journal_entries (id TEXT PRIMARY KEY, date TEXT NOT NULL, reference TEXT, description TEXT,
+            location TEXT, department TEXT, transaction_type TEXT NOT NULL, vendor_name TEXT, customer_name TEXT,
+            amount REAL NOT NULL, from_account TEXT NOT NULL, to_account TEXT NOT NULL, status TEXT DEFAULT 'draft',
+            created_at TEXT NOT NULL, created_by TEXT NOT NULL, updated_at TEXT, updated_by TEXT);
+        CREATE TABLE journal_entry_lines (id INTEGER PRIMARY KEY AUTOINCREMENT, journal_entry_id TEXT NOT NULL,
+            account_code TEXT NOT NULL, debit REAL DEFAULT 0, credit REAL DEFAULT 0, description TEXT,
+            created_at TEXT NOT NULL);
+        INSERT INTO subscription_plans (id, name, account_type, tier, price_monthly, price_yearly) VALUES
+            (1, 'Individual Basic', 'individual', 'basic', 31, 300),
+            (2, 'Business Pro', 'Business', 'pro', 60, 600);
+        INSERT INTO user_subscriptions (id, user_id, plan_id, status, billing_cycle, current_period_start,
+                                        current_period_end, amount) VALUES
+            (1, 1, 1, 'active', 'monthly', '2026-10-01 00:00:00', '2026-10-31 00:00:00', 31.0),
+            (2, 2, 2, 'active', 'monthly', '2026-10-10T08:30:00', '2026-11-08T08:30:00', 60.0),
+            (3, 3, 1, 'cancelled', 'monthly', '2026-10-01', '2026-10-31', 31.0);
+    """)
+    conn.commit()
+    conn.close()
+    return db
+
+
+def query(db, sql):
+    conn = db.get_connection()
+    rows = [tuple(row) for row in conn.execute(sql).fetchall()]
+    conn.close()
+    return rows
+
+
+def test_daily_recognition_posts_balanced_entries_once(db):
+    service = SubscriptionAccountingService(db)
+
+    summary = service.recognize_revenue_range(date(2026, 10, 15), date(2026, 10, 15))
+    assert summary['entries_created'] == 2
+    assert summary['total_amount'] == pytest.approx(1.0 + 2.0)
+    assert query(db, "SELECT reference, description, amount, from_account, to_account FROM journal_entries "
+                     "ORDER BY reference") == [
+        ('SUB-REV-1-20261015', 'Daily revenue recognition - Individual Basic - Day 15 of 31', 1.0, '23010', '40100'),
+        ('SUB-REV-2-20261015', 'Daily revenue recognition - Business Pro - Day 6 of 30', 2.0, '23030', '40300')
+    ]
+    assert query(db, "SELECT SUM(debit) - SUM(credit), COUNT(*) FROM journal_entry_lines") == [(0.0, 4)]
+
+    # Re-running the same day is a no-op
+    assert service.recognize_revenue_range(date(2026, 10, 15), date(2026, 10, 15))['entries_created'] == 0
+    assert query(db, "SELECT COUNT(*) FROM journal_entries") == [(2,)]
+
+
+def test_backfill_in_chunks_recognizes_each_period_exactly(db):
+    service = SubscriptionAccountingService(db)
+    service.recognize_revenue_range(date(2026, 10, 20), date(2026, 10, 20))
+
+    summary = service.backfill_revenue_recognition(date(2026, 9, 25), date(2026, 11, 15), chunk_days=7)
+    assert summary['chunks'] == 8
+    assert summary['entries_created'] == 31 + 30 - 2
+
+    # Only days inside each current period are recognized, and they add up to the period amount
+    assert query(db, """
+        SELECT subscription_id, COUNT(*), MIN(recognition_date), MAX(recognition_date), ROUND(SUM(amount), 2)
+        FROM subscription_revenue_recognition GROUP BY subscription_id ORDER BY subscription_id
+    """) == [(1, 31, '2026-10-01', '2026-10-31', 31.0), (2, 30, '2026-10-10', '2026-11-08', 60.0)]
+
+    with pytest.raises(ValueError):
+        service.backfill_revenue_recognition(date(2026, 11, 1), date(2026, 10, 1))
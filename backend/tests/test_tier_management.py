@@ -0,0 +1,89 @@
+import random
+import shutil
+
+import pytest
+
+from database_manager import DatabaseManager
+from tier_management import TierManagementSystem
+
+TIERS = [
+    ('individual', 1, 0, 10, 0.25), ('individual', 2, 11, 25, 0.20), ('individual', 3, 26, 50, 0.15),
+    ('individual', 4, 51, 100, 0.10), ('individual', 5, 101, None, 0.05),
+    ('family', 1, 0, 15, 0.10), ('family', 2, 16, 30, 0.08), ('family', 3, 31, 60, 0.06), ('family', 4, 61, None, 0.04),
+    ('business', 1, 0, 20, 0.10), ('business', 2, 21, 50, 0.08), ('business', 3, 51, 100, 0.06),
+    ('business', 4, 101, None, 0.04)
+]
+
+
+def build_tier_db(path, users, seed=11):
+    """DatabaseManager schema plus the AI fee columns and tables from safe_database_update.py"""
+    rng = random.Random(seed)
+    conn = DatabaseManager(db_path=str(path)).get_connection()
+    for column in ['current_tier INTEGER DEFAULT 1', 'monthly_transaction_count INTEGER DEFAULT 0',
+                   'loyalty_score DECIMAL(3,2) DEFAULT 0.0', 'total_lifetime_transactions INTEGER DEFAULT 0',
+                   'last_tier_check DATE']:
+        conn.execute(f"ALTER TABLE users ADD COLUMN {column}")
+    conn.execute("""
+        CREATE TABLE fee_tiers (id INTEGER PRIMARY KEY AUTOINCREMENT, account_type VARCHAR(20) NOT NULL,
+            tier_level INTEGER NOT NULL, min_transactions INTEGER NOT NULL, max_transactions INTEGER,
+            base_fee DECIMAL(5,2) NOT NULL, fee_type VARCHAR(10) NOT NULL DEFAULT 'fixed', is_active BOOLEAN DEFAULT 1)
+    """)
+    conn.execute("""
+        CREATE TABLE ai_fee_history (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            tier_at_time INTEGER DEFAULT 1, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+    """)
+    conn.executemany("INSERT INTO fee_tiers (account_type, tier_level, min_transactions, max_transactions, base_fee) "
+                     "VALUES (?, ?, ?, ?, ?)", TIERS)
+    conn.executemany("""
+        INSERT INTO users (id, email, name, account_type, current_tier, monthly_transaction_count,
+                           loyalty_score, total_lifetime_transactions)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(user_id, f"u{user_id}@example.com", f"User {user_id}", rng.choice(['individual', 'family', 'business']),
+           rng.randint(1, 3), rng.randint(0, 130), round(rng.random(), 2), rng.randint(0, 300))
+          for user_id in range(1, users + 1)])
+    conn.executemany("""
+        INSERT INTO transactions (user_id, date, merchant, amount, round_up, fee, total_debit, created_at)
+        VALUES (?, '2026-10-01', 'Starbucks', ?, ?, ?, 0, ?)
+    """, [(rng.randint(1, users), round(rng.uniform(1, 80), 2), rng.choice([0, 1.0, 2.0]), rng.choice([0, 0.1, 0.25]),
+           f"2026-10-{rng.randint(1, 28):02d} 12:00:00") for _ in range(users * 8)])
+    conn.commit()
+    conn.close()
+
+
+def tier_state(path):
+    conn = DatabaseManager(db_path=str(path)).get_connection()
+    rows = conn.execute("SELECT id, current_tier, last_tier_check IS NOT NULL FROM users ORDER BY id").fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+
+def test_set_based_run_matches_per_user_run(tmp_path):
+    build_tier_db(tmp_path / 'set.db', users=300)
+    shutil.copy(tmp_path / 'set.db', tmp_path / 'loop.db')
+
+    set_based = TierManagementSystem(str(tmp_path / 'set.db')).process_tier_updates()
+    per_user = TierManagementSystem(str(tmp_path / 'loop.db')).process_tier_updates(set_based=False)
+
+    assert set_based['success'] and per_user['success']
+    assert set_based['tier_changes']
+    assert set_based['tier_changes'] == per_user['tier_changes']
+    assert set_based['recommendations'] == per_user['recommendations']
+    assert set_based['processed_users'] == per_user['processed_users'] == 300
+    assert tier_state(tmp_path / 'set.db') == tier_state(tmp_path / 'loop.db')
+
+    # A second run finds nothing left to upgrade
+    assert TierManagementSystem(str(tmp_path / 'set.db')).process_tier_updates()['tier_changes'] == []
+
+
+def test_zero_fee_history_does_not_abort_upgrade(tmp_path):
+    build_tier_db(tmp_path / 'tiers.db', users=1)
+    conn = DatabaseManager(db_path=str(tmp_path / 'tiers.db')).get_connection()
+    conn.execute("UPDATE users SET account_type = 'individual', current_tier = 1, monthly_transaction_count = 30")
+    conn.execute("UPDATE transactions SET fee = 0, round_up = 1.0")
+    conn.commit()
+    conn.close()
+
+    result = TierManagementSystem(str(tmp_path / 'tiers.db')).process_tier_updates(user_id=1)
+    assert result['success']
+    assert result['tier_changes'][0]['new_tier'] == 3
+    assert result['tier_changes'][0]['benefits']['fee_reduction'] == '0%'
@@ -0,0 +1,58 @@
+import pytest
+from flask import Flask
+
+from blueprints.auth import helpers
+from blueprints.user import routes, user_bp
+from database_manager import DatabaseManager
+
+PROFILE_COLUMNS = ['phone', 'city', 'state', 'zip_code', 'address', 'account_number', 'first_name', 'last_name', 'dob',
+                   'ssn_last4', 'country', 'timezone', 'employer', 'occupation', 'annual_income', 'employment_status',
+                   'risk_tolerance']
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = DatabaseManager(db_path=str(tmp_path / 'user_routes.db'))
+    monkeypatch.setattr(routes, 'db_manager', db)
+    monkeypatch.setattr(helpers, 'db_manager', db)
+    return db
+
+
+@pytest.fixture
+def client(db):
+    app = Flask(__name__)
+    app.register_blueprint(user_bp)
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def user_id(db):
+    conn = db.get_connection()
+    # Profile columns the registration migrations add to users
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    for column in PROFILE_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE users ADD COLUMN {column} TEXT")
+    cur = conn.execute("INSERT INTO users (email, password, name, account_type) VALUES ('sam@example.com', 'x', 'Sam', 'individual')")
+    user_id = cur.lastrowid
+    conn.execute("INSERT INTO goals (user_id, title, target_amount) VALUES (?, 'Emergency fund', 500)", (user_id,))
+    conn.execute("INSERT INTO notifications (user_id, title, message) VALUES (?, 'Welcome', 'Hi')", (user_id,))
+    conn.executemany("INSERT INTO transactions (user_id, date, merchant, amount, total_debit) VALUES (?, '2026-10-01', 'Cafe', 4.5, 5.0)",
+                     [(user_id,)] * 3)
+    conn.commit()
+    conn.close()
+    return user_id
+
+
+def test_sqlite_routes_read_through_their_connection(client, user_id):
+    headers = {'Authorization': f'Bearer token_{user_id}'}
+
+    profile = client.get('/api/user/profile', headers=headers)
+    assert profile.status_code == 200
+    assert profile.get_json()['profile']['email'] == 'sam@example.com'
+
+    assert [goal['title'] for goal in client.get('/api/user/goals', headers=headers).get_json()['data']] == ['Emergency fund']
+    assert [note['title'] for note in client.get('/api/user/notifications', headers=headers).get_json()['data']] == ['Welcome']
+    assert routes._get_transaction_count(user_id) == 3
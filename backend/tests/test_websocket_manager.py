@@ -0,0 +1,114 @@
+import asyncio
+import json
+import time
+
+import pytest
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+from websocket_manager import WebSocketManager, resolve_identity
+import websocket_manager
+
+TOKENS = {
+    'token_1': {'id': 1, 'role': 'individual', 'dashboard': 'individual'},
+    'token_2': {'id': 2, 'role': 'individual', 'dashboard': 'individual'},
+    'admin_token_3': {'id': 3, 'role': 'admin', 'dashboard': 'admin'},
+}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    manager = WebSocketManager(heartbeat_interval=3600, authenticate=TOKENS.get)
+    monkeypatch.setattr(websocket_manager, 'ws_manager', manager)
+    manager.start('127.0.0.1', 0)
+    yield manager
+    manager.stop()
+
+
+def receive(client, message_type):
+    while True:
+        message = json.loads(client.recv(timeout=5))
+        if message['type'] == message_type:
+            return message
+
+
+def wait_for(condition):
+    deadline = time.time() + 5
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_topic_and_tenant_routing(server):
+    url = f"ws://127.0.0.1:{server.port}/ws"
+    with connect(f"{url}/user/main?token=token_1&topics=roundups") as alice, \
+            connect(f"{url}/user/main?token=token_2&user_id=1&topics=roundups") as bob, \
+            connect(f"{url}/admin/main", additional_headers={'Authorization': 'Bearer admin_token_3'}) as admin:
+        admin.send(json.dumps({'type': 'subscribe', 'topics': ['roundups', 'mappings']}))
+        assert receive(admin, 'subscribed')['topics'] == ['mappings', 'roundups']
+        wait_for(lambda: len(server.topic_index.get('roundups', ())) == 3)
+
+        server.publish('roundups', {'amount': 0.5}, tenant_id='1')
+        server.publish('mappings', {'mapping_id': 9}, admin_only=True)
+        server.publish('roundups', {'amount': 0.75}, tenant_id='2')
+
+        assert receive(alice, 'roundups_update')['data'] == {'amount': 0.5}
+        assert receive(bob, 'roundups_update')['data'] == {'amount': 0.75}  # Never sees tenant 1
+        assert [receive(admin, t)['data'] for t in ('roundups_update', 'mappings_update', 'roundups_update')] == \
+            [{'amount': 0.5}, {'mapping_id': 9}, {'amount': 0.75}]
+
+    stats = server.stats
+    assert (stats['messages_published'], stats['payloads_serialized'], stats['deliveries']) == (3, 3, 5)
+
+
+class StuckSocket:
+    """A client that never acknowledges a frame"""
+
+    def __init__(self):
+        self.closed_with = None
+
+    async def send(self, payload):
+        await asyncio.Event().wait()
+
+    async def close(self, code=1000, reason=''):
+        self.closed_with = code
+
+
+def test_slow_consumer_is_dropped_without_blocking_others():
+    manager = WebSocketManager(send_queue_size=2)
+
+    async def scenario():
+        manager.loop = asyncio.get_running_loop()
+        stuck, healthy = StuckSocket(), StuckSocket()
+        manager.add_connection(stuck, 'user', '1')
+        manager.add_connection(healthy, 'admin')
+        manager.subscribe(stuck, ['transactions'])
+        manager.subscribe(healthy, ['transactions'])
+        healthy_connection = manager.connection_info[healthy]
+        for n in range(4):
+            manager.publish('transactions', {'n': n}, tenant_id='1')
+            healthy_connection.queue = asyncio.Queue(maxsize=2)  # Keep the healthy client caught up
+        await asyncio.sleep(0)
+        return stuck, healthy
+
+    stuck, healthy = asyncio.run(scenario())
+    assert stuck.closed_with == 1013
+    assert stuck not in manager.connection_info and healthy in manager.connection_info
+    assert manager.stats['slow_consumers_dropped'] == 1
+    assert manager.stats['payloads_serialized'] == 4
+
+
+@pytest.mark.parametrize('path', ['/ws/user/main?user_id=1', '/ws/admin/main?token=bogus', '/ws/admin/main?token=token_1'])
+def test_connections_need_a_token_for_the_dashboard(server, path):
+    with connect(f"ws://127.0.0.1:{server.port}{path}") as client:
+        with pytest.raises(ConnectionClosed) as closed:
+            client.recv(timeout=5)
+    assert closed.value.rcvd.code == 1008
+    assert server.connection_info == {}
+
+
+def test_identity_comes_from_the_token_only():
+    assert resolve_identity(TOKENS['token_1'], 'family') == ('family', '1')
+    assert resolve_identity(TOKENS['admin_token_3'], 'user') == ('admin', None)
+    assert resolve_identity(TOKENS['token_2'], 'admin') is None
+    assert resolve_identity(None, 'user') is None
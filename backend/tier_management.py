@@ -7,8 +7,13 @@ import sqlite3
 import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
+import numpy as np
 from ai_fee_engine import AIFeeEngine
 
+USER_COLUMNS = ['id', 'email', 'account_type', 'current_tier', 'monthly_transaction_count',
+                'loyalty_score', 'total_lifetime_transactions', 'created_at']
+BENEFIT_TRANSACTIONS = 20  # Recent transactions used to estimate upgrade savings
+
 class TierManagementSystem:
     """AI-powered tier management with automatic upgrades and optimizations"""
     
@@ -16,14 +21,19 @@ class TierManagementSystem:
         self.db_path = db_path
         self.ai_engine = AIFeeEngine(db_path)
     
-    def process_tier_updates(self, user_id: int = None) -> Dict:
+    def process_tier_updates(self, user_id: int = None, set_based: bool = True) -> Dict:
         """
         Process tier updates for all users or specific user
         Returns summary of tier changes and recommendations
+
+        A full run uses the set-based evaluator; set_based=False keeps the
+        per-user path, which a single user_id always takes.
         """
         try:
             if user_id:
                 users_to_process = [self._get_user_info(user_id)]
+            elif set_based:
+                return self._process_all_tier_updates()
             else:
                 users_to_process = self._get_all_users()
             
@@ -74,16 +84,126 @@ class TierManagementSystem:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def _process_all_tier_updates(self) -> Dict:
+        """
+        Set-based tier run: one users scan, one fee_tiers scan, upgrades decided
+        on numpy arrays, one windowed query for the upgraded users' recent
+        transactions and every tier change applied in a single transaction.
+        Produces the same result as the per-user loop.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT {', '.join(USER_COLUMNS)}
+                FROM users
+                ORDER BY monthly_transaction_count DESC
+            """)
+            users = [dict(zip(USER_COLUMNS, row)) for row in cursor.fetchall()]
+            
+            cursor.execute("""
+                SELECT account_type, tier_level, min_transactions, max_transactions, base_fee
+                FROM fee_tiers
+                WHERE is_active = 1
+                ORDER BY account_type, tier_level
+            """)
+            tiers = cursor.fetchall()
+            
+            new_tiers = self._decide_tier_upgrades(users, tiers)
+            upgraded = [index for index, user in enumerate(users) if new_tiers[index] is not None]
+            base_fees = {(account_type, tier_level): base_fee for account_type, tier_level, _, _, base_fee in tiers}
+            
+            recent = self._get_recent_transactions(cursor, [users[index]['id'] for index in upgraded])
+            
+            tier_changes = []
+            for index in upgraded:
+                user = users[index]
+                new_tier = new_tiers[index]
+                tier_changes.append({
+                    'user_id': user['id'],
+                    'email': user['email'],
+                    'old_tier': user['current_tier'],
+                    'new_tier': new_tier,
+                    'upgrade_reason': f"Monthly transactions ({user['monthly_transaction_count']}) qualify for tier {new_tier}",
+                    'benefits': self._summarize_tier_benefits(
+                        new_tier, base_fees[(user['account_type'], new_tier)], recent.get(user['id'], []))
+                })
+            
+            # All tier changes land together or not at all
+            cursor.executemany("""
+                UPDATE users 
+                SET current_tier = ?, last_tier_check = CURRENT_DATE
+                WHERE id = ?
+            """, [(change['new_tier'], change['user_id']) for change in tier_changes])
+            conn.commit()
+        finally:
+            conn.close()
+        
+        recommendations = []
+        for user in users:
+            recommendations.extend(self._recommendations_for(user))
+        
+        self._update_tier_statistics()
+        
+        return {
+            'success': True,
+            'tier_changes': tier_changes,
+            'recommendations': recommendations,
+            'processed_users': len(users),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def _decide_tier_upgrades(self, users: List[Dict], tiers: List[Tuple]) -> List[Optional[int]]:
+        """
+        Vectorized form of the _analyze_user_tier rule: the lowest active tier
+        whose transaction range holds the monthly count and whose level is
+        above the current tier. Returns the new tier per user, or None.
+        """
+        counts = np.array([user['monthly_transaction_count'] or 0 for user in users], dtype=np.int64)
+        current = np.array([user['current_tier'] or 0 for user in users], dtype=np.int64)
+        account_types = np.array([user['account_type'] or '' for user in users], dtype=object)
+        new_tiers = np.zeros(len(users), dtype=np.int64)
+        
+        # tiers arrive ordered by level, so the first match per user wins
+        for account_type, tier_level, min_trans, max_trans, _ in tiers:
+            candidates = (account_types == account_type) & (new_tiers == 0) & (counts >= min_trans) & (current < tier_level)
+            if max_trans is not None:
+                candidates &= counts <= max_trans
+            new_tiers[candidates] = tier_level
+        
+        return [int(tier) if tier else None for tier in new_tiers]
+    
+    def _get_recent_transactions(self, cursor, user_ids: List[int]) -> Dict[int, List[Tuple]]:
+        """Latest BENEFIT_TRANSACTIONS transactions for each user, in one windowed query"""
+        if not user_ids:
+            return {}
+        
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS tier_upgrade_users (user_id INTEGER PRIMARY KEY)")
+        cursor.execute("DELETE FROM tier_upgrade_users")
+        cursor.executemany("INSERT INTO tier_upgrade_users (user_id) VALUES (?)", [(user_id,) for user_id in user_ids])
+        cursor.execute("""
+            SELECT user_id, amount, round_up, fee FROM (
+                SELECT t.user_id, t.amount, t.round_up, t.fee,
+                       ROW_NUMBER() OVER (PARTITION BY t.user_id ORDER BY t.created_at DESC, t.id DESC) AS position
+                FROM transactions t
+                JOIN tier_upgrade_users u ON u.user_id = t.user_id
+            )
+            WHERE position <= ?
+            ORDER BY user_id, position
+        """, (BENEFIT_TRANSACTIONS,))
+        
+        recent = {}
+        for user_id, amount, round_up, fee in cursor.fetchall():
+            recent.setdefault(user_id, []).append((amount, round_up, fee))
+        cursor.execute("DROP TABLE tier_upgrade_users")
+        return recent
+    
     def _get_user_info(self, user_id: int) -> Dict:
         """Get user information for tier analysis"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT id, email, account_type, current_tier, monthly_transaction_count,
-                   loyalty_score, total_lifetime_transactions, created_at
-            FROM users WHERE id = ?
-        """, (user_id,))
+        cursor.execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE id = ?", (user_id,))
         
         user = cursor.fetchone()
         conn.close()
@@ -91,25 +211,15 @@ class TierManagementSystem:
         if not user:
             raise ValueError(f"User {user_id} not found")
         
-        return {
-            'id': user[0],
-            'email': user[1],
-            'account_type': user[2],
-            'current_tier': user[3],
-            'monthly_transaction_count': user[4],
-            'loyalty_score': user[5],
-            'total_lifetime_transactions': user[6],
-            'created_at': user[7]
-        }
+        return dict(zip(USER_COLUMNS, user))
     
     def _get_all_users(self) -> List[Dict]:
         """Get all users for batch tier processing"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT id, email, account_type, current_tier, monthly_transaction_count,
-                   loyalty_score, total_lifetime_transactions, created_at
+        cursor.execute(f"""
+            SELECT {', '.join(USER_COLUMNS)}
             FROM users
             ORDER BY monthly_transaction_count DESC
         """)
@@ -117,19 +227,7 @@ class TierManagementSystem:
         users = cursor.fetchall()
         conn.close()
         
-        return [
-            {
-                'id': user[0],
-                'email': user[1],
-                'account_type': user[2],
-                'current_tier': user[3],
-                'monthly_transaction_count': user[4],
-                'loyalty_score': user[5],
-                'total_lifetime_transactions': user[6],
-                'created_at': user[7]
-            }
-            for user in users
-        ]
+        return [dict(zip(USER_COLUMNS, user)) for user in users]
     
     def _analyze_user_tier(self, user_id: int) -> Dict:
         """Analyze if user should be upgraded to higher tier"""
@@ -299,19 +397,25 @@ class TierManagementSystem:
         cursor.execute("""
             SELECT amount, round_up, fee FROM transactions 
             WHERE user_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT 20
-        """, (user_id,))
+            ORDER BY created_at DESC, id DESC 
+            LIMIT ?
+        """, (user_id, BENEFIT_TRANSACTIONS))
         
         recent_transactions = cursor.fetchall()
         conn.close()
         
+        return self._summarize_tier_benefits(new_tier, new_base_fee, recent_transactions)
+    
+    def _summarize_tier_benefits(self, new_tier: int, new_base_fee: float, recent_transactions: List[Tuple]) -> Dict:
+        """Benefits of a tier upgrade from (amount, round_up, fee) rows, newest first"""
         if not recent_transactions:
             return {'savings_per_transaction': 0, 'monthly_savings': 0}
         
         # Calculate average savings per transaction
         total_savings = 0
+        current_fee = 0
         for amount, round_up, current_fee in recent_transactions:
+            current_fee = current_fee or 0
             if round_up:
                 if new_tier > 1:  # Assuming percentage-based for business, fixed for others
                     old_fee = current_fee
@@ -319,7 +423,7 @@ class TierManagementSystem:
                     savings = max(0, old_fee - new_fee)
                     total_savings += savings
         
-        avg_savings_per_transaction = total_savings / len(recent_transactions) if recent_transactions else 0
+        avg_savings_per_transaction = total_savings / len(recent_transactions)
         
         # Estimate monthly savings
         monthly_transactions = len(recent_transactions) * 1.5  # Estimate based on recent activity
@@ -329,16 +433,19 @@ class TierManagementSystem:
             'savings_per_transaction': round(avg_savings_per_transaction, 2),
             'monthly_savings': round(estimated_monthly_savings, 2),
             'tier_level': new_tier,
-            'fee_reduction': f"{((current_fee - new_base_fee) / current_fee * 100):.1f}%" if recent_transactions else "0%"
+            'fee_reduction': f"{((current_fee - new_base_fee) / current_fee * 100):.1f}%" if current_fee else "0%"
         }
     
     def _generate_user_recommendations(self, user_id: int) -> List[Dict]:
         """Generate AI-powered recommendations for user"""
-        user = self._get_user_info(user_id)
+        return self._recommendations_for(self._get_user_info(user_id))
+    
+    def _recommendations_for(self, user: Dict) -> List[Dict]:
+        """Recommendation rules applied to an already-loaded user row"""
         recommendations = []
         
         # Transaction frequency recommendations
-        monthly_count = user['monthly_transaction_count']
+        monthly_count = user['monthly_transaction_count'] or 0
         if monthly_count < 5:
             recommendations.append({
                 'type': 'engagement',
@@ -357,7 +464,7 @@ class TierManagementSystem:
             })
         
         # Loyalty recommendations
-        loyalty_score = user['loyalty_score']
+        loyalty_score = user['loyalty_score'] or 0
         if loyalty_score < 0.4:
             recommendations.append({
                 'type': 'retention',
@@ -368,7 +475,7 @@ class TierManagementSystem:
             })
         
         # Lifetime value recommendations
-        lifetime_transactions = user['total_lifetime_transactions']
+        lifetime_transactions = user['total_lifetime_transactions'] or 0
         if lifetime_transactions > 100:
             recommendations.append({
                 'type': 'premium',
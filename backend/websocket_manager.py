@@ -1,163 +1,372 @@
 """
 WebSocket Manager for Kamioi Platform
-Handles real-time updates for all dashboards
+Handles real-time updates for all dashboards.
+
+One persistent asyncio loop (in its own thread) owns every connection. Clients
+subscribe to topics; published messages are serialized once and routed only to
+connections subscribed to the topic and allowed to see the tenant. Each
+connection has a bounded send queue drained by its own task, and a client that
+falls too far behind is disconnected instead of slowing everyone else down.
 """
 
+import os
 import json
 import asyncio
 import websockets
 from datetime import datetime
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlsplit, parse_qs
 import threading
 import time
 
-class WebSocketManager:
-    def __init__(self):
-        self.connections: Dict[str, Set[websockets.WebSocketServerProtocol]] = {
-            'user': set(),
-            'family': set(),
-            'business': set(),
-            'admin': set()
+ALL_TOPICS = '*'
+ADMIN_ROLES = ('admin', 'superadmin')
+
+
+def authenticate_token(token: Optional[str]) -> Optional[Dict]:
+    """Resolve a connect token to a user exactly as the HTTP API does (Authorization: Bearer)"""
+    from blueprints.auth.helpers import get_auth_user_from_token
+    return get_auth_user_from_token(token)
+
+
+def resolve_identity(user: Optional[Dict], requested_dashboard: str):
+    """
+    Dashboard type and tenant for an authenticated user, or None if the user may
+    not open the requested dashboard. Admins see every tenant; everyone else is
+    pinned to their own user id and can never open the admin dashboard.
+    """
+    if not user:
+        return None
+    if user.get('role') in ADMIN_ROLES or user.get('dashboard') == 'admin':
+        return 'admin', None
+    if requested_dashboard == 'admin':
+        return None
+    return requested_dashboard, str(user['id'])
+
+
+class Connection:
+    """A client socket plus its subscriptions and bounded outbound queue"""
+
+    def __init__(self, websocket, dashboard_type: str, tenant_id: Optional[str], max_queue: int):
+        self.websocket = websocket
+        self.dashboard_type = dashboard_type
+        self.tenant_id = str(tenant_id) if tenant_id is not None else None
+        self.topics: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.connected_at = datetime.utcnow().isoformat()
+        self.sent = 0
+        self.sender = None
+
+    @property
+    def is_admin(self) -> bool:
+        return self.dashboard_type == 'admin'
+
+    def can_see(self, tenant_id: Optional[str], admin_only: bool) -> bool:
+        if self.is_admin:
+            return True
+        if admin_only:
+            return False
+        return tenant_id is None or self.tenant_id == str(tenant_id)
+
+    def offer(self, payload: str) -> bool:
+        """Queue a serialized message; False means the client is too far behind"""
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def drain(self):
+        while True:
+            payload = await self.queue.get()
+            if payload is None:
+                return
+            await self.websocket.send(payload)
+            self.sent += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'dashboard_type': self.dashboard_type,
+            'user_id': self.tenant_id,
+            'topics': sorted(self.topics),
+            'queue_depth': self.queue.qsize(),
+            'sent': self.sent,
+            'connected_at': self.connected_at
         }
-        self.connection_info: Dict[websockets.WebSocketServerProtocol, Dict] = {}
-        
-    def add_connection(self, websocket: websockets.WebSocketServerProtocol, dashboard_type: str, user_id: str = None):
-        """Add a new WebSocket connection"""
-        self.connections[dashboard_type].add(websocket)
-        self.connection_info[websocket] = {
-            'dashboard_type': dashboard_type,
-            'user_id': user_id,
-            'connected_at': datetime.utcnow().isoformat()
+
+
+class WebSocketManager:
+    def __init__(self, send_queue_size: int = None, heartbeat_interval: float = 30, authenticate=None):
+        self.send_queue_size = send_queue_size or int(os.getenv('KAMIOI_WS_SEND_QUEUE', '256'))
+        self.heartbeat_interval = heartbeat_interval
+        self.authenticate = authenticate or authenticate_token  # token -> user dict or None
+        self.connection_info: Dict[object, Connection] = {}
+        self.topic_index: Dict[str, Set[Connection]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread = None
+        self._stop = None
+        self._ready = threading.Event()
+        self.resume_handlers: Dict[str, tuple] = {}
+        self.stats = {
+            'messages_published': 0,
+            'payloads_serialized': 0,
+            'deliveries': 0,
+            'slow_consumers_dropped': 0,
+            'undeliverable': 0  # Published while the server loop was not running
         }
+
+    @property
+    def connections(self) -> Dict[str, Set]:
+        """Sockets grouped by dashboard type"""
+        grouped = {'user': set(), 'family': set(), 'business': set(), 'admin': set()}
+        for websocket, connection in list(self.connection_info.items()):
+            grouped.setdefault(connection.dashboard_type, set()).add(websocket)
+        return grouped
+
+    # ------------------------------------------------------------------
+    # Connections and subscriptions (loop thread only)
+    # ------------------------------------------------------------------
+
+    def add_connection(self, websocket, dashboard_type: str, user_id: str = None) -> Connection:
+        """Add a new WebSocket connection and start its sender task"""
+        connection = Connection(websocket, dashboard_type, user_id, self.send_queue_size)
+        connection.sender = asyncio.get_running_loop().create_task(self._run_sender(connection))
+        self.connection_info[websocket] = connection
         print(f"WebSocket connection added: {dashboard_type} (user: {user_id})")
-    
-    def remove_connection(self, websocket: websockets.WebSocketServerProtocol):
+        return connection
+
+    def remove_connection(self, websocket):
         """Remove a WebSocket connection"""
-        if websocket in self.connection_info:
-            info = self.connection_info[websocket]
-            dashboard_type = info['dashboard_type']
-            self.connections[dashboard_type].discard(websocket)
-            del self.connection_info[websocket]
-            print(f"WebSocket connection removed: {dashboard_type}")
-    
+        connection = self.connection_info.pop(websocket, None)
+        if connection is None:
+            return
+        for topic in connection.topics:
+            self.topic_index.get(topic, set()).discard(connection)
+        if connection.sender and not connection.sender.done():
+            connection.sender.cancel()
+        print(f"WebSocket connection removed: {connection.dashboard_type}")
+
+    async def _run_sender(self, connection: Connection):
+        try:
+            await connection.drain()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.remove_connection(connection.websocket)
+
+    def subscribe(self, websocket, topics: List[str]) -> List[str]:
+        connection = self.connection_info.get(websocket)
+        if connection is None:
+            return []
+        for topic in topics:
+            if topic:
+                connection.topics.add(topic)
+                self.topic_index.setdefault(topic, set()).add(connection)
+        return sorted(connection.topics)
+
+    def unsubscribe(self, websocket, topics: List[str]) -> List[str]:
+        connection = self.connection_info.get(websocket)
+        if connection is None:
+            return []
+        for topic in topics:
+            connection.topics.discard(topic)
+            self.topic_index.get(topic, set()).discard(connection)
+        return sorted(connection.topics)
+
+    # ------------------------------------------------------------------
+    # Fan-out
+    # ------------------------------------------------------------------
+
+    def publish(self, topic: str, data: Dict, tenant_id: str = None, admin_only: bool = False,
+                message_type: str = None):
+        """
+        Thread-safe: route a message to the topic's subscribers. tenant_id limits it to
+        that tenant's connections (admins see every tenant); admin_only limits it to admins.
+        """
+        message = {
+            'type': message_type or f"{topic}_update",
+            'topic': topic,
+            'data': data,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        self.stats['messages_published'] += 1
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            self.stats['undeliverable'] += 1
+            return
+        try:
+            if self._in_loop():
+                self._fan_out(topic, message, tenant_id, admin_only)
+            else:
+                loop.call_soon_threadsafe(self._fan_out, topic, message, tenant_id, admin_only)
+        except RuntimeError:
+            self.stats['undeliverable'] += 1
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _fan_out(self, topic: str, message: Dict, tenant_id: str = None, admin_only: bool = False):
+        targets = self.topic_index.get(topic, set()) | self.topic_index.get(ALL_TOPICS, set())
+        self._deliver([c for c in targets if c.can_see(tenant_id, admin_only)], message)
+
+    def _deliver(self, targets: List[Connection], message: Dict) -> int:
+        if not targets:
+            return 0
+        payload = json.dumps(message)  # Serialized once, shared by every recipient
+        self.stats['payloads_serialized'] += 1
+        slow = []
+        for connection in targets:
+            if connection.offer(payload):
+                self.stats['deliveries'] += 1
+            else:
+                slow.append(connection)
+        for connection in slow:
+            self._drop_slow_consumer(connection)
+        return len(targets) - len(slow)
+
+    def _drop_slow_consumer(self, connection: Connection):
+        self.stats['slow_consumers_dropped'] += 1
+        print(f"WebSocket client dropped (send queue full): {connection.dashboard_type} (user: {connection.tenant_id})")
+        self.remove_connection(connection.websocket)
+        try:
+            asyncio.get_running_loop().create_task(connection.websocket.close(code=1013, reason='slow consumer'))
+        except Exception:
+            pass
+
     async def send_to_dashboard(self, dashboard_type: str, message: Dict):
         """Send message to all connections of a specific dashboard type"""
-        if dashboard_type in self.connections:
-            message_str = json.dumps(message)
-            disconnected = set()
-            
-            for websocket in self.connections[dashboard_type]:
-                try:
-                    await websocket.send(message_str)
-                except websockets.exceptions.ConnectionClosed:
-                    disconnected.add(websocket)
-                except Exception as e:
-                    print(f"Error sending message to {dashboard_type}: {e}")
-                    disconnected.add(websocket)
-            
-            # Remove disconnected connections
-            for websocket in disconnected:
-                self.remove_connection(websocket)
-    
+        self._deliver([c for c in list(self.connection_info.values()) if c.dashboard_type == dashboard_type], message)
+
     async def send_to_user(self, user_id: str, message: Dict):
         """Send message to specific user across all their dashboard connections"""
-        message_str = json.dumps(message)
-        disconnected = set()
-        
-        for websocket, info in self.connection_info.items():
-            if info.get('user_id') == user_id:
-                try:
-                    await websocket.send(message_str)
-                except websockets.exceptions.ConnectionClosed:
-                    disconnected.add(websocket)
-                except Exception as e:
-                    print(f"Error sending message to user {user_id}: {e}")
-                    disconnected.add(websocket)
-        
-        # Remove disconnected connections
-        for websocket in disconnected:
-            self.remove_connection(websocket)
-    
+        self._deliver([c for c in list(self.connection_info.values()) if c.tenant_id == str(user_id)], message)
+
     async def broadcast_to_all(self, message: Dict):
         """Broadcast message to all connected clients"""
-        message_str = json.dumps(message)
-        disconnected = set()
-        
-        for dashboard_type, connections in self.connections.items():
-            for websocket in connections:
-                try:
-                    await websocket.send(message_str)
-                except websockets.exceptions.ConnectionClosed:
-                    disconnected.add(websocket)
-                except Exception as e:
-                    print(f"Error broadcasting message: {e}")
-                    disconnected.add(websocket)
-        
-        # Remove disconnected connections
-        for websocket in disconnected:
-            self.remove_connection(websocket)
-    
+        self._deliver(list(self.connection_info.values()), message)
+
+    def register_resume(self, topic: str, handler, admin_only: bool = False):
+        """handler(since) -> dict of what a client resuming `topic` after sequence `since` missed"""
+        self.resume_handlers[topic] = (handler, admin_only)
+
+    def reply(self, websocket, message: Dict):
+        """Send a direct reply through the connection's queue so ordering with pushes is preserved"""
+        connection = self.connection_info.get(websocket)
+        if connection and not connection.offer(json.dumps(message)):
+            self._drop_slow_consumer(connection)
+
+    # ------------------------------------------------------------------
+    # Server lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self, host: str = 'localhost', port: int = 8765) -> threading.Thread:
+        """Run the server on one persistent event loop in a background thread"""
+        if self.thread and self.thread.is_alive():
+            return self.thread
+        self._ready.clear()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._serve(host, port)),
+                                       name='websocket-server', daemon=True)
+        self.thread.start()
+        self._ready.wait(10)
+        return self.thread
+
+    def stop(self):
+        if self.loop and self._stop:
+            self.loop.call_soon_threadsafe(self._stop.set)
+        if self.thread:
+            self.thread.join(timeout=10)
+        self.thread = None
+
+    async def _serve(self, host: str, port: int):
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        heartbeat = self.loop.create_task(self._heartbeat_loop())
+        try:
+            async with websockets.serve(handle_websocket_connection, host, port) as server:
+                self.port = server.sockets[0].getsockname()[1]
+                print(f"WebSocket server running on ws://{host}:{self.port}")
+                self._ready.set()
+                await self._stop.wait()
+        finally:
+            heartbeat.cancel()
+            self._ready.set()
+            self.loop = None
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await send_periodic_updates()
+
     def get_connection_stats(self) -> Dict:
         """Get statistics about current connections"""
+        connections = list(self.connection_info.values())
         stats = {
-            'total_connections': sum(len(connections) for connections in self.connections.values()),
+            'total_connections': len(connections),
             'by_dashboard': {
-                dashboard_type: len(connections) 
-                for dashboard_type, connections in self.connections.items()
+                dashboard_type: len(sockets)
+                for dashboard_type, sockets in self.connections.items()
             },
-            'connection_details': []
+            'topics': {topic: len(subscribers) for topic, subscribers in list(self.topic_index.items()) if subscribers},
+            'fan_out': dict(self.stats),
+            'connection_details': [connection.to_dict() for connection in connections]
         }
-        
-        for websocket, info in self.connection_info.items():
-            stats['connection_details'].append({
-                'dashboard_type': info['dashboard_type'],
-                'user_id': info['user_id'],
-                'connected_at': info['connected_at']
-            })
-        
         return stats
 
+
 # Global WebSocket manager instance
 ws_manager = WebSocketManager()
 
-async def handle_websocket_connection(websocket, path):
-    """Handle incoming WebSocket connections"""
+
+async def handle_websocket_connection(websocket, path: str = None):
+    """
+    Handle incoming WebSocket connections. Path: /ws/<dashboard_type>/<endpoint>?token=...;
+    the token (or an Authorization: Bearer header) is required and decides the
+    tenant and role. topics (comma-separated) is optional.
+    """
     try:
-        # Parse the path to determine dashboard type and endpoint
-        path_parts = path.strip('/').split('/')
-        dashboard_type = path_parts[1] if len(path_parts) > 1 else 'user'
+        url = urlsplit(path or getattr(websocket, 'path', '/'))
+        path_parts = url.path.strip('/').split('/')
+        requested_dashboard = path_parts[1] if len(path_parts) > 1 else 'user'
         endpoint = path_parts[2] if len(path_parts) > 2 else 'general'
-        
-        # Create a unique connection key for this endpoint
-        connection_key = f"{dashboard_type}_{endpoint}"
-        
-        # Add connection with the endpoint-specific key
-        ws_manager.add_connection(websocket, connection_key, endpoint)
-        
+        query = parse_qs(url.query)
+
+        token = (query.get('token') or [None])[0] or _bearer_token(websocket)
+        user = await asyncio.get_running_loop().run_in_executor(None, ws_manager.authenticate, token) if token else None
+        identity = resolve_identity(user, requested_dashboard)
+        if identity is None:
+            await websocket.close(code=1008, reason='Forbidden' if user else 'Unauthorized')
+            return
+        dashboard_type, user_id = identity
+
+        ws_manager.add_connection(websocket, dashboard_type, user_id)
+        topics = ws_manager.subscribe(websocket, ','.join(query.get('topics', [])).split(','))
+
         # Send welcome message
-        welcome_message = {
+        ws_manager.reply(websocket, {
             'type': 'connection_established',
             'dashboard_type': dashboard_type,
             'endpoint': endpoint,
-            'connection_key': connection_key,
+            'topics': topics,
             'timestamp': datetime.utcnow().isoformat(),
             'message': f'Connected to {dashboard_type} {endpoint} endpoint'
-        }
-        await websocket.send(json.dumps(welcome_message))
-        
+        })
+
         # Keep connection alive and handle incoming messages
         async for message in websocket:
             try:
                 data = json.loads(message)
                 await handle_websocket_message(websocket, data)
             except json.JSONDecodeError:
-                await websocket.send(json.dumps({
+                ws_manager.reply(websocket, {
                     'type': 'error',
                     'message': 'Invalid JSON format'
-                }))
+                })
             except Exception as e:
                 print(f"Error handling WebSocket message: {e}")
-                
+
     except websockets.exceptions.ConnectionClosed:
         pass
     except Exception as e:
@@ -165,113 +374,97 @@ async def handle_websocket_connection(websocket, path):
     finally:
         ws_manager.remove_connection(websocket)
 
+
+def _bearer_token(websocket) -> Optional[str]:
+    headers = getattr(websocket, 'request_headers', None) or getattr(getattr(websocket, 'request', None), 'headers', None)
+    auth = headers.get('Authorization', '') if headers else ''
+    return auth.split(' ', 1)[1].strip() if auth.startswith('Bearer ') else None
+
+
 async def handle_websocket_message(websocket, data: Dict):
     """Handle incoming WebSocket messages"""
     message_type = data.get('type')
-    
+
     if message_type == 'ping':
-        await websocket.send(json.dumps({
+        ws_manager.reply(websocket, {
             'type': 'pong',
             'timestamp': datetime.utcnow().isoformat()
-        }))
-    elif message_type == 'subscribe':
-        # Handle subscription to specific events
-        event_type = data.get('event_type')
-        await websocket.send(json.dumps({
-            'type': 'subscribed',
-            'event_type': event_type,
+        })
+    elif message_type in ('subscribe', 'unsubscribe'):
+        # {"type": "subscribe", "topics": ["roundups", "mappings"]}; event_type is the older single-topic form
+        topics = data.get('topics') or [data.get('event_type')]
+        if message_type == 'subscribe':
+            current = ws_manager.subscribe(websocket, topics)
+        else:
+            current = ws_manager.unsubscribe(websocket, topics)
+        ws_manager.reply(websocket, {
+            'type': f'{message_type}d',
+            'topics': current,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    elif message_type == 'resume':
+        # {"type": "resume", "topic": "llm_center", "since": 1234} - replay what was missed, then live pushes follow
+        topic = data.get('topic')
+        handler, admin_only = ws_manager.resume_handlers.get(topic, (None, False))
+        connection = ws_manager.connection_info.get(websocket)
+        if handler is None or connection is None or not connection.can_see(None, admin_only):
+            ws_manager.reply(websocket, {'type': 'error', 'message': f'Cannot resume topic: {topic}'})
+            return
+        ws_manager.subscribe(websocket, [topic])
+        since = data.get('since')
+        result = await asyncio.get_running_loop().run_in_executor(None, handler, int(since) if since is not None else None)
+        ws_manager.reply(websocket, {
+            'type': f'{topic}_resume',
+            'topic': topic,
+            'data': result,
             'timestamp': datetime.utcnow().isoformat()
-        }))
+        })
     elif message_type == 'get_stats':
         # Send connection statistics
-        stats = ws_manager.get_connection_stats()
-        await websocket.send(json.dumps({
+        ws_manager.reply(websocket, {
             'type': 'connection_stats',
-            'data': stats,
+            'data': ws_manager.get_connection_stats(),
             'timestamp': datetime.utcnow().isoformat()
-        }))
+        })
     else:
-        await websocket.send(json.dumps({
+        ws_manager.reply(websocket, {
             'type': 'error',
             'message': f'Unknown message type: {message_type}'
-        }))
+        })
+
 
 def start_websocket_server(host='localhost', port=8765):
     """Start the WebSocket server"""
     print(f"Starting WebSocket server on {host}:{port}")
-    
-    async def server():
-        async with websockets.serve(handle_websocket_connection, host, port):
-            print(f"WebSocket server running on ws://{host}:{port}")
-            await asyncio.Future()  # Run forever
-    
-    # Run in a separate thread
-    def run_server():
-        asyncio.run(server())
-    
-    server_thread = threading.Thread(target=run_server, daemon=True)
-    server_thread.start()
-    return server_thread
+    return ws_manager.start(host, port)
 
-# Real-time update functions
-async def notify_transaction_update(dashboard_type: str, transaction_data: Dict):
-    """Notify dashboard of transaction update"""
-    message = {
-        'type': 'transaction_update',
-        'data': transaction_data,
-        'timestamp': datetime.utcnow().isoformat()
-    }
-    await ws_manager.send_to_dashboard(dashboard_type, message)
 
-async def notify_mapping_update(dashboard_type: str, mapping_data: Dict):
-    """Notify dashboard of mapping update"""
-    message = {
-        'type': 'mapping_update',
-        'data': mapping_data,
-        'timestamp': datetime.utcnow().isoformat()
-    }
-    await ws_manager.send_to_dashboard(dashboard_type, message)
+# Real-time update functions (safe to call from any thread)
+def notify_transaction_update(user_id: str, transaction_data: Dict):
+    """Notify a user's dashboards of transaction updates"""
+    ws_manager.publish('transactions', transaction_data, tenant_id=user_id, message_type='transaction_update')
+
+
+def notify_mapping_update(mapping_data: Dict):
+    """Notify admin dashboards of a mapping update"""
+    ws_manager.publish('mappings', mapping_data, admin_only=True, message_type='mapping_update')
+
 
-async def notify_roundup_update(user_id: str, roundup_data: Dict):
+def notify_roundup_update(user_id: str, roundup_data: Dict):
     """Notify user of round-up update"""
-    message = {
-        'type': 'roundup_update',
-        'data': roundup_data,
-        'timestamp': datetime.utcnow().isoformat()
-    }
-    await ws_manager.send_to_user(user_id, message)
+    ws_manager.publish('roundups', roundup_data, tenant_id=user_id, message_type='roundup_update')
+
 
-async def notify_system_alert(alert_data: Dict):
+def notify_system_alert(alert_data: Dict):
     """Broadcast system alert to all connected clients"""
-    message = {
-        'type': 'system_alert',
-        'data': alert_data,
-        'timestamp': datetime.utcnow().isoformat()
-    }
-    await ws_manager.broadcast_to_all(message)
+    ws_manager.publish('system', alert_data, message_type='system_alert')
 
-# Periodic update functions
-def start_periodic_updates():
-    """Start periodic updates for real-time data"""
-    def update_loop():
-        while True:
-            try:
-                # Send periodic updates every 30 seconds
-                asyncio.run(send_periodic_updates())
-                time.sleep(30)
-            except Exception as e:
-                print(f"Error in periodic updates: {e}")
-                time.sleep(30)
-    
-    update_thread = threading.Thread(target=update_loop, daemon=True)
-    update_thread.start()
-    return update_thread
 
 async def send_periodic_updates():
     """Send periodic updates to all connected clients"""
     # Get current connection stats
     stats = ws_manager.get_connection_stats()
-    
+
     # Send heartbeat to all connections
     heartbeat_message = {
         'type': 'heartbeat',
@@ -281,62 +474,72 @@ async def send_periodic_updates():
         },
         'timestamp': datetime.utcnow().isoformat()
     }
-    
+
     await ws_manager.broadcast_to_all(heartbeat_message)
 
+
 # Integration with existing systems
 def integrate_with_event_bus():
     """Integrate WebSocket manager with event bus"""
     try:
         from event_bus import event_bus, EventType
-        
+
         def handle_event(event):
             """Handle events from the event bus"""
-            if event.event_type == EventType.INGEST_RAW:
-                asyncio.run(notify_transaction_update('user', {
-                    'message': 'New transaction processed',
-                    'transaction_id': event.data.get('transaction_id')
-                }))
-            elif event.event_type == EventType.MAPPING_APPROVED:
-                asyncio.run(notify_mapping_update('admin', {
+            if event.type == EventType.MAPPING_APPROVED:
+                notify_mapping_update({
                     'message': 'Mapping approved',
                     'mapping_id': event.data.get('mapping_id')
-                }))
-            elif event.event_type == EventType.ROUNDUP_ACCRUED:
-                asyncio.run(notify_roundup_update(event.tenant_id, {
+                })
+            elif event.type == EventType.ROUNDUP_SWEPT:
+                notify_roundup_update(event.tenant_id, {
+                    'message': 'Round-ups swept',
+                    'entries_swept': event.data.get('entries_swept'),
+                    'total_swept': event.data.get('total_swept')
+                })
+
+        def handle_batch(event):
+            """One small delta per batch instead of one message per transaction"""
+            items = [item['data'] for item in event.data.get('events', [])]
+            if event.type == EventType.INGEST_RAW:
+                notify_transaction_update(event.tenant_id, {
+                    'message': f'{len(items)} new transactions processed',
+                    'count': len(items),
+                    'transaction_ids': [data.get('transaction_id') for data in items]
+                })
+            elif event.type == EventType.ROUNDUP_ACCRUED:
+                notify_roundup_update(event.tenant_id, {
                     'message': 'Round-up accrued',
-                    'amount': event.data.get('amount')
-                }))
-        
+                    'count': len(items),
+                    'amount': round(sum(float(data.get('amount') or 0) for data in items), 2)
+                })
+
         # Subscribe to relevant events
-        event_bus.subscribe(EventType.INGEST_RAW, handle_event)
+        event_bus.subscribe(EventType.INGEST_RAW, handle_batch, batch=True)
         event_bus.subscribe(EventType.MAPPING_APPROVED, handle_event)
-        event_bus.subscribe(EventType.ROUNDUP_ACCRUED, handle_event)
-        
+        event_bus.subscribe(EventType.ROUNDUP_ACCRUED, handle_batch, batch=True)
+        event_bus.subscribe(EventType.ROUNDUP_SWEPT, handle_event)
+
         print("WebSocket manager integrated with event bus")
-        
+
     except ImportError:
         print("Event bus not available, WebSocket manager running standalone")
 
+
 # Initialize WebSocket server
 def initialize_websocket_server():
     """Initialize the WebSocket server and start all services"""
     print("Initializing WebSocket server...")
-    
-    # Start WebSocket server
+
+    # Start WebSocket server (heartbeats run on the server's own loop)
     server_thread = start_websocket_server()
-    
-    # Start periodic updates
-    update_thread = start_periodic_updates()
-    
+
     # Integrate with event bus
     integrate_with_event_bus()
-    
+
+    # Push LLM Center deltas on the 'llm_center' topic
+    from llm_change_feed import llm_change_feed
+    llm_change_feed.start()
+
     print("WebSocket server initialized successfully")
-    print("WebSocket endpoints:")
-    print("  - ws://localhost:8765/ws/user/<user_id>")
-    print("  - ws://localhost:8765/ws/family/<family_id>")
-    print("  - ws://localhost:8765/ws/business/<business_id>")
-    print("  - ws://localhost:8765/ws/admin")
-    
-    return server_thread, update_thread
+    return server_thread